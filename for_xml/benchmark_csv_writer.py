@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: csv.DictWriter vs positional tuple rows through csv.writer
+
+Compares, on the records of an example XML file:
+1. Writing only: the same rows of every table written as dicts through
+   csv.DictWriter and as tuples through csv.writer
+2. Extraction + writing for item_references, the hottest table: dict rows
+   with DictWriter vs native tuple rows with csv.writer
+
+Both variants must produce byte-identical CSV text; the script checks this
+before printing timings.
+
+Usage:
+    python benchmark_csv_writer.py [examples/1985.xml] [--rounds 20]
+"""
+
+import argparse
+import csv
+import io
+import os
+import time
+import xml.etree.ElementTree as ET
+
+from xml_parser import XMLRecordParser
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+
+
+def load_parsers(xml_path):
+    """Parse every <REC> of the file"""
+    root = ET.parse(xml_path).getroot()
+    return [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+
+def dict_rows(parser, table_name):
+    """Rows of a table as dictionaries, like the extractors return them"""
+    if table_name == 'uid':
+        return [{'uid': parser.uid}]
+    rows = getattr(parser, f'extract_{table_name}')()
+    if rows is None:
+        return []
+    return [rows] if isinstance(rows, dict) else rows
+
+
+def write_dicts(rows_by_table):
+    """Write dict rows with csv.DictWriter, one writer per table"""
+    outputs = {}
+    for table_name, rows in rows_by_table.items():
+        buffer = io.StringIO(newline='')
+        csv.DictWriter(buffer, fieldnames=list(XML_TABLE_COLUMNS[table_name])).writerows(rows)
+        outputs[table_name] = buffer.getvalue()
+    return outputs
+
+
+def write_tuples(rows_by_table):
+    """Write tuple rows with csv.writer, one writer per table"""
+    outputs = {}
+    for table_name, rows in rows_by_table.items():
+        buffer = io.StringIO(newline='')
+        csv.writer(buffer).writerows(rows)
+        outputs[table_name] = buffer.getvalue()
+    return outputs
+
+
+def best_of(func, rounds):
+    """Best wall time of several rounds"""
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmark(xml_path, rounds):
+    """Run both comparisons and print a summary"""
+    parsers = load_parsers(xml_path)
+    print(f"Records: {len(parsers)} from {xml_path}, best of {rounds} rounds")
+
+    # 1. Writing only, all tables
+    dict_input = {table: [row for p in parsers for row in dict_rows(p, table)] for table in XML_TABLE_COLUMNS}
+    tuple_input = {table: [row for p in parsers for row in p.extract_tuples(table)] for table in XML_TABLE_COLUMNS}
+    dict_time, dict_out = best_of(lambda: write_dicts(dict_input), rounds)
+    tuple_time, tuple_out = best_of(lambda: write_tuples(tuple_input), rounds)
+    assert dict_out == tuple_out, "positional output differs from DictWriter output"
+    row_count = sum(len(rows) for rows in tuple_input.values())
+    print(f"\nWrite only, all tables ({row_count} rows):")
+    print(f"  csv.DictWriter      {dict_time * 1000:8.2f} ms")
+    print(f"  tuples + csv.writer {tuple_time * 1000:8.2f} ms  ({dict_time / tuple_time:.2f}x)")
+
+    # 2. Extraction + writing, item_references
+    def references_dicts():
+        rows = [row for p in parsers for row in (p.extract_item_references() or [])]
+        return write_dicts({'item_references': rows})
+
+    def references_tuples():
+        rows = [row for p in parsers for row in p.extract_item_references_tuples()]
+        return write_tuples({'item_references': rows})
+
+    dict_time, dict_out = best_of(references_dicts, rounds)
+    tuple_time, tuple_out = best_of(references_tuples, rounds)
+    assert dict_out == tuple_out, "item_references output differs"
+    print(f"\nExtract + write, item_references ({len(tuple_input['item_references'])} rows):")
+    print(f"  dicts + DictWriter  {dict_time * 1000:8.2f} ms")
+    print(f"  tuples + csv.writer {tuple_time * 1000:8.2f} ms  ({dict_time / tuple_time:.2f}x)")
+    print("\nOutputs are byte-identical.")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark DictWriter vs positional CSV rows')
+    arg_parser.add_argument('xml_path', nargs='?',
+                            default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', '1985.xml'))
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    options = arg_parser.parse_args()
+    run_benchmark(options.xml_path, options.rounds)
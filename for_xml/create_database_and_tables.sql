@@ -2,7 +2,8 @@
 -- WOS XML Parser - Database and Table Creation Script
 -- =============================================================================
 -- This script creates the database schema for importing WOS XML Parser CSV output
--- into MySQL or MariaDB. It creates 33 tables organized into 6 sections.
+-- into MySQL or MariaDB. It creates 33 tables organized into 6 sections, plus
+-- the dimension tables of Section 7 (used with xml_proc_main.py --dimensions).
 --
 -- Usage:
 --   mysql -u root -p < create_database_and_tables.sql
@@ -68,19 +69,23 @@ CREATE TABLE IF NOT EXISTS item_abstract (
 CREATE TABLE IF NOT EXISTS item_doc_types (
     uid VARCHAR(50),
     doctype VARCHAR(100),
+    doctype_id BIGINT,
     FOREIGN KEY (uid) REFERENCES item(uid) ON DELETE CASCADE,
     INDEX idx_uid (uid),
-    INDEX idx_doctype (doctype)
+    INDEX idx_doctype (doctype),
+    INDEX idx_doctype_id (doctype_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Normalized document types
 CREATE TABLE IF NOT EXISTS item_doc_types_norm (
     uid VARCHAR(50),
     doctype_norm VARCHAR(100),
+    doctype_norm_id BIGINT,
     UNIQUE INDEX idx_id (id),
     FOREIGN KEY (uid) REFERENCES item(uid) ON DELETE CASCADE,
     INDEX idx_uid (uid),
-    INDEX idx_doctype_norm (doctype_norm)
+    INDEX idx_doctype_norm (doctype_norm),
+    INDEX idx_doctype_norm_id (doctype_norm_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Languages
@@ -130,6 +135,7 @@ CREATE TABLE IF NOT EXISTS item_keywords_plus (
 CREATE TABLE IF NOT EXISTS item_source (
     uid VARCHAR(50),
     source VARCHAR(500),
+    source_id BIGINT,
     source_abbrev VARCHAR(200),
     abbrev_iso VARCHAR(200),
     abbrev_11 VARCHAR(50),
@@ -137,7 +143,8 @@ CREATE TABLE IF NOT EXISTS item_source (
     series VARCHAR(500),
     book_subtitle TEXT,
     UNIQUE INDEX idx_uid (uid),
-    INDEX idx_source (source(255))
+    INDEX idx_source (source(255)),
+    INDEX idx_source_id (source_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Identifiers (DOI, ISSN, etc.)
@@ -237,8 +244,10 @@ CREATE TABLE IF NOT EXISTS item_orgs (
     ROR_ID VARCHAR(100),
     org_id VARCHAR(100),
     organization VARCHAR(1000),
+    organization_id BIGINT,
     INDEX idx_uid (uid),
-    INDEX idx_organization (organization(255))
+    INDEX idx_organization (organization(255)),
+    INDEX idx_organization_id (organization_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Sub-organizations
@@ -291,8 +300,10 @@ CREATE TABLE IF NOT EXISTS item_rp_orgs (
     ROR_ID VARCHAR(100),
     org_id VARCHAR(100),
     organization VARCHAR(1000),
+    organization_id BIGINT,
     INDEX idx_uid (uid),
-    INDEX idx_organization (organization(255))
+    INDEX idx_organization (organization(255)),
+    INDEX idx_organization_id (organization_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Reprint sub-organizations
@@ -335,10 +346,12 @@ CREATE TABLE IF NOT EXISTS item_headings (
 CREATE TABLE IF NOT EXISTS item_subjects (
     uid VARCHAR(50),
     subject VARCHAR(500),
+    subject_id BIGINT,
     ascatype VARCHAR(50),
     INDEX idx_uid (uid),
     INDEX idx_subject (subject(255)),
-    INDEX idx_ascatype (ascatype)
+    INDEX idx_ascatype (ascatype),
+    INDEX idx_subject_id (subject_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- =============================================================================
@@ -388,12 +401,14 @@ CREATE TABLE IF NOT EXISTS item_acks (
 CREATE TABLE IF NOT EXISTS item_grants (
     uid VARCHAR(50),
     grant_agency VARCHAR(1000),
+    grant_agency_id BIGINT,
     grant_agency_pref VARCHAR(500),
     grant_id VARCHAR(1000),
     grant_source VARCHAR(100),
     INDEX idx_uid (uid),
     INDEX idx_grant_agency (grant_agency),
-    INDEX idx_grant_id (grant_id)
+    INDEX idx_grant_id (grant_id),
+    INDEX idx_grant_agency_id (grant_agency_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- =============================================================================
@@ -433,6 +448,44 @@ CREATE TABLE IF NOT EXISTS item_topics (
     INDEX idx_uid (uid),
     INDEX idx_topic_micro (topic_micro)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- =============================================================================
+-- Section 7: Dimension Tables (5 tables)
+-- =============================================================================
+-- Written by xml_proc_main.py --dimensions: the fact tables then carry the
+-- *_id columns (e.g. item_orgs.organization_id) instead of the text columns.
+-- Ids are 63-bit hashes of the values, equal across workers and runs.
+
+CREATE TABLE IF NOT EXISTS dim_org (
+    id BIGINT PRIMARY KEY,
+    organization VARCHAR(1000),
+    INDEX idx_organization (organization(255))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS dim_subject (
+    id BIGINT PRIMARY KEY,
+    subject VARCHAR(500),
+    INDEX idx_subject (subject(255))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS dim_source (
+    id BIGINT PRIMARY KEY,
+    source VARCHAR(500),
+    INDEX idx_source (source(255))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS dim_grant_agency (
+    id BIGINT PRIMARY KEY,
+    grant_agency VARCHAR(1000),
+    INDEX idx_grant_agency (grant_agency(255))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS dim_doctype (
+    id BIGINT PRIMARY KEY,
+    doctype VARCHAR(100),
+    INDEX idx_doctype (doctype)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Re-enable foreign key checks
 SET FOREIGN_KEY_CHECKS = 1;
 
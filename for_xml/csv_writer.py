@@ -3,27 +3,429 @@ CSV Writer with proper escaping for WOS XML data
 
 This module provides utilities to write data to CSV files with proper handling
 of special characters like commas, quotes, and newlines.
+
+CSV files can optionally be written compressed (gzip, or zstd when the
+zstandard package is installed). Every process keeps one compressor
+stream per table file and feeds it batch by batch; at the commit point
+(the end of an input file, wait_for_compressed_writes()) the stream is
+finished and appended as one complete gzip member / zstd frame, so files
+stay appendable by several processes and decompress as one stream
+(gzip -dc, zstd -dc). Compression and the file write run on a background
+thread while the caller goes on parsing.
+
+With a byte or row cap, a table is written as numbered parts
+(item_references.00001.csv, .00002.csv, ...) instead of one file. Every
+part has its own header row and is claimed by exactly one process; a
+process keeps writing its current part across input files until the part
+is full. Closed parts are logged with their row count and SHA-256 in
+load_parts.jsonl, from which xml_load_manifest builds the load manifest.
 """
 
 import csv
+import gzip
+import hashlib
+import io
+import json
 import os
+import queue
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from xml_common_def import row_getter
+
+# Dialect shared by every writer (the csv.DictWriter default: minimal quoting, CRLF)
+CSV_DIALECT = 'excel'
+
+# Supported compressions: file suffix and default level
+CSV_COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_COMPRESSION_LEVELS = {'gzip': 3, 'zstd': 3}
+
+# Chunks waiting for the background compressor, per process
+MAX_PENDING_CHUNKS = 64
+
+# Digits of the part number in part file names (item.00001.csv)
+PART_NUMBER_WIDTH = 5
+
+# Log of closed part files, one JSON line per part, next to the parts
+PART_LOG_FILE = "load_parts.jsonl"
+
+
+def compress_chunk(data, compression, level=None):
+    """
+    Compress bytes as one self-contained gzip member or zstd frame
+
+    :param data: Bytes to compress
+    :param compression: 'gzip' or 'zstd'
+    :param level: Compression level (default: DEFAULT_COMPRESSION_LEVELS)
+    """
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class CompressedStream:
+    """One gzip member or zstd frame, compressed chunk by chunk and kept in memory until finished"""
+
+    def __init__(self, compression, level=None):
+        """
+        :param compression: 'gzip' or 'zstd'
+        :param level: Compression level (default: DEFAULT_COMPRESSION_LEVELS)
+        """
+        if level is None:
+            level = DEFAULT_COMPRESSION_LEVELS[compression]
+        if compression == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.chunks = []
+
+    def compress(self, data):
+        """Add bytes to the member or frame"""
+        chunk = self._compressor.compress(data)
+        if chunk:
+            self.chunks.append(chunk)
+
+    def finish(self):
+        """The complete gzip member or zstd frame"""
+        self.chunks.append(self._compressor.flush())
+        return b''.join(self.chunks)
+
+
+class BackgroundCompressor:
+    """
+    Compresses chunks into one stream per file on a background thread
+
+    Chunks are compressed in submission order into the CompressedStream of
+    their file; flush() appends every stream to its file as one member or
+    frame, discard() drops the streams of some files. zlib and zstandard release the GIL while compressing, so parsing
+    continues in the meantime. Errors are raised from the next submit() or
+    flush().
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_CHUNKS):
+        self.max_pending = max_pending
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._error = None
+        self._streams = {}
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so every worker process starts its own
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._queue = queue.Queue(self.max_pending)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._pid = os.getpid()
+            self._error = None
+            self._streams = {}
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            file_path, data, compression, level = self._queue.get()
+            try:
+                if self._error is not None:
+                    continue
+                if file_path is None:
+                    # Commit point: append every stream as one member or frame
+                    streams, self._streams = self._streams, {}
+                    for stream_path, stream in streams.items():
+                        with open(stream_path, 'ab') as f:
+                            f.write(stream.finish())
+                    continue
+                if data is None:
+                    self._streams.pop(file_path, None)
+                    continue
+                stream = self._streams.get(file_path)
+                if stream is None:
+                    stream = self._streams[file_path] = CompressedStream(compression, level)
+                stream.compress(data)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, file_path, data, compression, level=None):
+        """Queue bytes to be compressed into the stream of file_path"""
+        self._ensure_thread()
+        self._raise_error()
+        self._queue.put((file_path, data, compression, level))
+
+    def discard(self, file_paths):
+        """Drop the pending streams of files, e.g. of a failed input file"""
+        if self._pid == os.getpid() and self._queue is not None:
+            for file_path in file_paths:
+                self._queue.put((file_path, None, None, None))
+            self._queue.join()
+        self._raise_error()
+
+    def flush(self):
+        """Block until every queued chunk is compressed and every stream is appended to its file"""
+        if self._pid == os.getpid() and self._queue is not None:
+            self._queue.put((None, None, None, None))
+            self._queue.join()
+        self._raise_error()
+
+
+# One background compressor per process, shared by all writers
+_BACKGROUND_COMPRESSOR = BackgroundCompressor()
+
+
+def wait_for_compressed_writes():
+    """Finish the compressor streams of this process and block until they are written (a commit point)"""
+    _BACKGROUND_COMPRESSOR.flush()
+
+
+def format_csv_rows(rows):
+    """CSV text of rows, UTF-8 encoded"""
+    buffer = io.StringIO(newline='')
+    csv.writer(buffer, dialect=CSV_DIALECT).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def open_csv_file(file_path, mode='r', compression_level=None):
+    """
+    Open a plain, gzip (.gz) or zstd (.zst) CSV file as text
+
+    :param file_path: Path of the file; the suffix selects the compression
+    :param mode: 'r' to read or 'w' to write
+    :param compression_level: Compression level when writing (default: DEFAULT_COMPRESSION_LEVELS)
+    """
+    if file_path.endswith('.gz'):
+        level = DEFAULT_COMPRESSION_LEVELS['gzip'] if compression_level is None else compression_level
+        return gzip.open(file_path, mode + 't', compresslevel=level, encoding='utf-8', newline='')
+    if file_path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+        raw = open(file_path, mode + 'b')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            level = DEFAULT_COMPRESSION_LEVELS['zstd'] if compression_level is None else compression_level
+            stream = zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return open(file_path, mode, encoding='utf-8', newline='')
+
+
+def csv_header_length(file_path, chunk_size=1 << 16):
+    """
+    Bytes of the header row of a CSV file written by CSVWriter
+
+    Header names are never quoted, so the header of a plain file is its
+    first line; compressed files hold the header in their first gzip member
+    or zstd frame, so the rows after it can be appended to another file of
+    the same compression as they are.
+    """
+    with open(file_path, 'rb') as f:
+        if not file_path.endswith(('.gz', '.zst')):
+            return len(f.readline())
+        if file_path.endswith('.gz'):
+            decompressor = zlib.decompressobj(31)
+        else:
+            if zstandard is None:
+                raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        consumed = 0
+        while not decompressor.eof:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"Truncated header in {file_path}")
+            decompressor.decompress(chunk)
+            consumed += len(chunk)
+        return consumed - len(decompressor.unused_data)
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CSVPartFiles:
+    """
+    Numbered part files of one table, rolled over at a byte or row cap
+
+    Part numbers are claimed with O_CREAT | O_EXCL, so parallel workers and
+    later runs never write to the same part. The byte cap counts CSV text
+    before compression; a part only exceeds it when a single batch does.
+    """
+
+    def __init__(self, file_path, headers, max_bytes=None, max_rows=None, compression=None,
+                 compression_level=None):
+        """
+        Initialize the part files of a table
+
+        :param file_path: Path of the unsplit file, e.g. xml_output/item.csv[.gz]
+        :param headers: List of column headers, repeated in every part
+        :param max_bytes: Optional cap on the CSV bytes of a part
+        :param max_rows: Optional cap on the data rows of a part
+        :param compression: Optional 'gzip' or 'zstd'
+        :param compression_level: Compression level (default: DEFAULT_COMPRESSION_LEVELS)
+        """
+        self.dir_path = os.path.dirname(file_path)
+        name = os.path.basename(file_path)
+        self.table_name, self.extension = name.split('.', 1)
+        self.header = format_csv_rows([headers])
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.compression = compression
+        self.compression_level = compression_level
+        self.next_number = 1
+        self.part_path = None
+        self.part_rows = 0
+        self.part_bytes = 0
+
+    def _open_part(self):
+        """Claim the next free part number and write its header"""
+        while True:
+            part_name = f"{self.table_name}.{self.next_number:0{PART_NUMBER_WIDTH}d}.{self.extension}"
+            part_path = os.path.join(self.dir_path, part_name)
+            self.next_number += 1
+            try:
+                os.close(os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                break
+            except FileExistsError:
+                continue
+        with open(part_path, 'wb') as f:
+            f.write(compress_chunk(self.header, self.compression, self.compression_level)
+                    if self.compression else self.header)
+        self.part_path = part_path
+        self.part_rows = 0
+        self.part_bytes = len(self.header)
+
+    def _append(self, data):
+        if self.compression:
+            _BACKGROUND_COMPRESSOR.submit(self.part_path, data, self.compression, self.compression_level)
+            return
+        with open(self.part_path, 'ab') as f:
+            f.write(data)
+
+    def write_tuples(self, rows):
+        """
+        Append positional rows, rolling over to new parts at the caps
+
+        :param rows: List of tuples in header order
+        """
+        start = 0
+        while start < len(rows):
+            if self.part_path is None:
+                self._open_part()
+            end = len(rows)
+            if self.max_rows:
+                end = min(end, start + self.max_rows - self.part_rows)
+            data = format_csv_rows(rows[start:end])
+            if self.max_bytes and self.part_rows and self.part_bytes + len(data) > self.max_bytes:
+                self.close_part()
+                continue
+            self._append(data)
+            self.part_rows += end - start
+            self.part_bytes += len(data)
+            start = end
+            if (self.max_rows and self.part_rows >= self.max_rows) or \
+                    (self.max_bytes and self.part_bytes >= self.max_bytes):
+                self.close_part()
+
+    def close_part(self):
+        """Finish the current part and log its row count and checksum"""
+        if self.part_path is None:
+            return
+        if self.compression:
+            wait_for_compressed_writes()
+        entry = {
+            'table': self.table_name,
+            'file': os.path.basename(self.part_path),
+            'rows': self.part_rows,
+            'bytes': os.path.getsize(self.part_path),
+            'sha256': file_sha256(self.part_path),
+        }
+        with open(os.path.join(self.dir_path, PART_LOG_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.part_path = None
+
+
+# Part files of this process by unsplit file path, kept open across input files
+_OPEN_PART_FILES = {}
+
+
+def _part_files(file_path, *args):
+    """The CSVPartFiles of this process for a table file"""
+    key = (os.getpid(), file_path)
+    if key not in _OPEN_PART_FILES:
+        _OPEN_PART_FILES[key] = CSVPartFiles(file_path, *args)
+    return _OPEN_PART_FILES[key]
+
+
+def close_part_files():
+    """Finish the open parts of this process (e.g. at the end of a run)"""
+    for (pid, _), part_files in list(_OPEN_PART_FILES.items()):
+        if pid == os.getpid():
+            part_files.close_part()
 
 
 class CSVWriter:
     """Handles writing data to CSV files with proper escaping"""
     
-    def __init__(self, file_path, headers, mode='a'):
+    def __init__(self, file_path, headers, mode='a', compression=None, compression_level=None,
+                 max_part_bytes=None, max_part_rows=None, index=False):
         """
         Initialize CSV writer
         
         :param file_path: Path to the CSV file
         :param headers: List of column headers
         :param mode: File mode ('w' for write, 'a' for append)
+        :param compression: Optional 'gzip' or 'zstd'; the matching suffix
+                            (.gz, .zst) is appended to file_path
+        :param compression_level: Compression level (default: DEFAULT_COMPRESSION_LEVELS)
+        :param max_part_bytes: Optional byte cap; rows go to numbered part files
+        :param max_part_rows: Optional row cap; rows go to numbered part files
+        :param index: Record the offset of every record's rows in the UID
+                      index log (plain unsplit files with a uid column only,
+                      see xml_uid_index)
         """
+        if index and (compression is not None or max_part_bytes or max_part_rows):
+            raise ValueError("The UID index needs plain, unsplit CSV files")
+        if compression is not None:
+            if compression not in CSV_COMPRESSION_SUFFIXES:
+                raise ValueError(f"Unknown compression: {compression}")
+            if compression == 'zstd' and zstandard is None:
+                raise ImportError("zstd compression requires the zstandard package: pip install zstandard")
+            file_path += CSV_COMPRESSION_SUFFIXES[compression]
         self.file_path = file_path
         self.headers = headers
         self.mode = mode
+        self.compression = compression
+        self.compression_level = compression_level
+        self._row_getter = row_getter(headers)
+        self._uid_index = headers.index('uid') if index else None
         self._ensure_dir()
+        self.parts = None
+        if max_part_bytes or max_part_rows:
+            self.parts = _part_files(file_path, headers, max_part_bytes, max_part_rows, compression,
+                                     compression_level)
+            return
         self._init_file()
     
     def _ensure_dir(self):
@@ -35,9 +437,38 @@ class CSVWriter:
     def _init_file(self):
         """Initialize file with headers if writing new file"""
         if self.mode == 'w' or not os.path.exists(self.file_path):
+            if self.compression:
+                with open(self.file_path, 'wb') as f:
+                    f.write(compress_chunk(self._format_rows([self.headers]), self.compression,
+                                           self.compression_level))
+                return
             with open(self.file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=self.headers)
-                writer.writeheader()
+                csv.writer(f, dialect=CSV_DIALECT).writerow(self.headers)
+    
+    def _format_rows(self, rows):
+        """CSV text of rows, UTF-8 encoded"""
+        return format_csv_rows(rows)
+    
+    def _to_tuples(self, data_list):
+        """
+        Convert row dictionaries to tuples in header order
+
+        :raises ValueError: if a dictionary has keys outside the headers, like csv.DictWriter
+        """
+        try:
+            rows = list(map(self._row_getter, data_list))
+            # Every header is present, so only a longer dictionary has other keys
+            extra = [data for data in data_list if len(data) > len(self.headers)]
+        except KeyError:
+            # Missing keys are written as empty fields, like csv.DictWriter does
+            rows = [tuple(data.get(key, '') for key in self.headers) for data in data_list]
+            extra = data_list
+        for data in extra:
+            wrong_fields = data.keys() - set(self.headers)
+            if wrong_fields:
+                raise ValueError("dict contains fields not in fieldnames: "
+                                 + ", ".join(repr(field) for field in sorted(wrong_fields, key=str)))
+        return rows
     
     def write_row(self, data):
         """
@@ -48,9 +479,7 @@ class CSVWriter:
         if data is None:
             return
         
-        with open(self.file_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=self.headers)
-            writer.writerow(data)
+        self.write_tuples(self._to_tuples([data]))
     
     def write_rows(self, data_list):
         """
@@ -61,208 +490,88 @@ class CSVWriter:
         if not data_list:
             return
         
-        with open(self.file_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=self.headers)
-            writer.writerows(data_list)
-
-
-class XMLDataWriter:
-    """Manages all CSV writers for XML data extraction"""
+        self.write_tuples(self._to_tuples(data_list))
     
-    def __init__(self):
-        """Initialize all CSV writers with their respective headers"""
-        from xml_common_def import XMLFilePathDef
-        
-        # Section 1: Paper Basic Information
-        self.uid_writer = CSVWriter(
-            XMLFilePathDef.UID_FILE_PATH,
-            ['uid']
-        )
-
-        self.item_writer = CSVWriter(
-            XMLFilePathDef.ITEM_FILE_PATH,
-            ['uid', 'sortdate', 'pubyear', 'has_abstract', 'vol', 'issue', 
-             'part', 'supplement', 'special_issue', 'early_access_date', 
-             'early_access_month', 'early_access_year', 'page_begin', 
-             'page_end', 'page_count']
-        )
-        
-        self.item_title_writer = CSVWriter(
-            XMLFilePathDef.ITEM_TITLE_FILE_PATH,
-            ['uid', 'title']
-        )
-        
-        self.item_abstract_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ABSTRACT_FILE_PATH,
-            ['uid', 'abstract']
-        )
-        
-        self.item_doc_types_writer = CSVWriter(
-            XMLFilePathDef.ITEM_DOC_TYPES_FILE_PATH,
-            ['uid', 'doctype']
-        )
-        
-        self.item_doc_types_norm_writer = CSVWriter(
-            XMLFilePathDef.ITEM_DOC_TYPES_NORM_FILE_PATH,
-            ['uid', 'doctype_norm']
-        )
-        
-        self.item_langs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_LANGS_FILE_PATH,
-            ['uid', 'type', 'language']
-        )
-        
-        self.item_langs_norm_writer = CSVWriter(
-            XMLFilePathDef.ITEM_LANGS_NORM_FILE_PATH,
-            ['uid', 'type', 'language_norm']
-        )
-        
-        self.item_editions_writer = CSVWriter(
-            XMLFilePathDef.ITEM_EDITIONS_FILE_PATH,
-            ['uid', 'edition']
-        )
-        
-        self.item_keywords_writer = CSVWriter(
-            XMLFilePathDef.ITEM_KEYWORDS_FILE_PATH,
-            ['uid', 'keyword']
-        )
-        
-        self.item_keywords_plus_writer = CSVWriter(
-            XMLFilePathDef.ITEM_KEYWORDS_PLUS_FILE_PATH,
-            ['uid', 'keyword_plus']
-        )
-        
-        self.item_source_writer = CSVWriter(
-            XMLFilePathDef.ITEM_SOURCE_FILE_PATH,
-            ['uid', 'source', 'source_abbrev', 'abbrev_iso', 'abbrev_11', 
-             'abbrev_29', 'series', 'book_subtitle']
-        )
-        
-        self.item_ids_writer = CSVWriter(
-            XMLFilePathDef.ITEM_IDS_FILE_PATH,
-            ['uid', 'identifier_type', 'identifier_value']
-        )
-        
-        self.item_oas_writer = CSVWriter(
-            XMLFilePathDef.ITEM_OAS_FILE_PATH,
-            ['uid', 'oa_type']
-        )
-        
-        self.item_publishers_writer = CSVWriter(
-            XMLFilePathDef.ITEM_PUBLISHERS_FILE_PATH,
-            ['uid', 'addr_no', 'full_address', 'city', 'role', 'seq_no', 
-             'display_name', 'full_name', 'unified_name']
-        )
-        
-        # Section 2: Author Information
-        self.item_authors_writer = CSVWriter(
-            XMLFilePathDef.ITEM_AUTHORS_FILE_PATH,
-            ['uid', 'seq_no', 'role', 'reprint', 'display_name', 
-             'wos_standard', 'full_name', 'first_name', 'last_name', 
-             'suffix', 'email_addr']
-        )
-        
-        self.item_addresses_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ADDRESSES_FILE_PATH,
-            ['uid', 'addr_no', 'full_address', 'city', 'state', 'country', 
-             'zip', 'zip_location']
-        )
-        self.item_addr_aus_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ADDR_AUS_FILE_PATH,
-            ['uid', 'seq_no', 'address_no']
-        )
-        self.item_au_addrs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ADDR_AUS_FILE_PATH,
-            ['uid', 'seq_no', 'address_no']
-        )
-        self.item_au_addrs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_AU_ADDRS_FILE_PATH,
-            ['uid', 'seq_no', 'address_no']
-        )
-        
-        self.item_orgs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ORGS_FILE_PATH,
-            ['uid', 'addr_no', 'org_pref', 'ROR_ID', 'org_id', 'organization']
-        )
-        
-        self.item_suborgs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_SUBORGS_FILE_PATH,
-            ['uid', 'addr_no', 'suborganization']
-        )
-        
-        self.item_author_ids_writer = CSVWriter(
-            XMLFilePathDef.ITEM_AUTHOR_IDS_FILE_PATH,
-            ['uid', 'seq_no', 'r_id', 'orcid', 'orcid_tr']
-        )
-        
-        self.item_rp_addrs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_RP_ADDRS_FILE_PATH,
-            ['uid', 'addr_no', 'full_address', 'city', 'state', 'country', 
-             'zip', 'zip_location']
-        )
-        
-        self.item_rp_au_addrs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_RP_AU_ADDRS_FILE_PATH,
-            ['uid', 'seq_no', 'address_no']
-        )
-        
-        self.item_rp_orgs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_RP_ORGS_FILE_PATH,
-            ['uid', 'addr_no', 'org_pref', 'ROR_ID', 'org_id', 'organization']
-        )
-        
-        self.item_rp_suborgs_writer = CSVWriter(
-            XMLFilePathDef.ITEM_RP_SUBORGS_FILE_PATH,
-            ['uid', 'addr_no', 'suborganization']
-        )
-        
-        self.item_contributors_writer = CSVWriter(
-            XMLFilePathDef.ITEM_CONTRIBUTORS_FILE_PATH,
-            ['uid', 'seq_no', 'orcid_id', 'r_id', 'r_id_role', 
-             'display_name', 'full_name', 'first_name', 'last_name']
-        )
-        
-        # Section 3: Category Information
-        self.item_headings_writer = CSVWriter(
-            XMLFilePathDef.ITEM_HEADINGS_FILE_PATH,
-            ['uid', 'headings']
-        )
+    def write_tuples(self, rows):
+        """
+        Write multiple positional rows to CSV
         
-        self.item_subjects_writer = CSVWriter(
-            XMLFilePathDef.ITEM_SUBJECTS_FILE_PATH,
-            ['uid', 'subject', 'ascatype']
-        )
+        Rows are formatted by the C csv.writer directly; the output is
+        byte-identical to csv.DictWriter for the same values. Compressed
+        rows are handed to the background compressor; call
+        wait_for_compressed_writes() before relying on them being on disk.
         
-        # Section 4: References
-        self.item_references_writer = CSVWriter(
-            XMLFilePathDef.ITEM_REFERENCES_FILE_PATH,
-            ['uid', 'occurence_order', 'cited_uid', 'cited_author', 
-             'cited_year', 'cited_page', 'cited_volume', 'cited_title', 
-             'cited_work', 'cited_doi', 'cited_assignee', 'patent_no']
-        )
+        :param rows: List of tuples in header order
+        """
+        if not rows:
+            return
         
-        self.item_cite_locations_writer = CSVWriter(
-            XMLFilePathDef.ITEM_CITE_LOCATIONS_FILE_PATH,
-            ['uid', 'occurence_order', 'physical_location', 'section', 'function']
-        )
+        if self.parts is not None:
+            self.parts.write_tuples(rows)
+            return
         
-        # Section 5: Funding Information
-        self.item_acks_writer = CSVWriter(
-            XMLFilePathDef.ITEM_ACKS_FILE_PATH,
-            ['uid', 'ack_text']
-        )
+        if self.compression:
+            _BACKGROUND_COMPRESSOR.submit(self.file_path, self._format_rows(rows), self.compression,
+                                          self.compression_level)
+            return
         
-        self.item_grants_writer = CSVWriter(
-            XMLFilePathDef.ITEM_GRANTS_FILE_PATH,
-            ['uid', 'grant_agency', 'grant_agency_pref', 'grant_id', 'grant_source']
-        )
+        if self._uid_index is not None:
+            self._write_indexed(rows)
+            return
         
-        # Section 6: Conference Information
-        self.item_conferences_writer = CSVWriter(
-            XMLFilePathDef.ITEM_CONFERENCES_FILE_PATH,
-            ['uid', 'conf_id', 'conf_info', 'conf_title', 'conf_start', 
-             'conf_end', 'conf_date', 'conf_city', 'conf_state', 'sponsor']
-        )
+        with open(self.file_path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f, dialect=CSV_DIALECT).writerows(rows)
+    
+    def _write_indexed(self, rows):
+        """Append rows in one write and log the offset of every record's rows"""
+        from xml_uid_index import append_indexed_rows
+        uid_index = self._uid_index
+        chunks = []
+        start = 0
+        # The rows of a record are contiguous in a batch
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or rows[end][uid_index] != rows[start][uid_index]:
+                chunks.append((rows[start][uid_index], end - start, self._format_rows(rows[start:end])))
+                start = end
+        append_indexed_rows(self.file_path, chunks)
+
+
+class XMLDataWriter:
+    """Manages all CSV writers for XML data extraction"""
+    
+    def __init__(self, output_dir=None, compression=None, compression_level=None,
+                 max_part_bytes=None, max_part_rows=None, tables=None, index=False):
+        """
+        Initialize all CSV writers with their respective headers
+        
+        :param output_dir: Optional directory replacing the default output
+                           directory (e.g. a per-node output shard)
+        :param compression: Optional 'gzip' or 'zstd' for compressed CSV files
+        :param compression_level: Compression level (default: DEFAULT_COMPRESSION_LEVELS)
+        :param max_part_bytes: Optional byte cap per part file (see CSVPartFiles)
+        :param max_part_rows: Optional row cap per part file (see CSVPartFiles)
+        :param tables: Mapping of table name to column names (default:
+                       XML_TABLE_COLUMNS; e.g. the dimension-encoded tables)
+        :param index: Log the UID offsets of the rows (see xml_uid_index)
+        """
+        # Compressed rows reach the disk on close(): records are marked then
+        self.buffered = compression is not None
+        from xml_common_def import XMLFilePathDef, XML_TABLE_COLUMNS
+        
+        def table_path(table_name):
+            default_path = getattr(XMLFilePathDef, f"{table_name.upper()}_FILE_PATH")
+            if output_dir is None:
+                return default_path
+            return os.path.join(output_dir, os.path.basename(default_path))
+        
+        # One writer per table, in the order of XML_TABLE_COLUMNS (sections 1-6)
+        self.writers = {
+            table_name: CSVWriter(table_path(table_name), list(columns),
+                                  compression=compression, compression_level=compression_level,
+                                  max_part_bytes=max_part_bytes, max_part_rows=max_part_rows,
+                                  index=index)
+            for table_name, columns in (tables or XML_TABLE_COLUMNS).items()
+        }
     
     def write_record_data(self, parser):
         """
@@ -270,48 +579,26 @@ class XMLDataWriter:
         
         :param parser: XMLRecordParser instance with extracted data
         """
-        # Section 1: Paper Basic Information
-        self.uid_writer.write_row({'uid': parser.uid})
-        self.item_writer.write_row(parser.extract_item())
-        self.item_title_writer.write_row(parser.extract_item_title())
-        self.item_abstract_writer.write_row(parser.extract_item_abstract())
-        self.item_doc_types_writer.write_rows(parser.extract_item_doc_types())
-        self.item_doc_types_norm_writer.write_rows(parser.extract_item_doc_types_norm())
-        self.item_langs_writer.write_rows(parser.extract_item_langs())
-        self.item_langs_norm_writer.write_rows(parser.extract_item_langs_norm())
-        self.item_editions_writer.write_rows(parser.extract_item_editions())
-        self.item_keywords_writer.write_rows(parser.extract_item_keywords())
-        self.item_keywords_plus_writer.write_rows(parser.extract_item_keywords_plus())
-        self.item_source_writer.write_row(parser.extract_item_source())
-        self.item_ids_writer.write_rows(parser.extract_item_ids())
-        self.item_oas_writer.write_rows(parser.extract_item_oas())
-        self.item_publishers_writer.write_rows(parser.extract_item_publishers())
-        
-        # Section 2: Author Information
-        self.item_authors_writer.write_rows(parser.extract_item_authors())
-        self.item_addresses_writer.write_rows(parser.extract_item_addresses())
-        self.item_au_addrs_writer.write_rows(parser.extract_item_au_addrs())
-        self.item_addr_aus_writer.write_rows(parser.extract_item_addr_aus())
-        self.item_orgs_writer.write_rows(parser.extract_item_orgs())
-        self.item_suborgs_writer.write_rows(parser.extract_item_suborgs())
-        self.item_author_ids_writer.write_rows(parser.extract_item_author_ids())
-        self.item_rp_addrs_writer.write_rows(parser.extract_item_rp_addrs())
-        self.item_rp_au_addrs_writer.write_rows(parser.extract_item_rp_au_addrs())
-        self.item_rp_orgs_writer.write_rows(parser.extract_item_rp_orgs())
-        self.item_rp_suborgs_writer.write_rows(parser.extract_item_rp_suborgs())
-        self.item_contributors_writer.write_rows(parser.extract_item_contributors())
-        
-        # # Section 3: Category Information
-        self.item_headings_writer.write_rows(parser.extract_item_headings())
-        self.item_subjects_writer.write_rows(parser.extract_item_subjects())
-        
-        # # Section 4: References
-        self.item_references_writer.write_rows(parser.extract_item_references())
-        self.item_cite_locations_writer.write_rows(parser.extract_item_cite_locations())
-        
-        # # Section 5: Funding Information
-        self.item_acks_writer.write_row(parser.extract_item_acks())
-        self.item_grants_writer.write_rows(parser.extract_item_grants())
-        
-        # # Section 6: Conference Information
-        self.item_conferences_writer.write_rows(parser.extract_item_conferences())
\ No newline at end of file
+        for table_name, writer in self.writers.items():
+            writer.write_tuples(parser.extract_tuples(table_name))
+
+    def write_batch(self, batch):
+        """
+        Write all rows of a RecordBatch to CSV files
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        for table_name, writer in self.writers.items():
+            writer.write_tuples(batch.rows(table_name))
+
+    def close(self):
+        """Wait until all compressed rows are written"""
+        if self.buffered:
+            wait_for_compressed_writes()
+
+    def discard(self):
+        """Drop the compressed rows of a failed input file that are not written yet"""
+        if self.buffered:
+            # Part files count their rows as written; their streams are appended at the next commit point
+            _BACKGROUND_COMPRESSOR.discard([writer.file_path for writer in self.writers.values()
+                                            if writer.parts is None])
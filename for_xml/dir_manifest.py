@@ -0,0 +1,160 @@
+"""
+Cached directory manifest for huge input trees
+
+Shared by the XML parser and the text parser in the repository root, which
+imports it as for_xml.dir_manifest; each passes its own file filter (see
+input_file_filter). The module only uses the standard library so that it can
+be imported both ways.
+
+Walking hundreds of thousands of input files with os.listdir plus one isdir()
+stat per entry takes minutes over NFS. DirectoryManifest walks the tree with
+os.scandir (the entry type comes from the directory listing itself) and keeps
+a JSON manifest of every directory with its mtime and its files (name, size,
+mtime). On later runs each directory is revalidated with a single stat: if its
+mtime is unchanged the cached listing is reused instead of reading and
+stat-ing the directory again. The file sizes feed the scheduler, which
+submits the largest files first.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+MANIFEST_VERSION = 1
+
+# Directories modified this recently may still change within the same
+# mtime tick, so their listing is not trusted on the next run
+RACY_WINDOW_SECONDS = 2.0
+
+
+class DirectoryManifest:
+    """Scans directory trees with os.scandir and caches listings by directory mtime"""
+
+    def __init__(self, manifest_path: Optional[str] = None):
+        """
+        Initialize the manifest
+
+        :param manifest_path: JSON manifest file; None scans without caching
+        """
+        self.manifest_path = manifest_path
+        self.dirs = self._load() if manifest_path else {}
+        self.stats = {'dirs_scanned': 0, 'dirs_cached': 0}
+
+    def _load(self):
+        """Load cached directory listings from the manifest file"""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load manifest file: {e}")
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("dirs", {})
+
+    def save(self):
+        """Write the manifest file atomically"""
+        if not self.manifest_path:
+            return
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION,
+                       "updated": datetime.now().isoformat(),
+                       "dirs": self.dirs}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _list_directory(self, dir_path, dir_mtime):
+        """Read one directory with os.scandir"""
+        files = []
+        subdirs = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif self.manifest_path:
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime])
+                else:
+                    files.append([entry.name, None, None])
+        racy = dir_mtime is None or time.time() - dir_mtime < RACY_WINDOW_SECONDS
+        return {"mtime": None if racy else dir_mtime, "files": files, "subdirs": subdirs}
+
+    def scan(self, root_path: str, file_filter: Callable[[str], bool] = None) -> List[Tuple[str, int, float]]:
+        """
+        Find all files below root_path
+
+        :param root_path: Directory to scan recursively
+        :param file_filter: Optional predicate on the file name
+        :return: List of (path, size, mtime); size and mtime are None without a manifest
+        """
+        root_path = os.path.abspath(root_path)
+        found_files = []
+        visited = set()
+        stack = [root_path]
+
+        while stack:
+            dir_path = stack.pop()
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+
+            cached = self.dirs.get(dir_path)
+            if cached is not None and cached["mtime"] is not None and cached["mtime"] == dir_mtime:
+                listing = cached
+                self.stats['dirs_cached'] += 1
+            else:
+                try:
+                    listing = self._list_directory(dir_path, dir_mtime)
+                except (PermissionError, FileNotFoundError, NotADirectoryError):
+                    continue
+                self.stats['dirs_scanned'] += 1
+            self.dirs[dir_path] = listing
+            visited.add(dir_path)
+
+            for name, size, mtime in listing["files"]:
+                if file_filter is None or file_filter(name):
+                    found_files.append((os.path.join(dir_path, name), size, mtime))
+            for name in listing["subdirs"]:
+                stack.append(os.path.join(dir_path, name))
+
+        # Forget directories below this root that no longer exist
+        prefix = root_path.rstrip(os.sep) + os.sep
+        for dir_path in list(self.dirs):
+            if (dir_path == root_path or dir_path.startswith(prefix)) and dir_path not in visited:
+                del self.dirs[dir_path]
+
+        return found_files
+
+
+def input_file_filter(suffix: str = '') -> Callable[[str], bool]:
+    """
+    Build the file filter of one parser's input files
+
+    Hidden files such as .DS_Store are always skipped.
+
+    :param suffix: Required file name suffix, e.g. '.xml'; empty accepts every visible file
+    :return: Predicate on the file name for DirectoryManifest.scan
+    """
+    def accept(name: str) -> bool:
+        return name.endswith(suffix) and not name.startswith('.')
+    return accept
+
+
+def schedule_by_size(entries: List[Tuple[str, int, float]]) -> List[str]:
+    """
+    Order manifest entries for submission to a worker pool
+
+    The largest files go first so the pool does not end waiting on one
+    big file; without sizes the scan order is kept.
+    """
+    if entries and all(size is not None for _, size, _ in entries):
+        entries = sorted(entries, key=lambda entry: entry[1], reverse=True)
+    return [path for path, _, _ in entries]
@@ -68,9 +68,170 @@ echo ""
 echo "Step 2: Importing CSV data..."
 echo "=================================================="
 
+LOAD_DIR="$SCRIPT_DIR/$CSV_DIR"
+
+# Loads one part with its LOAD DATA script (see xml_load_manifest.py plan) and records
+# it in $LOADED_FILE; compressed parts are fed through the named pipe <script>.fifo
+load_part() {
+    local part="$1" script="$2" decompress_pid=""
+    case "$part" in
+        *.gz)
+            mkfifo "$script.fifo"
+            gzip -dc "$PART_DIR/$part" > "$script.fifo" &
+            decompress_pid=$! ;;
+        *.zst)
+            mkfifo "$script.fifo"
+            zstd -dcq "$PART_DIR/$part" > "$script.fifo" &
+            decompress_pid=$! ;;
+    esac
+    if $MYSQL_CMD -h "$DB_HOST" -u "$DB_USER" ${DB_PASSWORD:+-p"$DB_PASSWORD"} --local-infile=1 < "$script"; then
+        echo "$part" >> "$LOADED_FILE"
+        echo "✓ $part"
+    else
+        [ -n "$decompress_pid" ] && kill "$decompress_pid" 2> /dev/null
+        echo "✗ $part"
+        return 1
+    fi
+}
+export -f load_part
+export MYSQL_CMD DB_HOST DB_USER DB_PASSWORD
+
+# Loads the parts of a load plan (lines "<part>\t<script>"), IMPORT_JOBS at a time
+load_plan() {
+    export PART_DIR="$1" LOADED_FILE="$2"
+    tr '\t' '\n' < "$3" | xargs -d '\n' -n 2 -P "$IMPORT_JOBS" bash -c 'load_part "$1" "$2"' _
+}
+
+# Import batches (xml_proc_main.py --import-batch): every run with its own batch directory
+# in $CSV_DIR/batches/. Only the complete batches not applied yet are imported, in order:
+# first the deletes of the batch's tombstoned UIDs, then its parts. Applied batches are
+# recorded in $CSV_DIR/import_state.json; a failed batch is resumed with the parts it
+# has not loaded yet. IMPORT_BATCHES=0 imports the top-level tables instead.
+if [ -d "$CSV_DIR/batches" ] && [ "${IMPORT_BATCHES:-1}" != "0" ]; then
+    IMPORT_JOBS="${IMPORT_JOBS:-4}"
+    PLAN_DIR=$(mktemp -d)
+    trap 'rm -rf "$PLAN_DIR"' EXIT
+    python3 xml_import_batches.py pending "$CSV_DIR" > "$PLAN_DIR/pending.txt"
+    echo "Importing $(wc -l < "$PLAN_DIR/pending.txt") pending batches with $IMPORT_JOBS parallel jobs..."
+
+    while read -r batch_id; do
+        BATCH_DIR="$SCRIPT_DIR/$CSV_DIR/batches/$batch_id"
+        BATCH_LOADED="$BATCH_DIR/loaded_parts.txt"
+        echo ""
+        echo "Batch $batch_id"
+        if [ -d "$BATCH_DIR/tombstones" ] && ! grep -qx "tombstones" "$BATCH_LOADED" 2> /dev/null; then
+            python3 xml_import_batches.py tombstone-sql "$BATCH_DIR" > "$PLAN_DIR/$batch_id-tombstones.sql"
+            if ! $MYSQL_CMD -h "$DB_HOST" -u "$DB_USER" ${DB_PASSWORD:+-p"$DB_PASSWORD"} --local-infile=1 \
+                    < "$PLAN_DIR/$batch_id-tombstones.sql"; then
+                echo "✗ Deleting the tombstoned UIDs of batch $batch_id failed"
+                exit 1
+            fi
+            # Deleted once: a resumed batch must not delete the rows it already loaded
+            echo "tombstones" >> "$BATCH_LOADED"
+            echo "✓ tombstones"
+        fi
+        python3 xml_load_manifest.py plan "$BATCH_DIR" "$PLAN_DIR/$batch_id" --loaded "$BATCH_LOADED" \
+            > "$PLAN_DIR/$batch_id.tsv"
+        if ! load_plan "$BATCH_DIR" "$BATCH_LOADED" "$PLAN_DIR/$batch_id.tsv"; then
+            echo ""
+            echo "✗ Batch $batch_id failed; run this script again to resume it"
+            exit 1
+        fi
+        # Incremental citation counts (xml_cite_counts.py init): the batch's changed
+        # citation_merge, cite_count and cite_count_year rows, upserted once
+        if [ -f "$CSV_DIR/cite_count_state.sqlite" ] && ! grep -qx "cite_counts" "$BATCH_LOADED" 2> /dev/null; then
+            python3 xml_cite_counts.py apply-batch "$BATCH_DIR" --state "$CSV_DIR/cite_count_state.sqlite"
+            python3 xml_cite_counts.py upsert-sql "$BATCH_DIR" > "$PLAN_DIR/$batch_id-cite-counts.sql"
+            if ! $MYSQL_CMD -h "$DB_HOST" -u "$DB_USER" ${DB_PASSWORD:+-p"$DB_PASSWORD"} --local-infile=1 \
+                    < "$PLAN_DIR/$batch_id-cite-counts.sql"; then
+                echo "✗ Updating the citation counts of batch $batch_id failed"
+                exit 1
+            fi
+            echo "cite_counts" >> "$BATCH_LOADED"
+            echo "✓ cite_counts"
+        fi
+        python3 xml_import_batches.py applied "$CSV_DIR" "$batch_id"
+        echo "✓ Batch $batch_id applied"
+    done < "$PLAN_DIR/pending.txt"
+    echo ""
+    echo "✓ All batches imported"
+    exit 0
+fi
+
+# Size-capped part files (xml_proc_main.py --max-part-mb / --max-part-rows) are listed
+# in load_manifest.json: every part is checked against its checksum and loaded by its
+# own LOAD DATA, IMPORT_JOBS at a time. Loaded parts are recorded in loaded_parts.txt,
+# so running the script again retries only the parts that failed.
+if [ -f "$CSV_DIR/load_manifest.json" ]; then
+    IMPORT_JOBS="${IMPORT_JOBS:-4}"
+    LOADED_FILE="$SCRIPT_DIR/$CSV_DIR/loaded_parts.txt"
+    PLAN_DIR=$(mktemp -d)
+    trap 'rm -rf "$PLAN_DIR"' EXIT
+    python3 xml_load_manifest.py plan "$CSV_DIR" "$PLAN_DIR" --loaded "$LOADED_FILE" > "$PLAN_DIR/plan.tsv"
+    echo "Loading $(wc -l < "$PLAN_DIR/plan.tsv") parts from load_manifest.json with $IMPORT_JOBS parallel jobs..."
+
+    exit_code=0
+    load_plan "$SCRIPT_DIR/$CSV_DIR" "$LOADED_FILE" "$PLAN_DIR/plan.tsv" || exit_code=$?
+    if [ $exit_code -eq 0 ]; then
+        echo ""
+        echo "✓ All parts loaded"
+        exit 0
+    fi
+    echo ""
+    echo "✗ Some parts failed to load; run this script again to retry only the failed parts"
+    exit $exit_code
+fi
+
+# Dimension-encoded output (xml_proc_main.py --dimensions) loads the dim_* tables
+# and the *_id columns of the encoded tables (see import_dimension_data.sql)
+IMPORT_SQL="import_csv_data.sql"
+if compgen -G "$CSV_DIR/dim_*.csv" > /dev/null; then
+    echo "Dimension tables found, loading dimension-encoded tables..."
+    IMPORT_SQL=$(mktemp)
+    python3 xml_dimensions.py import-sql > "$IMPORT_SQL"
+fi
+
+# Compressed CSV files (xml_proc_main.py --compress) are decompressed on the fly:
+# every table gets a named pipe fed by gzip/zstd, and LOAD DATA reads from the pipe
+if compgen -G "$CSV_DIR/*.csv.gz" > /dev/null || compgen -G "$CSV_DIR/*.csv.zst" > /dev/null; then
+    echo "Compressed CSV files found, streaming them through named pipes..."
+    FIFO_DIR=$(mktemp -d)
+    trap 'kill $(jobs -p) 2> /dev/null; rm -rf "$FIFO_DIR"' EXIT
+    for csv_name in $(grep -o "'xml_output/[A-Za-z_]*\.csv'" "$IMPORT_SQL" | tr -d "'" | sed 's|xml_output/||'); do
+        if [ -f "$CSV_DIR/$csv_name.gz" ]; then
+            mkfifo "$FIFO_DIR/$csv_name"
+            gzip -dc "$CSV_DIR/$csv_name.gz" > "$FIFO_DIR/$csv_name" &
+        elif [ -f "$CSV_DIR/$csv_name.zst" ]; then
+            if ! command -v zstd &> /dev/null; then
+                echo "✗ Error: $csv_name.zst needs the 'zstd' command"
+                exit 1
+            fi
+            mkfifo "$FIFO_DIR/$csv_name"
+            zstd -dcq "$CSV_DIR/$csv_name.zst" > "$FIFO_DIR/$csv_name" &
+        else
+            ln -s "$SCRIPT_DIR/$CSV_DIR/$csv_name" "$FIFO_DIR/$csv_name"
+        fi
+    done
+    LOAD_DIR="$FIFO_DIR"
+fi
+
 # Create a temporary SQL file with updated CSV paths
 TMP_SQL=$(mktemp)
-sed "s|'xml_output/|'$SCRIPT_DIR/$CSV_DIR/|g" import_csv_data.sql > "$TMP_SQL"
+sed "s|'xml_output/|'$LOAD_DIR/|g" "$IMPORT_SQL" > "$TMP_SQL"
+
+# Derived tables computed by xml_derived_tables.py replace the
+# CREATE TABLE AS SELECT statements of modify_database.sql
+if [ -f "$CSV_DIR/derived/cite_count.csv" ]; then
+    echo "Derived tables found, loading them after the main tables..."
+    sed "s|'xml_output/derived/|'$SCRIPT_DIR/$CSV_DIR/derived/|g" import_derived_tables.sql >> "$TMP_SQL"
+fi
+# Tables of the analysis tools (xml_highly_cited.py, xml_reference_resolver.py)
+# come with their own load scripts
+for derived_sql in "$CSV_DIR"/derived/*.sql; do
+    if [ -f "$derived_sql" ]; then
+        sed "s|'xml_output/derived/|'$SCRIPT_DIR/$CSV_DIR/derived/|g" "$derived_sql" >> "$TMP_SQL"
+    fi
+done
 
 if [ -n "$DB_PASSWORD" ]; then
     $MYSQL_CMD -h "$DB_HOST" -u "$DB_USER" -p"$DB_PASSWORD" --local-infile=1 < "$TMP_SQL"
@@ -80,6 +241,9 @@ fi
 
 exit_code=$?
 rm -f "$TMP_SQL"
+if [ "$IMPORT_SQL" != "import_csv_data.sql" ]; then
+    rm -f "$IMPORT_SQL"
+fi
 
 if [ $exit_code -eq 0 ]; then
     echo ""
@@ -0,0 +1,145 @@
+-- =============================================================================
+-- WOS XML Parser - Derived Table Import Statements
+-- =============================================================================
+-- Loads the tables computed by `python xml_derived_tables.py` into
+-- xml_output/derived/ in place of the CREATE TABLE AS SELECT statements of
+-- modify_database.sql. The tables are recomputed from the whole output on
+-- every run, so they are dropped and loaded again.
+--
+-- import_csv_to_mysql.sh runs this file after the main import when
+-- xml_output/derived/ exists. The thomson statements and the analysis tables
+-- of modify_database.sql still run in the database.
+--
+-- The unique keys of cite_count and cite_count_year are the keys of the
+-- upserts of incremental citation counts (xml_cite_counts.py upsert-sql).
+-- =============================================================================
+
+USE wos_xml;
+
+SET SESSION SQL_MODE = '';
+
+DROP TABLE IF EXISTS citations, citation_merge, cite_count, item_max_pubyear, item_doi, item_rp_cntry,
+    cite_count_year;
+
+CREATE TABLE citations (
+    uid VARCHAR(50),
+    cited_uid VARCHAR(50),
+    INDEX idx_citations_cited_uid (cited_uid),
+    INDEX idx_citations_uid (uid),
+    INDEX idx_citations_uid_cited_uid (uid, cited_uid)
+);
+
+CREATE TABLE citation_merge (
+    uid VARCHAR(50),
+    cited_uid VARCHAR(50),
+    INDEX idx_uid (uid),
+    INDEX idx_cited_uid (cited_uid),
+    UNIQUE INDEX idx_uid_cited_uid (uid, cited_uid)
+);
+
+CREATE TABLE cite_count (
+    cited_uid VARCHAR(50),
+    citation_count INT,
+    UNIQUE INDEX idx_cite_count_cited_uid (cited_uid)
+);
+
+CREATE TABLE item_max_pubyear (
+    uid VARCHAR(50),
+    max_pubyear SMALLINT,
+    UNIQUE INDEX idx_uid (uid),
+    INDEX idx_max_pubyear (max_pubyear)
+);
+
+CREATE TABLE item_doi (
+    uid VARCHAR(50),
+    doi VARCHAR(255),
+    INDEX idx_uid (uid),
+    INDEX idx_doi (doi)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE item_rp_cntry (
+    uid VARCHAR(50),
+    country VARCHAR(255),
+    INDEX idx_uid (uid),
+    INDEX idx_country (country),
+    UNIQUE INDEX idx_uid_country (uid, country)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE cite_count_year (
+    cited_uid VARCHAR(50),
+    citing_year SMALLINT,
+    citation_count INT,
+    UNIQUE INDEX idx_cite_count_year_cited_uid (cited_uid, citing_year)
+);
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/citations.csv'
+INTO TABLE citations
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, cited_uid);
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/citation_merge.csv'
+IGNORE INTO TABLE citation_merge
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, cited_uid);
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/cite_count.csv'
+INTO TABLE cite_count
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(cited_uid, citation_count);
+
+-- Items without a pubyear have an empty max_pubyear
+LOAD DATA LOCAL INFILE 'xml_output/derived/item_max_pubyear.csv'
+IGNORE INTO TABLE item_max_pubyear
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @max_pubyear)
+SET max_pubyear = NULLIF(@max_pubyear, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/item_doi.csv'
+INTO TABLE item_doi
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, doi);
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/item_rp_cntry.csv'
+IGNORE INTO TABLE item_rp_cntry
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, country);
+
+LOAD DATA LOCAL INFILE 'xml_output/derived/cite_count_year.csv'
+INTO TABLE cite_count_year
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(cited_uid, citing_year, citation_count);
@@ -0,0 +1,178 @@
+-- =============================================================================
+-- WOS XML Parser - Dimension-Encoded CSV Import Statements
+-- =============================================================================
+-- Output written with xml_proc_main.py --dimensions stores organizations,
+-- subjects, source titles, grant agencies and document types once in the
+-- dim_* tables; the fact tables below carry their ids (*_id columns) in
+-- place of the text.
+--
+-- This file is not run on its own: import_csv_to_mysql.sh builds the import
+-- script with `python xml_dimensions.py import-sql`, which loads the dim_*
+-- tables first and uses the statements below in place of the ones for the
+-- same tables in import_csv_data.sql.
+--
+-- Example query on the encoded tables:
+--   SELECT d.organization, COUNT(DISTINCT o.uid) AS paper_count
+--   FROM item_orgs o JOIN dim_org d ON d.id = o.organization_id
+--   GROUP BY o.organization_id ORDER BY paper_count DESC LIMIT 10;
+-- =============================================================================
+
+USE wos_xml;
+
+SET FOREIGN_KEY_CHECKS = 0;
+
+SET SESSION SQL_MODE = '';
+
+-- =============================================================================
+-- Dimension tables
+-- =============================================================================
+
+LOAD DATA LOCAL INFILE 'xml_output/dim_org.csv'
+IGNORE INTO TABLE dim_org
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(id, organization);
+
+LOAD DATA LOCAL INFILE 'xml_output/dim_subject.csv'
+IGNORE INTO TABLE dim_subject
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(id, subject);
+
+LOAD DATA LOCAL INFILE 'xml_output/dim_source.csv'
+IGNORE INTO TABLE dim_source
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(id, source);
+
+LOAD DATA LOCAL INFILE 'xml_output/dim_grant_agency.csv'
+IGNORE INTO TABLE dim_grant_agency
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(id, grant_agency);
+
+LOAD DATA LOCAL INFILE 'xml_output/dim_doctype.csv'
+IGNORE INTO TABLE dim_doctype
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(id, doctype);
+
+-- =============================================================================
+-- Encoded fact tables
+-- =============================================================================
+
+LOAD DATA LOCAL INFILE 'xml_output/item_doc_types.csv'
+INTO TABLE item_doc_types
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @doctype_id)
+SET doctype_id = NULLIF(@doctype_id, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_doc_types_norm.csv'
+INTO TABLE item_doc_types_norm
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @doctype_norm_id)
+SET doctype_norm_id = NULLIF(@doctype_norm_id, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_source.csv'
+INTO TABLE item_source
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @source_id, @source_abbrev, @abbrev_iso, @abbrev_11, @abbrev_29, @series, @book_subtitle)
+SET
+    source_id = NULLIF(@source_id, ''),
+    source_abbrev = NULLIF(@source_abbrev, ''),
+    abbrev_iso = NULLIF(@abbrev_iso, ''),
+    abbrev_11 = NULLIF(@abbrev_11, ''),
+    abbrev_29 = NULLIF(@abbrev_29, ''),
+    series = NULLIF(@series, ''),
+    book_subtitle = NULLIF(@book_subtitle, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_orgs.csv'
+INTO TABLE item_orgs
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @addr_no, @org_pref, @ROR_ID, @org_id, @organization_id)
+SET
+    addr_no = NULLIF(@addr_no, ''),
+    org_pref = NULLIF(@org_pref, ''),
+    ROR_ID = NULLIF(@ROR_ID, ''),
+    org_id = NULLIF(@org_id, ''),
+    organization_id = NULLIF(@organization_id, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_rp_orgs.csv'
+INTO TABLE item_rp_orgs
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @addr_no, @org_pref, @ROR_ID, @org_id, @organization_id)
+SET
+    addr_no = NULLIF(@addr_no, ''),
+    org_pref = NULLIF(@org_pref, ''),
+    ROR_ID = NULLIF(@ROR_ID, ''),
+    org_id = NULLIF(@org_id, ''),
+    organization_id = NULLIF(@organization_id, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_subjects.csv'
+INTO TABLE item_subjects
+FIELDS TERMINATED BY ',' 
+OPTIONALLY ENCLOSED BY '"'
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @subject_id, @ascatype)
+SET
+    subject_id = NULLIF(@subject_id, ''),
+    ascatype = NULLIF(@ascatype, '');
+
+LOAD DATA LOCAL INFILE 'xml_output/item_grants.csv'
+INTO TABLE item_grants
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ','
+ENCLOSED BY '"'
+ESCAPED BY ''
+LINES TERMINATED BY '\r\n'
+IGNORE 1 LINES
+(uid, @grant_agency_id, @grant_agency_pref, @grant_id, @grant_source)
+SET
+    grant_agency_id = NULLIF(@grant_agency_id, ''),
+    grant_agency_pref = NULLIF(@grant_agency_pref, ''),
+    grant_id = NULLIF(@grant_id, ''),
+    grant_source = NULLIF(@grant_source, '');
+
+SET FOREIGN_KEY_CHECKS = 1;
@@ -1,3 +1,11 @@
+-- The tables citations, citation_merge (without the thomson.cite_to_cite
+-- rows), cite_count, item_max_pubyear (without the thomson years), item_doi,
+-- item_rp_cntry and cite_count_year can be computed from the CSV output with
+-- `python xml_derived_tables.py` and loaded with import_derived_tables.sql
+-- instead of the statements below. `python xml_citation_merge.py --edges
+-- cite_to_cite.tsv --years thomson_pubyear.tsv` then merges the exported
+-- thomson edges and years into them, replacing the INSERT IGNORE below.
+
 CREATE TABLE citations AS SELECT uid, cited_uid FROM item_references WHERE cited_uid LIKE 'WOS:%';
 
 CREATE INDEX idx_citations_cited_uid ON citations(cited_uid); 
@@ -90,6 +98,9 @@ WHERE country IS NOT NULL AND country IS NOT NULL AND country != '';
 
 
 -- calculate highly cited papers
+-- `python xml_highly_cited.py` computes this table (top1/top5 with their
+-- thresholds, PERCENTILE_CONT per pubyear and traditional subject) from the
+-- derived tables and writes derived/articles.sql to load it.
 
 CREATE TABLE articles AS select distinct (a.uid), b.max_pubyear AS pubyear from item_doc_types_norm a join item_max_pubyear b on a.uid = b.uid where doctype_norm = 'Article';
 CREATE INDEX idx_uid ON articles(uid);
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the positional CSV writers
+"""
+
+import unittest
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+import zlib
+
+from csv_writer import CSVWriter, XMLDataWriter, wait_for_compressed_writes, zstandard
+from xml_record_batch import RecordBatchCallback
+from xml_parser import XMLRecordParser
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+
+
+class TestPositionalWriter(unittest.TestCase):
+    """Positional output must match csv.DictWriter byte for byte"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        xml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', '1985.xml')
+        root = ET.parse(xml_path).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _dict_writer_output(self, table_name, path):
+        """Reference output written with csv.DictWriter"""
+        columns = list(XML_TABLE_COLUMNS[table_name])
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            for parser in self.parsers:
+                if table_name == 'uid':
+                    rows = [{'uid': parser.uid}]
+                else:
+                    rows = getattr(parser, f'extract_{table_name}')() or []
+                    if isinstance(rows, dict):
+                        rows = [rows]
+                writer.writerows(rows)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_data_writer_matches_dict_writer(self):
+        """XMLDataWriter output is byte-identical to DictWriter for every table"""
+        output_dir = os.path.join(self.test_dir, 'out')
+        for parser in self.parsers:
+            XMLDataWriter(output_dir).write_record_data(parser)
+
+        for table_name in XML_TABLE_COLUMNS:
+            expected = self._dict_writer_output(table_name, os.path.join(self.test_dir, 'ref.csv'))
+            with open(os.path.join(output_dir, table_name + '.csv'), 'rb') as f:
+                self.assertEqual(f.read(), expected, f"{table_name}.csv differs")
+
+    def test_reference_tuples_match_dicts(self):
+        """Native item_references tuples follow the schema column order"""
+        columns = XML_TABLE_COLUMNS['item_references']
+        for parser in self.parsers:
+            rows = parser.extract_item_references() or []
+            self.assertEqual([tuple(row[c] for c in columns) for row in rows],
+                             parser.extract_item_references_tuples())
+
+    def test_missing_keys_written_empty(self):
+        """Dict rows with missing keys are written like DictWriter's restval"""
+        path = os.path.join(self.test_dir, 'partial.csv')
+        writer = CSVWriter(path, ['uid', 'title'])
+        writer.write_rows([{'uid': 'WOS:1', 'title': 'a, "b"'}, {'uid': 'WOS:2'}])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'uid,title\r\nWOS:1,"a, ""b"""\r\nWOS:2,\r\n')
+
+    def test_unknown_keys_rejected(self):
+        """Dict rows with keys outside the headers raise like DictWriter's extrasaction='raise'"""
+        path = os.path.join(self.test_dir, 'extra.csv')
+        writer = CSVWriter(path, ['uid', 'title'])
+        for rows in ([{'uid': 'WOS:1', 'title': 'a', 'titel': 'b'}], [{'uid': 'WOS:1', 'titel': 'b'}]):
+            with self.assertRaises(ValueError) as context:
+                writer.write_rows(rows)
+            self.assertIn("'titel'", str(context.exception))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'uid,title\r\n')
+
+
+
+class TestCompressedWriter(unittest.TestCase):
+    """Compressed CSV files decompress to the uncompressed output"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _write_both(self, compression):
+        """Write the example records uncompressed and compressed in batches of 30"""
+        xml_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', '1985.xml')
+        parsers = [XMLRecordParser(record)
+                   for record in ET.parse(xml_path).getroot().findall('.//ns:REC', WOS_NAMESPACE)]
+        plain_dir = os.path.join(self.test_dir, 'plain')
+        compressed_dir = os.path.join(self.test_dir, compression)
+        plain = RecordBatchCallback(plain_dir, batch_size=30)
+        compressed = RecordBatchCallback(compressed_dir, batch_size=30,
+                                         sink_class=lambda output_dir: XMLDataWriter(output_dir, compression))
+        for parser in parsers:
+            plain(parser)
+            self.assertFalse(compressed(parser), "compressed rows must only count as written after flush")
+        plain.flush()
+        compressed.flush()
+        return plain_dir, compressed_dir
+
+    def test_gzip_round_trip(self):
+        """Concatenated gzip members decompress to the same bytes"""
+        plain_dir, gzip_dir = self._write_both('gzip')
+        for table_name in XML_TABLE_COLUMNS:
+            with open(os.path.join(plain_dir, table_name + '.csv'), 'rb') as f:
+                expected = f.read()
+            with gzip.open(os.path.join(gzip_dir, table_name + '.csv.gz'), 'rb') as f:
+                self.assertEqual(f.read(), expected, table_name)
+
+    def test_one_member_per_commit(self):
+        """The batches of one input file are compressed as one gzip member after the header"""
+        _, gzip_dir = self._write_both('gzip')
+        with open(os.path.join(gzip_dir, 'item_references.csv.gz'), 'rb') as f:
+            data = f.read()
+        members = 0
+        while data:
+            decompressor = zlib.decompressobj(wbits=31)
+            decompressor.decompress(data)
+            data = decompressor.unused_data
+            members += 1
+        self.assertEqual(members, 2)
+
+    def test_discarded_rows_are_not_written(self):
+        """Compressed rows of a failed input file are dropped, rows of the next file are written"""
+        writer = XMLDataWriter(self.test_dir, 'gzip')
+        writer.writers['item_keywords'].write_tuples([('WOS:1', 'failed')])
+        writer.discard()
+        writer = XMLDataWriter(self.test_dir, 'gzip')
+        writer.writers['item_keywords'].write_tuples([('WOS:2', 'kept')])
+        writer.close()
+        with gzip.open(os.path.join(self.test_dir, 'item_keywords.csv.gz'), 'rb') as f:
+            self.assertEqual(f.read().splitlines()[1:], [b'WOS:2,kept'])
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        """Concatenated zstd frames decompress to the same bytes"""
+        plain_dir, zstd_dir = self._write_both('zstd')
+        with open(os.path.join(plain_dir, 'item_references.csv'), 'rb') as f:
+            expected = f.read()
+        with open(os.path.join(zstd_dir, 'item_references.csv.zst'), 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            self.assertEqual(reader.read(), expected)
+
+    def test_append_to_existing_file(self):
+        """A second writer appends to a compressed file without repeating the header"""
+        path = os.path.join(self.test_dir, 'append.csv')
+        for uid in ('WOS:1', 'WOS:2'):
+            CSVWriter(path, ['uid'], compression='gzip').write_tuples([(uid,)])
+            wait_for_compressed_writes()
+        with gzip.open(path + '.gz', 'rb') as f:
+            self.assertEqual(f.read(), b'uid\r\nWOS:1\r\nWOS:2\r\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the CSR citation graph
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+from xml_citation_graph import CitationGraph, build_citation_graph, np
+from xml_derived_tables import is_wos_citation, table_rows
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_test_helpers import EXAMPLE_XML
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestCitationGraph(unittest.TestCase):
+    """Test cases for build_citation_graph and CitationGraph"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        # Loaded twice: every edge is duplicated
+        for history_name in ('first.json', 'second.json'):
+            history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, history_name))
+            load_xml_file(EXAMPLE_XML, make_record_callback(self.output_dir), False, history_manager)
+        self.edges = set((uid, cited_uid) for uid, cited_uid in
+                         table_rows(self.output_dir, 'item_references', ('uid', 'cited_uid'))
+                         if is_wos_citation(cited_uid))
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def test_graph_matches_distinct_citations(self):
+        """Forward and reverse rows hold the distinct citations, sorted, whatever the chunk size"""
+        self.assertGreater(len(self.edges), 0)
+        for chunk_edges in (7, 100000):
+            graph_dir = os.path.join(self.test_dir, f'graph-{chunk_edges}')
+            meta = build_citation_graph(self.output_dir, graph_dir, chunk_edges=chunk_edges)
+            self.assertEqual(meta['edges'], len(self.edges))
+            self.assertEqual(meta['duplicate_edges'], len(self.edges))
+            graph = CitationGraph(graph_dir)
+            self.assertEqual(graph.node_count, len({uid for edge in self.edges for uid in edge}))
+
+            forward, reverse = set(), set()
+            for node_id in range(graph.node_count):
+                cited, citing = list(graph.cited(node_id)), list(graph.citing(node_id))
+                self.assertEqual(cited, sorted(set(cited)))
+                self.assertEqual(citing, sorted(set(citing)))
+                forward.update((graph.uid(node_id), graph.uid(target)) for target in cited)
+                reverse.update((graph.uid(source), graph.uid(node_id)) for source in citing)
+            self.assertEqual(forward, self.edges)
+            self.assertEqual(reverse, self.edges)
+
+    def test_degrees(self):
+        """In-degree is the citation count and out-degree the reference count of a UID"""
+        graph_dir = os.path.join(self.test_dir, 'graph')
+        build_citation_graph(self.output_dir, graph_dir, chunk_edges=5)
+        graph = CitationGraph(graph_dir)
+        cite_counts = Counter(cited_uid for _, cited_uid in self.edges)
+        reference_counts = Counter(uid for uid, _ in self.edges)
+        for uid in set(cite_counts) | set(reference_counts):
+            node_id = graph.node_id(uid)
+            self.assertEqual(graph.in_degree(node_id), cite_counts[uid])
+            self.assertEqual(graph.out_degree(node_id), reference_counts[uid])
+        self.assertEqual(int(graph.in_degrees().sum()), len(self.edges))
+        self.assertIsNone(graph.node_id('WOS:NOT-IN-GRAPH'))
+
+    def test_empty_output(self):
+        """An output without WOS citations gives an empty graph"""
+        empty_dir = os.path.join(self.test_dir, 'empty')
+        os.makedirs(empty_dir)
+        meta = build_citation_graph(empty_dir)
+        self.assertEqual((meta['nodes'], meta['edges']), (0, 0))
+        self.assertEqual(CitationGraph(os.path.join(empty_dir, 'citation_graph')).edge_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
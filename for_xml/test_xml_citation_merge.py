@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the external citation edge merge
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+from csv_writer import CSV_DIALECT
+from xml_citation_merge import merge_citations, normalize_uid, np
+from xml_derived_tables import build_derived_tables
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_test_helpers import EXAMPLE_XML
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestCitationMerge(unittest.TestCase):
+    """Test cases for merge_citations"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        self.derived_dir = os.path.join(self.output_dir, 'derived')
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        load_xml_file(EXAMPLE_XML, make_record_callback(self.output_dir), False, history_manager)
+        build_derived_tables(self.output_dir)
+        self.derived = {table_name: self._read(table_name)
+                        for table_name in ('citation_merge', 'cite_count', 'cite_count_year', 'item_max_pubyear')}
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, table_name):
+        with open(os.path.join(self.derived_dir, table_name + '.csv'), 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            next(reader)
+            return [tuple(row) for row in reader]
+
+    def test_without_external_edges_matches_derived_tables(self):
+        """Merging nothing reproduces the derived citation tables, in the same order"""
+        counts = merge_citations(self.output_dir, chunk_edges=7)
+        self.assertEqual(counts['citation_merge'], len(self.derived['citation_merge']))
+        for table_name in ('citation_merge', 'cite_count', 'cite_count_year'):
+            self.assertEqual(self._read(table_name), self.derived[table_name], table_name)
+
+    def test_external_edges_and_years(self):
+        """External UT pairs are normalized, deduplicated against the parsed edges and counted per year"""
+        parsed = self.derived['citation_merge']
+        uid, cited_uid = parsed[0]
+        edges_path = os.path.join(self.test_dir, 'cite_to_cite.tsv')
+        external = [(uid[4:], cited_uid[4:]),                  # a parsed edge without prefix
+                    ('A1900OLD0000001', cited_uid[4:]),         # an old paper with an external year
+                    ('A1900OLD0000001', cited_uid[4:]),
+                    ('A1900OLD0000002', 'WOS:A1900OLD0000001')]  # no year anywhere
+        with open(edges_path, 'w', encoding='utf-8') as f:
+            f.write("ut\tutcited\n")
+            f.writelines(f"{citing}\t{cited}\n" for citing, cited in external)
+        years_path = os.path.join(self.test_dir, 'years.csv')
+        with open(years_path, 'w', encoding='utf-8') as f:
+            f.write(f"A1900OLD0000001,1899\nA1900OLD0000001,1900\n{uid[4:]},1700\n")
+
+        counts = merge_citations(self.output_dir, [edges_path], [years_path], chunk_edges=3)
+        expected = sorted(set(parsed) | {('WOS:A1900OLD0000001', cited_uid),
+                                         ('WOS:A1900OLD0000002', 'WOS:A1900OLD0000001')})
+        self.assertEqual(self._read('citation_merge'), expected)
+        self.assertEqual(counts['duplicate_edges'], 2)
+
+        cite_counts = Counter(cited for _, cited in expected)
+        self.assertEqual(self._read('cite_count'), sorted((cited, str(count)) for cited, count in cite_counts.items()))
+        years = dict(self._read('item_max_pubyear'))
+        # Parsed years win over external ones
+        self.assertEqual(years[uid], '1985')
+        self.assertEqual(years['WOS:A1900OLD0000001'], '1900')
+        year_counts = Counter((cited, years[citing]) for citing, cited in expected if years.get(citing))
+        self.assertEqual(self._read('cite_count_year'),
+                         sorted((cited, year, str(count)) for (cited, year), count in year_counts.items()))
+
+    def test_normalize_uid(self):
+        """UTs get the WOS: prefix once"""
+        self.assertEqual(normalize_uid(' A1985ASN8900007 '), 'WOS:A1985ASN8900007')
+        self.assertEqual(normalize_uid('WOS:A1985ASN8900007'), 'WOS:A1985ASN8900007')
+        self.assertIsNone(normalize_uid(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the incremental citation counts
+"""
+
+import unittest
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import Counter
+
+from csv_writer import CSV_DIALECT
+from xml_cite_counts import (CITE_COUNT_CHANGES_DIR_NAME, apply_batch, apply_pending_batches, init_state,
+                             state_path_of, upsert_sql)
+from xml_derived_tables import build_derived_tables
+from xml_import_batches import BATCH_MANIFEST_FILE, batch_tombstone_dir, new_batch_dir
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_test_helpers import EXAMPLE_XML, write_csv
+
+
+def _read_csv(file_path):
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, dialect=CSV_DIALECT)
+        next(reader)
+        return [tuple(row) for row in reader]
+
+
+def _counts(edges, years):
+    """cite_count and cite_count_year computed from scratch"""
+    cite_count = Counter(cited_uid for _, cited_uid in edges)
+    cite_count_year = Counter((cited_uid, years[uid]) for uid, cited_uid in edges if years.get(uid))
+    return cite_count, cite_count_year
+
+
+class TestCiteCounts(unittest.TestCase):
+    """Test cases for the citation count state and its batch updates"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        load_xml_file(EXAMPLE_XML, make_record_callback(self.output_dir), False, history_manager)
+        build_derived_tables(self.output_dir)
+        self.edges = set(_read_csv(os.path.join(self.output_dir, 'derived', 'citation_merge.csv')))
+        self.years = {uid: int(year) for uid, year in
+                      _read_csv(os.path.join(self.output_dir, 'derived', 'item_max_pubyear.csv')) if year}
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _state(self):
+        connection = sqlite3.connect(state_path_of(self.output_dir))
+        try:
+            cite_count = Counter(dict(connection.execute("SELECT cited_uid, citation_count FROM cite_count")))
+            cite_count_year = Counter({(cited_uid, year): count for cited_uid, year, count in
+                                       connection.execute("SELECT * FROM cite_count_year")})
+            return cite_count, cite_count_year
+        finally:
+            connection.close()
+
+    def _write_batch(self, items, references, tombstones):
+        batch_dir = new_batch_dir(self.output_dir)
+        write_csv(os.path.join(batch_dir, 'item.csv'), ('uid', 'pubyear'), items)
+        write_csv(os.path.join(batch_dir, 'item_references.csv'), ('uid', 'occurence_order', 'cited_uid'),
+                  [(uid, order, cited_uid) for order, (uid, cited_uid) in enumerate(references)])
+        write_csv(os.path.join(batch_tombstone_dir(batch_dir), 'uid.csv'), ('uid',), [(uid,) for uid in tombstones])
+        with open(os.path.join(batch_dir, BATCH_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({}, f)
+        return batch_dir
+
+    def test_init_matches_derived_tables(self):
+        """The seeded counts equal the derived cite_count and cite_count_year"""
+        self.assertEqual(init_state(self.output_dir), len(self.edges))
+        self.assertEqual(self._state(), _counts(self.edges, self.years))
+        with self.assertRaises(FileExistsError):
+            init_state(self.output_dir)
+
+    def test_batch_updates_counts_and_writes_changes(self):
+        """A batch replacing one paper and adding another changes only the affected counts"""
+        init_state(self.output_dir)
+        before = _counts(self.edges, self.years)
+        changed_uid = sorted({uid for uid, _ in self.edges})[0]
+        old_cited = sorted(cited_uid for uid, cited_uid in self.edges if uid == changed_uid)
+        kept_cited = old_cited[1:]
+        other_cited = sorted(cited_uid for _, cited_uid in self.edges)[-1]
+        references = ([(changed_uid, cited_uid) for cited_uid in kept_cited]
+                      + [(changed_uid, 'WOS:NEWCITED'), (changed_uid, 'WOS:NEWCITED'), (changed_uid, 'WOS:REF.1')]
+                      + [('WOS:NEWPAPER', other_cited)])
+        batch_dir = self._write_batch([(changed_uid, '1986'), ('WOS:NEWPAPER', '1986')], references, [changed_uid])
+
+        summary = apply_batch(batch_dir)
+        edges = (self.edges - {(changed_uid, cited_uid) for cited_uid in old_cited}
+                 | {(changed_uid, cited_uid) for cited_uid in kept_cited}
+                 | {(changed_uid, 'WOS:NEWCITED'), ('WOS:NEWPAPER', other_cited)})
+        years = dict(self.years, **{changed_uid: 1986, 'WOS:NEWPAPER': 1986})
+        after = _counts(edges, years)
+        self.assertEqual(self._state(), after)
+        self.assertEqual(summary['citation_merge_added'], 2)
+        self.assertEqual(summary['citation_merge_removed'], 1)
+
+        changes_dir = os.path.join(batch_dir, CITE_COUNT_CHANGES_DIR_NAME)
+        expected_counts = sorted((cited_uid, str(after[0][cited_uid])) for cited_uid in set(before[0]) | set(after[0])
+                                 if before[0][cited_uid] != after[0][cited_uid])
+        self.assertEqual(_read_csv(os.path.join(changes_dir, 'cite_count.csv')), expected_counts)
+        expected_year_counts = sorted((cited_uid, str(year), str(after[1][(cited_uid, year)]))
+                                      for cited_uid, year in set(before[1]) | set(after[1])
+                                      if before[1][(cited_uid, year)] != after[1][(cited_uid, year)])
+        self.assertEqual(_read_csv(os.path.join(changes_dir, 'cite_count_year.csv')), expected_year_counts)
+        self.assertEqual(_read_csv(os.path.join(changes_dir, 'citation_merge_removed.csv')),
+                         [(changed_uid, old_cited[0])])
+
+        self.assertEqual(apply_pending_batches(self.output_dir), [])
+        self.assertEqual(self._state(), after)
+        sql = upsert_sql(batch_dir)
+        self.assertIn(os.path.join(os.path.abspath(changes_dir), 'cite_count.csv'), sql)
+        self.assertIn("ON DUPLICATE KEY UPDATE citation_count = VALUES(citation_count);", sql)
+
+    def test_external_edges_survive_redelivery(self):
+        """A re-delivered uid keeps its external edges, including those it also cites itself"""
+        changed_uid = sorted({uid for uid, _ in self.edges})[0]
+        old_cited = sorted(cited_uid for uid, cited_uid in self.edges if uid == changed_uid)
+        external = {(changed_uid, 'WOS:EXTERNAL'), (changed_uid, old_cited[0])}
+        merge_path = os.path.join(self.output_dir, 'derived', 'citation_merge.csv')
+        write_csv(merge_path, ('uid', 'cited_uid'), sorted(self.edges | external))
+        edge_path = os.path.join(self.test_dir, 'cite_to_cite.tsv')
+        with open(edge_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{uid}\t{cited_uid}\n" for uid, cited_uid in sorted(external))
+        init_state(self.output_dir, edge_paths=[edge_path])
+
+        batch_dir = self._write_batch([(changed_uid, '1986')], [(changed_uid, 'WOS:NEWCITED')], [changed_uid])
+        summary = apply_batch(batch_dir)
+        edges = ({edge for edge in self.edges if edge[0] != changed_uid} | external
+                 | {(changed_uid, 'WOS:NEWCITED')})
+        self.assertEqual(self._state(), _counts(edges, dict(self.years, **{changed_uid: 1986})))
+        self.assertEqual(summary['citation_merge_removed'], len(old_cited) - 1)
+        self.assertNotIn((changed_uid, 'WOS:EXTERNAL'),
+                         _read_csv(os.path.join(batch_dir, CITE_COUNT_CHANGES_DIR_NAME, 'citation_merge_removed.csv')))
+
+        # A tombstone without a new version leaves the external edges only
+        self._write_batch([], [], [changed_uid])
+        apply_pending_batches(self.output_dir)
+        edges = {edge for edge in edges if edge[0] != changed_uid} | external
+        self.assertEqual(self._state(), _counts(edges, dict(self.years, **{changed_uid: 1986})))
+
+    def test_tombstone_without_new_version(self):
+        """A tombstoned uid without a new row loses all its citations"""
+        init_state(self.output_dir)
+        removed_uid = sorted({uid for uid, _ in self.edges})[-1]
+        self._write_batch([], [], [removed_uid])
+        self.assertEqual(len(apply_pending_batches(self.output_dir)), 1)
+        edges = {edge for edge in self.edges if edge[0] != removed_uid}
+        self.assertEqual(self._state(), _counts(edges, self.years))
+
+    def test_existing_batches_count_as_applied(self):
+        """Batches present when the state is seeded are part of the derived tables"""
+        self._write_batch([('WOS:NEWPAPER', '1986')], [('WOS:NEWPAPER', 'WOS:NEWCITED')], [])
+        build_derived_tables(self.output_dir)
+        init_state(self.output_dir)
+        self.assertEqual(apply_pending_batches(self.output_dir), [])
+        self.assertEqual(self._state()[0]['WOS:NEWCITED'], 1)
+
+    def test_seeded_state_applies_batch_tombstones(self):
+        """A state seeded after a tombstoning batch equals the state the batch was applied to"""
+        changed_uid = sorted({uid for uid, _ in self.edges})[0]
+        init_state(self.output_dir)
+        self._write_batch([(changed_uid, '1986')], [(changed_uid, 'WOS:NEWCITED')], [changed_uid])
+        apply_pending_batches(self.output_dir)
+        applied = self._state()
+
+        os.remove(state_path_of(self.output_dir))
+        build_derived_tables(self.output_dir)
+        init_state(self.output_dir)
+        self.assertEqual(self._state(), applied)
+        edges = {edge for edge in self.edges if edge[0] != changed_uid} | {(changed_uid, 'WOS:NEWCITED')}
+        self.assertEqual(applied, _counts(edges, dict(self.years, **{changed_uid: 1986})))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the co-authorship network
+"""
+
+import unittest
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+
+from csv_writer import CSV_DIALECT
+from xml_coauthorship import AUTHORS_FILE, author_key, build_coauthorship, sp
+from xml_test_helpers import write_table
+
+
+def _read_gzip(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, dialect=CSV_DIALECT)
+        next(reader)
+        return [tuple(row) for row in reader]
+
+
+@unittest.skipIf(sp is None, "scipy is not installed")
+class TestCoauthorship(unittest.TestCase):
+    """Test cases for build_coauthorship"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        os.makedirs(self.output_dir)
+        papers = {
+            'WOS:P1': ('2000', ['ALPHA, A', 'BETA, B', 'GAMMA, C']),
+            'WOS:P2': ('2000', ['ALPHA, A', 'BETA, B']),
+            # Alpha under another spelling, the same ORCID
+            'WOS:P3': ('2000', ['ALPHA, AZ', 'DELTA, D']),
+            'WOS:P4': ('2001', ['BETA, B', 'GAMMA, C', 'DELTA, D', 'EPSILON, E']),
+            # Single author: no edge
+            'WOS:P5': ('2001', ['GAMMA, C']),
+        }
+        write_table(self.output_dir, 'item', [{'uid': uid, 'pubyear': year} for uid, (year, _) in papers.items()])
+        write_table(self.output_dir, 'item_authors', [
+            {'uid': uid, 'seq_no': str(seq_no), 'role': 'author', 'wos_standard': name}
+            for uid, (_, names) in papers.items() for seq_no, name in enumerate(names, 1)])
+        write_table(self.output_dir, 'item_author_ids', [
+            {'uid': 'WOS:P1', 'seq_no': '1', 'orcid': '0000-0001-2345-6789'},
+            {'uid': 'WOS:P2', 'seq_no': '1', 'orcid': '0000-0001-2345-6789'},
+            {'uid': 'WOS:P3', 'seq_no': '1', 'orcid': '0000-0001-2345-6789'},
+            {'uid': 'WOS:P3', 'seq_no': '2', 'r_id': 'D-1234-2010'},
+        ])
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _edges(self, year):
+        """Edges of a year as {(name, name): (papers, weight)}"""
+        network_dir = os.path.join(self.output_dir, 'coauthorship')
+        names = {author_id: name for author_id, _, name in _read_gzip(os.path.join(network_dir, AUTHORS_FILE))}
+        edges = {}
+        for author_a, author_b, papers, weight in _read_gzip(os.path.join(network_dir, f"{year}.csv.gz")):
+            self.assertLess(int(author_a), int(author_b))
+            pair = tuple(sorted((names[author_a].split(',')[0], names[author_b].split(',')[0])))
+            edges[pair] = (int(papers), float(weight))
+        return edges
+
+    def test_full_and_fractional_counts(self):
+        """Pairs count shared papers and 1 / (n - 1) per paper with n authors"""
+        counts = build_coauthorship(self.output_dir)
+        self.assertEqual(counts, {2000: 4, 2001: 6})
+        self.assertEqual(self._edges(2000), {
+            ('ALPHA', 'BETA'): (2, 1.5),
+            ('ALPHA', 'GAMMA'): (1, 0.5),
+            ('BETA', 'GAMMA'): (1, 0.5),
+            ('ALPHA', 'DELTA'): (1, 1.0),
+        })
+        edges = self._edges(2001)
+        self.assertEqual(len(edges), 6)
+        for papers, weight in edges.values():
+            self.assertEqual(papers, 1)
+            self.assertAlmostEqual(weight, 1 / 3, places=5)
+
+    def test_max_authors(self):
+        """Papers with more authors than the limit are left out"""
+        counts = build_coauthorship(self.output_dir, max_authors=3)
+        self.assertEqual(counts, {2000: 4, 2001: 0})
+        self.assertEqual(self._edges(2001), {})
+
+    def test_author_key(self):
+        """ORCID before ResearcherID before the normalized name"""
+        self.assertEqual(author_key('ALPHA, A', orcid_tr='0000-0001-2345-678x', r_id='D-1'),
+                         'orcid:0000-0001-2345-678X')
+        self.assertEqual(author_key('ALPHA, A', r_id='d-1'), 'rid:D-1')
+        self.assertEqual(author_key(' alpha,  a '), 'name:ALPHA, A')
+
+
+if __name__ == '__main__':
+    unittest.main()
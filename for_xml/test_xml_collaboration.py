@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the collaboration matrices
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+
+from csv_writer import CSV_DIALECT
+from xml_collaboration import IDS_FILE, build_collaboration, sp
+from xml_test_helpers import write_table
+
+
+@unittest.skipIf(sp is None, "scipy is not installed")
+class TestCollaboration(unittest.TestCase):
+    """Test cases for build_collaboration"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        os.makedirs(self.output_dir)
+        write_table(self.output_dir, 'item', [{'uid': 'WOS:P1', 'pubyear': '2000'},
+                                              {'uid': 'WOS:P2', 'pubyear': '2000'},
+                                              {'uid': 'WOS:P3', 'pubyear': '2000'},
+                                              {'uid': 'WOS:P4', 'pubyear': '2001'}])
+        addresses = [
+            # Two addresses in the USA count once
+            ('WOS:P1', '1', 'USA'), ('WOS:P1', '2', 'USA'), ('WOS:P1', '3', 'Peoples R  China'),
+            ('WOS:P1', '4', 'Germany'),
+            ('WOS:P2', '1', 'USA'), ('WOS:P2', '2', 'Peoples R China'),
+            ('WOS:P3', '1', 'Germany'),
+            ('WOS:P4', '1', 'USA'), ('WOS:P4', '2', 'Germany'),
+        ]
+        write_table(self.output_dir, 'item_addresses', [{'uid': uid, 'addr_no': addr_no, 'country': country}
+                                                        for uid, addr_no, country in addresses])
+        write_table(self.output_dir, 'item_orgs', [
+            {'uid': 'WOS:P1', 'addr_no': '1', 'org_pref': 'Y', 'organization': 'Harvard University'},
+            {'uid': 'WOS:P1', 'addr_no': '1', 'organization': 'Harvard Univ'},
+            # No preferred name: the other names count
+            {'uid': 'WOS:P1', 'addr_no': '2', 'organization': 'Small Lab'},
+            {'uid': 'WOS:P1', 'addr_no': '3', 'org_pref': 'Y', 'organization': 'Tsinghua University'},
+        ])
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _load(self, kind, year, counting):
+        """Symmetric matrix as {(name, name): value}, with (name, name) the diagonal"""
+        kind_dir = os.path.join(self.output_dir, 'collaboration', kind)
+        with open(os.path.join(kind_dir, IDS_FILE), 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            next(reader)
+            names = {int(entity): name for entity, name in reader}
+        matrix = sp.load_npz(os.path.join(kind_dir, f"{year}_{counting}.npz")).tocoo()
+        self.assertTrue((matrix.row <= matrix.col).all())
+        return {tuple(sorted((names[row], names[col]))): round(float(value), 6)
+                for row, col, value in zip(matrix.row, matrix.col, matrix.data)}
+
+    def test_country_matrices(self):
+        """Distinct countries per paper, full and fractional counting"""
+        summary = build_collaboration(self.output_dir)
+        self.assertEqual(summary['country'], {2000: 6, 2001: 3})
+        self.assertEqual(self._load('country', 2000, 'full'), {
+            ('USA', 'USA'): 2, ('Peoples R China', 'Peoples R China'): 2, ('Germany', 'Germany'): 2,
+            ('Peoples R China', 'USA'): 2, ('Germany', 'USA'): 1, ('Germany', 'Peoples R China'): 1,
+        })
+        third = round(1 / 3, 6)
+        self.assertEqual(self._load('country', 2000, 'fractional'), {
+            ('USA', 'USA'): round(third + 0.5, 6), ('Peoples R China', 'Peoples R China'): round(third + 0.5, 6),
+            ('Germany', 'Germany'): round(third + 1, 6),
+            ('Peoples R China', 'USA'): 1.5, ('Germany', 'USA'): 0.5, ('Germany', 'Peoples R China'): 0.5,
+        })
+        self.assertEqual(self._load('country', 2001, 'fractional'), {
+            ('USA', 'USA'): 0.5, ('Germany', 'Germany'): 0.5, ('Germany', 'USA'): 1.0})
+
+    def test_org_matrices(self):
+        """Preferred organization names, else the other names of the address"""
+        summary = build_collaboration(self.output_dir)
+        self.assertEqual(summary['org'], {2000: 6})
+        self.assertEqual(self._load('org', 2000, 'full'), {
+            ('Harvard University', 'Harvard University'): 1, ('Small Lab', 'Small Lab'): 1,
+            ('Tsinghua University', 'Tsinghua University'): 1,
+            ('Harvard University', 'Small Lab'): 1, ('Harvard University', 'Tsinghua University'): 1,
+            ('Small Lab', 'Tsinghua University'): 1,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for delta (upsert) processing of WOS update deliveries
+"""
+
+import unittest
+import copy
+import os
+import csv
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+from xml_file_commit import StagedCommitWriter, close_commit_parts, merge_commits
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_delta import compute_record_hash
+from xml_record_batch import RecordBatchCallback
+from xml_common_def import WOS_NAMESPACE
+from xml_test_helpers import EXAMPLES_DIR
+
+
+class TestDeltaProcessing(unittest.TestCase):
+    """Test cases for delta mode in load_xml_file"""
+
+    def setUp(self):
+        """Work in a temporary directory so tombstones land in xml_output/"""
+        self.examples_dir = EXAMPLES_DIR
+        self.test_dir = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        self.history_file = os.path.join(self.test_dir, 'history.json')
+        self.delivery = os.path.join(self.test_dir, 'delivery1.xml')
+        shutil.copy(os.path.join(self.examples_dir, '1985.xml'), self.delivery)
+        self.processed = []
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.test_dir)
+
+    def _callback(self, parser):
+        self.processed.append(parser.uid)
+
+    def _write_update(self, path, changed_index):
+        """Write a copy of the delivery with one record modified"""
+        ET.register_namespace('', WOS_NAMESPACE['ns'])
+        tree = ET.parse(self.delivery)
+        records = tree.getroot().findall('.//ns:REC', WOS_NAMESPACE)
+        title = records[changed_index].find('.//ns:title[@type="item"]', WOS_NAMESPACE)
+        title.text = (title.text or '') + ' (corrected)'
+        tree.write(path, encoding='utf-8', xml_declaration=True)
+        return records[changed_index].find('ns:UID', WOS_NAMESPACE).text
+
+    def test_record_hash_is_stable(self):
+        """Hashing the same record twice gives the same digest"""
+        record = ET.parse(self.delivery).getroot().find('.//ns:REC', WOS_NAMESPACE)
+        self.assertEqual(compute_record_hash(record), compute_record_hash(record))
+
+    def test_first_delta_run_writes_everything(self):
+        """A first delta run processes all records and writes no tombstones"""
+        history = ProcessingHistoryManager(self.history_file)
+        load_xml_file(self.delivery, self._callback, True, history, delta=True)
+        self.assertEqual(len(self.processed), 100)
+        self.assertIsNotNone(history.get_record_hash(self.processed[0]))
+        self.assertFalse(os.path.exists(os.path.join('xml_output', 'tombstones')))
+
+    def test_update_delivery_writes_only_changed_records(self):
+        """Only changed records are rewritten, and their UIDs are tombstoned"""
+        history = ProcessingHistoryManager(self.history_file)
+        load_xml_file(self.delivery, self._callback, True, history, delta=True)
+
+        update = os.path.join(self.test_dir, 'delivery2.xml')
+        changed_uid = self._write_update(update, 3)
+        self.processed = []
+        load_xml_file(update, self._callback, True, history, delta=True)
+
+        self.assertEqual(self.processed, [changed_uid])
+        # One tombstone list applies to every table
+        self.assertEqual(os.listdir(os.path.join('xml_output', 'tombstones')), ['uid.csv'])
+        with open(os.path.join('xml_output', 'tombstones', 'uid.csv'), newline='', encoding='utf-8') as f:
+            self.assertEqual(list(csv.DictReader(f)), [{'uid': changed_uid}])
+
+    def test_versions_within_one_batch(self):
+        """Versions of a UID in one batch are compared with each other like across deliveries"""
+        ET.register_namespace('', WOS_NAMESPACE['ns'])
+        tree = ET.parse(self.delivery)
+        records = tree.getroot().findall('.//ns:REC', WOS_NAMESPACE)
+        tree.getroot().append(copy.deepcopy(records[0]))
+        changed = copy.deepcopy(records[1])
+        title = changed.find('.//ns:title[@type="item"]', WOS_NAMESPACE)
+        title.text = (title.text or '') + ' (corrected)'
+        tree.getroot().append(changed)
+        tree.write(self.delivery, encoding='utf-8', xml_declaration=True)
+        changed_uid = changed.find('ns:UID', WOS_NAMESPACE).text
+
+        history = ProcessingHistoryManager(self.history_file)
+        callback = RecordBatchCallback(os.path.join(self.test_dir, 'out'), batch_size=500)
+        load_xml_file(self.delivery, callback, True, history, delta=True)
+
+        with open(os.path.join(self.test_dir, 'out', 'uid.csv'), newline='', encoding='utf-8') as f:
+            uids = [row['uid'] for row in csv.DictReader(f)]
+        self.assertEqual(len(uids), 101)
+        self.assertEqual(uids.count(changed_uid), 2)
+        with open(os.path.join('xml_output', 'tombstones', 'uid.csv'), newline='', encoding='utf-8') as f:
+            self.assertEqual(list(csv.DictReader(f)), [{'uid': changed_uid}])
+        written = ET.parse(self.delivery).getroot().findall('.//ns:REC', WOS_NAMESPACE)[-1]
+        self.assertEqual(history.get_record_hash(changed_uid), compute_record_hash(written))
+
+    def test_staged_tombstones_are_committed_with_the_rows(self):
+        """With atomic commits the tombstones of a file are staged and committed with its rows"""
+        output_dir = os.path.join(self.test_dir, 'out')
+        history = ProcessingHistoryManager(self.history_file)
+        load_xml_file(self.delivery, make_record_callback(output_dir, atomic=True), True, history, delta=True)
+
+        update = os.path.join(self.test_dir, 'delivery2.xml')
+        changed_uid = self._write_update(update, 3)
+        failing = make_record_callback(output_dir, atomic=True)
+        failing.sink_class = _FailingSink
+        with self.assertRaises(RuntimeError):
+            load_xml_file(update, failing, True, history, delta=True)
+        # The failed file leaves neither rows nor tombstones behind
+        self.assertFalse(os.path.exists(os.path.join('xml_output', 'tombstones')))
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'tombstones')))
+
+        load_xml_file(update, make_record_callback(output_dir, atomic=True), True, history, delta=True)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'tombstones')))
+        merge_commits(output_dir)
+        with open(os.path.join(output_dir, 'tombstones', 'uid.csv'), newline='', encoding='utf-8') as f:
+            self.assertEqual(list(csv.DictReader(f)), [{'uid': changed_uid}])
+        close_commit_parts()
+
+
+class _FailingSink:
+    """Staged sink whose input file fails when it is committed"""
+
+    buffered = True
+
+    def __init__(self, output_dir):
+        self.sink = StagedCommitWriter(output_dir)
+
+    def write_batch(self, batch):
+        self.sink.write_batch(batch)
+
+    def commit(self, commit_info):
+        raise RuntimeError("commit failed")
+
+    def discard(self):
+        self.sink.discard()
+
+
+if __name__ == '__main__':
+    unittest.main()
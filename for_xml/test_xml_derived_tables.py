@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the derived tables
+"""
+
+import unittest
+import csv
+import json
+import os
+import shutil
+import resource
+import sqlite3
+import tempfile
+
+from csv_writer import CSV_DIALECT
+from xml_derived_tables import DERIVED_TABLE_COLUMNS, bucket_count, build_derived_tables, table_rows
+from xml_import_batches import BATCH_MANIFEST_FILE, batch_tombstone_dir, new_batch_dir
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_test_helpers import EXAMPLE_XML, write_csv
+
+
+# modify_database.sql on SQLite, without the thomson tables and the NULL citing_year group
+REFERENCE_SQL = {
+    'citations': "SELECT uid, cited_uid FROM item_references WHERE cited_uid LIKE 'WOS:%' "
+                 "AND cited_uid NOT LIKE '%.%'",
+    'citation_merge': "SELECT DISTINCT uid, cited_uid FROM citations",
+    'cite_count': "SELECT cited_uid, COUNT(uid) FROM citation_merge GROUP BY cited_uid",
+    'item_max_pubyear': "SELECT uid, MAX(CAST(NULLIF(pubyear, '') AS INTEGER)) AS max_pubyear FROM item "
+                        "GROUP BY uid",
+    'item_doi': "SELECT uid, LOWER(identifier_value) FROM item_ids WHERE LOWER(identifier_type) = 'doi'",
+    'item_rp_cntry': "SELECT DISTINCT uid, country FROM item_rp_addrs WHERE country != ''",
+    'cite_count_year': "SELECT cm.cited_uid, ip.max_pubyear, COUNT(cm.uid) FROM citation_merge cm "
+                       "JOIN item_max_pubyear ip ON cm.uid = ip.uid WHERE ip.max_pubyear IS NOT NULL "
+                       "GROUP BY cm.cited_uid, ip.max_pubyear",
+}
+
+
+class TestDerivedTables(unittest.TestCase):
+    """Test cases for build_derived_tables"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        callback = make_record_callback(self.output_dir, batch_size=7)
+        load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _derived(self, derived_dir):
+        tables = {}
+        for table_name, columns in DERIVED_TABLE_COLUMNS.items():
+            with open(os.path.join(derived_dir, table_name + '.csv'), 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f, dialect=CSV_DIALECT)
+                self.assertEqual(tuple(next(reader)), columns)
+                tables[table_name] = sorted(tuple(row) for row in reader)
+        return tables
+
+    def _build(self, name):
+        derived_dir = os.path.join(self.test_dir, name)
+        build_derived_tables(self.output_dir, derived_dir)
+        return derived_dir
+
+    def _reference(self):
+        connection = sqlite3.connect(':memory:')
+        for table_name in ('item', 'item_references', 'item_ids', 'item_rp_addrs'):
+            columns = {'item': ('uid', 'pubyear'), 'item_references': ('uid', 'cited_uid'),
+                       'item_ids': ('uid', 'identifier_type', 'identifier_value'),
+                       'item_rp_addrs': ('uid', 'country')}[table_name]
+            connection.execute(f"CREATE TABLE {table_name} ({', '.join(columns)})")
+            connection.executemany(f"INSERT INTO {table_name} VALUES ({', '.join('?' * len(columns))})",
+                                   table_rows(self.output_dir, table_name, columns))
+        tables = {}
+        for table_name, sql in REFERENCE_SQL.items():
+            rows = connection.execute(sql).fetchall()
+            connection.execute(f"CREATE TABLE {table_name} AS {sql}")
+            tables[table_name] = sorted(tuple('' if value is None else str(value) for value in row)
+                                        for row in rows)
+        connection.close()
+        return tables
+
+    def test_matches_sql_reference(self):
+        """Every derived table equals the result of the SQL statements, with one or many buckets"""
+        reference = self._reference()
+        self.assertGreater(len(reference['citations']), 0)
+        self.assertGreater(len(reference['cite_count_year']), 0)
+        for memory_mb in (1024, 0):
+            derived_dir = os.path.join(self.test_dir, f'derived-{memory_mb}')
+            counts = build_derived_tables(self.output_dir, derived_dir, memory_mb=memory_mb)
+            derived = self._derived(derived_dir)
+            for table_name in DERIVED_TABLE_COLUMNS:
+                self.assertEqual(derived[table_name], reference[table_name], table_name)
+                self.assertEqual(counts[table_name], len(reference[table_name]), table_name)
+        self.assertEqual([name for name in os.listdir(self.output_dir) if name.startswith('derive-')], [])
+
+    def test_duplicate_input_rows_are_merged(self):
+        """Rows loaded twice do not change the deduplicated tables or the counts"""
+        first_dir = os.path.join(self.test_dir, 'first')
+        build_derived_tables(self.output_dir, first_dir)
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history2.json'))
+        load_xml_file(EXAMPLE_XML, make_record_callback(self.output_dir), False, history_manager)
+        second_dir = os.path.join(self.test_dir, 'second')
+        counts = build_derived_tables(self.output_dir, second_dir, memory_mb=0)
+        first, second = self._derived(first_dir), self._derived(second_dir)
+        for table_name in ('citation_merge', 'cite_count', 'item_max_pubyear', 'item_rp_cntry', 'cite_count_year'):
+            self.assertEqual(second[table_name], first[table_name], table_name)
+        self.assertEqual(counts['citations'], 2 * len(first['citations']))
+
+    def test_case_insensitive_like_mysql(self):
+        """DOI identifier types and reprint countries match regardless of case"""
+        output_dir = os.path.join(self.test_dir, 'cased')
+        write_csv(os.path.join(output_dir, 'item_ids.csv'), ('uid', 'identifier_type', 'identifier_value'),
+                  [('WOS:1', 'DOI', '10.1/ABC'), ('WOS:2', 'doi', '10.1/def'), ('WOS:3', 'issn', '0000-0000')])
+        write_csv(os.path.join(output_dir, 'item_rp_addrs.csv'), ('uid', 'country'),
+                  [('WOS:1', 'Peoples R China'), ('WOS:1', 'PEOPLES R CHINA'), ('WOS:2', 'USA')])
+        derived_dir = os.path.join(self.test_dir, 'cased-derived')
+        build_derived_tables(output_dir, derived_dir, memory_mb=0)
+        derived = self._derived(derived_dir)
+        self.assertEqual(derived['item_doi'], [('WOS:1', '10.1/abc'), ('WOS:2', '10.1/def')])
+        self.assertEqual(derived['item_rp_cntry'], [('WOS:1', 'Peoples R China'), ('WOS:2', 'USA')])
+
+    def test_batches_replace_tombstoned_uids(self):
+        """Complete batches replace the rows of their tombstoned UIDs; incomplete batches are skipped"""
+        before = self._derived(self._build('before'))
+        uid, cited_uid = before['citation_merge'][0]
+        other_uid = next(row[0] for row in before['citation_merge'] if row[0] != uid)
+        # A new version of uid citing one paper only, then a batch whose run did not finish
+        batch_dir = new_batch_dir(self.output_dir)
+        write_csv(os.path.join(batch_dir, 'item.csv'), ('uid', 'pubyear'), [(uid, '2030')])
+        write_csv(os.path.join(batch_dir, 'item_references.csv'), ('uid', 'cited_uid'), [(uid, 'WOS:NEW')])
+        write_csv(os.path.join(batch_tombstone_dir(batch_dir), 'uid.csv'), ('uid',), [(uid,)])
+        with open(os.path.join(batch_dir, BATCH_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({}, f)
+        incomplete_dir = new_batch_dir(self.output_dir)
+        write_csv(os.path.join(incomplete_dir, 'item.csv'), ('uid', 'pubyear'), [(uid, '2040')])
+        write_csv(os.path.join(incomplete_dir, 'item_references.csv'), ('uid', 'cited_uid'),
+                  [(other_uid, 'WOS:INCOMPLETE')])
+        write_csv(os.path.join(batch_tombstone_dir(incomplete_dir), 'uid.csv'), ('uid',), [(other_uid,)])
+
+        after = self._derived(self._build('after'))
+        self.assertEqual([row for row in after['citation_merge'] if row[0] == uid], [(uid, 'WOS:NEW')])
+        self.assertEqual([row for row in after['item_max_pubyear'] if row[0] == uid], [(uid, '2030')])
+        self.assertNotIn((uid, cited_uid), after['citations'])
+        self.assertEqual([row for row in after['citation_merge'] if row[0] == other_uid],
+                         [row for row in before['citation_merge'] if row[0] == other_uid])
+        self.assertNotIn(('WOS:INCOMPLETE', '1'), after['cite_count'])
+        self.assertIn(('WOS:NEW', '1'), after['cite_count'])
+
+    def test_bucket_count_follows_memory_budget(self):
+        """Larger inputs or smaller budgets need more buckets, within the open file limit"""
+        self.assertEqual(bucket_count(1000, 1024 * 1024), 1)
+        self.assertEqual(bucket_count(1024 * 1024, 1024 * 1024), 4)
+        self.assertEqual(bucket_count(10 ** 12, 1), min(512, resource.getrlimit(resource.RLIMIT_NOFILE)[0] - 64))
+
+    def test_open_file_limit(self):
+        """The most buckets run within a low open file limit and give the same tables"""
+        reference_dir = os.path.join(self.test_dir, 'reference')
+        build_derived_tables(self.output_dir, reference_dir)
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(300, soft_limit), hard_limit))
+        try:
+            self.assertEqual(bucket_count(10 ** 12, 1), min(300, soft_limit) - 64)
+            limited_dir = os.path.join(self.test_dir, 'limited')
+            build_derived_tables(self.output_dir, limited_dir, memory_mb=0)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+        self.assertEqual(self._derived(limited_dir), self._derived(reference_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
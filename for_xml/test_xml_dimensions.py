@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for dictionary-encoded dimension tables
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+import xml_dimensions
+from csv_writer import XMLDataWriter
+from xml_common_def import WOS_NAMESPACE
+from xml_file_commit import StagedCommitWriter, merge_commits
+from xml_dimensions import (DIMENSION_TABLES, DimensionEncoder, dimension_id, dimension_import_sql,
+                            finalize_dimensions)
+from xml_parser import XMLRecordParser
+from xml_record_batch import RecordBatch
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestDimensions(unittest.TestCase):
+    """Test cases for DimensionEncoder and the dimension files"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        xml_dimensions._WRITTEN_VALUES.clear()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _batch(self, parsers):
+        batch = RecordBatch()
+        for parser in parsers:
+            batch.add_record(parser)
+        return batch
+
+    def _read_rows(self, file_path):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            return list(csv.reader(f))
+
+    def test_encoded_tables_decode_to_flat_output(self):
+        """Replacing the ids by their dimension values gives the unencoded rows"""
+        flat_dir = os.path.join(self.test_dir, 'flat')
+        out_dir = os.path.join(self.test_dir, 'out')
+        XMLDataWriter(flat_dir).write_batch(self._batch(self.parsers))
+        # Two "workers" writing to the same directory, each with its own memory
+        DimensionEncoder(out_dir).write_batch(self._batch(self.parsers[:60]))
+        xml_dimensions._WRITTEN_VALUES.clear()
+        DimensionEncoder(out_dir).write_batch(self._batch(self.parsers[60:]))
+        counts = finalize_dimensions(out_dir)
+
+        for dim_table, columns in DIMENSION_TABLES.items():
+            dim_rows = self._read_rows(os.path.join(out_dir, dim_table + '.csv'))[1:]
+            self.assertEqual(len(dim_rows), counts[dim_table])
+            values = {value_id: value for value_id, value in dim_rows}
+            self.assertEqual(len(values), len(dim_rows), dim_table)
+            for table_name, column in columns:
+                flat = self._read_rows(os.path.join(flat_dir, table_name + '.csv'))
+                encoded = self._read_rows(os.path.join(out_dir, table_name + '.csv'))
+                index = flat[0].index(column)
+                self.assertEqual(encoded[0][index], column + '_id')
+                for row in encoded[1:]:
+                    row[index] = values[row[index]] if row[index] else ''
+                self.assertEqual(encoded[1:], flat[1:], table_name)
+
+    def test_staged_files_share_written_values(self):
+        """Staged files remember their values under the output directory; a discarded file forgets its own"""
+        out_dir = os.path.join(self.test_dir, 'out')
+        commit_info = {'file': EXAMPLE_XML, 'history_file': os.path.join(self.test_dir, 'history.json'),
+                       'records': [], 'record_count': 0, 'error_count': 0}
+        first = StagedCommitWriter(out_dir, sink_class=DimensionEncoder)
+        first.write_batch(self._batch(self.parsers[:60]))
+        first.commit(commit_info)
+        first.close()
+        failed = StagedCommitWriter(out_dir, sink_class=DimensionEncoder)
+        failed.write_batch(self._batch(self.parsers[60:]))
+        failed.discard()
+        last = StagedCommitWriter(out_dir, sink_class=DimensionEncoder)
+        last.write_batch(self._batch(self.parsers[60:]))
+        last.commit(commit_info)
+        last.close()
+        self.assertEqual({dim_path for _, dim_path in xml_dimensions._WRITTEN_VALUES},
+                         {os.path.join(os.path.abspath(out_dir), dim_table + '.csv') for dim_table in DIMENSION_TABLES})
+
+        merge_commits(out_dir)
+        flat = DimensionEncoder(os.path.join(self.test_dir, 'flat'))
+        flat.write_batch(self._batch(self.parsers))
+        for dim_table in DIMENSION_TABLES:
+            dim_rows = self._read_rows(os.path.join(out_dir, dim_table + '.csv'))[1:]
+            self.assertEqual(len(dim_rows), len({row[0] for row in dim_rows}), dim_table)
+            self.assertEqual(sorted(dim_rows), sorted(self._read_rows(os.path.join(
+                self.test_dir, 'flat', dim_table + '.csv'))[1:]), dim_table)
+
+    def test_ids_are_stable(self):
+        """Ids depend only on the value"""
+        self.assertEqual(dimension_id('HUMBOLDT UNIV'), dimension_id('HUMBOLDT UNIV'))
+        self.assertNotEqual(dimension_id('HUMBOLDT UNIV'), dimension_id('HUMBOLDT UNIV '))
+        self.assertLess(dimension_id('HUMBOLDT UNIV'), 2 ** 63)
+
+    def test_collisions_are_detected(self):
+        """Two values with the same id fail the run"""
+        with open(os.path.join(self.test_dir, 'dim_org.csv'), 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows([('id', 'organization'), ('1', 'A'), ('1', 'A'), ('1', 'B')])
+        with self.assertRaises(ValueError):
+            finalize_dimensions(self.test_dir)
+
+    def test_import_sql_uses_encoded_statements(self):
+        """The import script loads the dimensions and the *_id columns"""
+        script = dimension_import_sql()
+        self.assertIn("'xml_output/dim_org.csv'", script)
+        self.assertIn("organization_id = NULLIF(@organization_id, '')", script)
+        self.assertNotIn("organization = NULLIF(@organization, '')", script)
+        self.assertLess(script.index('dim_org.csv'), script.index("'xml_output/item.csv'"))
+        self.assertEqual(script.count("'xml_output/item_orgs.csv'"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
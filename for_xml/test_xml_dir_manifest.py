@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the cached os.scandir directory manifest
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+from xml_parallel_processor import XMLParallelFileProcessor, is_xml_input_file
+from dir_manifest import DirectoryManifest, schedule_by_size
+
+
+class TestDirectoryManifest(unittest.TestCase):
+    """Test cases for DirectoryManifest"""
+
+    def setUp(self):
+        """Create a small nested input tree with old directory mtimes"""
+        self.test_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.test_dir, 'input')
+        self.year_dir = os.path.join(self.input_dir, '1985')
+        os.makedirs(self.year_dir)
+        self._write(os.path.join(self.input_dir, 'a.xml'), 10)
+        self._write(os.path.join(self.year_dir, 'b.xml'), 30)
+        self._write(os.path.join(self.year_dir, 'notes.txt'), 5)
+        self._age_dirs()
+        self.manifest_path = os.path.join(self.test_dir, 'manifest.json')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, path, size):
+        with open(path, 'w') as f:
+            f.write('x' * size)
+
+    def _age_dirs(self):
+        """Move directory mtimes out of the racy window"""
+        old = time.time() - 60
+        for path in (self.input_dir, self.year_dir):
+            os.utime(path, (old, old))
+
+    def test_scan_without_manifest(self):
+        """Without a manifest files are found but not stat-ed"""
+        entries = DirectoryManifest().scan(self.input_dir, is_xml_input_file)
+        self.assertEqual(sorted(os.path.basename(path) for path, _, _ in entries), ['a.xml', 'b.xml'])
+        self.assertTrue(all(size is None for _, size, _ in entries))
+
+    def test_unchanged_directories_are_not_rescanned(self):
+        """A second run revalidates directories by mtime only"""
+        manifest = DirectoryManifest(self.manifest_path)
+        first = manifest.scan(self.input_dir, is_xml_input_file)
+        manifest.save()
+        self.assertEqual(manifest.stats['dirs_scanned'], 2)
+
+        manifest = DirectoryManifest(self.manifest_path)
+        second = manifest.scan(self.input_dir, is_xml_input_file)
+        self.assertEqual(manifest.stats['dirs_cached'], 2)
+        self.assertEqual(manifest.stats['dirs_scanned'], 0)
+        self.assertEqual(sorted(first), sorted(second))
+
+    def test_changed_directory_is_rescanned(self):
+        """Adding a file changes the directory mtime and invalidates its listing"""
+        manifest = DirectoryManifest(self.manifest_path)
+        manifest.scan(self.input_dir, is_xml_input_file)
+        manifest.save()
+
+        self._write(os.path.join(self.year_dir, 'c.xml'), 20)
+        new_mtime = time.time() - 30
+        os.utime(self.year_dir, (new_mtime, new_mtime))
+
+        manifest = DirectoryManifest(self.manifest_path)
+        entries = manifest.scan(self.input_dir, is_xml_input_file)
+        self.assertEqual(manifest.stats['dirs_scanned'], 1)
+        self.assertEqual(manifest.stats['dirs_cached'], 1)
+        self.assertIn('c.xml', [os.path.basename(path) for path, _, _ in entries])
+
+    def test_schedule_largest_first(self):
+        """Manifest sizes order the files largest first"""
+        manifest = DirectoryManifest(self.manifest_path)
+        ordered = schedule_by_size(manifest.scan(self.input_dir, is_xml_input_file))
+        self.assertEqual([os.path.basename(path) for path in ordered], ['b.xml', 'a.xml'])
+
+    def test_processor_uses_manifest(self):
+        """XMLParallelFileProcessor writes and reuses the manifest"""
+        processor = XMLParallelFileProcessor(worker_count=2, manifest_path=self.manifest_path)
+        files = processor.scan_directory_tree(self.input_dir)
+        self.assertEqual(len(files), 2)
+        self.assertTrue(os.path.exists(self.manifest_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
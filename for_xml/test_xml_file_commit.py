@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the atomic per-file commit of output rows
+"""
+
+import unittest
+import csv
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from csv_writer import PART_LOG_FILE, open_csv_file
+from xml_common_def import XML_TABLE_COLUMNS
+from xml_derived_tables import table_paths
+from xml_file_commit import (COMMIT_FILE, COMMIT_JOURNAL_FILE, COMMITS_DIR_NAME, PUBLISH_JOURNAL_FILE,
+                             STAGING_DIR_NAME, StagedCommitWriter, close_commit_parts, merge_commits,
+                             publish_commit)
+from xml_run_stats import RUN_STATS_FILE
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_record_batch import RecordBatch
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestFileCommit(unittest.TestCase):
+    """Test cases for StagedCommitWriter and merge_commits"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.expected_dir = os.path.join(self.test_dir, 'expected')
+        self.output_dir = os.path.join(self.test_dir, 'out')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        close_commit_parts()
+        shutil.rmtree(self.test_dir)
+
+    def _load(self, output_dir, history_name, times=1, **options):
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, history_name))
+        callback = make_record_callback(output_dir, batch_size=7, **options)
+        for _ in range(times):
+            load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        return history_manager
+
+    def _read(self, output_dir, table_name):
+        """Data rows of all files of a table, in file order"""
+        rows = []
+        for file_path in table_paths(output_dir, table_name):
+            with open_csv_file(file_path) as f:
+                rows.extend(list(csv.reader(f))[1:])
+        return rows
+
+    def test_commit_then_merge_matches_direct_output(self):
+        """Committed files are appended to one part per table and process, identical to direct writes"""
+        for suffix, compression in (('', None), ('.gz', 'gzip')):
+            expected_dir = os.path.join(self.expected_dir, suffix or 'plain')
+            output_dir = os.path.join(self.output_dir, suffix or 'plain')
+            self._load(expected_dir, 'direct.json', times=2, compression=compression)
+            history_manager = self._load(output_dir, 'atomic.json', times=2, compression=compression,
+                                         atomic=True)
+            self.assertTrue(history_manager.is_file_processed(EXAMPLE_XML))
+            self.assertFalse(os.path.exists(os.path.join(output_dir, 'item.csv' + suffix)))
+            self.assertEqual(sorted(name for name in os.listdir(output_dir) if name.startswith('item.')),
+                             ['item.00001.csv' + suffix])
+            # Tables without rows are not published
+            self.assertEqual(table_paths(output_dir, 'item_conferences'), [])
+            commits_dir = os.path.join(output_dir, COMMITS_DIR_NAME)
+            for commit_id in os.listdir(commits_dir):
+                self.assertEqual(os.listdir(os.path.join(commits_dir, commit_id)), [COMMIT_FILE])
+            close_commit_parts()
+            with open(os.path.join(output_dir, PART_LOG_FILE), 'r', encoding='utf-8') as f:
+                logged = [json.loads(line) for line in f]
+            self.assertEqual([entry['rows'] for entry in logged if entry['table'] == 'item'], [200])
+
+            self.assertEqual(merge_commits(output_dir), 2)
+            for table_name in XML_TABLE_COLUMNS:
+                self.assertEqual(self._read(output_dir, table_name), self._read(expected_dir, table_name),
+                                 table_name)
+            self.assertFalse(os.path.exists(commits_dir))
+            self.assertFalse(os.path.exists(os.path.join(output_dir, STAGING_DIR_NAME)))
+
+    def test_uncommitted_rows_are_discarded(self):
+        """Rows of a file that never finished are dropped by the next merge"""
+        writer = StagedCommitWriter(self.output_dir)
+        batch = RecordBatch()
+        batch.columns['item_keywords'] = [['WOS:1'], ['partial'], ['1']]
+        batch.uids = ['WOS:1']
+        writer.write_batch(batch)
+        self.assertEqual(merge_commits(self.output_dir), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, STAGING_DIR_NAME)))
+        self.assertEqual(table_paths(self.output_dir, 'item_keywords'), [])
+
+    def test_interrupted_merge_is_rolled_back(self):
+        """A publish or merge cut short is finished without duplicates; lost history entries are restored"""
+        self._load(self.expected_dir, 'direct.json', times=2, stats=True)
+        self._load(self.output_dir, 'atomic.json', atomic=True, stats=True)
+        # The worker of the second file died in the middle of appending its item rows
+        with mock.patch('xml_file_commit.publish_commit'):
+            self._load(self.output_dir, 'atomic.json', atomic=True, stats=True)
+        close_commit_parts()
+        commits_dir = os.path.join(self.output_dir, COMMITS_DIR_NAME)
+        second, = [commit_id for commit_id in os.listdir(commits_dir)
+                   if os.path.exists(os.path.join(commits_dir, commit_id, 'item.csv'))]
+        part_path = os.path.join(self.output_dir, 'item.00001.csv')
+        with open(os.path.join(commits_dir, second, PUBLISH_JOURNAL_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'sizes': {'item.00001.csv': os.path.getsize(part_path)}}, f)
+        with open(part_path, 'ab') as f:
+            f.write(b'WOS:A1985E16430')
+        # Merge the first commit only, then half-append the second one
+        shutil.move(os.path.join(commits_dir, second), os.path.join(self.test_dir, second))
+        merge_commits(self.output_dir)
+        shutil.move(os.path.join(self.test_dir, second), os.path.join(commits_dir, second))
+        stats_path = os.path.join(self.output_dir, RUN_STATS_FILE)
+        with open(os.path.join(self.output_dir, COMMIT_JOURNAL_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'commit': second, 'sizes': {RUN_STATS_FILE: os.path.getsize(stats_path)}}, f)
+        with open(stats_path, 'ab') as f:
+            f.write(b'{"records": 10')
+        # The worker died before saving its history
+        os.remove(os.path.join(self.test_dir, 'atomic.json'))
+
+        self.assertEqual(merge_commits(self.output_dir), 1)
+        for table_name in XML_TABLE_COLUMNS:
+            self.assertEqual(self._read(self.output_dir, table_name), self._read(self.expected_dir, table_name),
+                             table_name)
+        with open(stats_path, 'r', encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['records'] for line in f], [100, 100])
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'atomic.json'))
+        self.assertTrue(history_manager.is_file_processed(EXAMPLE_XML))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, COMMIT_JOURNAL_FILE)))
+
+    def test_publish_finishes_removing_appended_tables(self):
+        """Tables appended before a crash are removed, not appended again"""
+        with mock.patch('xml_file_commit.publish_commit'):
+            self._load(self.output_dir, 'atomic.json', atomic=True)
+        commits_dir = os.path.join(self.output_dir, COMMITS_DIR_NAME)
+        commit_id, = os.listdir(commits_dir)
+        commit_dir = os.path.join(commits_dir, commit_id)
+        publish_commit(commit_dir, self.output_dir)
+        close_commit_parts()
+        # As if the worker died after the appends, before removing the tables
+        shutil.copy(os.path.join(self.output_dir, 'item.00001.csv'), os.path.join(commit_dir, 'item.csv'))
+        with open(os.path.join(commit_dir, PUBLISH_JOURNAL_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'sizes': None}, f)
+        self.assertEqual(merge_commits(self.output_dir), 1)
+        self.assertEqual(len(self._read(self.output_dir, 'item')), 100)
+
+    def test_atomic_rejects_sqlite(self):
+        """SQLite output cannot be staged"""
+        with self.assertRaises(ValueError):
+            make_record_callback(self.output_dir, output_format='sqlite', atomic=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the highly cited articles engine
+"""
+
+import unittest
+import csv
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+from csv_writer import CSV_DIALECT
+from xml_derived_tables import build_derived_tables
+from xml_highly_cited import (ARTICLES_FILE, ARTICLES_SQL_FILE, build_highly_cited, np, parse_flag,
+                              threshold_column)
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_test_helpers import EXAMPLE_XML, write_csv
+
+
+# PERCENTILE_CONT on SQLite: linear interpolation between the rows at ranks floor(h) and floor(h) + 1
+REFERENCE_SQL = """
+WITH ranked AS (
+    SELECT uid, pubyear, subject, citation_count,
+           ROW_NUMBER() OVER (PARTITION BY pubyear, subject ORDER BY citation_count) - 1 AS rn,
+           COUNT(*) OVER (PARTITION BY pubyear, subject) AS n
+    FROM articles WHERE pubyear IS NOT NULL AND subject IS NOT NULL
+),
+positions AS (
+    SELECT DISTINCT pubyear, subject, n, (n - 1) * :fraction AS h FROM ranked
+),
+thresholds AS (
+    SELECT p.pubyear, p.subject,
+           lo.citation_count + (p.h - CAST(p.h AS INTEGER)) * (hi.citation_count - lo.citation_count) AS threshold
+    FROM positions p
+    JOIN ranked lo ON lo.pubyear = p.pubyear AND lo.subject = p.subject AND lo.rn = CAST(p.h AS INTEGER)
+    JOIN ranked hi ON hi.pubyear = p.pubyear AND hi.subject = p.subject
+                  AND hi.rn = MIN(CAST(p.h AS INTEGER) + 1, p.n - 1)
+)
+SELECT a.uid, t.threshold, CASE WHEN a.citation_count >= t.threshold THEN 1 ELSE 0 END
+FROM articles a LEFT JOIN thresholds t ON a.pubyear = t.pubyear AND a.subject = t.subject
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHighlyCited(unittest.TestCase):
+    """Test cases for build_highly_cited"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _read_articles(self, output_dir):
+        with open(os.path.join(output_dir, 'derived', ARTICLES_FILE), 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            headers = next(reader)
+            return headers, {row[0]: dict(zip(headers, row)) for row in reader}
+
+    def test_matches_sql_reference(self):
+        """Thresholds and flags equal PERCENTILE_CONT computed in SQL, for groups of any size and with ties"""
+        rng = random.Random(42)
+        output_dir = os.path.join(self.test_dir, 'out')
+        doc_types, subjects, pubyears, counts, articles = [], [], [], [], []
+        for number in range(3000):
+            uid = f"WOS:{number:015d}"
+            doctype = 'Article' if number % 10 else 'Review'
+            doc_types.append((uid, doctype))
+            subject = rng.choice(['Physics', 'Chemistry', 'Ecology', 'Mathematics', None])
+            if subject:
+                subjects.append((uid, 'Research Area', 'extended'))
+                subjects.append((uid, subject, 'traditional'))
+                subjects.append((uid, 'Other', 'traditional'))
+            pubyear = rng.choice([1985, 1986, 1987, None])
+            pubyears.append((uid, pubyear or ''))
+            count = int(rng.paretovariate(1.2)) - 1 if rng.random() < 0.8 else 0
+            if count:
+                counts.append((uid, count))
+            if doctype == 'Article' and pubyear:
+                # Articles without pubyear are left out, as by the inner join of the SQL
+                articles.append((uid, pubyear, subject, count))
+        # A single-article group
+        doc_types.append(("WOS:SINGLE", 'Article'))
+        subjects.append(("WOS:SINGLE", 'Astronomy', 'traditional'))
+        pubyears.append(("WOS:SINGLE", 1990))
+        articles.append(("WOS:SINGLE", 1990, 'Astronomy', 0))
+        write_csv(os.path.join(output_dir, 'item_doc_types_norm.csv'), ('uid', 'doctype_norm'), doc_types)
+        write_csv(os.path.join(output_dir, 'item_subjects.csv'), ('uid', 'subject', 'ascatype'), subjects)
+        write_csv(os.path.join(output_dir, 'derived', 'item_max_pubyear.csv'), ('uid', 'max_pubyear'), pubyears)
+        write_csv(os.path.join(output_dir, 'derived', 'cite_count.csv'), ('cited_uid', 'citation_count'), counts)
+
+        flags = [('top1', 99.0), ('top5', 95.0), ('top25', 75.0)]
+        self.assertEqual(build_highly_cited(output_dir, flags), len(articles))
+        headers, rows = self._read_articles(output_dir)
+        self.assertEqual(headers, ['uid', 'pubyear', 'subject', 'citation_count', 'top1', 'threshold',
+                                   'top5', 'top5_threshold', 'top25', 'top25_threshold'])
+
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE articles (uid, pubyear, subject, citation_count)")
+        connection.executemany("INSERT INTO articles VALUES (?, ?, ?, ?)", articles)
+        for name, percentile in flags:
+            reference = connection.execute(REFERENCE_SQL, {'fraction': percentile / 100}).fetchall()
+            self.assertEqual(len(reference), len(rows))
+            flagged = 0
+            for uid, threshold, flag in reference:
+                if threshold is None:
+                    self.assertEqual((rows[uid][name], rows[uid][threshold_column(name)]), ('', ''))
+                else:
+                    self.assertEqual(rows[uid][name], str(flag), (name, uid))
+                    self.assertEqual(rows[uid][threshold_column(name)], f"{threshold:.3f}", (name, uid))
+                    flagged += flag
+            self.assertGreater(flagged, 0)
+        connection.close()
+        self.assertEqual(rows['WOS:SINGLE']['top1'], '1')
+
+    def test_pipeline_output(self):
+        """The engine runs on the derived tables of a processed file and writes the load script"""
+        output_dir = os.path.join(self.test_dir, 'out')
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        load_xml_file(EXAMPLE_XML, make_record_callback(output_dir), False, history_manager)
+        build_derived_tables(output_dir)
+        count = build_highly_cited(output_dir)
+        self.assertGreater(count, 0)
+        _, rows = self._read_articles(output_dir)
+        self.assertEqual(len(rows), count)
+        self.assertTrue(all(row['pubyear'] == '1985' for row in rows.values()))
+        with open(os.path.join(output_dir, 'derived', ARTICLES_SQL_FILE), 'r', encoding='utf-8') as f:
+            sql = f.read()
+        csv_path = os.path.abspath(os.path.join(output_dir, 'derived', 'articles.csv'))
+        self.assertIn(f"LOAD DATA LOCAL INFILE '{csv_path}'", sql)
+        self.assertIn("    threshold DECIMAL(10, 3)", sql)
+        self.assertIn("top5_threshold DECIMAL(10, 3)", sql)
+        self.assertIn("ni82 TINYINT(1)", sql)
+
+    def test_parse_flag(self):
+        """Flags are name=percentile with a percentile between 0 and 100"""
+        self.assertEqual(parse_flag('top10=90'), ('top10', 90.0))
+        for text in ('top10', '10=90', 'top10=101'):
+            with self.assertRaises(ValueError):
+                parse_flag(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
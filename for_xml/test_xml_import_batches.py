@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for incremental import batches
+"""
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from xml_import_batches import (BATCH_MANIFEST_FILE, IMPORT_STATE_FILE, batch_tombstone_dir, finish_batch,
+                                mark_batch_applied, new_batch_dir, pending_batches, tombstone_sql)
+from xml_info_load_api import process_xml_to_csv
+from xml_load_manifest import write_load_plan
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestImportBatches(unittest.TestCase):
+    """Test cases for batch directories, manifests and the import state"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        # The processing history is kept in the working directory
+        os.chdir(self.test_dir)
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        os.chdir(self.cwd)
+        shutil.rmtree(self.test_dir)
+
+    def _run_batch(self, delta=False):
+        batch_dir = new_batch_dir(self.test_dir)
+        process_xml_to_csv(EXAMPLE_XML, skip_processed=False, delta=delta, output_dir=batch_dir,
+                           tombstone_dir=batch_tombstone_dir(batch_dir))
+        return batch_dir, finish_batch(batch_dir, xml_path=EXAMPLE_XML, delta=delta)
+
+    def test_batches_are_pending_until_applied(self):
+        """Complete batches are pending in order; applied and incomplete ones are not"""
+        first_dir, manifest = self._run_batch()
+        second_dir, _ = self._run_batch()
+        self.assertLess(os.path.basename(first_dir), os.path.basename(second_dir))
+        self.assertGreater(manifest['rows']['item'], 0)
+        self.assertEqual(manifest['tombstones'], 0)
+        incomplete_dir = new_batch_dir(self.test_dir)
+        self.assertFalse(os.path.exists(os.path.join(incomplete_dir, BATCH_MANIFEST_FILE)))
+
+        self.assertEqual(pending_batches(self.test_dir), [os.path.basename(first_dir), os.path.basename(second_dir)])
+        mark_batch_applied(os.path.basename(first_dir), os.path.join(self.test_dir, IMPORT_STATE_FILE))
+        self.assertEqual(pending_batches(self.test_dir), [os.path.basename(second_dir)])
+
+    def test_batch_load_plan_covers_its_tables(self):
+        """The load plan of a batch loads its unsplit tables from the batch directory"""
+        batch_dir, manifest = self._run_batch()
+        with open(os.path.join(batch_dir, 'load_manifest.json'), 'r', encoding='utf-8') as f:
+            parts = json.load(f)['parts']
+        self.assertIn({'table': 'item', 'path': 'item.csv'},
+                      [{'table': part['table'], 'path': part['path']} for part in parts])
+        plan = write_load_plan(batch_dir, os.path.join(self.test_dir, 'plan'))
+        self.assertIn('item.csv', [part_path for part_path, _ in plan])
+        self.assertNotIn('uid.csv', [part_path for part_path, _ in plan])
+        with open(dict(plan)['item.csv'], 'r', encoding='utf-8') as f:
+            self.assertIn(f"'{os.path.join(batch_dir, 'item.csv')}'", f.read())
+
+    def test_delta_batch_tombstones(self):
+        """Changed records of a delta batch are deleted before the batch is loaded"""
+        self._run_batch(delta=True)
+        history_path = os.path.join(self.test_dir, 'processing_history.json')
+        with open(history_path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        uid = next(iter(history['processed_records']))
+        history['processed_records'][uid]['metadata']['content_hash'] = 'changed'
+        with open(history_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f)
+
+        batch_dir, manifest = self._run_batch(delta=True)
+        self.assertEqual(manifest['tombstones'], 1)
+        sql = tombstone_sql(batch_dir)
+        self.assertIn(os.path.join(batch_tombstone_dir(batch_dir), 'uid.csv'), sql)
+        self.assertIn("DELETE t FROM item_references t JOIN tombstone_uid d ON t.uid = d.uid;", sql)
+        with open(os.path.join(batch_dir, 'load_manifest.json'), 'r', encoding='utf-8') as f:
+            part_paths = [part['path'] for part in json.load(f)['parts']]
+        self.assertNotIn(os.path.join('tombstones', 'item.csv'), part_paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
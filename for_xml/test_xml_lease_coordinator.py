@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for cooperative multi-node processing through lease files
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from unittest import mock
+
+from xml_file_commit import COMMITS_DIR_NAME, StagedCommitWriter
+from xml_info_load_api import load_xml_file
+from xml_lease_coordinator import (LeaseCoordinator, LeaseLostError, LeasedCallback, SharedHistoryView,
+                                   make_work_units, run_cooperative_node)
+from xml_processing_history import ProcessingHistoryManager
+from xml_record_batch import RecordBatchCallback
+from xml_test_helpers import EXAMPLES_DIR, EXAMPLE_XML
+
+
+def record_uid_handler(parser, output_path):
+    """Picklable record callback appending the UID to a node-local file"""
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write(parser.uid + "\n")
+
+
+class TestLeaseCoordinator(unittest.TestCase):
+    """Test cases for LeaseCoordinator"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.lease_dir = os.path.join(self.test_dir, 'leases')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def test_work_units_are_deterministic(self):
+        """Every node derives the same unit ids regardless of input order"""
+        files = [os.path.join(self.test_dir, f"{i}.xml") for i in range(5)]
+        self.assertEqual(make_work_units(files), make_work_units(list(reversed(files))))
+        bundles = make_work_units(files, bundle_size=2)
+        self.assertEqual([len(paths) for _, paths in bundles], [2, 2, 1])
+
+    def test_claim_is_exclusive(self):
+        """Only one node can hold a lease, and done units cannot be claimed"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a')
+        node_b = LeaseCoordinator(self.lease_dir, 'b')
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+        self.assertFalse(node_b.try_claim('unit', ['f.xml']))
+        self.assertEqual(node_b.lease_owner('unit'), 'a')
+
+        node_a.complete('unit', ['f.xml'])
+        self.assertTrue(node_b.is_finished('unit'))
+        self.assertFalse(node_b.try_claim('unit', ['f.xml']))
+
+    def test_expired_lease_is_reclaimed(self):
+        """A lease without heartbeat past the TTL is taken over"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a', lease_ttl=60)
+        node_b = LeaseCoordinator(self.lease_dir, 'b', lease_ttl=60)
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+
+        stale = time.time() - 120
+        os.utime(os.path.join(self.lease_dir, 'unit.lease'), (stale, stale))
+        self.assertTrue(node_b.try_claim('unit', ['f.xml']))
+        self.assertEqual(node_b.lease_owner('unit'), 'b')
+
+        node_a.heartbeat()
+        self.assertIn('unit', node_a.lost)
+
+    def test_fresh_lease_is_not_reclaimed(self):
+        """A lease renewed between the expiry check and the rename is put back"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a', lease_ttl=60)
+        node_b = LeaseCoordinator(self.lease_dir, 'b', lease_ttl=60)
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+
+        now = time.time()
+        with mock.patch.object(node_b, '_server_time', side_effect=[now + 120, now]):
+            self.assertFalse(node_b._reclaim_if_expired(os.path.join(self.lease_dir, 'unit.lease')))
+        self.assertEqual(node_b.lease_owner('unit'), 'a')
+        self.assertTrue(node_a.holds('unit'))
+        self.assertEqual(sorted(name for name in os.listdir(self.lease_dir) if not name.startswith('.')),
+                         ['unit.lease'])
+
+    def test_local_clock_skew_does_not_expire_lease(self):
+        """Lease ages use the file server's clock, not the clock of the checking host"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a', lease_ttl=60)
+        node_b = LeaseCoordinator(self.lease_dir, 'b', lease_ttl=60)
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+
+        with mock.patch('xml_lease_coordinator.time.time', return_value=time.time() + 3600):
+            self.assertFalse(node_b.try_claim('unit', ['f.xml']))
+            self.assertTrue(node_a.holds('unit'))
+        self.assertEqual(node_b.lease_owner('unit'), 'a')
+
+    def test_lost_lease_discards_staged_rows(self):
+        """A node whose lease was taken over neither commits the file nor marks the unit done"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a', lease_ttl=60)
+        node_b = LeaseCoordinator(self.lease_dir, 'b', lease_ttl=60)
+        self.assertTrue(node_a.try_claim('unit', [EXAMPLE_XML]))
+        stale = time.time() - 120
+        os.utime(os.path.join(self.lease_dir, 'unit.lease'), (stale, stale))
+        self.assertTrue(node_b.try_claim('unit', [EXAMPLE_XML]))
+
+        output_dir = os.path.join(self.test_dir, 'out')
+        callback = LeasedCallback(RecordBatchCallback(output_dir, sink_class=StagedCommitWriter), node_a, 'unit')
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        with self.assertRaises(LeaseLostError):
+            load_xml_file(EXAMPLE_XML, callback, True, history_manager)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, COMMITS_DIR_NAME)))
+        self.assertEqual(history_manager.get_processed_count(), 0)
+        self.assertFalse(node_a.complete('unit', [EXAMPLE_XML]))
+        self.assertFalse(node_a.is_finished('unit'))
+        self.assertEqual(node_a.lease_owner('unit'), 'b')
+
+    def test_failed_units_can_be_retried(self):
+        """Clearing the .failed marker makes a unit claimable again"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a')
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+        node_a.fail('unit', ['f.xml'], 'boom')
+        self.assertFalse(node_a.try_claim('unit', ['f.xml']))
+        self.assertEqual(node_a.clear_failed(['unit', 'other']), 1)
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+
+    def test_shared_history_sees_other_shards(self):
+        """Records of other shards count as processed, with their content hashes"""
+        peer = ProcessingHistoryManager(os.path.join(self.test_dir, 'peer.json'))
+        peer.mark_record_processed('WOS:1', None, {'content_hash': 'abc'})
+        own = ProcessingHistoryManager(os.path.join(self.test_dir, 'own.json'))
+        own.mark_record_processed('WOS:2', None, {'content_hash': 'def'})
+        view = SharedHistoryView(own, [peer.history_file, own.history_file])
+        self.assertTrue(view.is_record_processed('WOS:1'))
+        self.assertEqual(view.get_record_hash('WOS:1'), 'abc')
+        self.assertEqual(view.get_record_hash('WOS:2'), 'def')
+        self.assertFalse(view.is_record_processed('WOS:3'))
+        view.mark_record_processed('WOS:3', None)
+        self.assertTrue(own.is_record_processed('WOS:3'))
+
+    def test_heartbeat_keeps_lease_alive(self):
+        """A heartbeat refreshes the lease mtime"""
+        node_a = LeaseCoordinator(self.lease_dir, 'a', lease_ttl=60)
+        node_b = LeaseCoordinator(self.lease_dir, 'b', lease_ttl=60)
+        self.assertTrue(node_a.try_claim('unit', ['f.xml']))
+
+        stale = time.time() - 120
+        os.utime(os.path.join(self.lease_dir, 'unit.lease'), (stale, stale))
+        node_a.heartbeat()
+        self.assertFalse(node_b.try_claim('unit', ['f.xml']))
+
+
+class TestCooperativeNodes(unittest.TestCase):
+    """Several local processes split a set of files between them"""
+
+    def setUp(self):
+        """Create four copies of the example delivery"""
+        self.test_dir = tempfile.mkdtemp()
+        examples_dir = EXAMPLES_DIR
+        self.files = []
+        for i in range(4):
+            path = os.path.join(self.test_dir, f"chunk{i}.xml")
+            shutil.copy(os.path.join(examples_dir, '1985.xml'), path)
+            self.files.append(path)
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def test_each_unit_processed_once(self):
+        """Every file is processed by exactly one node"""
+        units = make_work_units(self.files)
+        lease_dir = os.path.join(self.test_dir, 'leases')
+        node_ids = ['node0', 'node1', 'node2']
+
+        with ProcessPoolExecutor(max_workers=len(node_ids)) as executor:
+            futures = [
+                executor.submit(
+                    run_cooperative_node, units,
+                    partial(record_uid_handler, output_path=os.path.join(self.test_dir, node_id + '.uids')),
+                    lease_dir, node_id, False, False,
+                    os.path.join(self.test_dir, node_id + '.history.json'), 60, 0.1)
+                for node_id in node_ids
+            ]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(sum(result['ok'] for result in results), len(units))
+        self.assertEqual(sum(result['failed'] for result in results), 0)
+        done_markers = [name for name in os.listdir(lease_dir) if name.endswith('.done')]
+        self.assertEqual(len(done_markers), len(units))
+
+        uid_count = 0
+        for node_id in node_ids:
+            uid_path = os.path.join(self.test_dir, node_id + '.uids')
+            if os.path.exists(uid_path):
+                with open(uid_path, encoding='utf-8') as f:
+                    uid_count += sum(1 for _ in f)
+        self.assertEqual(uid_count, 100 * len(self.files))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for size-capped CSV part files and their load manifest
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+from csv_writer import XMLDataWriter, close_part_files, file_sha256
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+from xml_load_manifest import build_load_manifest, count_csv_rows, write_load_plan
+from xml_parser import XMLRecordParser
+from xml_record_batch import RecordBatch
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestLoadManifest(unittest.TestCase):
+    """Test cases for part files and load_manifest.json"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        close_part_files()
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, output_dir, batch_size=20, **kwargs):
+        """Write the example records in batches, each batch through a new writer"""
+        for start in range(0, len(self.parsers), batch_size):
+            batch = RecordBatch()
+            for parser in self.parsers[start:start + batch_size]:
+                batch.add_record(parser)
+            writer = XMLDataWriter(output_dir, **kwargs)
+            writer.write_batch(batch)
+            writer.close()
+
+    def _read_rows(self, file_path):
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            return list(csv.reader(f))
+
+    def test_parts_hold_the_rows_of_the_single_file(self):
+        """Parts respect the row cap and concatenate to the unsplit file"""
+        flat_dir = os.path.join(self.test_dir, 'flat')
+        parts_dir = os.path.join(self.test_dir, 'parts')
+        self._write(flat_dir)
+        self._write(parts_dir, max_part_rows=150)
+        close_part_files()
+        manifest = build_load_manifest(parts_dir)
+
+        for table_name in XML_TABLE_COLUMNS:
+            expected = self._read_rows(os.path.join(flat_dir, table_name + '.csv'))
+            parts = [part for part in manifest['parts'] if part['table'] == table_name]
+            if len(expected) == 1:
+                self.assertEqual(parts, [], table_name)
+                continue
+            rows = []
+            for part in parts:
+                part_rows = self._read_rows(os.path.join(parts_dir, part['path']))
+                self.assertEqual(part_rows[0], expected[0])
+                self.assertLessEqual(part['rows'], 150)
+                self.assertEqual(part['rows'], len(part_rows) - 1)
+                self.assertEqual(part['sha256'], file_sha256(os.path.join(parts_dir, part['path'])))
+                rows.extend(part_rows[1:])
+            self.assertEqual(rows, expected[1:], table_name)
+        self.assertFalse(os.path.exists(os.path.join(parts_dir, 'item_references.csv')))
+
+    def test_byte_cap_and_compressed_parts(self):
+        """Compressed parts roll over at the byte cap and count their rows"""
+        parts_dir = os.path.join(self.test_dir, 'parts')
+        self._write(parts_dir, compression='gzip', max_part_bytes=16 * 1024)
+        close_part_files()
+        manifest = build_load_manifest(parts_dir)
+        references = [part for part in manifest['parts'] if part['table'] == 'item_references']
+        self.assertGreater(len(references), 1)
+        self.assertEqual(references[0]['path'], 'item_references.00001.csv.gz')
+        for part in references:
+            self.assertEqual(part['rows'], count_csv_rows(os.path.join(parts_dir, part['path'])))
+
+    def test_load_plan_skips_loaded_parts_and_checks_checksums(self):
+        """Only unloaded parts are planned, and a changed part is refused"""
+        parts_dir = os.path.join(self.test_dir, 'parts')
+        self._write(parts_dir, max_part_rows=150)
+        close_part_files()
+        manifest = build_load_manifest(parts_dir)
+        loadable = [part['path'] for part in manifest['parts'] if part['table'] != 'uid']
+
+        loaded_path = os.path.join(parts_dir, 'loaded_parts.txt')
+        with open(loaded_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(loadable[1:]) + '\n')
+        plan = write_load_plan(parts_dir, os.path.join(self.test_dir, 'plan'), loaded_path)
+        self.assertEqual([part_path for part_path, _ in plan], loadable[:1])
+        with open(plan[0][1], 'r', encoding='utf-8') as f:
+            self.assertIn(os.path.abspath(os.path.join(parts_dir, loadable[0])), f.read())
+
+        with open(os.path.join(parts_dir, loadable[0]), 'a', encoding='utf-8') as f:
+            f.write('WOS:X\r\n')
+        with self.assertRaises(ValueError):
+            write_load_plan(parts_dir, os.path.join(self.test_dir, 'plan'), loaded_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
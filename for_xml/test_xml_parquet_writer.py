@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the Parquet output sink
+"""
+
+import unittest
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_parser import XMLRecordParser
+from xml_processing_history import ProcessingHistoryManager
+from xml_parquet_writer import close_parquet_writers, pa
+from xml_test_helpers import EXAMPLE_XML
+
+if pa is not None:
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestParquetWriter(unittest.TestCase):
+    """Test cases for XMLParquetWriter"""
+
+    def setUp(self):
+        """Write the example file as CSV and as Parquet"""
+        self.test_dir = tempfile.mkdtemp()
+        self.csv_dir = os.path.join(self.test_dir, 'csv')
+        self.parquet_dir = os.path.join(self.test_dir, 'pq')
+        for output_dir, output_format in ((self.csv_dir, 'csv'), (self.parquet_dir, 'parquet')):
+            history_manager = ProcessingHistoryManager(os.path.join(output_dir, 'history.json'))
+            callback = make_record_callback(output_dir, batch_size=30, output_format=output_format)
+            load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        self.history_file = history_manager.history_file
+        self.unpublished_count = ProcessingHistoryManager(self.history_file).get_processed_count()
+        close_parquet_writers()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _csv_rows(self, table_name):
+        with open(os.path.join(self.csv_dir, table_name + '.csv'), newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+
+    def _parquet_table(self, table_name):
+        return ds.dataset(os.path.join(self.parquet_dir, 'parquet', table_name), format='parquet').to_table()
+
+    def test_row_counts_match_csv(self):
+        """Every table has the same rows as its CSV file"""
+        for table_name in XML_TABLE_COLUMNS:
+            csv_rows = self._csv_rows(table_name)
+            table_dir = os.path.join(self.parquet_dir, 'parquet', table_name)
+            if not csv_rows:
+                self.assertFalse(os.path.exists(table_dir), table_name)
+                continue
+            self.assertEqual(self._parquet_table(table_name).num_rows, len(csv_rows), table_name)
+
+    def test_sql_column_types(self):
+        """Types follow create_database_and_tables.sql; empty values are NULL"""
+        table = self._parquet_table('item')
+        self.assertEqual(table.schema.field('pubyear').type, pa.int16())
+        self.assertEqual(table.schema.field('sortdate').type, pa.date32())
+        self.assertEqual(table.schema.field('vol').type, pa.string())
+
+        csv_rows = self._csv_rows('item')
+        self.assertEqual(table.column('pubyear').to_pylist(), [int(row['pubyear']) for row in csv_rows])
+        self.assertEqual(table.column('sortdate').to_pylist(),
+                         [datetime.date.fromisoformat(row['sortdate']) for row in csv_rows])
+        self.assertEqual(table.column('supplement').to_pylist(),
+                         [row['supplement'] or None for row in csv_rows])
+
+    def test_dictionary_encoding_and_complete_parts(self):
+        """Repetitive columns are dictionary-encoded and no temporary parts remain"""
+        table_dir = os.path.join(self.parquet_dir, 'parquet', 'item_doc_types')
+        part_files = os.listdir(table_dir)
+        self.assertTrue(all(name.endswith('.parquet') for name in part_files))
+        metadata = pq.ParquetFile(os.path.join(table_dir, part_files[0])).metadata
+        self.assertIn('RLE_DICTIONARY', metadata.row_group(0).column(1).encodings)
+
+    def test_records_marked_after_publish(self):
+        """Records and files are marked only once the part files are published"""
+        self.assertEqual(self.unpublished_count, 0)
+        history_manager = ProcessingHistoryManager(self.history_file)
+        self.assertEqual(history_manager.get_processed_count(), 100)
+        self.assertTrue(history_manager.is_file_processed(EXAMPLE_XML))
+
+    def test_one_part_per_process_across_files(self):
+        """Input files of one process share a part file per table; failed files leave no rows"""
+        output_dir = os.path.join(self.test_dir, 'two-files')
+        history_manager = ProcessingHistoryManager(os.path.join(output_dir, 'history.json'))
+        callback = make_record_callback(output_dir, batch_size=30, output_format='parquet')
+        load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        # An input file that fails after some records
+        for record in ET.parse(EXAMPLE_XML).getroot().findall('.//ns:REC', WOS_NAMESPACE)[:40]:
+            callback(XMLRecordParser(record))
+        callback.discard()
+        load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        self.assertEqual(close_parquet_writers(), 2)
+
+        table_dir = os.path.join(output_dir, 'parquet', 'item')
+        self.assertEqual(len(os.listdir(table_dir)), 1)
+        metadata = pq.ParquetFile(os.path.join(table_dir, os.listdir(table_dir)[0])).metadata
+        self.assertEqual((metadata.num_rows, metadata.num_row_groups), (200, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for partitioned output by pubyear and edition
+"""
+
+import unittest
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+
+from csv_writer import XMLDataWriter
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+from xml_parser import XMLRecordParser
+from xml_partitioned_writer import (PartitionedWriter, build_partition_manifest, edition_filter, edition_label,
+                                    partitions_with_edition, record_partitions, PARTITION_MANIFEST_FILE)
+from xml_record_batch import RecordBatch
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestPartitionedWriter(unittest.TestCase):
+    """Test cases for PartitionedWriter"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _batch(self, parsers):
+        batch = RecordBatch()
+        for parser in parsers:
+            batch.add_record(parser)
+        return batch
+
+    def test_edition_label(self):
+        """Editions lose their prefix and several editions are combined in order"""
+        self.assertEqual(edition_label(['WOS.SCI']), 'SCI')
+        self.assertEqual(edition_label(['WOS.SSCI', 'WOS.SCI', 'WOS.SCI']), 'SCI+SSCI')
+        self.assertEqual(edition_label([]), 'unknown')
+
+    def test_edition_filter(self):
+        """The edition filter and the manifest lookup include combined partitions"""
+        labels = ['SCI', 'SSCI', 'AHCI+SCI', 'SCI+SSCI', 'AHCI+SCI+SSCI', 'AHCI+SSCI', 'unknown']
+        connection = sqlite3.connect(':memory:')
+        connection.execute("CREATE TABLE partitions (edition TEXT)")
+        connection.executemany("INSERT INTO partitions VALUES (?)", [(label,) for label in labels])
+        query = f"SELECT edition FROM partitions WHERE {edition_filter('SCI')} ORDER BY edition"
+        self.assertEqual([edition for edition, in connection.execute(query)],
+                         ['AHCI+SCI', 'AHCI+SCI+SSCI', 'SCI', 'SCI+SSCI'])
+        connection.close()
+        manifest = {'partitions': [{'path': f"pubyear=1985/edition={label}",
+                                    'editions': [] if label == 'unknown' else label.split('+')} for label in labels]}
+        self.assertEqual(partitions_with_edition(manifest, 'SSCI'),
+                         ['pubyear=1985/edition=SSCI', 'pubyear=1985/edition=SCI+SSCI',
+                          'pubyear=1985/edition=AHCI+SCI+SSCI', 'pubyear=1985/edition=AHCI+SSCI'])
+
+    def test_split_keeps_record_rows_together(self):
+        """Every row lands in the partition of its record, none twice"""
+        batch = self._batch(self.parsers)
+        partitions = record_partitions(batch)
+        parts = batch.split(partitions)
+        self.assertEqual(sum(len(part) for part in parts.values()), len(self.parsers))
+        for key, part in parts.items():
+            for table_name in XML_TABLE_COLUMNS:
+                for row in part.rows(table_name):
+                    self.assertEqual(partitions[row[0]], key)
+        for table_name in XML_TABLE_COLUMNS:
+            self.assertEqual(sum(part.row_count(table_name) for part in parts.values()),
+                             batch.row_count(table_name))
+
+    def test_manifest_matches_partition_files(self):
+        """Manifest row counts equal the rows of the partition CSV files and of flat output"""
+        flat_dir = os.path.join(self.test_dir, 'flat')
+        out_dir = os.path.join(self.test_dir, 'out')
+        XMLDataWriter(flat_dir).write_batch(self._batch(self.parsers))
+        writer = PartitionedWriter(out_dir)
+        for start in range(0, len(self.parsers), 30):
+            writer.write_batch(self._batch(self.parsers[start:start + 30]))
+        writer.close()
+        manifest = build_partition_manifest(out_dir)
+
+        with open(os.path.join(out_dir, PARTITION_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['partitions'], manifest['partitions'])
+        self.assertEqual(sum(entry['records'] for entry in manifest['partitions']), len(self.parsers))
+        self.assertIn('pubyear=1985/edition=SCI', [entry['path'] for entry in manifest['partitions']])
+
+        for table_name in ('item', 'item_editions', 'item_references'):
+            with open(os.path.join(flat_dir, table_name + '.csv'), 'r', encoding='utf-8', newline='') as f:
+                flat_rows = sorted(list(csv.reader(f))[1:])
+            partition_rows = []
+            for entry in manifest['partitions']:
+                path = os.path.join(out_dir, entry['path'], table_name + '.csv')
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    rows = list(csv.reader(f))[1:]
+                self.assertEqual(len(rows), entry['rows'][table_name])
+                partition_rows.extend(rows)
+            self.assertEqual(sorted(partition_rows), flat_rows, table_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
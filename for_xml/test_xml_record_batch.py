@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for columnar record batches
+"""
+
+import unittest
+import copy
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from array import array
+
+from csv_writer import XMLDataWriter
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS
+from xml_info_load_api import load_xml_file
+from xml_parser import XMLRecordParser
+from xml_processing_history import ProcessingHistoryManager
+from xml_record_batch import RecordBatch, RecordBatchCallback
+from xml_test_helpers import EXAMPLE_XML
+
+
+class FailingSink:
+    """Sink whose writes always fail"""
+
+    def __init__(self, output_dir=None):
+        pass
+
+    def write_batch(self, batch):
+        raise IOError("disk full")
+
+
+class TestRecordBatch(unittest.TestCase):
+    """Test cases for RecordBatch"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def test_rows_match_per_record_tuples(self):
+        """Batch rows are the concatenated per-record rows"""
+        batch = RecordBatch()
+        for parser in self.parsers:
+            batch.add_record(parser)
+        self.assertEqual(len(batch), len(self.parsers))
+        for table_name in XML_TABLE_COLUMNS:
+            expected = [row for parser in self.parsers for row in parser.extract_tuples(table_name)]
+            self.assertEqual(batch.rows(table_name), expected, table_name)
+            self.assertEqual(batch.row_count(table_name), len(expected))
+
+    def test_typed_columns(self):
+        """Integer columns become typed arrays; others stay as extracted"""
+        batch = RecordBatch()
+        for parser in self.parsers:
+            batch.add_record(parser)
+        pubyear = batch.column('item', 'pubyear')
+        self.assertIsInstance(pubyear, array)
+        self.assertEqual(pubyear.typecode, 'h')
+        self.assertEqual(set(pubyear), {1985})
+        self.assertIsInstance(batch.column('item', 'uid'), list)
+
+    def test_non_canonical_integers_are_not_typed(self):
+        """Empty values and leading zeros keep a column untyped"""
+        batch = RecordBatch({'item_authors': ('uid', 'seq_no')})
+        batch.columns['item_authors'] = [['WOS:1', 'WOS:2'], ['1', '']]
+        self.assertEqual(batch.column('item_authors', 'seq_no'), ['1', ''])
+        batch.columns['item_authors'] = [['WOS:1', 'WOS:2'], ['1', '02']]
+        self.assertEqual(batch.column('item_authors', 'seq_no'), ['1', '02'])
+
+    def test_batched_output_matches_per_record_output(self):
+        """Writing in batches produces the same files as writing per record"""
+        per_record_dir = os.path.join(self.test_dir, 'per_record')
+        batched_dir = os.path.join(self.test_dir, 'batched')
+        callback = RecordBatchCallback(batched_dir, batch_size=7)
+        for parser in self.parsers:
+            XMLDataWriter(per_record_dir).write_record_data(parser)
+            callback(parser)
+        callback.flush()
+
+        for table_name in XML_TABLE_COLUMNS:
+            with open(os.path.join(per_record_dir, table_name + '.csv'), 'rb') as f:
+                expected = f.read()
+            with open(os.path.join(batched_dir, table_name + '.csv'), 'rb') as f:
+                self.assertEqual(f.read(), expected, table_name)
+
+    def test_records_marked_only_after_write(self):
+        """Records of a batch that fails to write are not marked as processed"""
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        callback = RecordBatchCallback(os.path.join(self.test_dir, 'out'), batch_size=30, sink_class=FailingSink)
+        with self.assertRaises(IOError):
+            load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        processed = [info for info in history_manager.history["processed_records"].values()
+                     if not info.get("error")]
+        self.assertEqual(processed, [])
+
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history2.json'))
+        callback = RecordBatchCallback(os.path.join(self.test_dir, 'out'), batch_size=30)
+        load_xml_file(EXAMPLE_XML, callback, False, history_manager)
+        self.assertEqual(history_manager.get_processed_count(), len(self.parsers))
+
+    def test_repeated_uid_in_one_batch_is_skipped(self):
+        """A record repeated within one batch is written once, as with per-record writing"""
+        ET.register_namespace('', WOS_NAMESPACE['ns'])
+        tree = ET.parse(EXAMPLE_XML)
+        records = tree.getroot().findall('.//ns:REC', WOS_NAMESPACE)
+        tree.getroot().append(copy.deepcopy(records[2]))
+        repeated = os.path.join(self.test_dir, 'repeated.xml')
+        tree.write(repeated, encoding='utf-8', xml_declaration=True)
+
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        callback = RecordBatchCallback(os.path.join(self.test_dir, 'out'), batch_size=500)
+        load_xml_file(repeated, callback, True, history_manager)
+        with open(os.path.join(self.test_dir, 'out', 'uid.csv'), 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), len(self.parsers) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the reference resolver
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+
+from csv_writer import CSV_DIALECT
+from xml_reference_resolver import (MATCH_AUTHOR_YEAR_VOLUME_PAGE, MATCH_DOI, RESOLVED_CITATIONS_FILE,
+                                    build_resolved_citations, normalize_page, normalize_surname)
+from xml_test_helpers import write_table
+
+
+class TestReferenceResolver(unittest.TestCase):
+    """Test cases for build_resolved_citations"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+        os.makedirs(self.output_dir)
+        items = [
+            ('WOS:SOURCE1', 'PERLMANN, J', '1979', '12', '66'),
+            ('WOS:SOURCE2', 'TREIMAN, DJ', '1976', '7', '283'),
+            # Two records with the same key: never a match
+            ('WOS:TWIN1', 'KATZ, MB', '1975', '3', '10'),
+            ('WOS:TWIN2', 'KATZ, M', '1975', '3', '10'),
+            ('WOS:CITING', 'SMITH, A', '1985', '40', '388'),
+        ]
+        write_table(self.output_dir, 'item', [{'uid': uid, 'pubyear': year, 'vol': volume, 'page_begin': page}
+                                              for uid, _, year, volume, page in items])
+        write_table(self.output_dir, 'item_authors', [{'uid': uid, 'seq_no': '1', 'wos_standard': name}
+                                                      for uid, name, _, _, _ in items]
+                    + [{'uid': 'WOS:SOURCE1', 'seq_no': '2', 'wos_standard': 'OTHER, X'}])
+        write_table(self.output_dir, 'item_ids', [
+            {'uid': 'WOS:SOURCE2', 'identifier_type': 'xref_doi', 'identifier_value': '10.1000/ABC.123'},
+            {'uid': 'WOS:SOURCE1', 'identifier_type': 'issn', 'identifier_value': '0000-0000'},
+        ])
+        references = [
+            # By DOI, with a URL prefix and other case
+            {'cited_uid': '', 'cited_author': 'NOBODY', 'cited_doi': 'https://doi.org/10.1000/abc.123'},
+            # By author/year/volume/page, written differently
+            {'cited_uid': 'WOS:CITING.2', 'cited_author': 'Perlmann, A. J.', 'cited_year': '1979',
+             'cited_volume': '012', 'cited_page': 'P66'},
+            # Ambiguous key, missing parts, self citation, already linked
+            {'cited_uid': '', 'cited_author': 'KATZ MB', 'cited_year': '1975', 'cited_volume': '3', 'cited_page': '10'},
+            {'cited_uid': '', 'cited_author': 'PERLMANN, AJ', 'cited_year': '1979', 'cited_volume': '12'},
+            {'cited_uid': '', 'cited_author': 'SMITH, A', 'cited_year': '1985', 'cited_volume': '40',
+             'cited_page': '388'},
+            {'cited_uid': 'WOS:SOURCE1', 'cited_author': 'PERLMANN, J', 'cited_year': '1979', 'cited_volume': '12',
+             'cited_page': '66'},
+        ]
+        write_table(self.output_dir, 'item_references', [dict(reference, uid='WOS:CITING', occurence_order=str(order))
+                                                         for order, reference in enumerate(references, 1)])
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _read(self):
+        with open(os.path.join(self.output_dir, 'derived', RESOLVED_CITATIONS_FILE), 'r', encoding='utf-8',
+                  newline='') as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            next(reader)
+            return [tuple(row) for row in reader]
+
+    def test_resolves_by_doi_and_bibliographic_key(self):
+        """Unlinked references are matched by DOI or exact key; ambiguous, incomplete and self matches are not"""
+        expected = [('WOS:CITING', 'WOS:SOURCE2', '1', MATCH_DOI),
+                    ('WOS:CITING', 'WOS:SOURCE1', '2', MATCH_AUTHOR_YEAR_VOLUME_PAGE)]
+        for workers in (1, 2):
+            counts = build_resolved_citations(self.output_dir, workers=workers, chunk_references=2)
+            self.assertEqual(self._read(), expected)
+            self.assertEqual(counts['unlinked'], 5)
+            self.assertEqual((counts[MATCH_DOI], counts[MATCH_AUTHOR_YEAR_VOLUME_PAGE]), (1, 1))
+        with open(os.path.join(self.output_dir, 'derived', 'resolved_citations.sql'), 'r', encoding='utf-8') as f:
+            sql = f.read()
+        self.assertIn("(uid, cited_uid, @occurence_order, match_method)", sql)
+        csv_path = os.path.abspath(os.path.join(self.output_dir, 'derived', 'resolved_citations.csv'))
+        self.assertIn(f"LOAD DATA LOCAL INFILE '{csv_path}'", sql)
+
+    def test_normalization(self):
+        """Surnames and pages are compared without formatting"""
+        for name in ('PERLMANN, AJ', 'Perlmann, A. J.', 'PERLMANN AJ', 'Perlmänn, J'):
+            self.assertEqual(normalize_surname(name), 'PERLMANN')
+        self.assertEqual(normalize_page('P066'), '66')
+        self.assertEqual(normalize_page('283-290'), '283')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the streaming run statistics
+"""
+
+import unittest
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import WOS_NAMESPACE
+from xml_derived_tables import table_rows
+from xml_parser import XMLRecordParser
+from xml_record_batch import RecordBatch
+from xml_run_stats import (COUNTED_COLUMNS, HEAVY_HITTER_COLUMNS, RUN_STATS_FILE, RUN_SUMMARY_CSV_FILE,
+                           RUN_SUMMARY_FILE, RunStatisticsWriter, SpaceSaving, build_run_summary)
+from xml_test_helpers import EXAMPLE_XML
+
+
+def _zipf_stream(length, seed):
+    """Skewed stream of values: value i occurs about 1 / i times as often as value 1"""
+    rng = random.Random(seed)
+    values = [f"v{i}" for i in range(1, 2001)]
+    weights = [1 / i for i in range(1, 2001)]
+    return rng.choices(values, weights, k=length)
+
+
+class TestSpaceSaving(unittest.TestCase):
+    """Test cases for the Space-Saving summary"""
+
+    def _assert_bounds(self, summary, exact):
+        for value, count, error in summary.top():
+            self.assertLessEqual(count - error, exact[value])
+            self.assertLessEqual(exact[value], count)
+            self.assertLessEqual(error, summary.floor)
+        for value, count in exact.items():
+            if value not in summary.counters:
+                self.assertLessEqual(count, summary.floor)
+
+    def test_exact_below_capacity(self):
+        """With fewer values than its capacity the summary counts exactly"""
+        summary = SpaceSaving(10)
+        for value in 'abcabca':
+            summary.add(value)
+        self.assertEqual(summary.top(), [('a', 3, 0), ('b', 2, 0), ('c', 2, 0)])
+        self.assertEqual((summary.floor, summary.total), (0, 7))
+
+    def test_error_bounds(self):
+        """Counts bound the true counts from above, errors stay below floor <= N / k"""
+        stream = _zipf_stream(20000, 1)
+        summary = SpaceSaving(50)
+        for value in stream:
+            summary.add(value)
+        exact = Counter(stream)
+        self._assert_bounds(summary, exact)
+        self.assertLessEqual(summary.floor, len(stream) / 50)
+        self.assertEqual([value for value, _, _ in summary.top(3)], [value for value, _ in exact.most_common(3)])
+
+    def test_merge(self):
+        """Merged shard summaries keep valid bounds and survive a JSON round trip"""
+        stream = _zipf_stream(30000, 2)
+        merged = SpaceSaving(50)
+        for start in range(0, len(stream), 7000):
+            shard = SpaceSaving(50)
+            for value, count in Counter(stream[start:start + 7000]).items():
+                shard.add(value, count)
+            merged.merge(SpaceSaving.from_dict(json.loads(json.dumps(shard.to_dict()))))
+        self._assert_bounds(merged, Counter(stream))
+        self.assertEqual(merged.total, len(stream))
+        self.assertEqual(len(merged.counters), 50)
+        self.assertEqual(merged.top(1)[0][0], 'v1')
+        merged.add('new')
+        self.assertEqual(merged.counters['new'], [merged.floor + 1, merged.floor])
+
+
+class TestRunStatistics(unittest.TestCase):
+    """Test cases for RunStatisticsWriter and build_run_summary"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, output_dir, parsers):
+        """Write the records like one input file, in batches of 30"""
+        writer = RunStatisticsWriter(output_dir)
+        for start in range(0, len(parsers), 30):
+            batch = RecordBatch()
+            for parser in parsers[start:start + 30]:
+                batch.add_record(parser)
+            writer.write_batch(batch)
+        writer.close()
+
+    def _exact(self, table_name, column):
+        """Records per value from the written tables"""
+        pairs = {(uid, value) for uid, value in table_rows(self.output_dir, table_name, ('uid', column)) if value}
+        return Counter(value for _, value in pairs)
+
+    def test_summary_matches_tables(self):
+        """Counts from two files and a node shard equal the counts of the written tables"""
+        middle = len(self.parsers) // 2
+        self._write(self.output_dir, self.parsers[:middle])
+        self._write(os.path.join(self.output_dir, 'node=a-w0'), self.parsers[middle:])
+        summary = build_run_summary(self.output_dir)
+
+        self.assertEqual(summary['records'], len(self.parsers))
+        for name, (table_name, column) in COUNTED_COLUMNS.items():
+            self.assertEqual(summary['counts'][name], dict(self._exact(table_name, column)), name)
+            self.assertTrue(summary['counts'][name] or name == 'country')
+        for name, (table_name, column) in HEAVY_HITTER_COLUMNS.items():
+            exact = self._exact(table_name, column)
+            top = [(entry['value'], entry['count'], entry['error']) for entry in summary['heavy_hitters'][name]['top']]
+            self.assertEqual(top, sorted(((value, count, 0) for value, count in exact.items()),
+                                         key=lambda entry: (-entry[1], entry[0]))[:100], name)
+
+        with open(os.path.join(self.output_dir, RUN_SUMMARY_FILE), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['records'], len(self.parsers))
+        with open(os.path.join(self.output_dir, RUN_SUMMARY_CSV_FILE), 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f, dialect=CSV_DIALECT))
+        self.assertEqual(rows[1], ['records', '', str(len(self.parsers)), '0'])
+
+    def test_discarded_file_is_not_counted(self):
+        """A failed input file leaves no statistics"""
+        writer = RunStatisticsWriter(self.output_dir)
+        batch = RecordBatch()
+        batch.add_record(self.parsers[0])
+        writer.write_batch(batch)
+        writer.discard()
+        writer.close()
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, RUN_STATS_FILE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the heavy-hitter sketches
+"""
+
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+import xml_sketches
+
+from xml_common_def import WOS_NAMESPACE
+from xml_derived_tables import table_rows
+from xml_parser import XMLRecordParser
+from xml_record_batch import RecordBatch
+from xml_sketches import (MERGED_SKETCH_FILE, SKETCH_COLUMNS, SKETCH_DIR_NAME, ColumnSketch, CountMinSketch,
+                          SketchWriter, build_merged_sketches, combine_sketches, load_sketches, np,
+                          save_process_sketches, save_sketches, sketch_paths)
+from xml_test_helpers import EXAMPLE_XML
+
+
+def _zipf_counts(length, seed):
+    """Counts of a skewed stream: value i occurs about 1 / i times as often as value 1"""
+    rng = random.Random(seed)
+    values = [f"v{i}" for i in range(1, 5001)]
+    return Counter(rng.choices(values, [1 / i for i in range(1, 5001)], k=length))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestCountMinSketch(unittest.TestCase):
+    """Test cases for the Count-Min sketch and the column sketch"""
+
+    def test_error_bounds(self):
+        """Estimates never undercount and stay within e / w * N for nearly all values"""
+        counts = _zipf_counts(50000, 1)
+        sketch = CountMinSketch(width=512, depth=4)
+        sketch.add(counts)
+        self.assertEqual(sketch.total, 50000)
+        bound = sketch.epsilon * sketch.total
+        errors = [sketch.estimate(value) - count for value, count in counts.items()]
+        self.assertGreaterEqual(min(errors), 0)
+        self.assertLessEqual(sum(error > bound for error in errors), len(errors) * sketch.delta * 2)
+
+    def test_merge_is_exact(self):
+        """The merge of shard sketches equals the sketch of the whole stream"""
+        counts = _zipf_counts(20000, 2)
+        whole = ColumnSketch(1024, 3, 100)
+        whole.add(counts)
+        merged = ColumnSketch(1024, 3, 100)
+        items = list(counts.items())
+        for start in range(0, len(items), 700):
+            shard = ColumnSketch(1024, 3, 100)
+            shard.add(dict(items[start:start + 700]))
+            merged.merge(shard)
+        np.testing.assert_array_equal(merged.count_min.table, whole.count_min.table)
+        for value, lower, upper in merged.top(10):
+            self.assertLessEqual(lower, counts[value])
+            self.assertLessEqual(counts[value], upper)
+        self.assertEqual([value for value, _, _ in merged.top(3)], [value for value, _ in counts.most_common(3)])
+        with self.assertRaises(ValueError):
+            merged.merge(ColumnSketch(512, 3, 100))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestSketchWriter(unittest.TestCase):
+    """Test cases for SketchWriter and the sketch files"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the example records"""
+        root = ET.parse(EXAMPLE_XML).getroot()
+        cls.parsers = [XMLRecordParser(record) for record in root.findall('.//ns:REC', WOS_NAMESPACE)]
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, output_dir, parsers):
+        """Write the records like one input file, in batches of 30"""
+        writer = SketchWriter(output_dir)
+        for start in range(0, len(parsers), 30):
+            batch = RecordBatch()
+            for parser in parsers[start:start + 30]:
+                batch.add_record(parser)
+            writer.write_batch(batch)
+        writer.close()
+
+    def test_sketches_match_tables(self):
+        """Shards of two files and a node shard merge into the counts of the written tables"""
+        third = len(self.parsers) // 3
+        self._write(self.output_dir, self.parsers[:third])
+        self._write(self.output_dir, self.parsers[third:2 * third])
+        self._write(os.path.join(self.output_dir, 'node=a-w0'), self.parsers[2 * third:])
+
+        sketches = build_merged_sketches(self.output_dir)
+        # One shard per process and output directory
+        self.assertEqual(len(os.listdir(os.path.join(self.output_dir, SKETCH_DIR_NAME))), 1)
+        self.assertEqual(len(sketch_paths([self.output_dir])), 2)
+        merged = load_sketches(os.path.join(self.output_dir, MERGED_SKETCH_FILE))
+        for name, (table_name, column) in SKETCH_COLUMNS.items():
+            exact = Counter(value for value, in table_rows(self.output_dir, table_name, (column,)) if value)
+            self.assertEqual(merged[name].count_min.total, sum(exact.values()), name)
+            np.testing.assert_array_equal(merged[name].count_min.table, sketches[name].count_min.table)
+            for value, count in exact.items():
+                lower, upper = merged[name].estimate(value)
+                self.assertLessEqual(lower, count)
+                self.assertLessEqual(count, upper)
+            if exact:
+                self.assertEqual(merged[name].top(1)[0][2], exact.most_common(1)[0][1])
+        # The merged file is not counted again
+        combined = combine_sketches([self.output_dir])
+        self.assertEqual(combined['cited_work'].count_min.total, merged['cited_work'].count_min.total)
+
+    def test_shard_saved_every_interval(self):
+        """Process sketches are only saved every SKETCH_SAVE_INTERVAL files"""
+        interval = xml_sketches.SKETCH_SAVE_INTERVAL
+        xml_sketches.SKETCH_SAVE_INTERVAL = 2
+        try:
+            sketch_dir = os.path.join(self.output_dir, SKETCH_DIR_NAME)
+            self._write(self.output_dir, self.parsers[:5])
+            self.assertFalse(os.path.exists(sketch_dir))
+            self._write(self.output_dir, self.parsers[5:10])
+            self.assertEqual(len(os.listdir(sketch_dir)), 1)
+            self._write(self.output_dir, self.parsers[10:15])
+            total = load_sketches(sketch_paths([self.output_dir])[0])['cited_work'].count_min.total
+            save_process_sketches()
+            saved = load_sketches(sketch_paths([self.output_dir])[0])['cited_work'].count_min.total
+            exact = Counter(value for value, in table_rows(self.output_dir, 'item_references', ('cited_work',))
+                            if value)
+            self.assertLess(total, saved)
+            self.assertEqual(saved, sum(exact.values()))
+        finally:
+            xml_sketches.SKETCH_SAVE_INTERVAL = interval
+
+    def test_discarded_file_is_not_sketched(self):
+        """A failed input file leaves no sketches"""
+        writer = SketchWriter(self.output_dir)
+        batch = RecordBatch()
+        batch.add_record(self.parsers[0])
+        writer.write_batch(batch)
+        writer.discard()
+        writer.close()
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, SKETCH_DIR_NAME)))
+
+    def test_save_and_load(self):
+        """Sketch files keep tables, totals and heavy hitters"""
+        sketch = ColumnSketch(64, 2, 5)
+        sketch.add({'a': 3, 'b': 1})
+        path = os.path.join(self.test_dir, 'one.npz')
+        save_sketches(path, {'keyword': sketch})
+        loaded = load_sketches(path)['keyword']
+        np.testing.assert_array_equal(loaded.count_min.table, sketch.count_min.table)
+        self.assertEqual(loaded.top(2), [('a', 3, 3), ('b', 1, 1)])
+        self.assertEqual(loaded.estimate('c'), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the external merge sort of output tables
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import tempfile
+
+import xml_sort_tables
+from csv_writer import CSVWriter, open_csv_file, wait_for_compressed_writes
+from xml_sort_tables import sort_key_function, sort_output_tables, sort_table_file
+
+
+class TestSortTables(unittest.TestCase):
+    """Test cases for sort_table_file and sort_output_tables"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.headers = ['uid', 'occurence_order', 'cited_uid', 'cited_title']
+        # Descending UIDs, orders written 10 .. 1 and a repeated key with distinct payloads
+        self.rows = [(f"WOS:{uid:06d}", str(order), f"WOS:C{uid}-{order}", f"Title, \"{order}\"\nline 2")
+                     for uid in range(300, 0, -1) for order in range(10, 0, -1)]
+        self.rows += [("WOS:000001", "1", "WOS:DUP", "second"), ("WOS:000001", "1", "WOS:DUP", "third")]
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, file_path):
+        with open_csv_file(file_path) as f:
+            return list(csv.reader(f))
+
+    def _expected(self):
+        key = sort_key_function(self.headers)
+        return [self.headers] + sorted([list(row) for row in self.rows], key=key)
+
+    def test_external_sort_matches_in_memory_sort(self):
+        """Runs, merge passes and compression give the in-memory order"""
+        fanin = xml_sort_tables.MAX_MERGE_FANIN
+        xml_sort_tables.MAX_MERGE_FANIN = 3
+        try:
+            for compression, suffix in ((None, ''), ('gzip', '.gz')):
+                writer = CSVWriter(os.path.join(self.test_dir, 'item_references.csv'), self.headers,
+                                   compression=compression)
+                writer.write_tuples(self.rows)
+                wait_for_compressed_writes()
+                file_path = os.path.join(self.test_dir, 'item_references.csv' + suffix)
+                result = sort_table_file(file_path, memory_bytes=64 * 1024)
+                self.assertGreater(result['runs'], 3)
+                self.assertEqual(result['rows'], len(self.rows))
+                self.assertEqual(self._read(file_path), self._expected())
+        finally:
+            xml_sort_tables.MAX_MERGE_FANIN = fanin
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['item_references.csv', 'item_references.csv.gz'])
+
+    def test_sorted_gzip_keeps_configured_level(self):
+        """Sorted .gz tables are written at the given level, not gzip's default 9"""
+        writer = CSVWriter(os.path.join(self.test_dir, 'item_references.csv'), self.headers, compression='gzip')
+        writer.write_tuples(self.rows)
+        wait_for_compressed_writes()
+        file_path = os.path.join(self.test_dir, 'item_references.csv.gz')
+        for level, extra_flags in ((None, 0), (1, 4), (9, 2)):
+            sort_table_file(file_path, compression_level=level)
+            with open(file_path, 'rb') as f:
+                # Byte 8 of the gzip header: 2 = slowest level, 4 = fastest level, 0 otherwise
+                self.assertEqual(f.read(9)[8], extra_flags)
+            self.assertEqual(self._read(file_path), self._expected())
+
+    def test_numeric_order_and_stable_ties(self):
+        """Order columns compare as numbers; equal keys keep their order"""
+        expected = self._expected()
+        self.assertEqual([row[1] for row in expected[1:13]], ['1', '1', '1'] + [str(order) for order in range(2, 11)])
+        self.assertEqual([row[3] for row in expected[2:4]], ['second', 'third'])
+
+    def test_sort_output_tables_walks_partitions(self):
+        """Tables in subdirectories are sorted; other files are left alone"""
+        partition_dir = os.path.join(self.test_dir, 'pubyear=1985', 'edition=SCI')
+        CSVWriter(os.path.join(partition_dir, 'item_references.csv'), self.headers).write_tuples(self.rows)
+        dim_writer = CSVWriter(os.path.join(self.test_dir, 'dim_org.csv'), ['id', 'organization'])
+        dim_writer.write_tuples([('2', 'B'), ('1', 'A')])
+        # Tombstones, import batches and unmerged commits are not sorted
+        for skipped_dir in ('tombstones', os.path.join('batches', '00001'), os.path.join('.commits', 'c1')):
+            CSVWriter(os.path.join(self.test_dir, skipped_dir, 'item_references.csv'),
+                      self.headers).write_tuples(self.rows)
+        results = sort_output_tables(self.test_dir, memory_mb=1, jobs=2)
+        self.assertEqual(list(results), [os.path.join(partition_dir, 'item_references.csv')])
+        self.assertEqual(self._read(os.path.join(partition_dir, 'item_references.csv')), self._expected())
+        self.assertEqual(self._read(os.path.join(self.test_dir, 'dim_org.csv'))[1], ['2', 'B'])
+
+    def test_part_files_are_rejected(self):
+        """An output tree with part files fails instead of reporting nothing to sort"""
+        CSVWriter(os.path.join(self.test_dir, 'item_references.csv'), self.headers,
+                  max_part_rows=10).write_tuples(self.rows)
+        with self.assertRaises(ValueError) as context:
+            sort_output_tables(self.test_dir, memory_mb=1, jobs=1)
+        self.assertIn(self.test_dir, str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the SQLite bulk-load sink
+"""
+
+import unittest
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from contextlib import closing
+
+from xml_common_def import WOS_NAMESPACE
+
+from xml_info_load_api import load_xml_file, make_record_callback
+from xml_processing_history import ProcessingHistoryManager
+from xml_sql_schema import load_table_definitions
+from xml_sqlite_writer import prepare_sqlite_database, finalize_sqlite_database, sqlite_db_path
+from xml_test_helpers import EXAMPLE_XML
+
+
+class TestSQLiteWriter(unittest.TestCase):
+    """Test cases for XMLSQLiteWriter"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'out')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _load(self, output_format, output_dir):
+        history_manager = ProcessingHistoryManager(os.path.join(output_dir, 'history.json'))
+        load_xml_file(EXAMPLE_XML, make_record_callback(output_dir, 30, output_format), False, history_manager)
+
+    def _indexes(self):
+        with closing(sqlite3.connect(sqlite_db_path(self.output_dir))) as connection:
+            return {row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+    def test_schema_definitions(self):
+        """Indexes, foreign keys and AUTO_INCREMENT columns are read from the SQL script"""
+        definitions = load_table_definitions()
+        self.assertIn(('idx_keyword', ['keyword'], False), definitions['item_keywords'].indexes)
+        self.assertIn(('idx_uid', ['uid'], True), definitions['item_source'].indexes)
+        self.assertEqual(definitions['item_title'].foreign_keys, [(['uid'], 'item', ['uid'], 'ON DELETE CASCADE')])
+        self.assertEqual(definitions['item_authors'].auto_increment, ['id'])
+
+    def test_bulk_load_matches_csv(self):
+        """Every table has the rows of its CSV file; indexes exist only after finalize"""
+        csv_dir = os.path.join(self.test_dir, 'csv')
+        self._load('csv', csv_dir)
+
+        prepare_sqlite_database(self.output_dir)
+        self._load('sqlite', self.output_dir)
+        self.assertEqual(self._indexes(), set())
+        stats = finalize_sqlite_database(self.output_dir)
+
+        for table_name, row_count in stats['row_counts'].items():
+            with open(os.path.join(csv_dir, table_name + '.csv'), newline='', encoding='utf-8') as f:
+                self.assertEqual(row_count, sum(1 for _ in csv.DictReader(f)), table_name)
+        self.assertEqual(stats['foreign_key_violations'], 0)
+        self.assertIn('item_references_idx_cited_uid', self._indexes())
+
+        with closing(sqlite3.connect(sqlite_db_path(self.output_dir))) as connection:
+            self.assertEqual(connection.execute("SELECT DISTINCT pubyear FROM item").fetchall(), [(1985,)])
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM item WHERE supplement = ''").fetchone()[0], 0)
+            author_ids = connection.execute("SELECT MIN(id), COUNT(DISTINCT id) FROM item_authors").fetchone()
+            self.assertEqual(author_ids, (1, stats['row_counts']['item_authors']))
+
+    def test_reload_drops_and_rebuilds_indexes(self):
+        """A second load starts without indexes and reports only the new rows"""
+        prepare_sqlite_database(self.output_dir)
+        self._load('sqlite', self.output_dir)
+        first = finalize_sqlite_database(self.output_dir)
+
+        rows_before = prepare_sqlite_database(self.output_dir)
+        self.assertEqual(self._indexes(), set())
+        self.assertEqual(rows_before, first['loaded_rows'])
+        self._load('sqlite', self.output_dir)
+        second = finalize_sqlite_database(self.output_dir, rows_before=rows_before)
+        self.assertEqual(second['loaded_rows'], first['loaded_rows'])
+        self.assertTrue(self._indexes())
+
+    def test_delta_load_replaces_changed_records(self):
+        """Changed records of a delta load replace their old rows in every table"""
+        ET.register_namespace('', WOS_NAMESPACE['ns'])
+        tree = ET.parse(EXAMPLE_XML)
+        record = tree.getroot().findall('.//ns:REC', WOS_NAMESPACE)[3]
+        title = record.find('.//ns:title[@type="item"]', WOS_NAMESPACE)
+        title.text = (title.text or '') + ' (corrected)'
+        update = os.path.join(self.test_dir, 'update.xml')
+        tree.write(update, encoding='utf-8', xml_declaration=True)
+        uid = record.find('ns:UID', WOS_NAMESPACE).text
+
+        history_manager = ProcessingHistoryManager(os.path.join(self.test_dir, 'history.json'))
+        prepare_sqlite_database(self.output_dir)
+        load_xml_file(EXAMPLE_XML, make_record_callback(self.output_dir, 30, 'sqlite'), True, history_manager,
+                      delta=True)
+        first = finalize_sqlite_database(self.output_dir)
+        prepare_sqlite_database(self.output_dir)
+        load_xml_file(update, make_record_callback(self.output_dir, 30, 'sqlite'), True, history_manager,
+                      delta=True, tombstone_dir=os.path.join(self.test_dir, 'tombstones'))
+        second = finalize_sqlite_database(self.output_dir)
+
+        self.assertEqual(second['row_counts'], first['row_counts'])
+        self.assertFalse(any(name.endswith('_tombstone_uid') for name in self._indexes()))
+        with closing(sqlite3.connect(sqlite_db_path(self.output_dir))) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*), COUNT(DISTINCT uid) FROM item").fetchone(),
+                             (first['row_counts']['item'],) * 2)
+            self.assertEqual(connection.execute("SELECT title FROM item_title WHERE uid = ?",
+                                                (uid,)).fetchall(), [(title.text,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
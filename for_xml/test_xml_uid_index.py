@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test suite for the UID -> row offset index of the CSV tables
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from csv_writer import CSVWriter
+from xml_sort_tables import sort_table_file
+from xml_uid_index import (INDEX_RECORD, UID_INDEX_LOG_SUFFIX, UID_INDEX_SUFFIX, StaleIndexError,
+                           build_uid_indexes, index_table_file, lookup, uid_key)
+
+
+def _rows(uid, count):
+    return [(uid, str(order), f"Title {order}, \"quoted\"\nsecond line é") for order in range(1, count + 1)]
+
+
+def _write_records(file_path, headers, first, count):
+    writer = CSVWriter(file_path, headers, index=True)
+    for uid in range(first, first + count):
+        writer.write_tuples(_rows(f"WOS:{uid:015d}", uid % 3 + 1))
+
+
+class TestUIDIndex(unittest.TestCase):
+    """Test cases for the indexed CSVWriter, build_uid_indexes and lookup"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+        self.headers = ['uid', 'occurence_order', 'cited_title']
+        self.file_path = os.path.join(self.test_dir, 'item_references.csv')
+
+    def tearDown(self):
+        """Clean up test fixtures"""
+        shutil.rmtree(self.test_dir)
+
+    def _rows(self, uid, count):
+        return _rows(uid, count)
+
+    def test_uid_key(self):
+        """WOS UIDs keep their text and sort like it; other UIDs are hashed"""
+        self.assertEqual(uid_key("WOS:A1985ASN8900007"), b"A1985ASN8900007\0")
+        self.assertLess(uid_key("WOS:000000000000001"), uid_key("WOS:000000000000002"))
+        self.assertEqual(len(uid_key("MEDLINE:12345678")), 16)
+        self.assertTrue(uid_key("MEDLINE:12345678").startswith(b'\xff'))
+
+    def test_lookup_reads_rows_of_every_batch(self):
+        """Rows of a record written in several batches and tables are found"""
+        writer = CSVWriter(self.file_path, self.headers, index=True)
+        writer.write_tuples(self._rows("WOS:000000000000002", 3) + self._rows("WOS:000000000000001", 2))
+        writer.write_tuples(self._rows("WOS:000000000000003", 1) + self._rows("WOS:000000000000001", 1))
+        CSVWriter(os.path.join(self.test_dir, 'item.csv'), ['uid', 'pubyear'], index=True).write_tuples(
+            [("WOS:000000000000001", "1985")])
+
+        counts = build_uid_indexes(self.test_dir)
+        self.assertEqual(counts[self.file_path + UID_INDEX_SUFFIX], 4)
+        results = lookup("WOS:000000000000001", self.test_dir)
+        self.assertEqual([os.path.basename(path) for path, _, _ in results], ['item.csv', 'item_references.csv'])
+        self.assertEqual(results[1][1], self.headers)
+        self.assertEqual(results[1][2], [list(row) for row in
+                                         self._rows("WOS:000000000000001", 2) + self._rows("WOS:000000000000001", 1)])
+        self.assertEqual(lookup("WOS:000000000000009", self.test_dir), [])
+
+    def test_rescan_after_sort(self):
+        """Sorting a table rebuilds its index from the moved rows"""
+        writer = CSVWriter(self.file_path, self.headers, index=True)
+        for uid in range(20, 0, -1):
+            writer.write_tuples(self._rows(f"WOS:{uid:015d}", uid % 4 + 1))
+        sort_table_file(self.file_path, memory_bytes=4 * 1024)
+        self.assertEqual(os.path.getsize(self.file_path + UID_INDEX_LOG_SUFFIX), 20 * INDEX_RECORD.size)
+        build_uid_indexes(self.test_dir)
+        for uid in (1, 7, 20):
+            rows = lookup(f"WOS:{uid:015d}", self.test_dir)[0][2]
+            self.assertEqual(rows, [list(row) for row in self._rows(f"WOS:{uid:015d}", uid % 4 + 1)])
+        self.assertEqual(index_table_file(self.file_path), 20)
+
+    def test_parallel_writers(self):
+        """Offsets recorded by processes appending to the same table stay exact"""
+        CSVWriter(self.file_path, self.headers, index=True)
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(_write_records, self.file_path, self.headers, first, 50)
+                           for first in range(1, 201, 50)]:
+                future.result()
+        build_uid_indexes(self.test_dir)
+        for uid in range(1, 201):
+            rows = lookup(f"WOS:{uid:015d}", self.test_dir)[0][2]
+            self.assertEqual(rows, [list(row) for row in self._rows(f"WOS:{uid:015d}", uid % 3 + 1)])
+
+    def test_stale_index_is_detected(self):
+        """An index whose table changed fails instead of returning other rows"""
+        CSVWriter(self.file_path, self.headers, index=True).write_tuples(
+            self._rows("WOS:000000000000001", 2) + self._rows("WOS:000000000000002", 2))
+        build_uid_indexes(self.test_dir)
+        with open(self.file_path, 'r', encoding='utf-8', newline='') as f:
+            header, body = f.readline(), f.read()
+        with open(self.file_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(header + 'WOS:000000000000003,1,x\r\n' + body)
+        with self.assertRaises(StaleIndexError):
+            lookup("WOS:000000000000002", self.test_dir)
+
+    def test_index_rejects_compressed_files(self):
+        """Compressed and split files cannot be indexed"""
+        with self.assertRaises(ValueError):
+            CSVWriter(self.file_path, self.headers, compression='gzip', index=True)
+        with self.assertRaises(ValueError):
+            CSVWriter(self.file_path, self.headers, max_part_rows=10, index=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,364 @@
+"""
+Citation graph as memory-mapped CSR arrays
+
+Citation analyses (counts, neighbourhoods, graph algorithms) otherwise run
+MySQL joins on citation_merge. This tool reads the WOS references of
+item_references (cited_uid "WOS:..." without a ".", as citations in
+modify_database.sql), numbers every UID with a dense integer id and writes
+the graph as NumPy arrays to <output>/citation_graph/:
+
+- uids.npy: the UIDs, sorted; the id of a UID is its position
+- out_indptr.npy, out_indices.npy: forward CSR, the papers cited by id i
+  are out_indices[out_indptr[i]:out_indptr[i + 1]]
+- in_indptr.npy, in_indices.npy: reverse CSR, the papers citing id i
+- graph.json: node and edge counts
+
+Duplicate edges are removed and every adjacency list is sorted. The arrays
+are opened with mmap_mode='r', so loading takes no time and memory whatever
+the size of the graph; in-degree (citation count) and out-degree are two
+reads of an indptr array.
+
+    python xml_citation_graph.py build xml_output [--chunk-edges 5000000] [--temp-dir /scratch]
+    python xml_citation_graph.py degree WOS:A1985ASN8900007 --graph-dir xml_output/citation_graph
+
+The edges are processed in chunks of --chunk-edges: memory holds the UID
+array, the indptr arrays and one chunk; the edges themselves stay in
+temporary files and in the memory-mapped outputs.
+
+Requires numpy.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import is_wos_citation, table_rows
+from xml_optional_deps import optional_import, require
+
+np = optional_import('numpy')
+
+CITATION_GRAPH_DIR_NAME = "citation_graph"
+GRAPH_META_FILE = "graph.json"
+
+DEFAULT_CHUNK_EDGES = 5000000
+
+# Node ids fit int32 up to this many nodes
+_INT32_NODES = 2 ** 31 - 1
+
+_GRAPH_ARRAYS = ('uids', 'out_indptr', 'out_indices', 'in_indptr', 'in_indices')
+
+
+def wos_citation_pairs(output_dir):
+    """(uid, cited_uid) pairs of the WOS citations in item_references"""
+    for uid, cited_uid in table_rows(output_dir, 'item_references', ('uid', 'cited_uid')):
+        if is_wos_citation(cited_uid):
+            yield uid, cited_uid
+
+
+def edge_chunks(pairs, chunk_edges):
+    """
+    Edges as chunks of (citing UIDs, cited UIDs) byte string arrays
+
+    :param pairs: Iterable of (uid, cited_uid)
+    :param chunk_edges: Edges per chunk
+    """
+    citing, cited = [], []
+    for uid, cited_uid in pairs:
+        citing.append(uid.encode('utf-8'))
+        cited.append(cited_uid.encode('utf-8'))
+        if len(citing) >= chunk_edges:
+            yield np.array(citing, dtype=np.bytes_), np.array(cited, dtype=np.bytes_)
+            citing, cited = [], []
+    if citing:
+        yield np.array(citing, dtype=np.bytes_), np.array(cited, dtype=np.bytes_)
+
+
+def collect_uids(chunks):
+    """
+    Sorted distinct UIDs of edge chunks; chunk results are merged once they outgrow the merged array
+
+    :param chunks: Iterable of (citing UIDs, cited UIDs) arrays, see edge_chunks
+    :return: (UID array, number of edges)
+    """
+    merged = np.array([], dtype=np.bytes_)
+    pending, pending_size, edge_count = [], 0, 0
+    for citing, cited in chunks:
+        edge_count += len(citing)
+        pending.append(np.unique(np.concatenate((citing, cited))))
+        pending_size += len(pending[-1])
+        if pending_size > len(merged):
+            merged = np.unique(np.concatenate([merged] + pending))
+            pending, pending_size = [], 0
+    if pending:
+        merged = np.unique(np.concatenate([merged] + pending))
+    return merged, edge_count
+
+
+def _chunk_ranges(total, chunk_size):
+    for start in range(0, total, chunk_size):
+        yield start, min(start + chunk_size, total)
+
+
+def _scatter_csr(chunks, node_count, edge_count, index_dtype, indptr, indices_path):
+    """
+    Place edges into CSR order
+
+    :param chunks: Function returning an iterator of (source ids, target ids) chunks, called twice
+    :param node_count: Number of nodes
+    :param edge_count: Number of edges the chunks hold
+    :param index_dtype: dtype of the target ids
+    :param indptr: Array for the node_count + 1 row offsets, filled here
+    :param indices_path: .npy file for the targets; the targets of a row keep the order of the chunks
+    """
+    degrees = np.zeros(node_count, dtype=np.int64)
+    for sources, _ in chunks():
+        rows, counts = np.unique(sources, return_counts=True)
+        degrees[rows] += counts
+    indptr[0] = 0
+    np.cumsum(degrees, out=indptr[1:])
+    del degrees
+
+    indices = np.lib.format.open_memmap(indices_path, mode='w+', dtype=index_dtype, shape=(edge_count,))
+    cursor = np.array(indptr[:-1], dtype=np.int64)
+    for sources, targets in chunks():
+        order = np.argsort(sources, kind='stable')
+        sources, targets = sources[order], targets[order]
+        rows, starts, counts = np.unique(sources, return_index=True, return_counts=True)
+        # Position of every edge within the run of its source in this chunk
+        ranks = np.arange(len(sources)) - np.repeat(starts, counts)
+        indices[cursor[sources] + ranks] = targets
+        cursor[rows] += counts
+    indices.flush()
+    del indices
+
+
+def _dedup_rows(indptr, indices, chunk_edges, raw_file):
+    """
+    Sort every row and drop repeated targets, in blocks of rows of about chunk_edges edges
+
+    :param indptr: Row offsets, rewritten for the deduplicated rows
+    :param indices: Targets in CSR order
+    :param raw_file: Binary file receiving the deduplicated targets
+    :return: Number of edges kept
+    """
+    node_count = len(indptr) - 1
+    kept_indptr = np.zeros_like(indptr)
+    kept = 0
+    start = 0
+    while start < node_count:
+        end = int(np.searchsorted(indptr, indptr[start] + chunk_edges, side='right')) - 1
+        end = min(max(end, start + 1), node_count)
+        first, last = int(indptr[start]), int(indptr[end])
+        targets = np.array(indices[first:last])
+        rows = np.repeat(np.arange(start, end), np.diff(indptr[start:end + 1]))
+        order = np.lexsort((targets, rows))
+        rows, targets = rows[order], targets[order]
+        distinct = np.ones(len(targets), dtype=bool)
+        distinct[1:] = (rows[1:] != rows[:-1]) | (targets[1:] != targets[:-1])
+        targets[distinct].tofile(raw_file)
+        row_counts = np.bincount(rows[distinct] - start, minlength=end - start)
+        kept_indptr[start + 1:end + 1] = kept + np.cumsum(row_counts)
+        kept += int(row_counts.sum())
+        start = end
+    indptr[:] = kept_indptr
+    return kept
+
+
+def _raw_to_npy(raw_path, npy_path, dtype, count, chunk_edges):
+    """Copy a raw binary array into a .npy file"""
+    array = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(count,))
+    raw = np.memmap(raw_path, dtype=dtype, mode='r', shape=(count,)) if count else np.array([], dtype=dtype)
+    for start, end in _chunk_ranges(count, chunk_edges):
+        array[start:end] = raw[start:end]
+    array.flush()
+    del array, raw
+
+
+def build_citation_graph(output_dir=None, graph_dir=None, chunk_edges=DEFAULT_CHUNK_EDGES, temp_dir=None):
+    """
+    Build the CSR citation graph of an output tree
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param graph_dir: Directory of the graph files (default: <output_dir>/citation_graph)
+    :param chunk_edges: Edges processed at a time
+    :param temp_dir: Directory for the temporary edge files (default: the output directory)
+    :return: The graph.json dictionary
+    """
+    require(np, 'numpy')
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    graph_dir = graph_dir or os.path.join(output_dir, CITATION_GRAPH_DIR_NAME)
+    print(f"Building the citation graph of {output_dir}")
+
+    uids, _ = collect_uids(edge_chunks(wos_citation_pairs(output_dir), chunk_edges))
+    node_count = len(uids)
+    index_dtype = np.int32 if node_count <= _INT32_NODES else np.int64
+    print(f"  {node_count} UIDs ({time.time() - started:.1f}s)")
+
+    work_dir = tempfile.mkdtemp(prefix='citation-graph-', dir=temp_dir or output_dir)
+    try:
+        # Edges as ids, in two flat files
+        edge_paths = (os.path.join(work_dir, 'citing.bin'), os.path.join(work_dir, 'cited.bin'))
+        edge_count = 0
+        with open(edge_paths[0], 'wb') as citing_file, open(edge_paths[1], 'wb') as cited_file:
+            for citing, cited in edge_chunks(wos_citation_pairs(output_dir), chunk_edges):
+                np.searchsorted(uids, citing).astype(index_dtype).tofile(citing_file)
+                np.searchsorted(uids, cited).astype(index_dtype).tofile(cited_file)
+                edge_count += len(citing)
+
+        def edge_file_chunks():
+            if not edge_count:
+                return
+            citing = np.memmap(edge_paths[0], dtype=index_dtype, mode='r', shape=(edge_count,))
+            cited = np.memmap(edge_paths[1], dtype=index_dtype, mode='r', shape=(edge_count,))
+            for start, end in _chunk_ranges(edge_count, chunk_edges):
+                yield np.array(citing[start:end]), np.array(cited[start:end])
+
+        np.save(os.path.join(work_dir, 'uids.npy'), uids)
+        del uids
+
+        # Forward CSR with duplicates, then sorted and deduplicated
+        out_indptr = np.zeros(node_count + 1, dtype=np.int64)
+        scattered_path = os.path.join(work_dir, 'scattered.npy')
+        _scatter_csr(edge_file_chunks, node_count, edge_count, index_dtype, out_indptr, scattered_path)
+        for edge_path in edge_paths:
+            os.remove(edge_path)
+        raw_path = os.path.join(work_dir, 'out_indices.bin')
+        with open(raw_path, 'wb') as raw_file:
+            kept = _dedup_rows(out_indptr, np.load(scattered_path, mmap_mode='r'), chunk_edges, raw_file)
+        os.remove(scattered_path)
+        _raw_to_npy(raw_path, os.path.join(work_dir, 'out_indices.npy'), index_dtype, kept, chunk_edges)
+        os.remove(raw_path)
+        np.save(os.path.join(work_dir, 'out_indptr.npy'), out_indptr)
+
+        # Reverse CSR from the sorted forward rows, so every reverse row comes out sorted
+        out_indices = np.load(os.path.join(work_dir, 'out_indices.npy'), mmap_mode='r')
+
+        def reversed_chunks():
+            for start, end in _chunk_ranges(kept, chunk_edges):
+                citing = (np.searchsorted(out_indptr, np.arange(start, end), side='right') - 1).astype(index_dtype)
+                yield np.array(out_indices[start:end]), citing
+
+        in_indptr = np.zeros(node_count + 1, dtype=np.int64)
+        _scatter_csr(reversed_chunks, node_count, kept, index_dtype, in_indptr,
+                     os.path.join(work_dir, 'in_indices.npy'))
+        del out_indices
+        np.save(os.path.join(work_dir, 'in_indptr.npy'), in_indptr)
+
+        meta = {
+            'nodes': node_count,
+            'edges': kept,
+            'duplicate_edges': edge_count - kept,
+            'index_dtype': np.dtype(index_dtype).name,
+            'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        os.makedirs(graph_dir, exist_ok=True)
+        for name in _GRAPH_ARRAYS:
+            os.replace(os.path.join(work_dir, name + '.npy'), os.path.join(graph_dir, name + '.npy'))
+        # Written last: the arrays of a graph.json are complete
+        with open(os.path.join(work_dir, GRAPH_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        os.replace(os.path.join(work_dir, GRAPH_META_FILE), os.path.join(graph_dir, GRAPH_META_FILE))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Citation graph in {graph_dir}: {meta['nodes']} nodes, {meta['edges']} edges, "
+          f"{meta['duplicate_edges']} duplicates removed ({time.time() - started:.1f}s)")
+    return meta
+
+
+class CitationGraph:
+    """A citation graph opened from its memory-mapped arrays"""
+
+    def __init__(self, graph_dir=None):
+        """
+        Open a graph
+
+        :param graph_dir: Directory of the graph files (default: <output dir>/citation_graph)
+        """
+        require(np, 'numpy')
+        graph_dir = graph_dir or os.path.join(OUTPUT_DIR, CITATION_GRAPH_DIR_NAME)
+        with open(os.path.join(graph_dir, GRAPH_META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        for name in _GRAPH_ARRAYS:
+            setattr(self, name, np.load(os.path.join(graph_dir, name + '.npy'), mmap_mode='r'))
+
+    @property
+    def node_count(self):
+        return len(self.uids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_indices)
+
+    def node_id(self, uid):
+        """Id of a UID, or None if the UID is not in the graph"""
+        key = uid.encode('utf-8')
+        position = int(np.searchsorted(self.uids, key))
+        if position < len(self.uids) and self.uids[position] == key:
+            return position
+        return None
+
+    def uid(self, node_id):
+        """UID of an id"""
+        return self.uids[node_id].decode('utf-8')
+
+    def out_degree(self, node_id):
+        """Number of papers an id cites"""
+        return int(self.out_indptr[node_id + 1] - self.out_indptr[node_id])
+
+    def in_degree(self, node_id):
+        """Number of papers citing an id (its citation count)"""
+        return int(self.in_indptr[node_id + 1] - self.in_indptr[node_id])
+
+    def cited(self, node_id):
+        """Ids cited by an id, sorted"""
+        return self.out_indices[self.out_indptr[node_id]:self.out_indptr[node_id + 1]]
+
+    def citing(self, node_id):
+        """Ids citing an id, sorted"""
+        return self.in_indices[self.in_indptr[node_id]:self.in_indptr[node_id + 1]]
+
+    def in_degrees(self):
+        """Citation counts of all ids"""
+        return np.diff(self.in_indptr)
+
+    def out_degrees(self):
+        """Reference counts of all ids"""
+        return np.diff(self.out_indptr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Citation graph as memory-mapped CSR arrays')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Build the graph of an output directory')
+    build_parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    build_parser.add_argument('--graph-dir', default=None, help='Directory of the graph files '
+                                                                '(default: <output_dir>/citation_graph)')
+    build_parser.add_argument('--chunk-edges', type=int, default=DEFAULT_CHUNK_EDGES,
+                              help=f'Edges processed at a time (default: {DEFAULT_CHUNK_EDGES})')
+    build_parser.add_argument('--temp-dir', default=None, help='Directory for the temporary edge files '
+                                                               '(default: output directory)')
+    degree_parser = subparsers.add_parser('degree', help='Print the citation and reference counts of UIDs')
+    degree_parser.add_argument('uids', nargs='+')
+    degree_parser.add_argument('--graph-dir', default=None, help='Directory of the graph files')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_citation_graph(args.output_dir, args.graph_dir, args.chunk_edges, args.temp_dir)
+        return
+    graph = CitationGraph(args.graph_dir)
+    for uid in args.uids:
+        node_id = graph.node_id(uid)
+        if node_id is None:
+            print(f"{uid}\tnot in graph")
+        else:
+            print(f"{uid}\tcited by {graph.in_degree(node_id)}\tcites {graph.out_degree(node_id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Offline merge of the parsed citations with external citation edge lists
+
+modify_database.sql merges citation_merge with the legacy
+thomson.cite_to_cite edges by INSERT IGNORE into a table with a unique
+index, one index probe per edge. This tool does the merge on files:
+
+- Edges: the WOS citations of item_references and every external edge
+  list (two columns, citing UT and cited UT, comma or tab separated, with
+  or without a header line, e.g. cite_to_cite exported with
+  SELECT ut, utcited ... INTO OUTFILE). UTs without the "WOS:" prefix get
+  it, as CONCAT('WOS:', ut) does in the SQL.
+- Every UID gets a dense id (its position in the sorted UIDs) and every
+  edge becomes one int64, citing id << 32 | cited id.
+- The edges are spilled in chunks to bucket files by citing id range and
+  every bucket is deduplicated with np.unique, so memory holds one chunk or
+  bucket at a time. Buckets cover consecutive id ranges: the merged edges
+  come out sorted by (uid, cited_uid).
+- Citation counts per cited UID, and per cited UID and citing year (the
+  max_pubyear of the citing UID, from derived/item_max_pubyear.csv and the
+  external year files), are counted from the distinct edges.
+
+The results replace citation_merge.csv, cite_count.csv and
+cite_count_year.csv in <output>/derived/ (and item_max_pubyear.csv when
+external years are given; years of the parsed records take precedence), so
+they are loaded by import_derived_tables.sql like the tables of
+xml_derived_tables.py, which has to run first:
+
+    python xml_derived_tables.py xml_output
+    python xml_citation_merge.py xml_output --edges cite_to_cite.tsv --years thomson_pubyear.tsv
+
+Requires numpy.
+"""
+
+import argparse
+import csv
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from csv_writer import CSV_DIALECT
+from xml_citation_graph import collect_uids, edge_chunks, wos_citation_pairs
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import DERIVED_DIR_NAME, DERIVED_TABLE_COLUMNS, WOS_UID_PREFIX
+from xml_optional_deps import optional_import, require
+
+np = optional_import('numpy')
+
+DEFAULT_CHUNK_EDGES = 5000000
+
+# Edge keys hold two ids of 32 bits
+_MAX_NODES = 2 ** 31
+
+_CITED_MASK = 2 ** 32 - 1
+
+# Citing years are stored in the low 16 bits of the (cited id, year) keys
+_YEAR_BITS = 16
+
+_HEADER_FIELD = re.compile(r'^[a-z_]+$')
+
+
+def normalize_uid(value):
+    """UID of a UT with or without the WOS: prefix, None for empty values"""
+    value = value.strip()
+    if not value:
+        return None
+    return value if value.startswith(WOS_UID_PREFIX) else WOS_UID_PREFIX + value
+
+
+def read_external_rows(file_path):
+    """
+    Rows of an external two-column file
+
+    :param file_path: Comma or tab separated file; a first line of lowercase names (ut,utcited) is skipped
+    :return: Iterator of (first column, second column)
+    """
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        first_line = f.readline()
+        delimiter = '\t' if '\t' in first_line else ','
+        f.seek(0)
+        reader = csv.reader(f, delimiter=delimiter)
+        for line_number, row in enumerate(reader):
+            if len(row) < 2:
+                continue
+            if line_number == 0 and all(_HEADER_FIELD.match(field.strip()) for field in row):
+                continue
+            yield row[0], row[1]
+
+
+def external_edge_pairs(file_paths):
+    """Normalized (uid, cited_uid) pairs of external edge lists"""
+    for file_path in file_paths:
+        for citing, cited in read_external_rows(file_path):
+            uid, cited_uid = normalize_uid(citing), normalize_uid(cited)
+            if uid and cited_uid:
+                yield uid, cited_uid
+
+
+def _merged_pairs(output_dir, edge_paths):
+    yield from wos_citation_pairs(output_dir)
+    yield from external_edge_pairs(edge_paths)
+
+
+def _read_years(derived_dir, year_paths):
+    """
+    max_pubyear of every UID: the parsed records, then the external year files for UIDs without a year
+
+    :return: Dictionary of UID to year, and whether external years were added
+    """
+    years = {}
+    year_path = os.path.join(derived_dir, 'item_max_pubyear.csv')
+    if not os.path.exists(year_path):
+        raise FileNotFoundError(f"{year_path} not found; run xml_derived_tables.py first")
+    with open(year_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, dialect=CSV_DIALECT)
+        next(reader)
+        for uid, max_pubyear in reader:
+            years[uid] = int(max_pubyear) if max_pubyear else None
+    external = {}
+    for file_path in year_paths:
+        for ut, pubyear in read_external_rows(file_path):
+            uid, pubyear = normalize_uid(ut), pubyear.strip()
+            if uid and pubyear.isdigit() and uid not in years:
+                external[uid] = max(external.get(uid, 0), int(pubyear))
+    years.update(external)
+    return years, bool(external)
+
+
+class _KeyBuckets:
+    """Sorted int64 keys spilled to bucket files by key range"""
+
+    def __init__(self, work_dir, name, boundaries):
+        """
+        :param boundaries: Sorted lower key bounds of the buckets after the first
+        """
+        self.boundaries = boundaries
+        self.paths = [os.path.join(work_dir, f"{name}-{index:04d}.bin") for index in range(len(boundaries) + 1)]
+        for path in self.paths:
+            open(path, 'wb').close()
+
+    def add(self, keys):
+        keys = np.sort(keys)
+        splits = np.searchsorted(keys, self.boundaries)
+        for path, part in zip(self.paths, np.split(keys, splits)):
+            if len(part):
+                with open(path, 'ab') as f:
+                    part.tofile(f)
+
+    def buckets(self):
+        """Keys of every bucket in key order; a bucket file is removed once read"""
+        for path in self.paths:
+            keys = np.fromfile(path, dtype=np.int64)
+            os.remove(path)
+            yield keys
+
+
+def merge_citations(output_dir=None, edge_paths=(), year_paths=(), derived_dir=None,
+                    chunk_edges=DEFAULT_CHUNK_EDGES, temp_dir=None):
+    """
+    Merge the parsed citations with external edge lists
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param edge_paths: External edge list files
+    :param year_paths: External (UT, pubyear) files
+    :param derived_dir: Directory of the derived tables (default: <output_dir>/derived)
+    :param chunk_edges: Edges held in memory at a time
+    :param temp_dir: Directory for the bucket files (default: the output directory)
+    :return: Dictionary of written table to number of rows, with 'duplicate_edges'
+    """
+    require(np, 'numpy')
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    derived_dir = derived_dir or os.path.join(output_dir, DERIVED_DIR_NAME)
+    years_by_uid, external_years = _read_years(derived_dir, year_paths)
+
+    uids, edge_count = collect_uids(edge_chunks(_merged_pairs(output_dir, edge_paths), chunk_edges))
+    node_count = len(uids)
+    if node_count > _MAX_NODES:
+        raise ValueError(f"{node_count} UIDs do not fit the 32-bit ids of the edge keys")
+    print(f"Merging {edge_count} citation edges of {node_count} UIDs")
+
+    years = np.full(node_count, -1, dtype=np.int32)
+    known_years = [(uid, year) for uid, year in years_by_uid.items() if year is not None]
+    for start in range(0, len(known_years) if node_count else 0, chunk_edges):
+        chunk = known_years[start:start + chunk_edges]
+        keys = np.array([uid.encode('utf-8') for uid, _ in chunk], dtype=np.bytes_)
+        positions = np.minimum(np.searchsorted(uids, keys), node_count - 1)
+        found = uids[positions] == keys
+        years[positions[found]] = np.array([year for _, year in chunk], dtype=np.int32)[found]
+    del known_years
+
+    buckets = max(1, -(-edge_count // chunk_edges))
+    # Bucket b holds the ids from b * node_count // buckets on, for citing ids and cited ids alike
+    id_bounds = np.arange(1, buckets, dtype=np.int64) * node_count // buckets
+    work_dir = tempfile.mkdtemp(prefix='citation-merge-', dir=temp_dir or output_dir)
+    paths = {table_name: os.path.join(derived_dir, table_name + '.csv')
+             for table_name in ('citation_merge', 'cite_count', 'cite_count_year', 'item_max_pubyear')}
+    counts = {}
+    try:
+        edge_buckets = _KeyBuckets(work_dir, 'edges', id_bounds << 32)
+        for citing, cited in edge_chunks(_merged_pairs(output_dir, edge_paths), chunk_edges):
+            keys = (np.searchsorted(uids, citing).astype(np.int64) << 32) | np.searchsorted(uids, cited)
+            edge_buckets.add(np.unique(keys))
+
+        cite_counts = np.zeros(node_count, dtype=np.int64)
+        year_buckets = _KeyBuckets(work_dir, 'years', id_bounds << _YEAR_BITS)
+        merged = 0
+        with open(paths['citation_merge'] + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(DERIVED_TABLE_COLUMNS['citation_merge'])
+            for keys in edge_buckets.buckets():
+                keys = np.unique(keys)
+                merged += len(keys)
+                citing, cited = keys >> 32, keys & _CITED_MASK
+                writer.writerows(zip(np.char.decode(uids[citing], 'utf-8').tolist(),
+                                     np.char.decode(uids[cited], 'utf-8').tolist()))
+                cited_ids, cited_counts = np.unique(cited, return_counts=True)
+                cite_counts[cited_ids] += cited_counts
+                citing_years = years[citing]
+                known = citing_years >= 0
+                year_buckets.add((cited[known] << _YEAR_BITS) | citing_years[known])
+        counts['citation_merge'] = merged
+
+        cited_ids = np.flatnonzero(cite_counts)
+        with open(paths['cite_count'] + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(DERIVED_TABLE_COLUMNS['cite_count'])
+            writer.writerows(zip(np.char.decode(uids[cited_ids], 'utf-8').tolist(), cite_counts[cited_ids].tolist()))
+        counts['cite_count'] = len(cited_ids)
+
+        counts['cite_count_year'] = 0
+        with open(paths['cite_count_year'] + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(DERIVED_TABLE_COLUMNS['cite_count_year'])
+            for keys in year_buckets.buckets():
+                keys, year_counts = np.unique(keys, return_counts=True)
+                writer.writerows(zip(np.char.decode(uids[keys >> _YEAR_BITS], 'utf-8').tolist(),
+                                     (keys & (2 ** _YEAR_BITS - 1)).tolist(), year_counts.tolist()))
+                counts['cite_count_year'] += len(keys)
+
+        if external_years:
+            with open(paths['item_max_pubyear'] + '.tmp', 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, dialect=CSV_DIALECT)
+                writer.writerow(DERIVED_TABLE_COLUMNS['item_max_pubyear'])
+                writer.writerows((uid, '' if year is None else year) for uid, year in sorted(years_by_uid.items()))
+            counts['item_max_pubyear'] = len(years_by_uid)
+        for table_name in counts:
+            os.replace(paths[table_name] + '.tmp', paths[table_name])
+    finally:
+        for path in paths.values():
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    counts['duplicate_edges'] = edge_count - counts['citation_merge']
+    print(f"Merged citations in {derived_dir}: {counts['citation_merge']} edges "
+          f"({counts['duplicate_edges']} duplicates removed), {counts['cite_count']} cited UIDs, "
+          f"{counts['cite_count_year']} (cited UID, year) counts ({time.time() - started:.1f}s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the parsed citations with external citation edge lists')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--edges', action='append', default=[], metavar='FILE',
+                        help='External edge list (citing UT, cited UT), repeatable')
+    parser.add_argument('--years', action='append', default=[], metavar='FILE',
+                        help='External publication years (UT, pubyear), repeatable')
+    parser.add_argument('--derived-dir', default=None, help='Directory of the derived tables '
+                                                            '(default: <output_dir>/derived)')
+    parser.add_argument('--chunk-edges', type=int, default=DEFAULT_CHUNK_EDGES,
+                        help=f'Edges held in memory at a time (default: {DEFAULT_CHUNK_EDGES})')
+    parser.add_argument('--temp-dir', default=None, help='Directory for the bucket files (default: output directory)')
+    args = parser.parse_args()
+    merge_citations(args.output_dir, args.edges, args.years, args.derived_dir, args.chunk_edges, args.temp_dir)
+
+
+if __name__ == "__main__":
+    main()
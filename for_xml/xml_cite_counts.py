@@ -0,0 +1,371 @@
+"""
+Incremental citation counts across import batches
+
+xml_derived_tables.py recomputes cite_count and cite_count_year from the
+whole output. After a weekly update only the citing papers of the new
+import batch (xml_import_batches) change, so this module keeps the counts
+in a persistent state and applies one batch at a time:
+
+- The state (<output>/cite_count_state.sqlite) holds the distinct citation
+  edges by citing uid with their source (parsed records, external edge
+  lists or both), the max pubyear of every citing uid and the counts
+  keyed by cited_uid and by (cited_uid, citing_year), all as clustered
+  primary keys, so every update is an index lookup.
+- Applying a batch replaces the parsed edges and the year of every uid the
+  batch writes or tombstones: the old edges are subtracted from the counts
+  and the new ones added, so the work is proportional to the batch, not
+  the corpus. External edges of the uid are kept. A batch is applied once;
+  the state records it.
+- The changed rows are written to <batch>/cite_counts/: the new counts of
+  the changed keys (0 for keys that are gone) and the edges added to and
+  removed from citation_merge. upsert_sql() turns them into the SQL that
+  import_csv_to_mysql.sh runs after loading the batch.
+
+The state is seeded once from the derived tables (and so includes edges
+merged by xml_citation_merge.py); batches already present then count as
+applied. Edges of citation_merge.csv that are not in item_references are
+external; with --edges, the edge lists given to xml_citation_merge.py also
+mark the parsed edges they contain:
+
+    python xml_derived_tables.py xml_output
+    python xml_cite_counts.py init xml_output [--edges cite_to_cite.tsv]
+    python xml_cite_counts.py apply xml_output
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import DERIVED_DIR_NAME, DERIVED_TABLE_COLUMNS, is_wos_citation, table_rows
+from xml_import_batches import batch_tombstone_dir, batches_dir, list_batches
+
+CITE_COUNT_STATE_FILE = "cite_count_state.sqlite"
+CITE_COUNT_CHANGES_DIR_NAME = "cite_counts"
+
+# Changed rows of a batch: file name -> columns
+CHANGE_FILE_COLUMNS = {
+    'cite_count.csv': DERIVED_TABLE_COLUMNS['cite_count'],
+    'cite_count_year.csv': DERIVED_TABLE_COLUMNS['cite_count_year'],
+    'citation_merge_added.csv': DERIVED_TABLE_COLUMNS['citation_merge'],
+    'citation_merge_removed.csv': DERIVED_TABLE_COLUMNS['citation_merge'],
+}
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS edges (
+    uid TEXT, cited_uid TEXT, parsed INTEGER, external INTEGER,
+    PRIMARY KEY (uid, cited_uid)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS citing_year (
+    uid TEXT PRIMARY KEY, year INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cite_count (
+    cited_uid TEXT PRIMARY KEY, citation_count INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cite_count_year (
+    cited_uid TEXT, citing_year INTEGER, citation_count INTEGER,
+    PRIMARY KEY (cited_uid, citing_year)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS applied_batches (
+    batch_id TEXT PRIMARY KEY, applied_at TEXT, edges_added INTEGER, edges_removed INTEGER) WITHOUT ROWID;
+"""
+
+
+def state_path_of(output_dir=None):
+    """State file of an output directory"""
+    return os.path.join(output_dir or OUTPUT_DIR, CITE_COUNT_STATE_FILE)
+
+
+def _connect(state_path):
+    connection = sqlite3.connect(state_path)
+    connection.executescript(_STATE_SCHEMA)
+    return connection
+
+
+def _read_csv(file_path):
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, dialect=CSV_DIALECT)
+        next(reader)
+        yield from reader
+
+
+def init_state(output_dir=None, derived_dir=None, state_path=None, edge_paths=()):
+    """
+    Seed the state from the derived tables of an output directory
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param derived_dir: Directory of the derived tables (default: <output_dir>/derived)
+    :param state_path: State file (default: <output_dir>/cite_count_state.sqlite)
+    :param edge_paths: External edge lists merged into citation_merge.csv (see xml_citation_merge)
+    :return: Number of edges in the state
+    """
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    derived_dir = derived_dir or os.path.join(output_dir, DERIVED_DIR_NAME)
+    state_path = state_path or state_path_of(output_dir)
+    if os.path.exists(state_path):
+        raise FileExistsError(f"{state_path} already exists")
+    for file_name in ('citation_merge.csv', 'item_max_pubyear.csv'):
+        if not os.path.exists(os.path.join(derived_dir, file_name)):
+            raise FileNotFoundError(f"{os.path.join(derived_dir, file_name)} not found; "
+                                    f"run xml_derived_tables.py first")
+
+    if os.path.exists(state_path + '.tmp'):
+        os.remove(state_path + '.tmp')
+    connection = _connect(state_path + '.tmp')
+    try:
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?, 0, 0)",
+                                   _read_csv(os.path.join(derived_dir, 'citation_merge.csv')))
+            # Sources: the parsed citations, the external edge lists, and external for the rest
+            connection.executemany("UPDATE edges SET parsed = 1 WHERE uid = ? AND cited_uid = ?",
+                                   ((uid, cited_uid) for uid, cited_uid in
+                                    table_rows(output_dir, 'item_references', ('uid', 'cited_uid'))
+                                    if is_wos_citation(cited_uid)))
+            if edge_paths:
+                from xml_citation_merge import external_edge_pairs
+                connection.executemany("UPDATE edges SET external = 1 WHERE uid = ? AND cited_uid = ?",
+                                       external_edge_pairs(edge_paths))
+            connection.execute("UPDATE edges SET external = 1 WHERE parsed = 0")
+            connection.executemany("INSERT OR REPLACE INTO citing_year VALUES (?, ?)",
+                                   ((uid, int(year)) for uid, year in
+                                    _read_csv(os.path.join(derived_dir, 'item_max_pubyear.csv')) if year))
+            # Years of uids that cite nothing are never needed
+            connection.execute("DELETE FROM citing_year WHERE uid NOT IN (SELECT uid FROM edges)")
+            connection.execute("INSERT INTO cite_count SELECT cited_uid, COUNT(*) FROM edges GROUP BY cited_uid")
+            connection.execute("INSERT INTO cite_count_year SELECT e.cited_uid, y.year, COUNT(*) "
+                               "FROM edges e JOIN citing_year y ON e.uid = y.uid GROUP BY e.cited_uid, y.year")
+            # The derived tables cover every batch written so far
+            applied_at = datetime.now().isoformat()
+            connection.executemany("INSERT INTO applied_batches VALUES (?, ?, 0, 0)",
+                                   ((batch_id, applied_at) for batch_id, manifest in list_batches(output_dir)
+                                    if manifest is not None))
+        edge_count = connection.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+    finally:
+        connection.close()
+    os.replace(state_path + '.tmp', state_path)
+    print(f"Citation count state {state_path}: {edge_count} edges ({time.time() - started:.1f}s)")
+    return edge_count
+
+
+def _upsert_counts(connection, table_name, key_columns, deltas):
+    """Add count deltas to a count table; returns the new counts of the changed keys, 0 for removed keys"""
+    key_condition = ' AND '.join(f"{column} = ?" for column in key_columns)
+    changed = []
+    for key, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        key = key if isinstance(key, tuple) else (key,)
+        connection.execute(
+            f"INSERT INTO {table_name} VALUES ({', '.join('?' * len(key))}, ?) "
+            f"ON CONFLICT ({', '.join(key_columns)}) "
+            f"DO UPDATE SET citation_count = citation_count + excluded.citation_count",
+            key + (delta,))
+        count = connection.execute(f"SELECT citation_count FROM {table_name} WHERE {key_condition}", key).fetchone()[0]
+        if count <= 0:
+            connection.execute(f"DELETE FROM {table_name} WHERE {key_condition}", key)
+            count = 0
+        changed.append(key + (count,))
+    return changed
+
+
+def _write_changes(changes_dir, rows_by_file):
+    os.makedirs(changes_dir, exist_ok=True)
+    for file_name, columns in CHANGE_FILE_COLUMNS.items():
+        file_path = os.path.join(changes_dir, file_name)
+        with open(file_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(columns)
+            writer.writerows(rows_by_file[file_name])
+        os.replace(file_path + '.tmp', file_path)
+
+
+def apply_batch(batch_dir, state_path=None):
+    """
+    Apply the citations of an import batch to the state and write its changed rows
+
+    :param batch_dir: Batch directory
+    :param state_path: State file (default: cite_count_state.sqlite of the output directory of the batch)
+    :return: Dictionary of changed row counts, or None if the batch was applied before
+    """
+    started = time.time()
+    batch_dir = os.path.normpath(batch_dir)
+    batch_id = os.path.basename(batch_dir)
+    state_path = state_path or state_path_of(os.path.dirname(os.path.dirname(batch_dir)))
+    if not os.path.exists(state_path):
+        raise FileNotFoundError(f"{state_path} not found; run xml_cite_counts.py init first")
+    changes_dir = os.path.join(batch_dir, CITE_COUNT_CHANGES_DIR_NAME)
+
+    connection = _connect(state_path)
+    try:
+        if connection.execute("SELECT 1 FROM applied_batches WHERE batch_id = ?", (batch_id,)).fetchone():
+            print(f"Citation counts of batch {batch_id} already applied")
+            return None
+
+        new_years = {}
+        for uid, pubyear in table_rows(batch_dir, 'item', ('uid', 'pubyear')):
+            year = int(pubyear) if pubyear.isdigit() else None
+            if uid not in new_years or (year is not None and (new_years[uid] is None or year > new_years[uid])):
+                new_years[uid] = year
+        new_edges = defaultdict(set)
+        for uid, cited_uid in table_rows(batch_dir, 'item_references', ('uid', 'cited_uid')):
+            if is_wos_citation(cited_uid):
+                new_edges[uid].add(cited_uid)
+        tombstoned = {uid for uid, in table_rows(batch_tombstone_dir(batch_dir), 'uid', ('uid',))}
+
+        count_deltas, year_deltas = Counter(), Counter()
+        added, removed = [], []
+        with connection:
+            # Every uid of the batch replaces its previous version; its external edges stay
+            for uid in sorted(set(new_years) | set(new_edges) | tombstoned):
+                old_parsed, external = set(), set()
+                for cited_uid, parsed, is_external in connection.execute(
+                        "SELECT cited_uid, parsed, external FROM edges WHERE uid = ?", (uid,)):
+                    if parsed:
+                        old_parsed.add(cited_uid)
+                    if is_external:
+                        external.add(cited_uid)
+                row = connection.execute("SELECT year FROM citing_year WHERE uid = ?", (uid,)).fetchone()
+                old_year = row[0] if row else None
+                new_parsed, new_year = new_edges.get(uid, set()), new_years.get(uid)
+                old, new = old_parsed | external, new_parsed | external
+                if new_year is None and external:
+                    # The year of external edges without a parsed version (e.g. from external year files)
+                    new_year = old_year
+                for cited_uid in old:
+                    count_deltas[cited_uid] -= 1
+                    if old_year is not None:
+                        year_deltas[(cited_uid, old_year)] -= 1
+                for cited_uid in new:
+                    count_deltas[cited_uid] += 1
+                    if new_year is not None:
+                        year_deltas[(cited_uid, new_year)] += 1
+                removed.extend((uid, cited_uid) for cited_uid in sorted(old - new))
+                added.extend((uid, cited_uid) for cited_uid in sorted(new - old))
+                connection.executemany("UPDATE edges SET parsed = 0 WHERE uid = ? AND cited_uid = ?",
+                                       ((uid, cited_uid) for cited_uid in old_parsed - new_parsed))
+                connection.execute("DELETE FROM edges WHERE uid = ? AND parsed = 0 AND external = 0", (uid,))
+                connection.executemany("INSERT INTO edges VALUES (?, ?, 1, 0) "
+                                       "ON CONFLICT (uid, cited_uid) DO UPDATE SET parsed = 1",
+                                       ((uid, cited_uid) for cited_uid in new_parsed - old_parsed))
+                if new and new_year is not None:
+                    connection.execute("INSERT OR REPLACE INTO citing_year VALUES (?, ?)", (uid, new_year))
+                elif old_year is not None:
+                    connection.execute("DELETE FROM citing_year WHERE uid = ?", (uid,))
+
+            changes = {
+                'cite_count.csv': _upsert_counts(connection, 'cite_count', ('cited_uid',), count_deltas),
+                'cite_count_year.csv': _upsert_counts(connection, 'cite_count_year', ('cited_uid', 'citing_year'),
+                                                      year_deltas),
+                'citation_merge_added.csv': added,
+                'citation_merge_removed.csv': removed,
+            }
+            # Written before the state commits: a batch applied in the state always has its changes
+            _write_changes(changes_dir, changes)
+            connection.execute("INSERT INTO applied_batches VALUES (?, ?, ?, ?)",
+                               (batch_id, datetime.now().isoformat(), len(added), len(removed)))
+    finally:
+        connection.close()
+
+    summary = {file_name[:-len('.csv')]: len(rows) for file_name, rows in changes.items()}
+    print(f"Citation counts of batch {batch_id}: {summary['citation_merge_added']} edges added, "
+          f"{summary['citation_merge_removed']} removed, {summary['cite_count']} cite_count and "
+          f"{summary['cite_count_year']} cite_count_year rows changed ({time.time() - started:.1f}s)")
+    return summary
+
+
+def apply_pending_batches(output_dir=None, state_path=None):
+    """
+    Apply every complete batch the state has not seen, in batch order
+
+    :return: List of applied batch ids
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    state_path = state_path or state_path_of(output_dir)
+    applied = []
+    for batch_id, manifest in list_batches(output_dir):
+        if manifest is not None and apply_batch(os.path.join(batches_dir(output_dir), batch_id), state_path):
+            applied.append(batch_id)
+    return applied
+
+
+def upsert_sql(batch_dir):
+    """
+    SQL applying the changed rows of a batch to citation_merge, cite_count and cite_count_year
+
+    The tables are those of import_derived_tables.sql, whose unique keys the upserts rely on.
+
+    :param batch_dir: Batch directory with applied citation counts
+    :return: SQL script
+    """
+    from xml_load_manifest import IMPORT_SQL_PATH, load_statements
+    changes_dir = os.path.abspath(os.path.join(batch_dir, CITE_COUNT_CHANGES_DIR_NAME))
+    preamble, _ = load_statements(IMPORT_SQL_PATH)
+
+    def load(file_name, table_name, columns):
+        return (f"LOAD DATA LOCAL INFILE '{os.path.join(changes_dir, file_name)}'\n"
+                f"INTO TABLE {table_name}\n"
+                "CHARACTER SET utf8mb4\n"
+                "FIELDS TERMINATED BY ','\n"
+                "OPTIONALLY ENCLOSED BY '\"'\n"
+                "ESCAPED BY ''\n"
+                "LINES TERMINATED BY '\\r\\n'\n"
+                f"IGNORE 1 LINES ({', '.join(columns)});\n")
+
+    return preamble + "\n".join([
+        "CREATE TEMPORARY TABLE citation_merge_removed (uid VARCHAR(50), cited_uid VARCHAR(50));",
+        load('citation_merge_removed.csv', 'citation_merge_removed', ('uid', 'cited_uid')),
+        "DELETE c FROM citation_merge c JOIN citation_merge_removed d "
+        "ON c.uid = d.uid AND c.cited_uid = d.cited_uid;",
+        load('citation_merge_added.csv', 'citation_merge', ('uid', 'cited_uid')).replace(
+            "INTO TABLE citation_merge", "IGNORE INTO TABLE citation_merge"),
+        "CREATE TEMPORARY TABLE cite_count_change (cited_uid VARCHAR(50), citation_count INT);",
+        load('cite_count.csv', 'cite_count_change', ('cited_uid', 'citation_count')),
+        "INSERT INTO cite_count (cited_uid, citation_count) SELECT cited_uid, citation_count FROM cite_count_change "
+        "ON DUPLICATE KEY UPDATE citation_count = VALUES(citation_count);",
+        "DELETE c FROM cite_count c JOIN cite_count_change d ON c.cited_uid = d.cited_uid "
+        "WHERE d.citation_count = 0;",
+        "CREATE TEMPORARY TABLE cite_count_year_change (cited_uid VARCHAR(50), citing_year SMALLINT, "
+        "citation_count INT);",
+        load('cite_count_year.csv', 'cite_count_year_change', ('cited_uid', 'citing_year', 'citation_count')),
+        "INSERT INTO cite_count_year (cited_uid, citing_year, citation_count) "
+        "SELECT cited_uid, citing_year, citation_count FROM cite_count_year_change "
+        "ON DUPLICATE KEY UPDATE citation_count = VALUES(citation_count);",
+        "DELETE c FROM cite_count_year c JOIN cite_count_year_change d "
+        "ON c.cited_uid = d.cited_uid AND c.citing_year = d.citing_year WHERE d.citation_count = 0;",
+    ]) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental citation counts across import batches')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('init', 'Seed the state from the derived tables'),
+                               ('apply', 'Apply every complete batch not applied yet')):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+        command_parser.add_argument('--state', default=None, help='State file '
+                                                                  '(default: <output_dir>/cite_count_state.sqlite)')
+        if command == 'init':
+            command_parser.add_argument('--edges', nargs='*', default=[],
+                                        help='External edge lists merged by xml_citation_merge.py')
+    batch_parser = subparsers.add_parser('apply-batch', help='Apply one batch')
+    batch_parser.add_argument('batch_dir')
+    batch_parser.add_argument('--state', default=None, help='State file')
+    sql_parser = subparsers.add_parser('upsert-sql', help='Print the SQL applying the changed rows of a batch')
+    sql_parser.add_argument('batch_dir')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        init_state(args.output_dir, state_path=args.state, edge_paths=args.edges)
+    elif args.command == 'apply':
+        apply_pending_batches(args.output_dir, args.state)
+    elif args.command == 'apply-batch':
+        apply_batch(args.batch_dir, args.state)
+    else:
+        sys.stdout.write(upsert_sql(args.batch_dir))
+
+
+if __name__ == "__main__":
+    main()
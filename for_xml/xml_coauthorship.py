@@ -0,0 +1,165 @@
+"""
+Co-authorship network from sparse author-by-paper incidence matrices
+
+Co-authorship edges are a self-join of item_authors on uid, tens of
+millions of rows squared per paper, which MySQL does not finish overnight.
+This tool builds them with SciPy sparse algebra, one publication year at a
+time:
+
+- Authors are identified by ORCID (item_author_ids orcid, else orcid_tr),
+  else ResearcherID (r_id), else their normalized WOS standard name
+  ("PERLMANN, J"); the same identifier on several papers is one author.
+- The papers of a year and their authors form a 0/1 incidence matrix B
+  (papers x authors). B.T @ B counts the papers every pair of authors
+  shares; B.T @ diag(1 / (n - 1)) @ B is the fractional count, where a
+  paper with n authors gives every pair 1 / (n - 1), so every author gets
+  a total weight of 1 per paper however many co-authors it has.
+  Papers with more than --max-authors authors can be left out altogether.
+- Every year is written to <output>/coauthorship/<year>.csv.gz with the
+  pairs author_a < author_b and their papers and weight; the authors are
+  numbered in authors.csv.gz (author_id, author_key, name).
+
+    python xml_coauthorship.py xml_output [--max-authors 100]
+
+Requires numpy and scipy.
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import time
+from array import array
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import max_pubyears, table_rows
+from xml_optional_deps import optional_import, require
+
+np = optional_import('numpy')
+sp = optional_import('scipy.sparse')
+
+COAUTHORSHIP_DIR_NAME = "coauthorship"
+AUTHORS_FILE = "authors.csv.gz"
+EDGE_FILE_COLUMNS = ('author_a', 'author_b', 'papers', 'weight')
+
+# Papers without a pubyear are written to this file name
+UNKNOWN_YEAR = 'unknown'
+
+
+def author_key(name, orcid='', orcid_tr='', r_id=''):
+    """Identifier of an author: ORCID, else ResearcherID, else the normalized name"""
+    if orcid or orcid_tr:
+        return 'orcid:' + (orcid or orcid_tr).strip().upper()
+    if r_id:
+        return 'rid:' + r_id.strip().upper()
+    return 'name:' + ' '.join(name.upper().split())
+
+
+def _pair_matrices(papers, authors, author_count, max_authors):
+    """
+    Co-authorship counts of one year
+
+    :param papers: Paper number of every authorship
+    :param authors: Author id of every authorship
+    :return: (full counts, fractional counts) as upper triangular COO matrices
+    """
+    incidence = sp.csr_matrix((np.ones(len(papers), dtype=np.float64), (papers, authors)),
+                              shape=(int(papers.max()) + 1, author_count))
+    # An author listed twice on a paper is one authorship
+    incidence.data[:] = 1
+    sizes = np.diff(incidence.indptr)
+    keep = sizes >= 2
+    if max_authors:
+        keep &= sizes <= max_authors
+    incidence = incidence[np.flatnonzero(keep)]
+    sizes = sizes[keep]
+    full = (incidence.T @ incidence).tocsr()
+    fractional = (incidence.T @ sp.diags(1.0 / (sizes - 1)) @ incidence).tocsr()
+    # Same sparsity pattern; with sorted indices the entries of both come out in the same order
+    full.sort_indices()
+    fractional.sort_indices()
+    return sp.triu(full, k=1, format='coo'), sp.triu(fractional, k=1, format='coo')
+
+
+def build_coauthorship(output_dir=None, network_dir=None, max_authors=None):
+    """
+    Write the co-authorship edges of every publication year
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param network_dir: Directory of the edge files (default: <output_dir>/coauthorship)
+    :param max_authors: Leave out papers with more authors (default: keep all)
+    :return: Dictionary of year to number of edges
+    """
+    require(sp, 'scipy')
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    network_dir = network_dir or os.path.join(output_dir, COAUTHORSHIP_DIR_NAME)
+
+    years = max_pubyears(output_dir)
+    author_ids = {}
+    for uid, seq_no, r_id, orcid, orcid_tr in table_rows(output_dir, 'item_author_ids',
+                                                         ('uid', 'seq_no', 'r_id', 'orcid', 'orcid_tr')):
+        author_ids[(uid, seq_no)] = (orcid, orcid_tr, r_id)
+
+    # Authorships of every year as (paper number, author id) arrays
+    author_numbers, author_names = {}, []
+    paper_numbers = {}
+    authorships = {}
+    for uid, seq_no, wos_standard, display_name in table_rows(output_dir, 'item_authors',
+                                                              ('uid', 'seq_no', 'wos_standard', 'display_name')):
+        name = wos_standard or display_name
+        orcid, orcid_tr, r_id = author_ids.get((uid, seq_no), ('', '', ''))
+        key = author_key(name, orcid, orcid_tr, r_id)
+        if key == 'name:':
+            continue
+        author = author_numbers.setdefault(key, len(author_numbers))
+        if author == len(author_names):
+            author_names.append(name)
+        year = years.get(uid, UNKNOWN_YEAR)
+        year_papers = paper_numbers.setdefault(year, {})
+        paper = year_papers.setdefault(uid, len(year_papers))
+        papers, authors = authorships.setdefault(year, (array('q'), array('q')))
+        papers.append(paper)
+        authors.append(author)
+    del years, author_ids, paper_numbers
+    print(f"Co-authorship of {output_dir}: {len(author_numbers)} authors, "
+          f"{sum(len(papers) for papers, _ in authorships.values())} authorships ({time.time() - started:.1f}s)")
+
+    os.makedirs(network_dir, exist_ok=True)
+    with gzip.open(os.path.join(network_dir, AUTHORS_FILE + '.tmp'), 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        writer.writerow(('author_id', 'author_key', 'name'))
+        writer.writerows((author, key, author_names[author]) for key, author in author_numbers.items())
+    os.replace(os.path.join(network_dir, AUTHORS_FILE + '.tmp'), os.path.join(network_dir, AUTHORS_FILE))
+
+    edge_counts = {}
+    for year in sorted(authorships, key=str):
+        papers, authors = (np.frombuffer(values, dtype=np.int64) for values in authorships.pop(year))
+        full, fractional = _pair_matrices(papers, authors, len(author_numbers), max_authors)
+        edge_path = os.path.join(network_dir, f"{year}.csv.gz")
+        with gzip.open(edge_path + '.tmp', 'wt', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(EDGE_FILE_COLUMNS)
+            writer.writerows(zip(full.row.tolist(), full.col.tolist(), full.data.astype(np.int64).tolist(),
+                                 np.round(fractional.data, 6).tolist()))
+        os.replace(edge_path + '.tmp', edge_path)
+        edge_counts[year] = full.nnz
+        print(f"  {year}: {full.nnz} co-author pairs")
+    print(f"Co-authorship network in {network_dir} ({time.time() - started:.1f}s)")
+    return edge_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Co-authorship network per publication year')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--network-dir', default=None, help='Directory of the edge files '
+                                                            '(default: <output_dir>/coauthorship)')
+    parser.add_argument('--max-authors', type=int, default=None,
+                        help='Leave out papers with more authors (default: keep all)')
+    args = parser.parse_args()
+    build_coauthorship(args.output_dir, args.network_dir, args.max_authors)
+
+
+if __name__ == "__main__":
+    main()
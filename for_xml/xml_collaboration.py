@@ -0,0 +1,194 @@
+"""
+Country and organization collaboration matrices per publication year
+
+Country-by-country and organization-by-organization collaboration counts
+are self-joins of item_addresses and item_orgs on uid. This aggregator
+streams the two tables once, reduces every paper to its distinct
+countries and organizations, and builds per-year sparse co-occurrence
+matrices with SciPy, so the work grows linearly with the papers:
+
+- country: the country of every address in item_addresses
+- org: the preferred organization names (org_pref = Y) of every address in
+  item_orgs; addresses without a preferred name count with their other
+  organization names
+
+For a year, the papers x entities 0/1 incidence matrix B gives
+
+- full = B.T @ B: the diagonal is the number of papers of an entity, the
+  off-diagonal the number of papers two entities share
+- fractional: a paper with n entities gives each of them 1 / n on the
+  diagonal and every pair 1 / (n - 1) off the diagonal, so every paper
+  counts once however many countries or organizations it has
+
+Both are symmetric; the upper triangle (with the diagonal) is saved as a
+SciPy CSR matrix:
+
+    <output>/collaboration/<kind>/<year>_full.npz
+    <output>/collaboration/<kind>/<year>_fractional.npz
+    <output>/collaboration/<kind>/ids.csv        (id, name: row/column numbers)
+
+    python xml_collaboration.py xml_output
+    scipy.sparse.load_npz('xml_output/collaboration/country/2020_full.npz')
+
+Requires numpy and scipy.
+"""
+
+import argparse
+import csv
+import os
+import time
+from array import array
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import max_pubyears, table_rows
+from xml_optional_deps import optional_import, require
+
+np = optional_import('numpy')
+sp = optional_import('scipy.sparse')
+
+COLLABORATION_DIR_NAME = "collaboration"
+IDS_FILE = "ids.csv"
+COLLABORATION_KINDS = ('country', 'org')
+
+# Papers without a pubyear are saved under this name
+UNKNOWN_YEAR = 'unknown'
+
+
+def normalize_name(value):
+    """Country or organization name with collapsed whitespace"""
+    return ' '.join(value.split())
+
+
+class YearIncidence:
+    """Papers x entities incidence of every year, with entity ids shared by all years"""
+
+    def __init__(self):
+        self.ids = {}
+        self._papers = {}
+        self._pairs = {}
+
+    def add(self, year, uid, name):
+        """Record that the paper uid of a year has the entity name"""
+        entity = self.ids.setdefault(name, len(self.ids))
+        year_papers = self._papers.setdefault(year, {})
+        paper = year_papers.setdefault(uid, len(year_papers))
+        papers, entities = self._pairs.setdefault(year, (array('q'), array('q')))
+        papers.append(paper)
+        entities.append(entity)
+
+    def years(self):
+        """Years with papers, sorted"""
+        return sorted(self._pairs, key=str)
+
+    def matrix(self, year):
+        """0/1 incidence matrix of a year (papers x entities), a paper listing an entity twice counted once"""
+        papers, entities = (np.frombuffer(values, dtype=np.int64) for values in self._pairs[year])
+        incidence = sp.csr_matrix((np.ones(len(papers), dtype=np.float64), (papers, entities)),
+                                  shape=(len(self._papers[year]), len(self.ids)))
+        incidence.data[:] = 1
+        return incidence
+
+
+def cooccurrence_matrices(incidence):
+    """
+    Full and fractional co-occurrence of an incidence matrix
+
+    :param incidence: 0/1 CSR matrix, papers x entities
+    :return: (full, fractional) as upper triangular CSR matrices with the diagonal
+    """
+    sizes = np.diff(incidence.indptr).astype(np.float64)
+    full = incidence.T @ incidence
+    paper_weights = np.divide(1.0, sizes, out=np.zeros_like(sizes), where=sizes > 0)
+    pair_weights = np.divide(1.0, sizes - 1, out=np.zeros_like(sizes), where=sizes > 1)
+    pairs = incidence.T @ sp.diags(pair_weights) @ incidence
+    fractional = sp.csr_matrix(sp.triu(pairs, k=1) + sp.diags(incidence.T @ paper_weights))
+    # Entities without papers in the year
+    fractional.eliminate_zeros()
+    return sp.triu(full, format='csr'), fractional
+
+
+def _save_npz(path, matrix):
+    """Save a sparse matrix through a temporary file"""
+    with open(path + '.tmp', 'wb') as f:
+        sp.save_npz(f, matrix)
+    os.replace(path + '.tmp', path)
+
+
+def collaboration_incidences(output_dir):
+    """Country and organization incidences of an output tree: {kind: YearIncidence}"""
+    years = max_pubyears(output_dir)
+    countries = YearIncidence()
+    for uid, country in table_rows(output_dir, 'item_addresses', ('uid', 'country')):
+        country = normalize_name(country)
+        if country:
+            countries.add(years.get(uid, UNKNOWN_YEAR), uid, country)
+
+    orgs = YearIncidence()
+    preferred_addresses, other_orgs = set(), {}
+    for uid, addr_no, pref, organization in table_rows(output_dir, 'item_orgs',
+                                                       ('uid', 'addr_no', 'org_pref', 'organization')):
+        organization = normalize_name(organization)
+        if not organization:
+            continue
+        if pref == 'Y':
+            preferred_addresses.add((uid, addr_no))
+            orgs.add(years.get(uid, UNKNOWN_YEAR), uid, organization)
+        else:
+            other_orgs.setdefault((uid, addr_no), []).append(organization)
+    for (uid, addr_no), organizations in other_orgs.items():
+        if (uid, addr_no) not in preferred_addresses:
+            for organization in organizations:
+                orgs.add(years.get(uid, UNKNOWN_YEAR), uid, organization)
+    return {'country': countries, 'org': orgs}
+
+
+def build_collaboration(output_dir=None, collaboration_dir=None):
+    """
+    Save the collaboration matrices of every kind and publication year
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param collaboration_dir: Directory of the matrices (default: <output_dir>/collaboration)
+    :return: Dictionary of kind to {year: number of stored entries of the full matrix}
+    """
+    require(sp, 'scipy')
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    collaboration_dir = collaboration_dir or os.path.join(output_dir, COLLABORATION_DIR_NAME)
+    incidences = collaboration_incidences(output_dir)
+
+    summary = {}
+    for kind in COLLABORATION_KINDS:
+        incidence = incidences[kind]
+        kind_dir = os.path.join(collaboration_dir, kind)
+        os.makedirs(kind_dir, exist_ok=True)
+        ids_path = os.path.join(kind_dir, IDS_FILE)
+        with open(ids_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(('id', 'name'))
+            writer.writerows((entity, name) for name, entity in incidence.ids.items())
+        os.replace(ids_path + '.tmp', ids_path)
+
+        summary[kind] = {}
+        for year in incidence.years():
+            full, fractional = cooccurrence_matrices(incidence.matrix(year))
+            _save_npz(os.path.join(kind_dir, f"{year}_full.npz"), full)
+            _save_npz(os.path.join(kind_dir, f"{year}_fractional.npz"), fractional)
+            summary[kind][year] = full.nnz
+        print(f"Collaboration {kind}: {len(incidence.ids)} ids, {len(summary[kind])} years, "
+              f"{sum(summary[kind].values())} matrix entries ({time.time() - started:.1f}s)")
+    print(f"Collaboration matrices in {collaboration_dir} ({time.time() - started:.1f}s)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Country and organization collaboration matrices per year')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--collaboration-dir', default=None, help='Directory of the matrices '
+                                                                  '(default: <output_dir>/collaboration)')
+    args = parser.parse_args()
+    build_collaboration(args.output_dir, args.collaboration_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from operator import itemgetter
 
 # Output directory for XML parsed data
 OUTPUT_DIR = "xml_output"
@@ -100,5 +101,117 @@ class XMLFilePathDef:
     ITEM_CONFERENCES_FILE_PATH = os.path.join(OUTPUT_DIR, ITEM_CONFERENCES_FILE_NAME)
 
 
+# Column layout of every output table, in CSV (schema) column order
+XML_TABLE_COLUMNS = {
+    # Section 1: Paper Basic Information
+    'uid': ('uid',),
+    'item': (
+        'uid', 'sortdate', 'pubyear', 'has_abstract', 'vol', 'issue', 'part', 'supplement',
+        'special_issue', 'early_access_date', 'early_access_month', 'early_access_year',
+        'page_begin', 'page_end', 'page_count'
+    ),
+    'item_title': ('uid', 'title'),
+    'item_abstract': ('uid', 'abstract'),
+    'item_doc_types': ('uid', 'doctype'),
+    'item_doc_types_norm': ('uid', 'doctype_norm'),
+    'item_langs': ('uid', 'type', 'language'),
+    'item_langs_norm': ('uid', 'type', 'language_norm'),
+    'item_editions': ('uid', 'edition'),
+    'item_keywords': ('uid', 'keyword'),
+    'item_keywords_plus': ('uid', 'keyword_plus'),
+    'item_source': (
+        'uid', 'source', 'source_abbrev', 'abbrev_iso', 'abbrev_11', 'abbrev_29', 'series',
+        'book_subtitle'
+    ),
+    'item_ids': ('uid', 'identifier_type', 'identifier_value'),
+    'item_oas': ('uid', 'oa_type'),
+    'item_publishers': (
+        'uid', 'addr_no', 'full_address', 'city', 'role', 'seq_no', 'display_name',
+        'full_name', 'unified_name'
+    ),
+
+    # Section 2: Author Information
+    'item_authors': (
+        'uid', 'seq_no', 'role', 'reprint', 'display_name', 'wos_standard', 'full_name',
+        'first_name', 'last_name', 'suffix', 'email_addr'
+    ),
+    'item_addresses': (
+        'uid', 'addr_no', 'full_address', 'city', 'state', 'country', 'zip',
+        'zip_location'
+    ),
+    'item_au_addrs': ('uid', 'seq_no', 'address_no'),
+    'item_addr_aus': ('uid', 'seq_no', 'address_no'),
+    'item_orgs': ('uid', 'addr_no', 'org_pref', 'ROR_ID', 'org_id', 'organization'),
+    'item_suborgs': ('uid', 'addr_no', 'suborganization'),
+    'item_author_ids': ('uid', 'seq_no', 'r_id', 'orcid', 'orcid_tr'),
+    'item_rp_addrs': (
+        'uid', 'addr_no', 'full_address', 'city', 'state', 'country', 'zip',
+        'zip_location'
+    ),
+    'item_rp_au_addrs': ('uid', 'seq_no', 'address_no'),
+    'item_rp_orgs': ('uid', 'addr_no', 'org_pref', 'ROR_ID', 'org_id', 'organization'),
+    'item_rp_suborgs': ('uid', 'addr_no', 'suborganization'),
+    'item_contributors': (
+        'uid', 'seq_no', 'orcid_id', 'r_id', 'r_id_role', 'display_name', 'full_name',
+        'first_name', 'last_name'
+    ),
+
+    # Section 3: Category Information
+    'item_headings': ('uid', 'headings'),
+    'item_subjects': ('uid', 'subject', 'ascatype'),
+
+    # Section 4: References
+    'item_references': (
+        'uid', 'occurence_order', 'cited_uid', 'cited_author', 'cited_year', 'cited_page',
+        'cited_volume', 'cited_title', 'cited_work', 'cited_doi', 'cited_assignee',
+        'patent_no'
+    ),
+    'item_cite_locations': ('uid', 'occurence_order', 'physical_location', 'section', 'function'),
+
+    # Section 5: Funding Information
+    'item_acks': ('uid', 'ack_text'),
+    'item_grants': ('uid', 'grant_agency', 'grant_agency_pref', 'grant_id', 'grant_source'),
+
+    # Section 6: Conference Information
+    'item_conferences': (
+        'uid', 'conf_id', 'conf_info', 'conf_title', 'conf_start', 'conf_end', 'conf_date',
+        'conf_city', 'conf_state', 'sponsor'
+    ),
+}
+
+# All output table names, in the order XMLDataWriter writes them
+XML_TABLE_NAMES = list(XML_TABLE_COLUMNS)
+
+# Columns held as typed integer arrays in a RecordBatch (array typecodes);
+# a batch falls back to the plain values when a column has anything else
+XML_INTEGER_COLUMNS = {
+    'pubyear': 'h',
+    'early_access_year': 'h',
+    'page_count': 'l',
+    'seq_no': 'l',
+    'addr_no': 'l',
+    'occurence_order': 'l',
+}
+
+
+def row_getter(columns):
+    """
+    Build a function turning a row dictionary into a tuple in column order
+
+    :param columns: Column names of a table
+    :return: Callable mapping a row dict to a tuple
+    """
+    if len(columns) == 1:
+        column = columns[0]
+        return lambda row: (row[column],)
+    return itemgetter(*columns)
+
+
+# Delta mode: list of UIDs whose previously loaded rows are superseded in every table
+TOMBSTONE_DIR_NAME = "tombstones"
+TOMBSTONE_DIR = os.path.join(OUTPUT_DIR, TOMBSTONE_DIR_NAME)
+TOMBSTONE_FILE = "uid.csv"
+
+
 # XML Namespace definition for WOS XML files
 WOS_NAMESPACE = {'ns': 'http://clarivate.com/schema/wok5.30/public/FullRecord'}
@@ -0,0 +1,102 @@
+"""
+Delta (upsert) support for WOS update deliveries
+
+Clarivate re-delivers updated versions of records that were already loaded.
+In delta mode every processed UID keeps a content hash in the processing
+history. A re-delivered record is skipped when its hash is unchanged; when it
+changed, its UID is added to the tombstone list (tombstones/uid.csv) so the
+old rows can be deleted from every table downstream before the new rows are
+loaded.
+
+The UIDs of an input file are written in one append once its rows are
+written, before its records are marked as processed. With --atomic they are
+staged with the rows and committed with them (see xml_file_commit).
+"""
+
+import hashlib
+import os
+
+from csv_writer import CSVWriter
+from xml_common_def import TOMBSTONE_DIR, TOMBSTONE_FILE
+
+
+def _update_digest(digest, element):
+    """Feed an element subtree into a hash in a prefix-independent form"""
+    digest.update(element.tag.encode('utf-8') + b'\x00')
+    for key, value in sorted(element.attrib.items()):
+        digest.update(f"{key}={value}\x00".encode('utf-8'))
+    digest.update((element.text or '').encode('utf-8') + b'\x01')
+    for child in element:
+        _update_digest(digest, child)
+        digest.update((child.tail or '').encode('utf-8') + b'\x01')
+    digest.update(b'\x02')
+
+
+def compute_record_hash(record_element):
+    """
+    Compute the content hash of a <REC> element
+
+    Tags and attributes are hashed by their qualified names, so the hash does
+    not depend on namespace prefixes or on the record's position in the file.
+
+    :param record_element: XML Element representing a <REC> node
+    :return: Hex digest identifying the record content
+    """
+    digest = hashlib.sha1()
+    _update_digest(digest, record_element)
+    return digest.hexdigest()
+
+
+def write_tombstones(tombstone_dir, uids):
+    """
+    Append UIDs to the tombstone list of a directory in one write
+
+    :param tombstone_dir: Directory of the tombstone list (uid.csv)
+    :param uids: UIDs whose old rows must be deleted from every table
+    """
+    if uids:
+        CSVWriter(os.path.join(tombstone_dir, TOMBSTONE_FILE), ['uid']).write_tuples([(uid,) for uid in uids])
+
+
+class TombstoneWriter:
+    """Collects the UIDs of changed records of an input file for the tombstone list"""
+
+    def __init__(self, tombstone_dir=TOMBSTONE_DIR):
+        """
+        Initialize tombstone writer
+
+        :param tombstone_dir: Directory receiving the tombstone list (uid.csv)
+        """
+        self.tombstone_dir = tombstone_dir
+        self.uids = []
+
+    def add_uid(self, uid):
+        """
+        Record that all rows of a UID must be deleted from every table
+
+        :param uid: Record UID
+        """
+        self.uids.append(uid)
+
+    def take(self, uids=None):
+        """
+        Remove collected UIDs from the writer
+
+        :param uids: Optional UIDs to take (e.g. those of the written batch); default: all
+        :return: List of the taken UIDs that were collected, in collection order
+        """
+        if uids is None:
+            taken, self.uids = self.uids, []
+            return taken
+        uids = set(uids)
+        taken = [uid for uid in self.uids if uid in uids]
+        self.uids = [uid for uid in self.uids if uid not in uids]
+        return taken
+
+    def write(self, uids=None):
+        """
+        Append collected UIDs to the tombstone list in one write
+
+        :param uids: Optional UIDs to write (see take()); default: all
+        """
+        write_tombstones(self.tombstone_dir, self.take(uids))
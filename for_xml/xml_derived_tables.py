@@ -0,0 +1,392 @@
+"""
+Derived tables computed from the extracted rows
+
+modify_database.sql builds the citation and convenience tables in MySQL
+after every import, with full-table CREATE TABLE AS SELECT / GROUP BY
+passes. This stage computes the same tables from the output files and
+writes them to <output>/derived/ ready to load (import_derived_tables.sql),
+so the database never runs those scans:
+
+- citations: (uid, cited_uid) references to WOS records (cited_uid
+  "WOS:..." without a ".")
+- citation_merge: citations without duplicate pairs
+- cite_count: citations per cited_uid in citation_merge
+- item_max_pubyear: the largest pubyear of every uid
+- item_doi: the DOIs of item_ids, lowercased
+- item_rp_cntry: distinct (uid, country) of the reprint addresses
+- cite_count_year: citations per cited_uid and citing year
+  (item_max_pubyear of the citing uid)
+
+Identifier types and countries are compared case-insensitively, like the
+utf8mb4_unicode_ci collation of the MySQL tables; of countries differing
+only in case the first spelling is kept. One deviation: citing uids with an
+empty max_pubyear are left out of cite_count_year, while the join in
+modify_database.sql counts them in a NULL citing_year group. The unique key
+of cite_count_year does not merge NULL years, so xml_cite_counts could not
+maintain that group incrementally.
+
+Memory stays bounded by hash partitioning: rows to aggregate are spilled
+to bucket files by a hash of their key (uid, or cited_uid for the counts),
+and every bucket is aggregated on its own in memory. The number of buckets
+follows from the size of the input tables and the memory budget, capped by
+the open file limit of the process. Plain,
+compressed and part table files of the whole output tree (partitions, node
+shards, import batches) are read. Import batches without a batch manifest
+(runs that did not finish) are skipped, and the tombstones of every
+complete batch are applied: rows of a tombstoned UID written before the
+batch (top-level tables and earlier batches) are dropped, so only its new
+version is aggregated.
+
+    python xml_derived_tables.py xml_output [--memory-mb 1024] [--temp-dir /scratch]
+
+modify_database.sql keeps the statements that need other databases
+(thomson) and the analysis tables.
+"""
+
+import argparse
+import csv
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from csv_writer import CSV_DIALECT, open_csv_file
+from xml_common_def import OUTPUT_DIR, TOMBSTONE_FILE
+from xml_import_batches import batch_tombstone_dir, batches_dir, list_batches
+
+DERIVED_DIR_NAME = "derived"
+
+DERIVED_TABLE_COLUMNS = {
+    'citations': ('uid', 'cited_uid'),
+    'citation_merge': ('uid', 'cited_uid'),
+    'cite_count': ('cited_uid', 'citation_count'),
+    'item_max_pubyear': ('uid', 'max_pubyear'),
+    'item_doi': ('uid', 'doi'),
+    'item_rp_cntry': ('uid', 'country'),
+    'cite_count_year': ('cited_uid', 'citing_year', 'citation_count'),
+}
+
+DEFAULT_MEMORY_MB = 1024
+
+# Python objects take several times the bytes of their CSV text
+ROW_MEMORY_FACTOR = 4
+
+# Compressed tables are estimated at this many times their file size
+COMPRESSED_SIZE_FACTOR = 5
+
+# Bucket files open at the same time (one BucketFiles is written at a time)
+MAX_BUCKETS = 512
+
+# File descriptors kept free for the input tables, the derived tables and the interpreter
+RESERVED_FILE_DESCRIPTORS = 64
+
+WOS_UID_PREFIX = "WOS:"
+
+# Directories of an output tree without table rows
+_SKIPPED_DIR_NAMES = ('tombstones', DERIVED_DIR_NAME, 'parquet')
+
+
+def is_wos_citation(cited_uid):
+    """Whether a cited_uid references a WOS record (modify_database.sql: LIKE 'WOS:%', NOT LIKE '%.%')"""
+    return cited_uid.startswith(WOS_UID_PREFIX) and '.' not in cited_uid
+
+
+def _complete_batch_dirs(output_dir):
+    """Directories of the import batches of an output tree that have a batch manifest, in batch order"""
+    return [os.path.join(batches_dir(output_dir), batch_id)
+            for batch_id, manifest in list_batches(output_dir) if manifest is not None]
+
+
+def superseded_uids(output_dir):
+    """
+    UIDs tombstoned by the complete import batches of an output tree
+
+    :param output_dir: Output directory
+    :return: Dictionary of batch directory (None for the rest of the tree) to the
+             UIDs tombstoned by the batches after it, whose rows there are stale
+    """
+    superseded = {}
+    later = set()
+    for batch_dir in reversed(_complete_batch_dirs(output_dir)):
+        superseded[batch_dir] = later
+        tombstone_path = os.path.join(batch_tombstone_dir(batch_dir), TOMBSTONE_FILE)
+        if os.path.exists(tombstone_path):
+            with open_csv_file(tombstone_path) as f:
+                reader = csv.reader(f, dialect=CSV_DIALECT)
+                next(reader, None)
+                later = later | {row[0] for row in reader if row}
+    superseded[None] = later
+    return superseded
+
+
+def _batch_of(output_dir, file_path):
+    """Batch directory holding a table file of an output tree, or None"""
+    relative = os.path.relpath(file_path, batches_dir(output_dir))
+    if relative.startswith(os.pardir + os.sep):
+        return None
+    return os.path.join(batches_dir(output_dir), relative.split(os.sep)[0])
+
+
+def table_paths(output_dir, table_name):
+    """
+    Files of a table in an output tree: plain, compressed and part files
+    in the output directory and its partition, shard and complete batch directories
+    """
+    pattern = re.compile(r'^' + re.escape(table_name) + r'(\.\d+)?\.csv(\.gz|\.zst)?$')
+    root = batches_dir(output_dir)
+    complete = {os.path.basename(batch_dir) for batch_dir in _complete_batch_dirs(output_dir)}
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(output_dir):
+        dir_names[:] = sorted(name for name in dir_names
+                              if name not in _SKIPPED_DIR_NAMES and not name.startswith('.')
+                              and (dir_path != root or name in complete))
+        paths.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names)
+                     if pattern.match(file_name))
+    return paths
+
+
+def table_rows(output_dir, table_name, columns):
+    """
+    Rows of a table in an output tree, reduced to some columns
+
+    Rows of UIDs tombstoned by a later complete import batch are skipped
+    (see superseded_uids).
+
+    :param output_dir: Output directory
+    :param table_name: Table name, e.g. 'item_references'
+    :param columns: Column names to return, found by the header of every file
+    :return: Iterator of tuples in the order of columns
+    """
+    superseded = superseded_uids(output_dir)
+    for file_path in table_paths(output_dir, table_name):
+        stale = superseded.get(_batch_of(output_dir, file_path), superseded[None])
+        with open_csv_file(file_path) as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            headers = next(reader, None)
+            if headers is None:
+                continue
+            indexes = [headers.index(column) for column in columns]
+            uid_index = headers.index('uid') if stale and 'uid' in headers else None
+            for row in reader:
+                if uid_index is not None and row[uid_index] in stale:
+                    continue
+                yield tuple(row[index] for index in indexes)
+
+
+def max_pubyears(output_dir):
+    """Dictionary of uid to its largest pubyear (int), for the uids of item with a pubyear"""
+    years = {}
+    for uid, pubyear in table_rows(output_dir, 'item', ('uid', 'pubyear')):
+        if pubyear.isdigit() and (uid not in years or int(pubyear) > years[uid]):
+            years[uid] = int(pubyear)
+    return years
+
+
+def estimated_table_bytes(output_dir, table_names):
+    """CSV text size of tables, with compressed files estimated from their size"""
+    total = 0
+    for table_name in table_names:
+        for file_path in table_paths(output_dir, table_name):
+            size = os.path.getsize(file_path)
+            total += size * COMPRESSED_SIZE_FACTOR if file_path.endswith(('.gz', '.zst')) else size
+    return total
+
+
+def max_buckets():
+    """MAX_BUCKETS, lowered to fit the open file limit of the process (RLIMIT_NOFILE)"""
+    if resource is None:
+        return MAX_BUCKETS
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit == resource.RLIM_INFINITY:
+        return MAX_BUCKETS
+    return max(1, min(MAX_BUCKETS, soft_limit - RESERVED_FILE_DESCRIPTORS))
+
+
+def bucket_count(input_bytes, memory_bytes):
+    """Buckets needed so that every bucket fits the memory budget"""
+    return max(1, min(max_buckets(), -(-input_bytes * ROW_MEMORY_FACTOR // max(memory_bytes, 1))))
+
+
+def bucket_of(key, buckets):
+    """Bucket of a key; the same key always lands in the same bucket"""
+    return zlib.crc32(key.encode('utf-8')) % buckets
+
+
+class BucketFiles:
+    """Rows spilled to bucket files by a hash of their key"""
+
+    def __init__(self, work_dir, name, buckets):
+        """
+        Open the bucket files
+
+        :param work_dir: Temporary directory
+        :param name: Prefix of the bucket file names
+        :param buckets: Number of buckets
+        """
+        self.paths = [os.path.join(work_dir, f"{name}-{index:04d}.csv") for index in range(buckets)]
+        self.files = [open(path, 'w', encoding='utf-8', newline='') for path in self.paths]
+        self.writers = [csv.writer(f, dialect=CSV_DIALECT) for f in self.files]
+
+    def add(self, key, row):
+        """Spill a row to the bucket of its key"""
+        self.writers[bucket_of(key, len(self.writers))].writerow(row)
+
+    def close(self):
+        """Close the bucket files for reading"""
+        for f in self.files:
+            f.close()
+
+    def rows(self, index):
+        """Rows of one bucket; the bucket file is removed once read"""
+        with open(self.paths[index], 'r', encoding='utf-8', newline='') as f:
+            yield from csv.reader(f, dialect=CSV_DIALECT)
+        os.remove(self.paths[index])
+
+    def size(self):
+        """Bytes spilled"""
+        return sum(os.path.getsize(path) for path in self.paths if os.path.exists(path))
+
+
+class _DerivedWriters:
+    """CSV writers of the derived tables, replacing the tables atomically on close"""
+
+    def __init__(self, derived_dir):
+        os.makedirs(derived_dir, exist_ok=True)
+        self.paths = {table_name: os.path.join(derived_dir, table_name + '.csv')
+                      for table_name in DERIVED_TABLE_COLUMNS}
+        self.files = {table_name: open(path + '.tmp', 'w', encoding='utf-8', newline='')
+                      for table_name, path in self.paths.items()}
+        self.writers = {table_name: csv.writer(f, dialect=CSV_DIALECT) for table_name, f in self.files.items()}
+        self.counts = Counter()
+        for table_name, columns in DERIVED_TABLE_COLUMNS.items():
+            self.writers[table_name].writerow(columns)
+
+    def write(self, table_name, rows):
+        rows = list(rows)
+        self.writers[table_name].writerows(rows)
+        self.counts[table_name] += len(rows)
+
+    def close(self, commit):
+        for table_name, f in self.files.items():
+            f.close()
+            if commit:
+                os.replace(self.paths[table_name] + '.tmp', self.paths[table_name])
+            else:
+                os.remove(self.paths[table_name] + '.tmp')
+
+
+def build_derived_tables(output_dir=None, derived_dir=None, memory_mb=DEFAULT_MEMORY_MB, temp_dir=None):
+    """
+    Compute the derived tables of an output tree
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param derived_dir: Directory of the derived tables (default: <output_dir>/derived)
+    :param memory_mb: Memory budget of the aggregations
+    :param temp_dir: Directory for the bucket files (default: the output directory)
+    :return: Dictionary of derived table to number of rows
+    """
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    derived_dir = derived_dir or os.path.join(output_dir, DERIVED_DIR_NAME)
+    input_bytes = estimated_table_bytes(output_dir, ('item', 'item_references', 'item_rp_addrs'))
+    buckets = bucket_count(input_bytes, memory_mb * 1024 * 1024)
+    print(f"Deriving tables of {output_dir} ({input_bytes / 1024 / 1024:.1f} MB of input, {buckets} buckets)")
+
+    work_dir = tempfile.mkdtemp(prefix='derive-', dir=temp_dir or output_dir)
+    writers = _DerivedWriters(derived_dir)
+    committed = False
+    try:
+        spilled = 0
+
+        # Streamed: citations, item_doi; spilled by uid: pubyears, citation pairs, reprint countries.
+        # Every spill is closed before the next one opens, so at most one set of bucket files is open
+        pubyears = BucketFiles(work_dir, 'pubyear', buckets)
+        for uid, pubyear in table_rows(output_dir, 'item', ('uid', 'pubyear')):
+            pubyears.add(uid, (uid, pubyear))
+        pubyears.close()
+        pairs = BucketFiles(work_dir, 'pairs', buckets)
+        for uid, cited_uid in table_rows(output_dir, 'item_references', ('uid', 'cited_uid')):
+            if is_wos_citation(cited_uid):
+                writers.writers['citations'].writerow((uid, cited_uid))
+                writers.counts['citations'] += 1
+                pairs.add(uid, (uid, cited_uid))
+        pairs.close()
+        writers.write('item_doi', ((uid, value.lower()) for uid, id_type, value in
+                                   table_rows(output_dir, 'item_ids', ('uid', 'identifier_type', 'identifier_value'))
+                                   if id_type.lower() == 'doi'))
+        countries = BucketFiles(work_dir, 'rp_cntry', buckets)
+        for uid, country in table_rows(output_dir, 'item_rp_addrs', ('uid', 'country')):
+            if country:
+                countries.add(uid, (uid, country))
+        countries.close()
+        spilled += pubyears.size() + pairs.size() + countries.size()
+
+        # Per uid bucket: max pubyear, distinct pairs (spilled by cited_uid with the citing year), countries
+        cited = BucketFiles(work_dir, 'cited', buckets)
+        for index in range(buckets):
+            max_pubyear = {}
+            for uid, pubyear in pubyears.rows(index):
+                year = int(pubyear) if pubyear.isdigit() else None
+                known = max_pubyear.get(uid)
+                if uid not in max_pubyear or (year is not None and (known is None or year > known)):
+                    max_pubyear[uid] = year
+            writers.write('item_max_pubyear', ((uid, '' if year is None else year)
+                                               for uid, year in sorted(max_pubyear.items())))
+            merged = sorted(set(map(tuple, pairs.rows(index))))
+            writers.write('citation_merge', merged)
+            for uid, cited_uid in merged:
+                year = max_pubyear.get(uid)
+                cited.add(cited_uid, (cited_uid, '' if year is None else year))
+            first_spellings = {}
+            for uid, country in countries.rows(index):
+                first_spellings.setdefault((uid, country.lower()), (uid, country))
+            writers.write('item_rp_cntry', sorted(first_spellings.values()))
+        cited.close()
+        spilled += cited.size()
+
+        # Per cited_uid bucket: citation counts, in total and per citing year
+        for index in range(buckets):
+            counts = Counter()
+            year_counts = Counter()
+            for cited_uid, year in cited.rows(index):
+                counts[cited_uid] += 1
+                if year:
+                    # Citing uids without pubyear drop out; MySQL groups them under a NULL year
+                    year_counts[(cited_uid, int(year))] += 1
+            writers.write('cite_count', sorted(counts.items()))
+            writers.write('cite_count_year', ((cited_uid, year, count) for (cited_uid, year), count
+                                              in sorted(year_counts.items())))
+        committed = True
+    finally:
+        writers.close(committed)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Derived tables in {derived_dir} ({time.time() - started:.1f}s, "
+          f"{spilled / 1024 / 1024:.1f} MB spilled):")
+    for table_name in DERIVED_TABLE_COLUMNS:
+        print(f"  {table_name}: {writers.counts[table_name]} rows")
+    return dict(writers.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the derived tables of an output directory')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--derived-dir', default=None, help='Output directory of the derived tables '
+                                                            '(default: <output_dir>/derived)')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'Memory budget in MB (default: {DEFAULT_MEMORY_MB})')
+    parser.add_argument('--temp-dir', default=None, help='Directory for the bucket files (default: output directory)')
+    args = parser.parse_args()
+    build_derived_tables(args.output_dir, args.derived_dir, args.memory_mb, args.temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Dictionary-encoded dimension tables
+
+Organization names, subjects, source titles, grant agencies and document
+types repeat millions of times in the fact tables. With --dimensions they
+are written once to dimension tables (dim_org.csv, dim_subject.csv, ...)
+and the fact tables carry an integer id in place of the text, e.g.
+item_orgs.organization becomes item_orgs.organization_id.
+
+- The id of a value is the first 63 bits of its BLAKE2b hash, so every
+  worker, node shard and later run assigns the same id to the same value
+  without any coordination.
+- A worker appends the values it has not written before to the dimension
+  files, before the fact rows that use them; finalize_dimensions()
+  deduplicates the files at the end of the run and fails if two values
+  ever share an id.
+- The values a worker has written are remembered per final dimension
+  file, so staged files (--atomic) share them. The new values of an input
+  file that is not committed are forgotten again.
+- Empty values stay empty (NULL after import).
+
+create_database_and_tables.sql has the dim_* tables and the *_id columns;
+import_dimension_data.sql loads them in place of the text columns.
+"""
+
+import csv
+import hashlib
+import os
+import sys
+from functools import partial
+
+from csv_writer import CSVWriter, CSV_DIALECT
+from xml_common_def import OUTPUT_DIR, XML_TABLE_COLUMNS
+from xml_file_commit import committed_output_dir
+from xml_record_batch import RecordBatch
+
+# Dimension table -> the (fact table, column) pairs it encodes; the value
+# column of the dimension table is named after the first column
+DIMENSION_TABLES = {
+    'dim_org': (('item_orgs', 'organization'), ('item_rp_orgs', 'organization')),
+    'dim_subject': (('item_subjects', 'subject'),),
+    'dim_source': (('item_source', 'source'),),
+    'dim_grant_agency': (('item_grants', 'grant_agency'),),
+    'dim_doctype': (('item_doc_types', 'doctype'), ('item_doc_types_norm', 'doctype_norm')),
+}
+
+DIMENSION_ID_SUFFIX = '_id'
+
+IMPORT_DIMENSION_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_dimension_data.sql')
+
+
+def dimension_id(value):
+    """Id of a dimension value: the first 63 bits of its BLAKE2b hash"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big') >> 1
+
+
+def dimension_columns(dim_table):
+    """Columns of a dimension table, e.g. ('id', 'organization')"""
+    return ('id', DIMENSION_TABLES[dim_table][0][1])
+
+
+def encoded_table_columns():
+    """XML_TABLE_COLUMNS with every encoded column renamed to <column>_id"""
+    tables = dict(XML_TABLE_COLUMNS)
+    for encoded in DIMENSION_TABLES.values():
+        for table_name, column in encoded:
+            tables[table_name] = tuple(name + DIMENSION_ID_SUFFIX if name == column else name
+                                       for name in tables[table_name])
+    return tables
+
+
+# Values this process has written per final dimension file: value -> id
+_WRITTEN_VALUES = {}
+
+
+def _written_values(dim_path):
+    return _WRITTEN_VALUES.setdefault((os.getpid(), dim_path), {})
+
+
+class DimensionEncoder:
+    """RecordBatch sink replacing dimension values by ids before an inner sink"""
+
+    def __init__(self, output_dir=None, sink_class=None):
+        """
+        Initialize the encoding sink
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param sink_class: Inner sink class taking the encoded tables, built as
+                           sink_class(output_dir) (default: XMLDataWriter with
+                           encoded_table_columns())
+        """
+        self.tables = encoded_table_columns()
+        if sink_class is None:
+            from csv_writer import XMLDataWriter
+            sink_class = partial(XMLDataWriter, tables=self.tables)
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.sink = sink_class(self.output_dir)
+        self.dim_writers = {
+            dim_table: CSVWriter(os.path.join(self.output_dir, dim_table + '.csv'), list(dimension_columns(dim_table)))
+            for dim_table in DIMENSION_TABLES
+        }
+        # Staging directories are keyed by the output directory they are committed to
+        final_dir = committed_output_dir(self.output_dir)
+        self.dim_paths = {dim_table: os.path.join(final_dir, dim_table + '.csv') for dim_table in DIMENSION_TABLES}
+        self.new_values = {dim_table: [] for dim_table in DIMENSION_TABLES}
+        self.committed = False
+
+    @property
+    def buffered(self):
+        return getattr(self.sink, 'buffered', False)
+
+    def encode(self, batch):
+        """
+        Encode a batch, writing the values not seen before to the dimension files
+
+        :param batch: RecordBatch with XML_TABLE_COLUMNS tables
+        :return: RecordBatch with encoded_table_columns() tables
+        """
+        encoded = RecordBatch(self.tables)
+        encoded.uids = batch.uids
+        encoded.columns = dict(batch.columns)
+        for dim_table, columns in DIMENSION_TABLES.items():
+            writer = self.dim_writers[dim_table]
+            written = _written_values(self.dim_paths[dim_table])
+            new_rows = []
+            for table_name, column in columns:
+                index = XML_TABLE_COLUMNS[table_name].index(column)
+                ids = []
+                for value in batch.columns[table_name][index]:
+                    if not value:
+                        ids.append('')
+                        continue
+                    value_id = written.get(value)
+                    if value_id is None:
+                        value_id = written[value] = dimension_id(value)
+                        new_rows.append((value_id, value))
+                        self.new_values[dim_table].append(value)
+                    ids.append(value_id)
+                table_columns = list(encoded.columns[table_name])
+                table_columns[index] = ids
+                encoded.columns[table_name] = table_columns
+            writer.write_tuples(new_rows)
+        return encoded
+
+    def write_batch(self, batch):
+        """
+        Write the dimension values and then the encoded rows of a batch
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        self.sink.write_batch(self.encode(batch))
+
+    def commit(self, commit_info):
+        """Keep the new values of the input file and hand the commit to the inner sink"""
+        self.committed = True
+        if hasattr(self.sink, 'commit'):
+            self.sink.commit(commit_info)
+
+    def close(self):
+        """Close the inner sink; the new values of an uncommitted file are forgotten"""
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+        if not self.committed:
+            self._forget_new_values()
+
+    def discard(self):
+        """Forget the new values of a failed input file and drop its rows"""
+        self._forget_new_values()
+        if hasattr(self.sink, 'discard'):
+            self.sink.discard()
+
+    def _forget_new_values(self):
+        """Drop the values first written for this input file, whose dimension rows may be lost"""
+        for dim_table, values in self.new_values.items():
+            written = _written_values(self.dim_paths[dim_table])
+            for value in values:
+                written.pop(value, None)
+        self.new_values = {dim_table: [] for dim_table in DIMENSION_TABLES}
+
+
+def finalize_dimensions(output_dir=None):
+    """
+    Deduplicate the dimension files of a run, sorted by id
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: Dictionary of dimension table to number of values
+    :raises ValueError: if two different values have the same id
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    counts = {}
+    for dim_table in DIMENSION_TABLES:
+        dim_path = os.path.join(output_dir, dim_table + '.csv')
+        if not os.path.exists(dim_path):
+            continue
+        values = {}
+        with open(dim_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            headers = next(reader)
+            for value_id, value in reader:
+                known = values.setdefault(int(value_id), value)
+                if known != value:
+                    raise ValueError(f"{dim_table}: id {value_id} of both {known!r} and {value!r}")
+
+        tmp_path = dim_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, dialect=CSV_DIALECT)
+            writer.writerow(headers)
+            writer.writerows(sorted(values.items()))
+        os.replace(tmp_path, dim_path)
+        counts[dim_table] = len(values)
+
+    if counts:
+        print("\nDimension tables: " + ", ".join(f"{dim_table} {count}" for dim_table, count in counts.items()))
+    return counts
+
+
+def dimension_import_sql(import_sql_path=None):
+    """
+    import_csv_data.sql with the statements of the encoded tables taken from
+    import_dimension_data.sql, and the dimension tables loaded first
+    """
+    from xml_load_manifest import IMPORT_SQL_PATH, load_statements
+    import_sql_path = import_sql_path or IMPORT_SQL_PATH
+    with open(import_sql_path, 'r', encoding='utf-8') as f:
+        script = f.read()
+    preamble, original_statements = load_statements(import_sql_path)
+    _, statements = load_statements(IMPORT_DIMENSION_SQL_PATH)
+    for table_name, statement in statements.items():
+        if table_name in original_statements:
+            script = script.replace(original_statements[table_name], statement)
+    dimension_loads = "\n\n".join(statement for table_name, statement in statements.items()
+                                  if table_name in DIMENSION_TABLES)
+    return preamble + dimension_loads + "\n\n" + script[len(preamble):]
+
+
+if __name__ == "__main__":
+    # python xml_dimensions.py import-sql: the import script for dimension-encoded output
+    if sys.argv[1:] != ['import-sql']:
+        print("Usage: python xml_dimensions.py import-sql > import.sql", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(dimension_import_sql())
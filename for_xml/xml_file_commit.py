@@ -0,0 +1,458 @@
+"""
+Atomic per-file commit of output rows
+
+Without it the rows of every batch are appended to the shared table files
+as soon as they are extracted, so a worker that dies in the middle of an
+input file leaves part of that file's rows behind and running the file
+again duplicates them. With --atomic every input file is committed on its
+own:
+
+- StagedCommitWriter writes the rows of one input file through the usual
+  sink into a private staging directory (<output>/.staging/<id>/).
+- When the file is done, its processing history entries (the file and its
+  records) are written to commit.json inside the staging directory, in delta
+  mode next to the tombstone list of the file (tombstones/uid.csv), and the
+  directory is renamed to <output>/.commits/<id>/. The rename is the commit:
+  a crash before it loses only the in-flight file, whose staging directory
+  is discarded by the next run; a crash after it loses nothing.
+- Right after the commit the worker publishes the tables of the commit:
+  their rows (without the header) are appended to the worker's own part
+  file of every table (item.00001.csv, ...; see csv_writer.CSVPartFiles),
+  which it claimed with O_EXCL and keeps across input files until it
+  reaches COMMIT_PART_MAX_BYTES. Tables without rows are dropped. The part
+  sizes before the appends are journaled in publish.json inside the commit
+  first, so a publish cut short is truncated back and done again. Other
+  files (Parquet parts) are hard-linked into place and unlinked.
+- merge_commits() (at the start and at the end of every run) publishes the
+  files of commits whose worker died in the middle, appends the small side
+  files (dimension values, run_stats.jsonl, the partition counts and the
+  tombstone list) and records the history entries of the commits in the
+  processing history if the worker could not save them. A merge is journaled in
+  commit_journal.json with the size of every side file before the append,
+  so an interrupted merge is truncated back and redone.
+
+Tables are read as part files (see xml_derived_tables.table_paths and the
+load manifest of xml_load_manifest). Staged output cannot be combined with
+part caps, the UID index or SQLite output.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import re
+import uuid
+from datetime import datetime
+from multiprocessing import util as multiprocessing_util
+
+from csv_writer import PART_LOG_FILE, PART_NUMBER_WIDTH, csv_header_length
+from xml_common_def import OUTPUT_DIR, TOMBSTONE_DIR_NAME
+
+STAGING_DIR_NAME = ".staging"
+COMMITS_DIR_NAME = ".commits"
+COMMIT_FILE = "commit.json"
+COMMIT_JOURNAL_FILE = "commit_journal.json"
+PUBLISH_JOURNAL_FILE = "publish.json"
+
+# Size at which a worker starts a new part of a table
+COMMIT_PART_MAX_BYTES = 1 << 30
+
+# Table files published as numbered parts; dimension files are side files
+_TABLE_FILE_PATTERN = re.compile(r'^(?!dim_)(\w+)\.(csv(?:\.gz|\.zst)?)$')
+
+# Next part number to try by (pid, directory, file name)
+_NEXT_PART_NUMBERS = {}
+
+# Open parts of this process by (pid, directory, file name)
+_COMMIT_PARTS = {}
+
+
+def _fsync_tree(dir_path):
+    """Flush the files of a directory tree to disk"""
+    for current_dir, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            with open(os.path.join(current_dir, file_name), 'rb') as f:
+                os.fsync(f.fileno())
+
+
+def committed_output_dir(dir_path):
+    """Output directory the rows written to dir_path end up in: the parent of a staging directory, or dir_path"""
+    parent, commit_id = os.path.split(os.path.normpath(os.path.abspath(dir_path)))
+    staging_parent, staging_name = os.path.split(parent)
+    if staging_name == STAGING_DIR_NAME and commit_id:
+        return staging_parent
+    return os.path.abspath(dir_path)
+
+
+class StagedCommitWriter:
+    """RecordBatch sink staging the rows of one input file until it is committed"""
+
+    # Records are only marked once the whole file is committed
+    buffered = True
+
+    def __init__(self, output_dir=None, sink_class=None):
+        """
+        Initialize the staging sink
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param sink_class: Inner sink class, built as sink_class(staging_dir)
+                           (default: XMLDataWriter)
+        """
+        if sink_class is None:
+            from csv_writer import XMLDataWriter
+            sink_class = XMLDataWriter
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.commit_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self.staging_dir = os.path.join(self.output_dir, STAGING_DIR_NAME, self.commit_id)
+        os.makedirs(self.staging_dir)
+        self.sink = sink_class(self.staging_dir)
+        self.commit_info = None
+
+    def write_batch(self, batch):
+        """
+        Write the rows of a RecordBatch to the staging directory
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        self.sink.write_batch(batch)
+
+    def commit(self, commit_info):
+        """
+        Commit the staged rows on close()
+
+        :param commit_info: Processing history entries of the input file
+                            (file, history_file, records, record_count, error_count)
+                            and in delta mode its tombstones, which are taken out
+                            and staged with the rows
+        """
+        tombstones = commit_info.pop('tombstones', None)
+        if tombstones:
+            from xml_delta import write_tombstones
+            write_tombstones(os.path.join(self.staging_dir, TOMBSTONE_DIR_NAME), tombstones)
+        self.commit_info = commit_info
+        if hasattr(self.sink, 'commit'):
+            self.sink.commit(commit_info)
+
+    def close(self):
+        """Close the inner sink and commit, or discard the rows if commit() was not called"""
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+        if self.commit_info is None:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            return
+        with open(os.path.join(self.staging_dir, COMMIT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.commit_info, f)
+        _fsync_tree(self.staging_dir)
+        commits_dir = os.path.join(self.output_dir, COMMITS_DIR_NAME)
+        os.makedirs(commits_dir, exist_ok=True)
+        commit_dir = os.path.join(commits_dir, self.commit_id)
+        os.rename(self.staging_dir, commit_dir)
+        publish_commit(commit_dir, self.output_dir)
+
+    def discard(self):
+        """Drop the staged rows"""
+        if hasattr(self.sink, 'discard'):
+            self.sink.discard()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def _is_side_file(commit_dir, current_dir, file_name):
+    """Small files appended by merge_commits(): dimension values, JSON lines logs and the tombstone list"""
+    if os.path.relpath(current_dir, commit_dir) == TOMBSTONE_DIR_NAME:
+        return True
+    return file_name.endswith('.jsonl') or (file_name.startswith('dim_') and file_name.endswith('.csv'))
+
+
+class _CommitPart:
+    """Part file of a table that one process appends the rows of its commits to"""
+
+    def __init__(self, target_dir, file_name, header):
+        """
+        Claim the next free part number of the table and write its header
+
+        :param target_dir: Directory of the part
+        :param file_name: Name of the table file, e.g. item.csv.gz
+        :param header: Header bytes (the first line, or gzip member / zstd frame)
+        """
+        self.table_name, self.extension = _TABLE_FILE_PATTERN.match(file_name).groups()
+        self.dir_path = target_dir
+        key = (os.getpid(), target_dir, file_name)
+        number = _NEXT_PART_NUMBERS.get(key, 1)
+        while True:
+            self.path = os.path.join(target_dir, f"{self.table_name}.{number:0{PART_NUMBER_WIDTH}d}.{self.extension}")
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                break
+            except FileExistsError:
+                number += 1
+        _NEXT_PART_NUMBERS[key] = number + 1
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+        self.bytes = len(header)
+        self.rows = 0
+        self.sha256 = hashlib.sha256(header)
+
+    def append(self, source, header_length, rows):
+        """Append the rows of a staged table file, without its header"""
+        with open(source, 'rb') as f_in, open(self.path, 'ab') as f_out:
+            f_in.seek(header_length)
+            for chunk in iter(lambda: f_in.read(1 << 20), b''):
+                f_out.write(chunk)
+                self.sha256.update(chunk)
+                self.bytes += len(chunk)
+            f_out.flush()
+            os.fsync(f_out.fileno())
+        self.rows += rows
+
+    def close(self):
+        """Log the part for the load manifest (see CSVPartFiles.close_part)"""
+        if not os.path.exists(self.path):
+            # Deleted with its output tree
+            return
+        entry = {
+            'table': self.table_name,
+            'file': os.path.basename(self.path),
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'sha256': self.sha256.hexdigest(),
+        }
+        with open(os.path.join(self.dir_path, PART_LOG_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+def _commit_part(target_dir, file_name, source, header_length, data_length):
+    """The part of this process a staged table file is appended to, rolled over at COMMIT_PART_MAX_BYTES"""
+    pid = os.getpid()
+    key = (pid, target_dir, file_name)
+    part = _COMMIT_PARTS.get(key)
+    if part is not None and part.rows and part.bytes + data_length > COMMIT_PART_MAX_BYTES:
+        _COMMIT_PARTS.pop(key).close()
+        part = None
+    if part is None:
+        if not any(existing[0] == pid for existing in _COMMIT_PARTS):
+            # Worker processes log their parts when they exit (multiprocessing runs
+            # finalizers on a normal exit, unlike atexit handlers)
+            multiprocessing_util.Finalize(None, close_commit_parts, exitpriority=10)
+        with open(source, 'rb') as f:
+            header = f.read(header_length)
+        part = _COMMIT_PARTS[key] = _CommitPart(target_dir, file_name, header)
+    return part
+
+
+def close_commit_parts():
+    """Log the open parts of this process (e.g. at the end of a run); later commits start new parts"""
+    pid = os.getpid()
+    for key in [key for key in _COMMIT_PARTS if key[0] == pid]:
+        _COMMIT_PARTS.pop(key).close()
+
+
+def _forget_commit_parts(paths):
+    """Stop appending to parts that were truncated back"""
+    for key, part in list(_COMMIT_PARTS.items()):
+        if part.path in paths:
+            del _COMMIT_PARTS[key]
+
+
+def _write_json(path, data):
+    """Write a small JSON file durably through a temporary file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _is_control_file(commit_dir, current_dir, file_name):
+    """commit.json and publish.json of a commit"""
+    return current_dir == commit_dir and file_name in (COMMIT_FILE, PUBLISH_JOURNAL_FILE)
+
+
+def publish_commit(commit_dir, output_dir):
+    """
+    Move the tables of a commit into the output tree, leaving its side files
+
+    The rows of every table file are appended to the part of this process
+    (see _CommitPart); tables without rows are dropped. Other files are
+    hard-linked into place and then unlinked, so a file that is still in
+    the commit directory with a second link was published by a worker that
+    died before the unlink.
+
+    :param commit_dir: Directory of the commit in .commits
+    :param output_dir: Output directory the commit belongs to
+    """
+    from xml_load_manifest import count_csv_rows
+    journal_path = os.path.join(commit_dir, PUBLISH_JOURNAL_FILE)
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+        if journal['sizes'] is not None:
+            # Interrupted appends: truncate the parts back, the tables are appended again below
+            truncated = set()
+            for relative, size in journal['sizes'].items():
+                part_path = os.path.join(output_dir, relative)
+                if os.path.exists(part_path):
+                    with open(part_path, 'r+b') as f:
+                        f.truncate(size)
+                truncated.add(part_path)
+            _forget_commit_parts(truncated)
+
+    tables = []
+    for current_dir, _, file_names in os.walk(commit_dir):
+        for file_name in sorted(file_names):
+            source = os.path.join(current_dir, file_name)
+            if _is_control_file(commit_dir, current_dir, file_name) or _is_side_file(commit_dir, current_dir, file_name):
+                continue
+            target_dir = os.path.normpath(os.path.join(output_dir, os.path.relpath(current_dir, commit_dir)))
+            if _TABLE_FILE_PATTERN.match(file_name):
+                tables.append((source, target_dir, file_name))
+                continue
+            if os.stat(source).st_nlink == 1:
+                os.makedirs(target_dir, exist_ok=True)
+                try:
+                    os.link(source, os.path.join(target_dir, file_name))
+                except FileExistsError:
+                    raise ValueError(f"Cannot publish {source}: {os.path.join(target_dir, file_name)} "
+                                     f"already exists")
+            os.remove(source)
+
+    if os.path.exists(journal_path) and journal['sizes'] is None:
+        # The appends were complete: only the table files were left to remove
+        for source, _, _ in tables:
+            os.remove(source)
+        os.remove(journal_path)
+        return
+
+    appends = []
+    for source, target_dir, file_name in tables:
+        header_length = csv_header_length(source)
+        data_length = os.path.getsize(source) - header_length
+        if data_length == 0:
+            os.remove(source)
+            continue
+        os.makedirs(target_dir, exist_ok=True)
+        part = _commit_part(target_dir, file_name, source, header_length, data_length)
+        appends.append((part, source, header_length, count_csv_rows(source)))
+    if not appends:
+        return
+    sizes = {}
+    for part, _, _, _ in appends:
+        sizes.setdefault(os.path.relpath(part.path, output_dir), part.bytes)
+    _write_json(journal_path, {'sizes': sizes})
+    for part, source, header_length, rows in appends:
+        part.append(source, header_length, rows)
+    # The appends are done: from here on the table files are only removed
+    _write_json(journal_path, {'sizes': None})
+    for _, source, _, _ in appends:
+        os.remove(source)
+    os.remove(journal_path)
+
+
+def _apply_commit(commit_dir, output_dir):
+    """Append or move the side files of a published commit into the output tree"""
+    for current_dir, _, file_names in os.walk(commit_dir):
+        for file_name in sorted(file_names):
+            source = os.path.join(current_dir, file_name)
+            if _is_control_file(commit_dir, current_dir, file_name):
+                continue
+            target = os.path.join(output_dir, os.path.relpath(source, commit_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                os.replace(source, target)
+                continue
+            with open(source, 'rb') as f_in, open(target, 'ab') as f_out:
+                if file_name.endswith('.csv'):
+                    # Header names are never quoted, so the header is the first line
+                    f_in.readline()
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+                f_out.flush()
+                os.fsync(f_out.fileno())
+
+
+def _journal_sizes(commit_dir, output_dir):
+    """Sizes of the existing output files a commit appends to"""
+    sizes = {}
+    for current_dir, _, file_names in os.walk(commit_dir):
+        for file_name in file_names:
+            relative = os.path.relpath(os.path.join(current_dir, file_name), commit_dir)
+            target = os.path.join(output_dir, relative)
+            if not _is_control_file(commit_dir, current_dir, file_name) and os.path.exists(target):
+                sizes[relative] = os.path.getsize(target)
+    return sizes
+
+
+def record_commit_history(commits, history_managers=None):
+    """
+    Add the history entries of committed input files that are not marked yet
+
+    :param commits: commit_info dictionaries of load_xml_file (file, history_file, records, ...)
+    :param history_managers: Optional mapping of history file to the ProcessingHistoryManager
+                             already holding it, so its in-memory state stays current
+    """
+    from xml_processing_history import ProcessingHistoryManager
+    history_managers = dict(history_managers or {})
+    for commit_info in commits:
+        history_file = commit_info['history_file']
+        manager = history_managers.get(history_file)
+        if manager is None:
+            manager = history_managers[history_file] = ProcessingHistoryManager(history_file)
+        if manager.is_file_processed(commit_info['file']):
+            continue
+        manager.mark_records_processed([tuple(record) for record in commit_info['records']], commit_info['file'])
+        if os.path.exists(commit_info['file']):
+            manager.mark_file_processed(commit_info['file'], commit_info['record_count'],
+                                        commit_info['error_count'])
+
+
+def merge_commits(output_dir=None):
+    """
+    Finish the committed input files: publish the table files their worker
+    did not publish, append their side files and record their history
+
+    Run with no worker writing to the output directory: staging directories
+    left behind by failed or killed workers are discarded.
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: Number of commits merged
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    shutil.rmtree(os.path.join(output_dir, STAGING_DIR_NAME), ignore_errors=True)
+    commits_dir = os.path.join(output_dir, COMMITS_DIR_NAME)
+    journal_path = os.path.join(output_dir, COMMIT_JOURNAL_FILE)
+
+    if os.path.exists(journal_path):
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+        if os.path.isdir(os.path.join(commits_dir, journal['commit'])):
+            # Interrupted merge: undo the partial appends, the commit is merged again below
+            for relative, size in journal['sizes'].items():
+                with open(os.path.join(output_dir, relative), 'r+b') as f:
+                    f.truncate(size)
+            print(f"Rolled back the interrupted merge of commit {journal['commit']}")
+        os.remove(journal_path)
+
+    commit_ids = sorted(os.listdir(commits_dir)) if os.path.isdir(commits_dir) else []
+    commits = []
+    for commit_id in commit_ids:
+        with open(os.path.join(commits_dir, commit_id, COMMIT_FILE), 'r', encoding='utf-8') as f:
+            commits.append(json.load(f))
+    # History first: a crash during the merge must not make the files look unprocessed
+    record_commit_history(commits)
+
+    merged_dir = os.path.join(output_dir, STAGING_DIR_NAME)
+    for commit_id in commit_ids:
+        commit_dir = os.path.join(commits_dir, commit_id)
+        # Files a worker did not publish before it died
+        publish_commit(commit_dir, output_dir)
+        _write_json(journal_path, {'commit': commit_id, 'sizes': _journal_sizes(commit_dir, output_dir)})
+        _apply_commit(commit_dir, output_dir)
+        # Moved out of .commits in one rename, then deleted with the staging directory
+        os.makedirs(merged_dir, exist_ok=True)
+        os.rename(commit_dir, os.path.join(merged_dir, 'merged-' + commit_id))
+        os.remove(journal_path)
+    shutil.rmtree(merged_dir, ignore_errors=True)
+    if os.path.isdir(commits_dir) and not os.listdir(commits_dir):
+        os.rmdir(commits_dir)
+    if commit_ids:
+        print(f"\nMerged {len(commit_ids)} committed input files into {output_dir}")
+    return len(commit_ids)
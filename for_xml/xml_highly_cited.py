@@ -0,0 +1,244 @@
+"""
+Highly cited articles: percentile thresholds per publication year and subject
+
+The articles block of modify_database.sql flags the top 1% most cited
+articles of every (pubyear, traditional subject) group with a
+PERCENTILE_CONT(0.99) window and several UPDATE ... JOIN passes. This
+engine computes the same table with NumPy in one vectorized pass:
+
+- articles: distinct uids with doctype_norm 'Article', pubyear from
+  item_max_pubyear, citation_count from cite_count (0 if never cited);
+  both come from the derived tables (xml_derived_tables.py)
+- subject: the first traditional subject of the article in item_subjects
+  (the UPDATE ... JOIN of the SQL picks an arbitrary one)
+- for every configured flag, e.g. top1=99, the percentile of the citation
+  counts of the group, interpolated linearly between the two nearest ranks
+  like PERCENTILE_CONT, and the flag citation_count >= threshold; the
+  threshold of top1 is in the threshold column of the SQL table, the others
+  in <flag>_threshold columns
+
+Articles without pubyear are left out, as the SQL inner-joins
+item_max_pubyear. Articles without subject are in no group: their
+thresholds and flags are empty (NULL), as the UPDATE ... JOIN leaves them.
+
+The table is written to <output>/derived/articles.csv together with
+articles.sql, which creates and loads the articles table for its flag
+columns; import_csv_to_mysql.sh loads it with the other derived tables.
+
+    python xml_highly_cited.py xml_output [--flag top1=99 --flag top5=95]
+
+Requires numpy.
+"""
+
+import argparse
+import csv
+import os
+import time
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import DERIVED_DIR_NAME, table_rows
+from xml_optional_deps import optional_import, require
+
+np = optional_import('numpy')
+
+DEFAULT_FLAGS = (('top1', 99.0), ('top5', 95.0))
+
+ARTICLE_DOCTYPE = 'Article'
+
+ARTICLES_FILE = 'articles.csv'
+ARTICLES_SQL_FILE = 'articles.sql'
+
+# Flags of the articles table in modify_database.sql that have no definition here
+_UNCOMPUTED_FLAG_COLUMNS = ('ni82', 'ns')
+
+# Flag whose threshold keeps the threshold column of the articles table in modify_database.sql
+THRESHOLD_COLUMN_FLAG = 'top1'
+
+
+def threshold_column(name):
+    """Threshold column of a flag: threshold for top1, <flag>_threshold for the others"""
+    return 'threshold' if name == THRESHOLD_COLUMN_FLAG else f"{name}_threshold"
+
+
+def parse_flag(text):
+    """
+    Parse a flag definition
+
+    :param text: 'name=percentile', e.g. 'top1=99'
+    :return: (name, percentile)
+    """
+    name, separator, value = text.partition('=')
+    if not separator or not name.isidentifier():
+        raise ValueError(f"Flag must be name=percentile, got {text!r}")
+    percentile = float(value)
+    if not 0 <= percentile <= 100:
+        raise ValueError(f"Percentile of {name} must be between 0 and 100, got {percentile}")
+    return name, percentile
+
+
+def group_percentiles(groups, values, percentiles):
+    """
+    PERCENTILE_CONT of the values of every group
+
+    :param groups: Group number of every row (int array, negative for rows in no group)
+    :param values: Value of every row
+    :param percentiles: Percentiles between 0 and 100
+    :return: Array of shape (len(percentiles), len(groups)) with the threshold of the group of every
+             row, NaN for rows in no group
+    """
+    require(np, 'numpy')
+    values = np.asarray(values, dtype=np.float64)
+    thresholds = np.full((len(percentiles), len(groups)), np.nan)
+    member = np.flatnonzero(groups >= 0)
+    if not len(member):
+        return thresholds
+    order = member[np.lexsort((values[member], groups[member]))]
+    sorted_groups, sorted_values = groups[order], values[order]
+    group_ids, starts, sizes = np.unique(sorted_groups, return_index=True, return_counts=True)
+    # Group of every row as a position in group_ids
+    row_group = np.searchsorted(group_ids, groups[member])
+    for index, percentile in enumerate(percentiles):
+        position = (sizes - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, sizes - 1)
+        lower_values = sorted_values[starts + lower]
+        group_thresholds = lower_values + (position - lower) * (sorted_values[starts + upper] - lower_values)
+        thresholds[index, member] = group_thresholds[row_group]
+    return thresholds
+
+
+def _read_derived(derived_dir, file_name, columns):
+    """Rows of a derived table"""
+    file_path = os.path.join(derived_dir, file_name)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"{file_path} not found; run xml_derived_tables.py first")
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, dialect=CSV_DIALECT)
+        headers = next(reader)
+        indexes = [headers.index(column) for column in columns]
+        for row in reader:
+            yield tuple(row[index] for index in indexes)
+
+
+def articles_sql(flags, csv_path):
+    """
+    SQL creating and loading the articles table
+
+    :param flags: List of (name, percentile)
+    :param csv_path: Path of articles.csv in the LOAD DATA statement
+    """
+    flag_columns = [column for name, _ in flags for column in (name, threshold_column(name))]
+    definitions = [f"    {name} TINYINT(1),\n    {threshold_column(name)} DECIMAL(10, 3)," for name, _ in flags]
+    definitions += [f"    {name} TINYINT(1)," for name in _UNCOMPUTED_FLAG_COLUMNS if name not in dict(flags)]
+    nullable_columns = ['pubyear', 'subject'] + flag_columns
+    variables = ', '.join(['uid', '@pubyear', '@subject', 'citation_count'] + [f"@{column}" for column in flag_columns])
+    assignments = ',\n    '.join(f"{column} = NULLIF(@{column}, '')" for column in nullable_columns)
+    return (
+        "DROP TABLE IF EXISTS articles;\n\n"
+        "CREATE TABLE articles (\n"
+        "    uid VARCHAR(50),\n"
+        "    pubyear SMALLINT,\n"
+        "    subject VARCHAR(255),\n"
+        "    citation_count INT(10) DEFAULT 0,\n"
+        + "\n".join(definitions) + "\n"
+        "    INDEX idx_uid (uid)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;\n\n"
+        f"LOAD DATA LOCAL INFILE '{csv_path}'\n"
+        "INTO TABLE articles\n"
+        "CHARACTER SET utf8mb4\n"
+        "FIELDS TERMINATED BY ','\n"
+        "OPTIONALLY ENCLOSED BY '\"'\n"
+        "ESCAPED BY ''\n"
+        "LINES TERMINATED BY '\\r\\n'\n"
+        "IGNORE 1 LINES\n"
+        f"({variables})\n"
+        f"SET {assignments};\n"
+    )
+
+
+def build_highly_cited(output_dir=None, flags=DEFAULT_FLAGS, derived_dir=None):
+    """
+    Compute the articles table with its percentile flags
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param flags: List of (flag name, percentile)
+    :param derived_dir: Directory of the derived tables (default: <output_dir>/derived)
+    :return: Number of articles
+    """
+    require(np, 'numpy')
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    derived_dir = derived_dir or os.path.join(output_dir, DERIVED_DIR_NAME)
+
+    articles = {uid for uid, doctype in table_rows(output_dir, 'item_doc_types_norm', ('uid', 'doctype_norm'))
+                if doctype == ARTICLE_DOCTYPE}
+    # Articles with a pubyear, as the inner join of the SQL keeps them
+    years = {uid: int(max_pubyear) for uid, max_pubyear in
+             _read_derived(derived_dir, 'item_max_pubyear.csv', ('uid', 'max_pubyear'))
+             if max_pubyear and uid in articles}
+    del articles
+    # Row number of every article, in uid order
+    uids = sorted(years)
+    rows = {uid: row for row, uid in enumerate(uids)}
+    pubyears = np.array([years[uid] for uid in uids], dtype=np.int32)
+    del years
+    citation_counts = np.zeros(len(uids), dtype=np.int64)
+    for cited_uid, count in _read_derived(derived_dir, 'cite_count.csv', ('cited_uid', 'citation_count')):
+        row = rows.get(cited_uid)
+        if row is not None:
+            citation_counts[row] = int(count)
+    subjects = [None] * len(uids)
+    for uid, subject, ascatype in table_rows(output_dir, 'item_subjects', ('uid', 'subject', 'ascatype')):
+        row = rows.get(uid)
+        if row is not None and ascatype == 'traditional' and subjects[row] is None and subject:
+            subjects[row] = subject
+    del rows
+
+    subject_names = sorted({subject for subject in subjects if subject is not None})
+    subject_codes = {subject: code for code, subject in enumerate(subject_names)}
+    subject_ids = np.array([subject_codes.get(subject, -1) for subject in subjects], dtype=np.int64)
+    # One group per (pubyear, subject); -1 for articles without subject
+    groups = np.where(subject_ids >= 0, pubyears.astype(np.int64) * max(len(subject_names), 1) + subject_ids, -1)
+    thresholds = group_percentiles(groups, citation_counts, [percentile for _, percentile in flags])
+
+    os.makedirs(derived_dir, exist_ok=True)
+    csv_path = os.path.join(derived_dir, ARTICLES_FILE)
+    with open(csv_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        writer.writerow(['uid', 'pubyear', 'subject', 'citation_count']
+                        + [column for name, _ in flags for column in (name, threshold_column(name))])
+        for row, uid in enumerate(uids):
+            values = [uid, pubyears[row], subjects[row] or '', citation_counts[row]]
+            for index in range(len(flags)):
+                threshold = thresholds[index, row]
+                if np.isnan(threshold):
+                    values += ['', '']
+                else:
+                    values += [int(citation_counts[row] >= threshold), f"{threshold:.3f}"]
+            writer.writerow(values)
+    os.replace(csv_path + '.tmp', csv_path)
+    with open(os.path.join(derived_dir, ARTICLES_SQL_FILE), 'w', encoding='utf-8') as f:
+        f.write(articles_sql(flags, os.path.abspath(csv_path)))
+
+    group_count = len(np.unique(groups[groups >= 0]))
+    flagged = ', '.join(f"{name}: {int(np.sum(citation_counts >= thresholds[index]))}"
+                        for index, (name, _) in enumerate(flags))
+    print(f"Articles in {csv_path}: {len(uids)} articles in {group_count} (pubyear, subject) groups, "
+          f"{flagged} ({time.time() - started:.1f}s)")
+    return len(uids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag highly cited articles per publication year and subject')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--derived-dir', default=None, help='Directory of the derived tables '
+                                                            '(default: <output_dir>/derived)')
+    parser.add_argument('--flag', action='append', type=parse_flag, default=None, metavar='NAME=PERCENTILE',
+                        help='Flag and its percentile, repeatable (default: top1=99 top5=95)')
+    args = parser.parse_args()
+    build_highly_cited(args.output_dir, args.flag or DEFAULT_FLAGS, args.derived_dir)
+
+
+if __name__ == "__main__":
+    main()
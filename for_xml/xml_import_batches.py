@@ -0,0 +1,232 @@
+"""
+Incremental import batches for the MySQL loader
+
+A full import loads the whole xml_output/ tables. After an incremental run
+(a weekly update delivery) only the new rows need loading, so with
+--import-batch a run writes its rows to a batch directory of its own,
+xml_output/batches/<batch id>/, where the batch id is the start time of
+the run (20240115T093000) and orders the batches:
+
+- The tables, and in delta mode the tombstone list of changed records
+  (<batch>/tombstones/uid.csv), are written there instead of to xml_output/.
+- At the end of the run finish_batch() writes the load manifest of the
+  batch (load_manifest.json, see xml_load_manifest) and then
+  batch_manifest.json, which marks the batch complete. Batches of runs that
+  did not finish have no batch manifest and are never imported.
+
+import_csv_to_mysql.sh imports the complete batches that are not applied
+yet, in batch order: first the deletes of the tombstoned UIDs, then every
+load part of the batch. The applied batches are recorded in the local state
+file xml_output/import_state.json:
+
+    python xml_import_batches.py pending xml_output
+    python xml_import_batches.py applied xml_output 20240115T093000
+    python xml_import_batches.py status xml_output
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from xml_common_def import OUTPUT_DIR, TOMBSTONE_FILE, XML_TABLE_NAMES
+
+BATCHES_DIR_NAME = "batches"
+BATCH_MANIFEST_FILE = "batch_manifest.json"
+IMPORT_STATE_FILE = "import_state.json"
+BATCH_TOMBSTONE_DIR_NAME = "tombstones"
+
+BATCH_ID_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def _write_json(file_path, data):
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, file_path)
+
+
+def batches_dir(output_dir=None):
+    """Directory holding the import batches of an output directory"""
+    return os.path.join(output_dir or OUTPUT_DIR, BATCHES_DIR_NAME)
+
+
+def new_batch_dir(output_dir=None):
+    """
+    Create the batch directory of a run
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: Path of the new batch directory
+    """
+    base_id = datetime.now().strftime(BATCH_ID_FORMAT)
+    batch_id, counter = base_id, 1
+    while True:
+        batch_dir = os.path.join(batches_dir(output_dir), batch_id)
+        try:
+            os.makedirs(batch_dir)
+            return batch_dir
+        except FileExistsError:
+            counter += 1
+            batch_id = f"{base_id}-{counter}"
+
+
+def batch_tombstone_dir(batch_dir):
+    """Tombstone directory of a batch (delta mode)"""
+    return os.path.join(batch_dir, BATCH_TOMBSTONE_DIR_NAME)
+
+
+def finish_batch(batch_dir, started=None, xml_path=None, delta=False):
+    """
+    Write the load manifest and the batch manifest of a finished run
+
+    :param batch_dir: Batch directory of the run
+    :param started: Start time of the run (datetime)
+    :param xml_path: Input of the run
+    :param delta: Whether the run was in delta mode
+    :return: The batch manifest dictionary
+    """
+    from xml_load_manifest import build_load_manifest, count_csv_rows
+    load_manifest = build_load_manifest(batch_dir)
+    rows = {}
+    for part in load_manifest['parts']:
+        rows[part['table']] = rows.get(part['table'], 0) + part['rows']
+    tombstone_path = os.path.join(batch_tombstone_dir(batch_dir), TOMBSTONE_FILE)
+    manifest = {
+        'batch_id': os.path.basename(os.path.normpath(batch_dir)),
+        'started': started.isoformat() if started else None,
+        'completed': datetime.now().isoformat(),
+        'input': xml_path,
+        'delta': delta,
+        'parts': len(load_manifest['parts']),
+        'rows': rows,
+        'tombstones': count_csv_rows(tombstone_path) if os.path.exists(tombstone_path) else 0,
+    }
+    # Written last: a batch without it is incomplete
+    _write_json(os.path.join(batch_dir, BATCH_MANIFEST_FILE), manifest)
+    print(f"\nImport batch {manifest['batch_id']}: {sum(rows.values())} rows in {manifest['parts']} parts, "
+          f"{manifest['tombstones']} tombstones")
+    return manifest
+
+
+def load_import_state(state_path):
+    """Applied batches recorded in an import state file"""
+    if not os.path.exists(state_path):
+        return {'applied': {}}
+    with open(state_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def mark_batch_applied(batch_id, state_path):
+    """
+    Record a batch as imported
+
+    :param batch_id: Batch id (name of its directory)
+    :param state_path: Import state file
+    """
+    state = load_import_state(state_path)
+    state['applied'][batch_id] = {'applied_at': datetime.now().isoformat()}
+    _write_json(state_path, state)
+
+
+def list_batches(output_dir=None):
+    """
+    Batch ids of an output directory with their manifests, in batch order
+
+    :return: List of (batch id, batch manifest or None for incomplete batches)
+    """
+    root = batches_dir(output_dir)
+    batches = []
+    for batch_id in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        manifest_path = os.path.join(root, batch_id, BATCH_MANIFEST_FILE)
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        batches.append((batch_id, manifest))
+    return batches
+
+
+def pending_batches(output_dir=None, state_path=None):
+    """
+    Complete batches not applied yet, in batch order
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param state_path: Import state file (default: <output_dir>/import_state.json)
+    :return: List of batch ids
+    """
+    state_path = state_path or os.path.join(output_dir or OUTPUT_DIR, IMPORT_STATE_FILE)
+    applied = load_import_state(state_path)['applied']
+    return [batch_id for batch_id, manifest in list_batches(output_dir)
+            if manifest is not None and batch_id not in applied]
+
+
+def tombstone_sql(batch_dir, sql_path=None):
+    """
+    SQL deleting the rows of the tombstoned UIDs of a batch from every table
+
+    :param batch_dir: Batch directory
+    :param sql_path: Import script whose tables are cleaned (default: import_csv_data.sql)
+    :return: SQL script, or None if the batch has no tombstones
+    """
+    from xml_load_manifest import IMPORT_SQL_PATH, load_statements
+    tombstone_path = os.path.join(batch_tombstone_dir(batch_dir), TOMBSTONE_FILE)
+    if not os.path.exists(tombstone_path):
+        return None
+    preamble, statements = load_statements(sql_path or IMPORT_SQL_PATH)
+    lines = [
+        "CREATE TEMPORARY TABLE tombstone_uid (uid VARCHAR(50), INDEX idx_uid (uid));",
+        f"LOAD DATA LOCAL INFILE '{os.path.abspath(tombstone_path)}'",
+        "INTO TABLE tombstone_uid",
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"'",
+        "LINES TERMINATED BY '\\r\\n'",
+        "IGNORE 1 LINES (uid);",
+    ]
+    for table_name in XML_TABLE_NAMES:
+        if table_name in statements:
+            lines.append(f"DELETE t FROM {table_name} t JOIN tombstone_uid d ON t.uid = d.uid;")
+    return preamble + "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental import batches')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('pending', 'Print the ids of the complete batches not applied yet'),
+                               ('status', 'List every batch with its state')):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+        command_parser.add_argument('--state', default=None, help='Import state file')
+    applied_parser = subparsers.add_parser('applied', help='Record a batch as imported')
+    applied_parser.add_argument('output_dir')
+    applied_parser.add_argument('batch_id')
+    applied_parser.add_argument('--state', default=None, help='Import state file')
+    tombstone_parser = subparsers.add_parser('tombstone-sql', help='Print the deletes of the tombstones of a batch')
+    tombstone_parser.add_argument('batch_dir')
+    args = parser.parse_args()
+
+    if args.command == 'tombstone-sql':
+        sql = tombstone_sql(args.batch_dir)
+        if sql:
+            sys.stdout.write(sql)
+        return
+    state_path = args.state or os.path.join(args.output_dir, IMPORT_STATE_FILE)
+    if args.command == 'applied':
+        mark_batch_applied(args.batch_id, state_path)
+    elif args.command == 'pending':
+        for batch_id in pending_batches(args.output_dir, state_path):
+            print(batch_id)
+    else:
+        applied = load_import_state(state_path)['applied']
+        for batch_id, manifest in list_batches(args.output_dir):
+            if manifest is None:
+                status = 'incomplete'
+            elif batch_id in applied:
+                status = f"applied {applied[batch_id]['applied_at']}"
+            else:
+                status = 'pending'
+            rows = sum(manifest['rows'].values()) if manifest else 0
+            print(f"{batch_id}\t{status}\t{rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,177 @@
 import xml.etree.ElementTree as ET
 import os
+import socket
+import time
+from functools import partial
 from xml_parser import XMLRecordParser
 from csv_writer import XMLDataWriter
-from xml_common_def import WOS_NAMESPACE
+from xml_common_def import WOS_NAMESPACE, OUTPUT_DIR, TOMBSTONE_DIR
 from xml_processing_history import ProcessingHistoryManager
+from xml_delta import compute_record_hash, TombstoneWriter, write_tombstones
+from xml_record_batch import RecordBatchCallback, DEFAULT_BATCH_SIZE
+from dir_manifest import DirectoryManifest, input_file_filter
 
 
 # SOLUTION 1: Define callback at module level (top-level function)
-def write_record_callback(parser):
+def write_record_callback(parser, output_dir=None):
     """Callback function to write record data to CSV"""
     # Create a new writer instance in each worker process
-    data_writer = XMLDataWriter()
+    data_writer = XMLDataWriter(output_dir)
     data_writer.write_record_data(parser)
 
 
-def load_xml_file(xml_file_path, callback_func, skip_processed, history_manager):
-    """Load and process a single XML file with incremental processing support"""
+def make_record_callback(output_dir=None, batch_size=DEFAULT_BATCH_SIZE, output_format='csv',
+                         compression=None, compression_level=None, partition=False,
+                         max_part_bytes=None, max_part_rows=None, dimensions=False, index=False,
+                         atomic=False, stats=False, sketches=False):
+    """
+    Build the picklable record callback for a run
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param batch_size: Records per RecordBatch; 1 writes every CSV record on its own
+    :param output_format: 'csv', 'parquet' or 'sqlite'
+    :param compression: Optional 'gzip' or 'zstd' for compressed CSV files
+    :param compression_level: Compression level for compressed CSV files
+    :param partition: Route rows to pubyear=YYYY/edition=X/ partition directories
+    :param max_part_bytes: Optional byte cap per CSV part file (table.00001.csv, ...)
+    :param max_part_rows: Optional row cap per CSV part file
+    :param dimensions: Write dimension-encoded CSV tables (dim_org.csv, ...; see xml_dimensions)
+    :param index: Log the UID offsets of the CSV rows for the UID index (see xml_uid_index)
+    :param atomic: Stage the rows of every input file and commit them when the file is done
+                   (see xml_file_commit)
+    :param stats: Keep running statistics of the written records (see xml_run_stats)
+    :param sketches: Keep heavy-hitter sketches of the written rows (see xml_sketches)
+    """
+    sink_class = None
+    if index and (output_format != 'csv' or compression or max_part_bytes or max_part_rows):
+        raise ValueError("The UID index applies to plain, unsplit CSV output only")
+    if atomic and (output_format == 'sqlite' or max_part_bytes or max_part_rows or index):
+        raise ValueError("Atomic file commits cannot be combined with SQLite output, part caps or the UID index")
+    if output_format != 'csv' and (max_part_bytes or max_part_rows):
+        raise ValueError("Part file caps apply to CSV output only")
+    if output_format != 'csv' and dimensions:
+        raise ValueError("Dimension tables apply to CSV output only")
+    if output_format == 'sqlite':
+        from xml_sqlite_writer import XMLSQLiteWriter
+        if partition:
+            raise ValueError("Partitioned output is not supported for SQLite")
+        sink_class = XMLSQLiteWriter
+    elif output_format == 'parquet':
+        from xml_optional_deps import require
+        from xml_parquet_writer import XMLParquetWriter, pa
+        require(pa, 'pyarrow')
+        # Staged files are committed one by one; otherwise every worker keeps its parts open
+        sink_class = partial(XMLParquetWriter, per_process=not atomic)
+    elif compression or partition or max_part_bytes or max_part_rows or dimensions or index:
+        tables = None
+        if dimensions:
+            from xml_dimensions import encoded_table_columns
+            tables = encoded_table_columns()
+        sink_class = partial(XMLDataWriter, compression=compression, compression_level=compression_level,
+                             max_part_bytes=max_part_bytes, max_part_rows=max_part_rows, tables=tables,
+                             index=index)
+    
+    if partition:
+        from xml_partitioned_writer import PartitionedWriter
+        sink_class = partial(PartitionedWriter, sink_class=sink_class)
+    if dimensions:
+        from xml_dimensions import DimensionEncoder
+        sink_class = partial(DimensionEncoder, sink_class=sink_class)
+    if stats:
+        # Before the dimension encoding, inside the staging of atomic commits
+        from xml_run_stats import RunStatisticsWriter
+        sink_class = partial(RunStatisticsWriter, sink_class=sink_class)
+    if atomic:
+        from xml_file_commit import StagedCommitWriter
+        sink_class = partial(StagedCommitWriter, sink_class=sink_class)
+    if sketches:
+        # Outside the staging: every worker saves its sketches to one shard file now and then
+        from xml_optional_deps import require
+        from xml_sketches import SketchWriter, np
+        require(np, 'numpy')
+        sink_class = partial(SketchWriter, sink_class=sink_class)
+    if sink_class is not None:
+        return RecordBatchCallback(output_dir, batch_size or DEFAULT_BATCH_SIZE, sink_class=sink_class)
+    if batch_size is None or batch_size > 1:
+        return RecordBatchCallback(output_dir, batch_size or DEFAULT_BATCH_SIZE)
+    if output_dir is None:
+        return write_record_callback
+    return partial(write_record_callback, output_dir=output_dir)
+
+
+def _begin_output(output_format, output_dir=None, atomic=False):
+    """Prepare run-level output state (e.g. the SQLite database) before loading"""
+    state = {'started': time.time(), 'rows_before': 0}
+    if atomic:
+        # Commits of an interrupted run are merged before the history is consulted
+        from xml_file_commit import merge_commits
+        merge_commits(output_dir)
+    if output_format == 'sqlite':
+        from xml_sqlite_writer import prepare_sqlite_database
+        state['rows_before'] = prepare_sqlite_database(output_dir)
+    return state
+
+
+def _finish_output(output_format, state, output_dir=None, partition=False, split_parts=False,
+                   dimensions=False, uid_index=False, atomic=False, stats=False, sketches=False):
+    """Finish run-level output state (e.g. build the SQLite indexes) after loading"""
+    if output_format == 'parquet':
+        # Parts written by this process (sequential runs); workers publish theirs when they exit
+        from xml_parquet_writer import close_parquet_writers
+        close_parquet_writers()
+    if atomic:
+        from xml_file_commit import merge_commits
+        merge_commits(output_dir)
+    if dimensions:
+        from xml_dimensions import finalize_dimensions
+        finalize_dimensions(output_dir)
+    if uid_index:
+        from xml_uid_index import build_uid_indexes
+        build_uid_indexes(output_dir)
+    if split_parts or (atomic and output_format == 'csv'):
+        # Atomic commits publish the tables of every input file into part files
+        from csv_writer import close_part_files
+        from xml_load_manifest import build_load_manifest
+        close_part_files()
+        if atomic:
+            from xml_file_commit import close_commit_parts
+            close_commit_parts()
+        build_load_manifest(output_dir)
+    if partition:
+        from xml_partitioned_writer import build_partition_manifest
+        build_partition_manifest(output_dir)
+    if stats:
+        from xml_run_stats import build_run_summary
+        build_run_summary(output_dir)
+    if sketches:
+        from xml_sketches import build_merged_sketches
+        build_merged_sketches(output_dir)
+    if output_format == 'sqlite':
+        from xml_sqlite_writer import finalize_sqlite_database
+        finalize_sqlite_database(output_dir, time.time() - state['started'], state['rows_before'])
+
+
+def load_xml_file(xml_file_path, callback_func, skip_processed, history_manager, delta=False, tombstone_dir=None):
+    """Load and process a single XML file with incremental processing support
+
+    In delta mode records are compared by content hash instead of UID alone:
+    unchanged records are skipped, changed records are tombstoned and rewritten.
+
+    A batching callback (one with a flush() method, e.g. RecordBatchCallback)
+    returns True when it wrote its batch; records are marked as processed
+    only then, and the last partial batch is flushed at the end of the file
+    together with the history entries of the file, which staged sinks
+    commit with the rows (see xml_file_commit). Sinks that publish their rows
+    only when the worker exits (flush() returns False, see xml_parquet_writer)
+    mark the records and the file themselves then. UIDs of the batch in
+    flight count as processed, so a UID repeated within one batch is
+    handled like one repeated across batches.
+
+    The UIDs of changed records go to the tombstone list of tombstone_dir
+    (default: TOMBSTONE_DIR) once their rows are written, before they are
+    marked. Staged sinks take them from the history entries handed to
+    flush() and commit them with the rows instead.
+    """
     if not os.path.exists(xml_file_path):
         raise FileNotFoundError(f"The file {xml_file_path} does not exist.")
     
@@ -36,98 +192,302 @@ def load_xml_file(xml_file_path, callback_func, skip_processed, history_manager)
         
         record_count = 0
         error_count = 0
+        unchanged_count = 0
+        tombstone_writer = TombstoneWriter(tombstone_dir or TOMBSTONE_DIR) if delta else None
+        batched = hasattr(callback_func, 'flush')
+        pending = []
+        # UID -> content hash (None outside delta mode) of the records in pending
+        pending_hashes = {}
         
         # Process each record
         for record in records:
             try:
                 parser = XMLRecordParser(record)
+                metadata = None
                 
+                changed = False
+                if delta:
+                    # Skip unchanged records, tombstone the old rows of changed ones
+                    content_hash = compute_record_hash(record)
+                    metadata = {"content_hash": content_hash}
+                    if parser.uid in pending_hashes:
+                        known, previous_hash = True, pending_hashes[parser.uid]
+                    else:
+                        known = history_manager.is_record_processed(parser.uid)
+                        previous_hash = history_manager.get_record_hash(parser.uid) if known else None
+                    if known:
+                        if previous_hash == content_hash:
+                            unchanged_count += 1
+                            continue
+                        changed = True
                 # Skip if already processed and skip_processed is enabled
-                if skip_processed and history_manager.is_record_processed(parser.uid):
+                elif skip_processed and (parser.uid in pending_hashes or
+                                         history_manager.is_record_processed(parser.uid)):
                     continue
                 
+                if changed and batched:
+                    # Sinks that replace rows in place (SQLite) delete the old rows with the batch
+                    callback_func.batch.tombstones.append(parser.uid)
                 # Call the callback function with the parser
-                callback_func(parser)
+                flushed = callback_func(parser)
+                if changed:
+                    tombstone_writer.add_uid(parser.uid)
                 
-                # Mark record as processed
-                history_manager.mark_record_processed(parser.uid, xml_file_path)
+                # Mark record as processed (batched: once its batch is written)
+                if batched:
+                    pending.append((parser.uid, metadata))
+                    pending_hashes[parser.uid] = metadata and metadata["content_hash"]
+                    if flushed:
+                        if tombstone_writer is not None:
+                            tombstone_writer.write([uid for uid, _ in pending])
+                        history_manager.mark_records_processed(pending, xml_file_path)
+                        pending = []
+                        pending_hashes = {}
+                else:
+                    if changed:
+                        tombstone_writer.write()
+                    history_manager.mark_record_processed(parser.uid, xml_file_path, metadata)
                 record_count += 1
                 
             except Exception as e:
                 error_count += 1
                 print(f"Error processing record: {str(e)}")
+                if batched:
+                    # A batch that failed to write is dropped; its records stay
+                    # unmarked and are picked up again by the next run
+                    lost = len(pending) - len(callback_func.batch)
+                    if lost > 0:
+                        record_count -= lost
+                        if tombstone_writer is not None:
+                            tombstone_writer.take([uid for uid, _ in pending[:lost]])
+                        pending = pending[lost:]
+                        pending_hashes = {uid: metadata and metadata["content_hash"] for uid, metadata in pending}
                 try:
                     parser = XMLRecordParser(record)
                     history_manager.mark_error(parser.uid, str(e), xml_file_path)
                 except:
                     pass
         
-        # Mark file as fully processed
-        history_manager.mark_file_processed(xml_file_path, record_count, error_count)
+        committed = True
+        if batched:
+            commit_info = {
+                'file': os.path.abspath(xml_file_path),
+                'history_file': os.path.abspath(history_manager.history_file),
+                'records': pending,
+                'record_count': record_count,
+                'error_count': error_count,
+            }
+            if tombstone_writer is not None and tombstone_writer.uids:
+                commit_info['tombstones'] = tombstone_writer.take()
+            committed = callback_func.flush(commit_info) is not False
+            # Tombstones not taken by a staged sink follow the rows
+            tombstones = commit_info.pop('tombstones', None)
+            if tombstones:
+                write_tombstones(tombstone_writer.tombstone_dir, tombstones)
+            if committed:
+                history_manager.mark_records_processed(pending, xml_file_path)
+        
+        # Mark file as fully processed (deferred sinks mark it once its rows are published)
+        if committed:
+            history_manager.mark_file_processed(xml_file_path, record_count, error_count)
         print(f"Processed {record_count} records from {xml_file_path}")
+        if delta:
+            print(f"Skipped {unchanged_count} unchanged records")
         
     except ET.ParseError as e:
         print(f"Error parsing XML file {xml_file_path}: {str(e)}")
         raise
     except Exception as e:
         print(f"Error processing file {xml_file_path}: {str(e)}")
+        if hasattr(callback_func, 'discard'):
+            callback_func.discard()
         raise
 
 
-def load_xml_directory(directory_path, callback_func, skip_processed, history_manager):
-    """Recursively load all XML files in the given directory and subdirectories"""
+def load_xml_directory(directory_path, callback_func, skip_processed, history_manager, delta=False,
+                       tombstone_dir=None, manifest_path=None):
+    """
+    Recursively load all XML files in the given directory and subdirectories
+
+    :param manifest_path: Optional directory manifest file caching the tree listing (see dir_manifest)
+    """
     if not os.path.exists(directory_path):
         raise FileNotFoundError(f"The directory {directory_path} does not exist.")
     
     if not os.path.isdir(directory_path):
         raise ValueError(f"{directory_path} is not a directory.")
     
-    # Recursively walk through directory and all subdirectories
-    for root_dir, dirs, files in os.walk(directory_path):
-        for filename in files:
-            if filename.endswith('.xml'):
-                xml_file_path = os.path.join(root_dir, filename)
-                try:
-                    load_xml_file(xml_file_path, callback_func, skip_processed, history_manager)
-                except Exception as e:
-                    print(f"Failed to process {xml_file_path}: {str(e)}")
+    # Recursively scan the directory and all subdirectories, as the parallel modes do
+    manifest = DirectoryManifest(manifest_path)
+    entries = manifest.scan(directory_path, input_file_filter('.xml'))
+    manifest.save()
+    for xml_file_path, _, _ in sorted(entries):
+        try:
+            load_xml_file(xml_file_path, callback_func, skip_processed, history_manager, delta,
+                          tombstone_dir)
+        except Exception as e:
+            print(f"Failed to process {xml_file_path}: {str(e)}")
 
 
-def process_xml_to_csv(xml_path, skip_processed=True):
-    """Process the XML file or directory at xml_path to CSV, handle skip_processed logic here"""
+def process_xml_to_csv(xml_path, skip_processed=True, delta=False, batch_size=DEFAULT_BATCH_SIZE,
+                       output_format='csv', compression=None, compression_level=None, partition=False,
+                       max_part_bytes=None, max_part_rows=None, dimensions=False, index=False, atomic=False,
+                       output_dir=None, tombstone_dir=None, stats=False, sketches=False, manifest_path=None):
+    """
+    Process the XML file or directory at xml_path to CSV, handle skip_processed logic here
+
+    :param output_dir: Optional directory replacing the default output directory (e.g. an import batch)
+    :param tombstone_dir: Optional directory replacing the default tombstone directory
+    :param stats: Keep running statistics and write run_summary.json at the end (see xml_run_stats)
+    :param sketches: Keep heavy-hitter sketches and merge them into sketches.npz at the end (see xml_sketches)
+    :param manifest_path: Optional directory manifest file caching the input tree listing
+    """
     # Initialize history manager
     history_manager = ProcessingHistoryManager()
     
-    # Use the module-level callback function (picklable!)
-    callback_func = write_record_callback
+    # Use a module-level callback (picklable!)
+    callback_func = make_record_callback(output_dir, batch_size=batch_size, output_format=output_format,
+                                         compression=compression, compression_level=compression_level,
+                                         partition=partition, max_part_bytes=max_part_bytes,
+                                         max_part_rows=max_part_rows, dimensions=dimensions,
+                                         index=index, atomic=atomic, stats=stats,
+                                         sketches=sketches)
     
     # Check if input is a file or directory
     if os.path.isfile(xml_path):
-        load_xml_file(xml_path, callback_func, skip_processed, history_manager)
+        output_state = _begin_output(output_format, output_dir, atomic)
+        load_xml_file(xml_path, callback_func, skip_processed, history_manager, delta, tombstone_dir)
     elif os.path.isdir(xml_path):
-        load_xml_directory(xml_path, callback_func, skip_processed, history_manager)
+        output_state = _begin_output(output_format, output_dir, atomic)
+        load_xml_directory(xml_path, callback_func, skip_processed, history_manager, delta, tombstone_dir,
+                           manifest_path)
     else:
         raise ValueError(f"{xml_path} is neither a file nor a directory")
+    _finish_output(output_format, output_state, output_dir, partition=partition,
+                   split_parts=bool(max_part_bytes or max_part_rows), dimensions=dimensions,
+                   uid_index=index, atomic=atomic, stats=stats, sketches=sketches)
+
 
+def process_xml_to_csv_parallel(xml_path, workers=None, skip_processed=True, delta=False, manifest_path=None,
+                                batch_size=DEFAULT_BATCH_SIZE, output_format='csv', compression=None,
+                                compression_level=None, partition=False, max_part_bytes=None,
+                                max_part_rows=None, dimensions=False, index=False, atomic=False,
+                                output_dir=None, tombstone_dir=None, stats=False, sketches=False):
+    """
+    Process XML files in parallel mode
 
-def process_xml_to_csv_parallel(xml_path, workers=None, skip_processed=True):
-    """Process XML files in parallel mode"""
+    :param output_dir: Optional directory replacing the default output directory (e.g. an import batch)
+    :param tombstone_dir: Optional directory replacing the default tombstone directory
+    :param stats: Keep running statistics and write run_summary.json at the end (see xml_run_stats)
+    :param sketches: Keep heavy-hitter sketches and merge them into sketches.npz at the end (see xml_sketches)
+    """
     from xml_parallel_processor import XMLParallelFileProcessor
     
-    # Use the module-level callback function (picklable!)
-    callback_func = write_record_callback
+    # Use a module-level callback (picklable!)
+    callback_func = make_record_callback(output_dir, batch_size=batch_size, output_format=output_format,
+                                         compression=compression, compression_level=compression_level,
+                                         partition=partition, max_part_bytes=max_part_bytes,
+                                         max_part_rows=max_part_rows, dimensions=dimensions,
+                                         index=index, atomic=atomic, stats=stats,
+                                         sketches=sketches)
     
-    processor = XMLParallelFileProcessor(worker_count=workers)
+    processor = XMLParallelFileProcessor(worker_count=workers, manifest_path=manifest_path)
     
     if os.path.isfile(xml_path):
         # For single file, use sequential processing
         history_manager = ProcessingHistoryManager()
-        load_xml_file(xml_path, callback_func, skip_processed, history_manager)
+        output_state = _begin_output(output_format, output_dir, atomic)
+        load_xml_file(xml_path, callback_func, skip_processed, history_manager, delta, tombstone_dir)
     elif os.path.isdir(xml_path):
         # For directory, use parallel batch processing
-        processor.run_batch(callback_func, xml_path, skip_processed)
+        output_state = _begin_output(output_format, output_dir, atomic)
+        processor.run_batch(callback_func, xml_path, skip_processed, delta, tombstone_dir)
     else:
         raise ValueError(f"{xml_path} is neither a file nor a directory")
+    _finish_output(output_format, output_state, output_dir, partition=partition,
+                   split_parts=bool(max_part_bytes or max_part_rows), dimensions=dimensions,
+                   uid_index=index, atomic=atomic, stats=stats, sketches=sketches)
+
+
+def _read_input_roots(xml_path):
+    """Expand a .txt list of roots (one path per line, like path.txt) or a single path"""
+    if os.path.isfile(xml_path) and xml_path.endswith('.txt'):
+        with open(xml_path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [xml_path]
+
+
+def process_xml_to_csv_cooperative(xml_path, lease_dir, node_id=None, workers=None, skip_processed=True,
+                                   delta=False, bundle_size=1, lease_ttl=None, manifest_path=None,
+                                   batch_size=DEFAULT_BATCH_SIZE, output_format='csv', compression=None,
+                                   compression_level=None, partition=False, max_part_bytes=None,
+                                   max_part_rows=None, dimensions=False, index=False, atomic=False,
+                                   stats=False, sketches=False, retry_failed=False):
+    """
+    Process XML files cooperatively with other nodes sharing the same lease directory
+    
+    Every local worker acts as one node with its own output shard
+    (xml_output/node=<node_id>-w<N>/), its own processing history and, in delta
+    mode, its own tombstones (xml_output/node=<node_id>-w<N>/tombstones/). The
+    histories of all shards are consulted to skip or tombstone known records.
+
+    :param atomic: Must be True: rows of a file whose lease was lost are only discarded when staged
+    :param retry_failed: Clear the .failed markers of the units first, so failed files are processed again
+    """
+    if not atomic:
+        raise ValueError("Cooperative processing requires atomic output")
+    from concurrent.futures import ProcessPoolExecutor
+    from xml_parallel_processor import XMLParallelFileProcessor
+    from xml_lease_coordinator import (make_work_units, run_cooperative_node, shard_history_files,
+                                       LeaseCoordinator, DEFAULT_LEASE_TTL)
+    
+    processor = XMLParallelFileProcessor(worker_count=workers, manifest_path=manifest_path)
+    file_list = []
+    for root in _read_input_roots(xml_path):
+        if os.path.isfile(root):
+            file_list.append(root)
+        else:
+            file_list.extend(processor.scan_directory_tree(root))
+    units = make_work_units(file_list, bundle_size)
+    print(f"Located {len(file_list)} XML files in {len(units)} work units")
+    
+    node_id = node_id or socket.gethostname()
+    claimant_ids = [f"{node_id}-w{i}" for i in range(processor.worker_count)]
+    if retry_failed:
+        cleared = LeaseCoordinator(lease_dir, node_id).clear_failed(unit_id for unit_id, _ in units)
+        print(f"Cleared {cleared} failed units for retry")
+    
+    shard_dirs = {claimant_id: os.path.join(OUTPUT_DIR, f"node={claimant_id}") for claimant_id in claimant_ids}
+    output_states = {claimant_id: _begin_output(output_format, shard_dir, atomic)
+                     for claimant_id, shard_dir in shard_dirs.items()}
+    # Read after the commits of an interrupted run were merged into the local shard histories
+    peer_history_files = shard_history_files(OUTPUT_DIR) if skip_processed or delta else []
+    
+    with ProcessPoolExecutor(max_workers=len(claimant_ids)) as executor:
+        futures = []
+        for claimant_id, shard_dir in shard_dirs.items():
+            futures.append(executor.submit(
+                run_cooperative_node, units, make_record_callback(shard_dir, batch_size, output_format,
+                                                         compression, compression_level, partition,
+                                                         max_part_bytes, max_part_rows, dimensions,
+                                                         index, atomic, stats, sketches),
+                lease_dir, claimant_id, skip_processed, delta,
+                os.path.join(shard_dir, "processing_history.json"),
+                lease_ttl or DEFAULT_LEASE_TTL, tombstone_dir=os.path.join(shard_dir, "tombstones"),
+                peer_history_files=peer_history_files))
+        outcomes = {'total': 0, 'ok': 0, 'failed': 0, 'failures': []}
+        for future in futures:
+            result = future.result()
+            for key in ('total', 'ok', 'failed'):
+                outcomes[key] += result[key]
+            outcomes['failures'].extend(result['failures'])
+    
+    for claimant_id, shard_dir in shard_dirs.items():
+        _finish_output(output_format, output_states[claimant_id], shard_dir, partition,
+                       bool(max_part_bytes or max_part_rows), dimensions, index, atomic, stats,
+                       sketches)
+    processor._print_summary(outcomes)
+    return outcomes
 
 
 def process_xml_to_csv_fresh(xml_path):
@@ -0,0 +1,444 @@
+"""
+Cooperative multi-node processing over a shared filesystem
+
+Several hosts (or several local processes) split the XML files of a run
+between them without any queue service. Work is divided into units (single
+files or bundles of files). A node claims a unit by atomically creating a
+lease file in a shared lease directory and keeps the lease alive with a
+heartbeat that refreshes the file's mtime. A lease whose mtime is older than
+the lease TTL belongs to a dead node and is reclaimed by the next node that
+sees it. Lease ages are measured against the mtime of a clock probe the node
+touches in the lease directory, so both timestamps come from the file server
+and clock skew between hosts does not expire live leases. Finished units get a .done marker, units that raised get a .failed
+marker (cleared with clear_failed() to retry them), and each node writes its
+rows to its own output shard.
+
+A node whose lease was taken over does not commit the input file in flight:
+LeasedCallback checks the lease before every flush, which is the commit
+point of staged output, and the file's rows are discarded instead. Parquet
+parts, which a worker otherwise keeps open until it exits, are published
+(or dropped) at the end of every unit. Cooperative runs therefore require
+--atomic: unstaged output would already have appended the rows of earlier
+batches of the lost file to the shard.
+
+Every node keeps its own processing history in its shard. SharedHistoryView
+lets a node also see the records of the other shards (as of the start of the
+run), so a record first loaded by another node is skipped when unchanged.
+
+Lease directory layout:
+    <unit_id>.lease   - held by a node (JSON: node, claimed_at, paths)
+    <unit_id>.done    - unit finished (JSON: node, finished_at, paths)
+    <unit_id>.failed  - unit raised an error (JSON: node, error, paths)
+    .clock.<node_id>  - clock probe of a node (empty, only its mtime is used)
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+# A lease not refreshed for this many seconds is considered abandoned
+DEFAULT_LEASE_TTL = 300
+
+# Seconds between rescans while other nodes still hold leases
+DEFAULT_POLL_INTERVAL = 10
+
+
+class LeaseLostError(RuntimeError):
+    """The lease of a unit was taken over by another node"""
+
+
+def make_work_units(file_list: List[str], bundle_size: int = 1) -> List[Tuple[str, List[str]]]:
+    """
+    Group files into work units with ids that are identical on every node
+
+    :param file_list: XML file paths (as seen on the shared filesystem)
+    :param bundle_size: Number of files per unit
+    :return: List of (unit_id, paths) tuples in a deterministic order
+    """
+    paths = sorted(os.path.abspath(path) for path in file_list)
+    units = []
+    for start in range(0, len(paths), max(1, bundle_size)):
+        bundle = paths[start:start + max(1, bundle_size)]
+        digest = hashlib.sha1("\n".join(bundle).encode('utf-8')).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(bundle[0]))[0]
+        units.append((f"{stem}-{digest}", bundle))
+    return units
+
+
+class LeaseCoordinator:
+    """Claims, heartbeats and completes work units through lease files"""
+
+    def __init__(self, lease_dir, node_id, lease_ttl=DEFAULT_LEASE_TTL, heartbeat_interval=None):
+        """
+        Initialize the coordinator for one node
+
+        :param lease_dir: Lease directory on the shared filesystem
+        :param node_id: Unique id of this node (e.g. host name plus worker number)
+        :param lease_ttl: Seconds after which an unrefreshed lease is reclaimed
+        :param heartbeat_interval: Seconds between heartbeats (default: TTL / 3)
+        """
+        self.lease_dir = lease_dir
+        self.node_id = node_id
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval or max(lease_ttl / 3.0, 0.1)
+        self.held = set()
+        self.lost = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(lease_dir, exist_ok=True)
+
+    def _path(self, unit_id, suffix):
+        return os.path.join(self.lease_dir, unit_id + suffix)
+
+    def _write_marker(self, path, payload):
+        """Write a marker file atomically"""
+        tmp_path = f"{path}.{self.node_id}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def _server_time(self):
+        """Return the current time of the file server holding the lease directory"""
+        probe_path = os.path.join(self.lease_dir, f".clock.{self.node_id}")
+        with open(probe_path, 'a', encoding='utf-8'):
+            pass
+        os.utime(probe_path, None)
+        return os.stat(probe_path).st_mtime
+
+    def is_finished(self, unit_id):
+        """Check whether a unit is done or failed"""
+        return (os.path.exists(self._path(unit_id, '.done'))
+                or os.path.exists(self._path(unit_id, '.failed')))
+
+    def lease_owner(self, unit_id):
+        """Return the node currently holding a unit's lease, or None"""
+        try:
+            with open(self._path(unit_id, '.lease'), 'r', encoding='utf-8') as f:
+                return json.load(f).get('node')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def holds(self, unit_id):
+        """Check that this node still holds an unexpired lease of a unit"""
+        if self.lease_owner(unit_id) != self.node_id:
+            return False
+        try:
+            lease_mtime = os.stat(self._path(unit_id, '.lease')).st_mtime
+        except FileNotFoundError:
+            return False
+        return self._server_time() - lease_mtime < self.lease_ttl
+
+    def _reclaim_if_expired(self, lease_path):
+        """Remove an abandoned lease; only one node wins the rename"""
+        try:
+            age = self._server_time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.lease_ttl:
+            return False
+        stale_path = f"{lease_path}.stale.{self.node_id}"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return True
+        # Between the stat and the rename another node may have reclaimed the
+        # lease and created a fresh one: that lease is put back
+        if self._server_time() - os.stat(stale_path).st_mtime < self.lease_ttl:
+            try:
+                os.link(stale_path, lease_path)
+            except FileExistsError:
+                # A third node claimed the unit meanwhile; the owner of the
+                # fresh lease notices the loss before its commit
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        print(f"[{self.node_id}] Reclaimed expired lease {os.path.basename(lease_path)}")
+        return True
+
+    def try_claim(self, unit_id, paths):
+        """
+        Try to take the lease of a unit
+
+        :return: True if this node now holds the lease
+        """
+        if self.is_finished(unit_id):
+            return False
+        lease_path = self._path(unit_id, '.lease')
+        for _ in range(2):
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._reclaim_if_expired(lease_path):
+                    return False
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'node': self.node_id,
+                           'claimed_at': datetime.now().isoformat(),
+                           'paths': paths}, f)
+            # The unit may have finished between the check and the claim
+            if self.is_finished(unit_id):
+                os.remove(lease_path)
+                return False
+            with self._lock:
+                self.held.add(unit_id)
+            return True
+        return False
+
+    def _drop(self, unit_id):
+        with self._lock:
+            self.held.discard(unit_id)
+        if self.lease_owner(unit_id) == self.node_id:
+            try:
+                os.remove(self._path(unit_id, '.lease'))
+            except FileNotFoundError:
+                pass
+
+    def release(self, unit_id):
+        """Give up a lease without finishing the unit"""
+        self._drop(unit_id)
+
+    def complete(self, unit_id, paths):
+        """
+        Mark a unit as done and release its lease
+
+        :return: False (and no .done marker) if the lease was lost meanwhile
+        """
+        if not self.holds(unit_id):
+            self.lost.add(unit_id)
+            self._drop(unit_id)
+            return False
+        self._write_marker(self._path(unit_id, '.done'), {
+            'node': self.node_id,
+            'finished_at': datetime.now().isoformat(),
+            'paths': paths
+        })
+        self._drop(unit_id)
+        return True
+
+    def fail(self, unit_id, paths, error_message):
+        """Mark a unit as failed so other nodes do not retry it"""
+        self._write_marker(self._path(unit_id, '.failed'), {
+            'node': self.node_id,
+            'failed_at': datetime.now().isoformat(),
+            'error': error_message,
+            'paths': paths
+        })
+        self._drop(unit_id)
+
+    def clear_failed(self, unit_ids):
+        """
+        Remove the .failed markers of units so they are processed again
+
+        :param unit_ids: Ids of the units to retry
+        :return: Number of markers removed
+        """
+        cleared = 0
+        for unit_id in unit_ids:
+            try:
+                os.remove(self._path(unit_id, '.failed'))
+                cleared += 1
+            except FileNotFoundError:
+                pass
+        return cleared
+
+    def heartbeat(self):
+        """Refresh the mtime of every held lease"""
+        with self._lock:
+            held = list(self.held)
+        for unit_id in held:
+            lease_path = self._path(unit_id, '.lease')
+            if self.lease_owner(unit_id) != self.node_id:
+                self.lost.add(unit_id)
+                continue
+            try:
+                os.utime(lease_path, None)
+            except FileNotFoundError:
+                self.lost.add(unit_id)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def start_heartbeat(self):
+        """Start the background heartbeat thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._thread.start()
+
+    def stop_heartbeat(self):
+        """Stop the background heartbeat thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class LeasedCallback:
+    """Record callback that refuses to commit an input file once the lease of its unit is lost"""
+
+    def __init__(self, callback, coordinator, unit_id):
+        """
+        Wrap the record callback of a node for one work unit
+
+        :param callback: Record callback of the node
+        :param coordinator: LeaseCoordinator holding the unit
+        :param unit_id: Id of the unit being processed
+        """
+        self.callback = callback
+        self.coordinator = coordinator
+        self.unit_id = unit_id
+
+    def __call__(self, parser):
+        return self.callback(parser)
+
+    def __getattr__(self, name):
+        # Plain function callbacks have no flush(), so load_xml_file does not batch them
+        attr = getattr(self.callback, name)
+        if name != 'flush':
+            return attr
+
+        def flush(*args, **kwargs):
+            if not self.coordinator.holds(self.unit_id):
+                self.coordinator.lost.add(self.unit_id)
+                raise LeaseLostError(f"Lease of {self.unit_id} was taken over by another node")
+            return attr(*args, **kwargs)
+        return flush
+
+
+def shard_history_files(output_dir):
+    """Processing history files of the node shards (node=<id>/) of an output directory"""
+    return sorted(glob.glob(os.path.join(glob.escape(output_dir), 'node=*', 'processing_history.json')))
+
+
+class SharedHistoryView:
+    """Processing history of one node that also knows the records of other shards"""
+
+    def __init__(self, history_manager, peer_history_files=()):
+        """
+        Load the processed records of the other shards
+
+        :param history_manager: ProcessingHistoryManager of this node, which receives all updates
+        :param peer_history_files: Processing history files of the other shards (read only)
+        """
+        self.history_manager = history_manager
+        self.peer_hashes = {}
+        for path in peer_history_files:
+            if os.path.abspath(path) == os.path.abspath(history_manager.history_file):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    records = json.load(f).get("processed_records", {})
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Warning: Could not load history file {path}: {e}")
+                continue
+            for uid, info in records.items():
+                if not info.get("error"):
+                    self.peer_hashes[uid] = (info.get("metadata") or {}).get("content_hash")
+
+    def is_record_processed(self, uid):
+        """Check whether this node or another shard processed a record"""
+        return self.history_manager.is_record_processed(uid) or uid in self.peer_hashes
+
+    def get_record_hash(self, uid):
+        """Content hash of a record, from this node's history first"""
+        if self.history_manager.is_record_processed(uid):
+            return self.history_manager.get_record_hash(uid)
+        return self.peer_hashes.get(uid)
+
+    def __getattr__(self, name):
+        return getattr(self.history_manager, name)
+
+
+def _publish_process_output(coordinator, unit_id, history_manager):
+    """
+    Publish the output this process defers until its exit (Parquet parts)
+    before the unit is marked done, or drop it if the lease was lost
+    """
+    import xml_parquet_writer
+    if xml_parquet_writer.pa is None:
+        return
+    if not coordinator.holds(unit_id):
+        xml_parquet_writer.discard_parquet_writers()
+        raise LeaseLostError(f"Lease of {unit_id} was taken over by another node")
+    xml_parquet_writer.close_parquet_writers({os.path.abspath(history_manager.history_file): history_manager})
+
+
+def run_cooperative_node(units: List[Tuple[str, List[str]]], handler: Callable, lease_dir: str, node_id: str,
+                         skip_processed: bool = True, delta: bool = False, history_file: str = None,
+                         lease_ttl: float = DEFAULT_LEASE_TTL,
+                         poll_interval: float = DEFAULT_POLL_INTERVAL, tombstone_dir: str = None,
+                         peer_history_files: List[str] = ()) -> Dict:
+    """
+    Claim and process work units until every unit is done or failed
+
+    :param units: Work units from make_work_units (same list on every node)
+    :param handler: Record callback, already bound to this node's output shard
+    :param lease_dir: Lease directory on the shared filesystem
+    :param node_id: Unique id of this node
+    :param history_file: Processing history file of this node
+    :param tombstone_dir: Tombstone directory of this node's shard (delta mode)
+    :param peer_history_files: Processing history files of the other shards (see SharedHistoryView)
+    :return: Outcome dictionary for the units processed by this node
+    """
+    from xml_info_load_api import load_xml_file
+    from xml_processing_history import ProcessingHistoryManager
+
+    coordinator = LeaseCoordinator(lease_dir, node_id, lease_ttl)
+    history_manager = ProcessingHistoryManager(history_file or f"processing_history.{node_id}.json")
+    if peer_history_files:
+        history_manager = SharedHistoryView(history_manager, peer_history_files)
+    outcomes = {'total': 0, 'ok': 0, 'failed': 0, 'failures': []}
+
+    # Start at a node-specific offset so nodes do not all race for the same unit
+    if units:
+        offset = int(hashlib.sha1(node_id.encode('utf-8')).hexdigest(), 16) % len(units)
+        units = units[offset:] + units[:offset]
+
+    coordinator.start_heartbeat()
+    try:
+        while True:
+            pending = False
+            for unit_id, paths in units:
+                if coordinator.is_finished(unit_id):
+                    continue
+                if not coordinator.try_claim(unit_id, paths):
+                    pending = pending or not coordinator.is_finished(unit_id)
+                    continue
+
+                callback = LeasedCallback(handler, coordinator, unit_id)
+                try:
+                    for path in paths:
+                        load_xml_file(path, callback, skip_processed, history_manager, delta, tombstone_dir)
+                    _publish_process_output(coordinator, unit_id, history_manager)
+                    if not coordinator.complete(unit_id, paths):
+                        raise LeaseLostError(f"Lease of {unit_id} was taken over by another node")
+                    outcomes['total'] += 1
+                    outcomes['ok'] += 1
+                    print(f"[{node_id}] OK: {unit_id}")
+                except LeaseLostError as err:
+                    # The new owner processes the unit; it is neither done nor failed here
+                    coordinator.release(unit_id)
+                    pending = True
+                    print(f"[{node_id}] LOST: {unit_id}: {err}")
+                except Exception as err:
+                    outcomes['total'] += 1
+                    coordinator.fail(unit_id, paths, str(err))
+                    outcomes['failed'] += 1
+                    outcomes['failures'].append((unit_id, str(err)))
+                    print(f"[{node_id}] ERROR: {unit_id}: {err}")
+
+            # Units leased by other nodes may still finish or expire
+            if not pending:
+                break
+            time.sleep(poll_interval)
+    finally:
+        coordinator.stop_heartbeat()
+
+    return outcomes
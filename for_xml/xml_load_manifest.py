@@ -0,0 +1,201 @@
+"""
+Load manifest of size-capped CSV part files
+
+With --max-part-mb / --max-part-rows every table is written as numbered
+parts (item_references.00001.csv, ...; see csv_writer.CSVPartFiles). At the
+end of a run build_load_manifest() lists every part of the output tree in
+load_manifest.json with its table, row count, size and SHA-256, so that
+the parts can be loaded concurrently and a failed part retried on its own.
+
+- Parts closed by the writers are taken from their load_parts.jsonl logs.
+- Parts that were still open when their worker process ended (the last
+  part of every table and worker) are counted and hashed here.
+- Dimension tables (dim_*.csv, see xml_dimensions) and unsplit table files
+  (item.csv, e.g. of an import batch, see xml_import_batches) are listed as
+  one part each.
+- Tombstones and the working directories of atomic commits are not listed.
+
+The command line turns the manifest into one LOAD DATA script per part,
+using the statements of import_csv_data.sql (import_csv_to_mysql.sh runs
+them in parallel):
+
+    python xml_load_manifest.py plan xml_output /tmp/plan [--loaded xml_output/loaded_parts.txt]
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+from csv_writer import PART_LOG_FILE, file_sha256, open_csv_file
+from xml_common_def import OUTPUT_DIR, XML_TABLE_NAMES
+
+LOAD_MANIFEST_FILE = "load_manifest.json"
+
+# Parts loaded by import_csv_to_mysql.sh, one manifest path per line
+LOADED_PARTS_FILE = "loaded_parts.txt"
+
+IMPORT_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_csv_data.sql')
+
+_PART_FILE_PATTERN = re.compile(r'^(\w+)\.(\d+)\.csv(\.gz|\.zst)?$')
+_DIMENSION_FILE_PATTERN = re.compile(r'^(dim_\w+)\.csv$')
+_TABLE_FILE_PATTERN = re.compile(r'^(\w+)\.csv(\.gz|\.zst)?$')
+
+# Directories of an output tree without load parts
+_EXCLUDED_DIR_NAMES = ('tombstones', 'batches')
+
+_LOAD_STATEMENT_PATTERN = re.compile(r"LOAD DATA LOCAL INFILE 'xml_output/(\w+)\.csv'.*?;", re.DOTALL)
+
+
+def count_csv_rows(file_path):
+    """Data rows of a CSV file, without its header row"""
+    with open_csv_file(file_path) as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def _logged_parts(dir_path):
+    """Entries of the load_parts.jsonl log of a directory, by file name"""
+    log_path = os.path.join(dir_path, PART_LOG_FILE)
+    entries = {}
+    if os.path.exists(log_path):
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry['file']] = entry
+    return entries
+
+
+def build_load_manifest(output_dir=None):
+    """
+    List every part file of an output tree in load_manifest.json
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: The manifest dictionary
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    table_order = {table_name: index for index, table_name in enumerate(XML_TABLE_NAMES)}
+    parts = []
+    for dir_path, dir_names, file_names in os.walk(output_dir):
+        # Tombstones are applied separately; batches have manifests of their own
+        dir_names[:] = [name for name in dir_names if name not in _EXCLUDED_DIR_NAMES and not name.startswith('.')]
+        logged = _logged_parts(dir_path)
+        for file_name in file_names:
+            match = _PART_FILE_PATTERN.match(file_name) or _DIMENSION_FILE_PATTERN.match(file_name)
+            if not match:
+                match = _TABLE_FILE_PATTERN.match(file_name)
+                if not match or match.group(1) not in XML_TABLE_NAMES:
+                    continue
+            file_path = os.path.join(dir_path, file_name)
+            entry = logged.get(file_name)
+            if entry is None or entry['bytes'] != os.path.getsize(file_path):
+                # Part still open when its worker ended
+                entry = {'table': match.group(1), 'rows': count_csv_rows(file_path),
+                         'bytes': os.path.getsize(file_path), 'sha256': file_sha256(file_path)}
+            parts.append({
+                'table': entry['table'],
+                'path': os.path.relpath(file_path, output_dir),
+                'part': int(match.group(2)) if match.re is _PART_FILE_PATTERN else 0,
+                'rows': entry['rows'],
+                'bytes': entry['bytes'],
+                'sha256': entry['sha256'],
+            })
+    parts.sort(key=lambda part: (table_order.get(part['table'], len(table_order)), part['path']))
+
+    manifest = {'updated': datetime.now().isoformat(), 'parts': parts}
+    manifest_path = os.path.join(output_dir, LOAD_MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+    print(f"\nLoad manifest: {manifest_path} ({len(parts)} parts, "
+          f"{sum(part['rows'] for part in parts)} rows)")
+    return manifest
+
+
+def load_statements(sql_path=IMPORT_SQL_PATH):
+    """
+    LOAD DATA statements of import_csv_data.sql
+
+    :return: (preamble before the first statement, {table: statement})
+    """
+    with open(sql_path, 'r', encoding='utf-8') as f:
+        script = f.read()
+    first = _LOAD_STATEMENT_PATTERN.search(script)
+    preamble = script[:first.start()] if first else script
+    return preamble, {match.group(1): match.group(0) for match in _LOAD_STATEMENT_PATTERN.finditer(script)}
+
+
+def write_load_plan(output_dir, plan_dir, loaded_path=None):
+    """
+    Write one LOAD DATA script per part that is not loaded yet
+
+    Every part is checked against its manifest checksum first. Compressed
+    parts are loaded from a named pipe next to their script (<script>.fifo)
+    that the caller feeds with the decompressed part.
+
+    :param output_dir: Output directory with load_manifest.json
+    :param plan_dir: Directory for the scripts
+    :param loaded_path: Optional file listing loaded parts (LOADED_PARTS_FILE)
+    :return: List of (part path, script path) to load
+    """
+    with open(os.path.join(output_dir, LOAD_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    loaded = set()
+    if loaded_path and os.path.exists(loaded_path):
+        with open(loaded_path, 'r', encoding='utf-8') as f:
+            loaded = {line.strip() for line in f if line.strip()}
+
+    preamble, statements = load_statements()
+    if any(part['table'].startswith('dim_') for part in manifest['parts']):
+        # Dimension-encoded output: its own statements for the encoded tables
+        from xml_dimensions import IMPORT_DIMENSION_SQL_PATH
+        statements.update(load_statements(IMPORT_DIMENSION_SQL_PATH)[1])
+    os.makedirs(plan_dir, exist_ok=True)
+    plan = []
+    for index, part in enumerate(manifest['parts']):
+        if part['path'] in loaded or part['table'] not in statements:
+            # Tables import_csv_data.sql does not load (uid) are skipped as well
+            continue
+        part_path = os.path.abspath(os.path.join(output_dir, part['path']))
+        if file_sha256(part_path) != part['sha256']:
+            raise ValueError(f"Checksum mismatch for {part['path']}")
+        script_path = os.path.join(os.path.abspath(plan_dir), f"{index:06d}-{os.path.basename(part_path)}.sql")
+        infile = script_path + '.fifo' if part_path.endswith(('.gz', '.zst')) else part_path
+        statement = statements[part['table']].replace(f"'xml_output/{part['table']}.csv'", f"'{infile}'", 1)
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write(preamble + statement + "\n")
+        plan.append((part['path'], script_path))
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load plans for size-capped CSV part files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='(Re)build load_manifest.json of an output directory')
+    build_parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    plan_parser = subparsers.add_parser('plan', help='Write LOAD DATA scripts for the parts not loaded yet '
+                                                     'and print "<part>\\t<script>" lines')
+    plan_parser.add_argument('output_dir')
+    plan_parser.add_argument('plan_dir')
+    plan_parser.add_argument('--loaded', default=None, help='File listing the parts already loaded')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_load_manifest(args.output_dir)
+        return
+    try:
+        plan = write_load_plan(args.output_dir, args.plan_dir, args.loaded)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    for part_path, script_path in plan:
+        print(f"{part_path}\t{script_path}")
+
+
+if __name__ == "__main__":
+    main()
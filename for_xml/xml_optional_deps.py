@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Optional dependencies of the analysis tools
+
+The parser itself only needs the standard library. The citation graph and
+merge, the highly cited articles engine and the sketches need numpy; the
+co-authorship and collaboration networks also need scipy. Their modules
+import these with optional_import and call require before the first use, so
+they can still be imported without them.
+"""
+
+import importlib
+
+
+def optional_import(module_name):
+    """
+    Import an optional dependency
+
+    :param module_name: Module to import, e.g. 'scipy.sparse'
+    :return: The module, or None if it is not installed
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+def require(module, package):
+    """
+    Raise a helpful error if an optional dependency is not installed
+
+    :param module: Result of optional_import
+    :param package: Name of the package to install, e.g. 'scipy'
+    """
+    if module is None:
+        raise ImportError(f"This feature requires {package}: pip install {package}")
@@ -5,35 +5,35 @@ Concurrent XML file processing capabilities for WOS XML data
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
 from typing import Callable, List, Dict, Tuple
+from dir_manifest import DirectoryManifest, input_file_filter, schedule_by_size
+
+is_xml_input_file = input_file_filter('.xml')
 
 class XMLParallelFileProcessor:
     """Handles concurrent processing of WOS XML data files"""
     
-    def __init__(self, worker_count=None):
+    def __init__(self, worker_count=None, manifest_path=None):
         if worker_count is None:
             worker_count = os.cpu_count() or 1
         self.worker_count = worker_count
+        self.manifest_path = manifest_path
+        
+    def scan_manifest_entries(self, root_path: str) -> List[Tuple[str, int, float]]:
+        """Recursively find all XML files as (path, size, mtime) manifest entries"""
+        manifest = DirectoryManifest(self.manifest_path)
+        entries = manifest.scan(root_path, is_xml_input_file)
+        manifest.save()
+        if self.manifest_path:
+            print(f"Manifest: {manifest.stats['dirs_cached']} directories cached, "
+                  f"{manifest.stats['dirs_scanned']} rescanned")
+        return entries
         
     def scan_directory_tree(self, root_path: str) -> List[str]:
         """Recursively find all XML files"""
-        found_files = []
-        
-        try:
-            entries = os.listdir(root_path)
-        except (PermissionError, FileNotFoundError):
-            return found_files
-            
-        for entry in entries:
-            full_path = os.path.join(root_path, entry)
-            
-            if os.path.isdir(full_path):
-                found_files.extend(self.scan_directory_tree(full_path))
-            elif entry.endswith('.xml') and not entry.startswith('.'):
-                found_files.append(full_path)
-                
-        return found_files
+        return [path for path, _, _ in self.scan_manifest_entries(root_path)]
     
-    def execute_on_file(self, filepath: str, handler: Callable, skip_processed: bool) -> Tuple[bool, str, str]:
+    def execute_on_file(self, filepath: str, handler: Callable, skip_processed: bool, delta: bool = False,
+                        tombstone_dir: str = None) -> Tuple[bool, str, str]:
         """Execute processing handler on a single XML file"""
         try:
             from xml_info_load_api import load_xml_file
@@ -43,17 +43,18 @@ class XMLParallelFileProcessor:
             history_manager = ProcessingHistoryManager()
             
             # Process the file with the handler
-            load_xml_file(filepath, handler, skip_processed, history_manager)
+            load_xml_file(filepath, handler, skip_processed, history_manager, delta, tombstone_dir)
             return (True, filepath, "")
         except Exception as err:
             return (False, filepath, str(err))
     
-    def run_batch(self, handler: Callable, input_directory: str, skip_processed: bool = True) -> Dict:
+    def run_batch(self, handler: Callable, input_directory: str, skip_processed: bool = True, delta: bool = False,
+                  tombstone_dir: str = None) -> Dict:
         """Execute batch processing with concurrent workers"""
         target_path = os.path.join(os.getcwd(), input_directory) if not os.path.isabs(input_directory) else input_directory
         
         print(f"Scanning: {target_path}")
-        file_list = self.scan_directory_tree(target_path)
+        file_list = schedule_by_size(self.scan_manifest_entries(target_path))
         total_count = len(file_list)
         
         if total_count == 0:
@@ -64,7 +65,7 @@ class XMLParallelFileProcessor:
         # For very small file counts, sequential processing is more efficient
         if total_count < 2:
             print("File count is small, using sequential processing")
-            return self._sequential_batch(handler, file_list, total_count, skip_processed)
+            return self._sequential_batch(handler, file_list, total_count, skip_processed, delta, tombstone_dir)
         
         actual_workers = min(self.worker_count, total_count)
         print(f"Launching {actual_workers} concurrent workers")
@@ -74,7 +75,7 @@ class XMLParallelFileProcessor:
         
         with ProcessPoolExecutor(max_workers=actual_workers) as executor:
             task_map = {
-                executor.submit(self.execute_on_file, fpath, handler, skip_processed): fpath 
+                executor.submit(self.execute_on_file, fpath, handler, skip_processed, delta, tombstone_dir): fpath 
                 for fpath in file_list
             }
             
@@ -93,12 +94,13 @@ class XMLParallelFileProcessor:
         self._print_summary(outcomes)
         return outcomes
     
-    def _sequential_batch(self, handler: Callable, file_list: List[str], total_count: int, skip_processed: bool) -> Dict:
+    def _sequential_batch(self, handler: Callable, file_list: List[str], total_count: int, skip_processed: bool,
+                          delta: bool = False, tombstone_dir: str = None) -> Dict:
         """Execute batch processing sequentially for small file counts"""
         outcomes = {'total': total_count, 'ok': 0, 'failed': 0, 'failures': []}
         
         for i, fpath in enumerate(file_list, 1):
-            success, path, error_info = self.execute_on_file(fpath, handler, skip_processed)
+            success, path, error_info = self.execute_on_file(fpath, handler, skip_processed, delta, tombstone_dir)
             
             if success:
                 outcomes['ok'] += 1
@@ -126,7 +128,8 @@ class XMLParallelFileProcessor:
                 print(f"  {os.path.basename(path)}: {err[:100]}")
 
 
-def process_xml_with_concurrency(handler: Callable, directory: str, workers=None, skip_processed=True):
+def process_xml_with_concurrency(handler: Callable, directory: str, workers=None, skip_processed=True, delta=False,
+                                 manifest_path=None):
     """Convenience function for concurrent XML processing"""
-    processor = XMLParallelFileProcessor(worker_count=workers)
-    return processor.run_batch(handler, directory, skip_processed)
+    processor = XMLParallelFileProcessor(worker_count=workers, manifest_path=manifest_path)
+    return processor.run_batch(handler, directory, skip_processed, delta)
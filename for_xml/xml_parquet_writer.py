@@ -0,0 +1,317 @@
+"""
+Parquet output sink for the XML tables
+
+An alternative to the CSV files for analytical use: every table becomes a
+directory of Parquet files (xml_output/parquet/<table>/part-*.parquet) that
+query engines (DuckDB, Spark, pandas/pyarrow datasets, ...) read directly,
+with column statistics for predicate pushdown.
+
+- Column types come from create_database_and_tables.sql (pubyear SMALLINT
+  -> int16, sortdate DATE -> date32, VARCHAR/TEXT -> string); empty values
+  become NULL, as NULLIF does in import_csv_data.sql.
+- Rows are buffered per table and written in row groups of
+  DEFAULT_ROW_GROUP_ROWS rows, large enough for efficient scans.
+- Repetitive text columns are dictionary-encoded; free text and
+  near-unique identifiers are stored plain.
+- Every worker process writes its own part file per table (and partition),
+  kept open across input files, so worker processes and node shards never
+  share a file and row groups fill up. The rows of the input file in flight
+  are held in memory and added to the part when the file is done, or
+  dropped if it fails. Parts are written under a .tmp name and renamed
+  when the process publishes them: at worker exit, or at the end of the run
+  in the main process (close_parquet_writers()). Only then are the records
+  and files of the part marked in the processing history, so a worker that
+  dies loses no history entries of unpublished rows.
+- With --atomic every input file is staged and committed on its own, so
+  its parts are published when the file is done.
+
+Requires pyarrow.
+"""
+
+import os
+import uuid
+from array import array
+from multiprocessing import util as multiprocessing_util
+
+from xml_common_def import OUTPUT_DIR, XML_TABLE_COLUMNS
+from xml_optional_deps import optional_import, require
+from xml_sql_schema import load_table_schema, base_type
+
+pa = optional_import('pyarrow')
+pc = optional_import('pyarrow.compute')
+pq = optional_import('pyarrow.parquet')
+
+PARQUET_DIR_NAME = "parquet"
+
+# Rows per row group; also the most rows a sink buffers per table
+DEFAULT_ROW_GROUP_ROWS = 500000
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Free text and near-unique values, not worth a dictionary
+PARQUET_PLAIN_COLUMNS = {
+    'title', 'abstract', 'ack_text', 'full_address', 'cited_uid', 'cited_title', 'cited_doi',
+    'identifier_value', 'email_addr', 'r_id', 'orcid', 'orcid_tr', 'orcid_id', 'conf_info', 'sponsor',
+}
+
+_ARROW_TYPES_BY_SQL_TYPE = {
+    'TINYINT': 'int8',
+    'SMALLINT': 'int16',
+    'INT': 'int32',
+    'INTEGER': 'int32',
+    'BIGINT': 'int64',
+    'DATE': 'date32',
+    'DECIMAL': 'float64',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+}
+
+
+def parquet_schemas(sql_path=None):
+    """
+    Arrow schemas of all output tables, in XML_TABLE_COLUMNS column order
+
+    :param sql_path: Optional CREATE TABLE script (default: create_database_and_tables.sql)
+    :return: Mapping of table name to pyarrow.Schema
+    """
+    require(pa, 'pyarrow')
+    sql_tables = load_table_schema(sql_path) if sql_path else load_table_schema()
+    schemas = {}
+    for table_name, columns in XML_TABLE_COLUMNS.items():
+        sql_types = dict(sql_tables.get(table_name, []))
+        fields = []
+        for column in columns:
+            arrow_type = _ARROW_TYPES_BY_SQL_TYPE.get(base_type(sql_types.get(column, 'VARCHAR')), 'string')
+            fields.append(pa.field(column, getattr(pa, arrow_type)()))
+        schemas[table_name] = pa.schema(fields)
+    return schemas
+
+
+def _to_arrow(values, arrow_type):
+    """
+    Convert extracted values to an Arrow array of the column type
+
+    Empty strings become NULL. Values that do not parse as the column type
+    (e.g. a malformed date) also become NULL instead of failing the batch.
+    """
+    strings = pa.array(values, pa.string())
+    strings = pc.if_else(pc.equal(strings, ''), pa.scalar(None, pa.string()), strings)
+    if arrow_type == pa.string():
+        return strings
+    try:
+        return strings.cast(arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        converted = []
+        for value in strings:
+            try:
+                converted.append(pa.scalar(value, pa.string()).cast(arrow_type).as_py())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                converted.append(None)
+        return pa.array(converted, arrow_type)
+
+
+class _ParquetParts:
+    """The part files of all tables under one Parquet directory, open until published"""
+
+    def __init__(self, root_dir, schemas, row_group_rows):
+        self.root_dir = root_dir
+        self.schemas = schemas
+        self.row_group_rows = row_group_rows
+        self.part_name = f"part-{uuid.uuid4().hex[:16]}.parquet"
+        self.buffers = {table_name: [] for table_name in schemas}
+        self.buffered_rows = {table_name: 0 for table_name in schemas}
+        self.writers = {}
+
+    def _part_path(self, table_name):
+        return os.path.join(self.root_dir, table_name, self.part_name)
+
+    def _open_writer(self, table_name):
+        """Create the part file of a table on its first row group"""
+        schema = self.schemas[table_name]
+        os.makedirs(os.path.join(self.root_dir, table_name), exist_ok=True)
+        dictionary_columns = [field.name for field in schema
+                              if field.type == pa.string() and field.name not in PARQUET_PLAIN_COLUMNS]
+        return pq.ParquetWriter(self._part_path(table_name) + '.tmp', schema,
+                                compression=PARQUET_COMPRESSION,
+                                use_dictionary=dictionary_columns,
+                                write_statistics=True)
+
+    def _write_row_group(self, table_name):
+        """Write the buffered rows of a table as one row group"""
+        if not self.buffered_rows[table_name]:
+            return
+        table = pa.concat_tables(self.buffers[table_name])
+        writer = self.writers.get(table_name)
+        if writer is None:
+            writer = self.writers[table_name] = self._open_writer(table_name)
+        writer.write_table(table, row_group_size=self.row_group_rows)
+        self.buffers[table_name] = []
+        self.buffered_rows[table_name] = 0
+
+    def append(self, table_name, tables, row_count):
+        """Add Arrow tables of one table, writing a row group when enough rows are buffered"""
+        self.buffers[table_name].extend(tables)
+        self.buffered_rows[table_name] += row_count
+        if self.buffered_rows[table_name] >= self.row_group_rows:
+            self._write_row_group(table_name)
+
+    def publish(self):
+        """Write the remaining rows and rename the complete part files into place"""
+        for table_name in self.schemas:
+            self._write_row_group(table_name)
+        for table_name, writer in self.writers.items():
+            writer.close()
+            os.replace(self._part_path(table_name) + '.tmp', self._part_path(table_name))
+        self.writers = {}
+
+    def discard(self):
+        """Drop the buffered rows and the unpublished part files"""
+        for table_name, writer in self.writers.items():
+            writer.close()
+            os.remove(self._part_path(table_name) + '.tmp')
+        self.writers = {}
+        self.buffers = {table_name: [] for table_name in self.schemas}
+        self.buffered_rows = {table_name: 0 for table_name in self.schemas}
+
+
+# Parts of this process by (pid, Parquet directory), and the history entries of the files they hold
+_PROCESS_PARTS = {}
+_PROCESS_COMMITS = {}
+
+# Arrow schemas by process, parsed from the CREATE TABLE script once
+_SCHEMAS = {}
+
+
+def _process_parts(root_dir, row_group_rows):
+    """The open parts of this process for a Parquet directory"""
+    pid = os.getpid()
+    if pid not in _PROCESS_COMMITS:
+        _PROCESS_COMMITS[pid] = []
+        # Worker processes publish their parts when they exit (multiprocessing runs
+        # finalizers on a normal exit, unlike atexit handlers)
+        multiprocessing_util.Finalize(None, close_parquet_writers, exitpriority=10)
+    key = (pid, root_dir)
+    if key not in _PROCESS_PARTS:
+        _PROCESS_PARTS[key] = _ParquetParts(root_dir, _schemas(), row_group_rows)
+    return _PROCESS_PARTS[key]
+
+
+def _schemas():
+    if os.getpid() not in _SCHEMAS:
+        _SCHEMAS[os.getpid()] = parquet_schemas()
+    return _SCHEMAS[os.getpid()]
+
+
+def close_parquet_writers(history_managers=None):
+    """
+    Publish the open parts of this process and mark the files they hold as processed
+
+    :param history_managers: Optional mapping of history file to the ProcessingHistoryManager
+                             that already holds it in memory (see xml_file_commit.record_commit_history)
+    :return: Number of input files published
+    """
+    pid = os.getpid()
+    for key in [key for key in _PROCESS_PARTS if key[0] == pid]:
+        _PROCESS_PARTS.pop(key).publish()
+    commits = _PROCESS_COMMITS.get(pid) or []
+    _PROCESS_COMMITS[pid] = []
+    if commits:
+        from xml_file_commit import record_commit_history
+        record_commit_history(commits, history_managers)
+    return len(commits)
+
+
+def discard_parquet_writers():
+    """Drop the open parts of this process without publishing them"""
+    pid = os.getpid()
+    for key in [key for key in _PROCESS_PARTS if key[0] == pid]:
+        _PROCESS_PARTS.pop(key).discard()
+    _PROCESS_COMMITS[pid] = []
+
+
+class XMLParquetWriter:
+    """Writes RecordBatch objects to per-table Parquet part files"""
+
+    # Rows become readable only when the part files are published
+    buffered = True
+
+    def __init__(self, output_dir=None, row_group_rows=DEFAULT_ROW_GROUP_ROWS, per_process=False):
+        """
+        Initialize the Parquet sink of one input file
+
+        :param output_dir: Optional directory replacing the default output
+                           directory (e.g. a per-node output shard)
+        :param row_group_rows: Rows per row group
+        :param per_process: Add the rows to the parts of the process, published
+                            by close_parquet_writers(); otherwise the sink
+                            has its own parts, published by close()
+        """
+        require(pa, 'pyarrow')
+        self.root_dir = os.path.join(output_dir or OUTPUT_DIR, PARQUET_DIR_NAME)
+        self.row_group_rows = row_group_rows
+        self.schemas = _schemas()
+        self.per_process = per_process
+        self.tables = {table_name: [] for table_name in self.schemas}
+        self.row_counts = {table_name: 0 for table_name in self.schemas}
+        self.commit_info = None
+        self.parts = None if per_process else _ParquetParts(self.root_dir, self.schemas, row_group_rows)
+
+    @property
+    def deferred(self):
+        """Records are marked by close_parquet_writers(), not at the end of the input file"""
+        return self.per_process
+
+    def _column_array(self, batch, table_name, index, field):
+        """One column of a batch as an Arrow array, using the typed batch column if there is one"""
+        if pa.types.is_integer(field.type):
+            typed = batch.column(table_name, field.name)
+            if isinstance(typed, array):
+                return pa.array(typed, field.type)
+        return _to_arrow(batch.columns[table_name][index], field.type)
+
+    def write_batch(self, batch):
+        """
+        Buffer the rows of a RecordBatch
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        for table_name, schema in self.schemas.items():
+            row_count = batch.row_count(table_name)
+            if not row_count:
+                continue
+            arrays = [self._column_array(batch, table_name, index, field) for index, field in enumerate(schema)]
+            table = pa.Table.from_arrays(arrays, schema=schema)
+            if self.parts is not None:
+                self.parts.append(table_name, [table], row_count)
+                continue
+            self.tables[table_name].append(table)
+            self.row_counts[table_name] += row_count
+
+    def commit(self, commit_info):
+        """
+        Keep the processing history entries of the input file until its rows are published
+
+        :param commit_info: Processing history entries of the file (see load_xml_file)
+        """
+        self.commit_info = commit_info
+
+    def close(self):
+        """Publish the part files, or add the rows of the input file to the parts of the process"""
+        if self.parts is not None:
+            self.parts.publish()
+            return
+        parts = _process_parts(self.root_dir, self.row_group_rows)
+        for table_name, tables in self.tables.items():
+            if tables:
+                parts.append(table_name, tables, self.row_counts[table_name])
+        commits = _PROCESS_COMMITS[os.getpid()]
+        if self.commit_info is not None and not any(commit is self.commit_info for commit in commits):
+            commits.append(self.commit_info)
+        self.tables = {table_name: [] for table_name in self.schemas}
+
+    def discard(self):
+        """Drop the rows of a failed input file"""
+        self.tables = {table_name: [] for table_name in self.schemas}
+        self.commit_info = None
+        if self.parts is not None:
+            self.parts.discard()
@@ -6,7 +6,10 @@ WOS XML records and structures it according to the table design in tables.md
 """  
 
 import xml.etree.ElementTree as ET
-from xml_common_def import WOS_NAMESPACE
+from xml_common_def import WOS_NAMESPACE, XML_TABLE_COLUMNS, row_getter
+
+# Per-table converters from row dictionaries to tuples in schema column order
+_ROW_GETTERS = {table_name: row_getter(columns) for table_name, columns in XML_TABLE_COLUMNS.items()}
 
 
 class XMLRecordParser:
@@ -446,23 +449,35 @@ class XMLRecordParser:
     
     def extract_item_references(self):
         """Extract data for item_references table (4.1)"""
+        columns = XML_TABLE_COLUMNS['item_references']
+        references = [dict(zip(columns, row)) for row in self.extract_item_references_tuples()]
+        return references if references else None
+    
+    def extract_item_references_tuples(self):
+        """Extract item_references rows (4.1) as tuples in schema column order"""
         references = []
+        prefix = '{' + self.ns['ns'] + '}'
+        get_text = self._get_text
         for ref in self.record.findall('.//ns:references/ns:reference', self.ns):
-            references.append({
-                'uid': self.uid,
-                'occurence_order': self._get_attr(ref, 'occurenceOrder'),
-                'cited_uid': self._get_text(ref.find('ns:uid', self.ns)),
-                'cited_author': self._get_text(ref.find('ns:citedAuthor', self.ns)),
-                'cited_year': self._get_text(ref.find('ns:year', self.ns)),
-                'cited_page': self._get_text(ref.find('ns:page', self.ns)),
-                'cited_volume': self._get_text(ref.find('ns:volume', self.ns)),
-                'cited_title': self._get_text(ref.find('ns:citedTitle', self.ns)),
-                'cited_work': self._get_text(ref.find('ns:citedWork', self.ns)),
-                'cited_doi': self._get_text(ref.find('ns:doi', self.ns)),
-                'cited_assignee': self._get_text(ref.find('ns:assignee', self.ns)),
-                'patent_no': self._get_text(ref.find('ns:patent_no', self.ns))
-            })
-        return references if references else None
+            # Index the children once instead of one find() per column
+            fields = {}
+            for child in ref:
+                fields.setdefault(child.tag, child)
+            references.append((
+                self.uid,
+                ref.attrib.get('occurenceOrder', ""),
+                get_text(fields.get(prefix + 'uid')),
+                get_text(fields.get(prefix + 'citedAuthor')),
+                get_text(fields.get(prefix + 'year')),
+                get_text(fields.get(prefix + 'page')),
+                get_text(fields.get(prefix + 'volume')),
+                get_text(fields.get(prefix + 'citedTitle')),
+                get_text(fields.get(prefix + 'citedWork')),
+                get_text(fields.get(prefix + 'doi')),
+                get_text(fields.get(prefix + 'assignee')),
+                get_text(fields.get(prefix + 'patent_no'))
+            ))
+        return references
     
     def extract_item_cite_locations(self):
         """Extract data for item_cite_locations table (4.2)"""
@@ -547,4 +562,32 @@ class XMLRecordParser:
                 'sponsor': self._get_text(conf.find('ns:sponsors/ns:sponsor', self.ns))
             })
         
-        return conferences if conferences else None
\ No newline at end of file
+        return conferences if conferences else None
+    
+    # ==================================================================
+    # Positional (tuple) extraction
+    # ==================================================================
+    
+    def extract_tuples(self, table_name):
+        """
+        Extract the rows of one table as tuples in XML_TABLE_COLUMNS order
+        
+        Tables with a native tuple extractor (extract_<table>_tuples) skip the
+        intermediate dictionaries; the others are converted with itemgetter.
+        
+        :param table_name: Output table name, e.g. 'item_references'
+        :return: List of tuples (empty if the record has no rows for the table)
+        """
+        if table_name == 'uid':
+            return [(self.uid,)]
+        
+        native_extractor = getattr(self, f'extract_{table_name}_tuples', None)
+        if native_extractor is not None:
+            return native_extractor()
+        
+        rows = getattr(self, f'extract_{table_name}')()
+        if rows is None:
+            return []
+        if isinstance(rows, dict):
+            rows = [rows]
+        return list(map(_ROW_GETTERS[table_name], rows))
@@ -0,0 +1,233 @@
+"""
+Partitioned output by publication year and edition
+
+With partitioning on, every table's rows are routed in the same pass to
+xml_output/pubyear=YYYY/edition=X/ (Hive-style directory names that DuckDB,
+Spark and pyarrow datasets understand), so jobs that read one year or one
+collection can skip everything else.
+
+- pubyear comes from the item rows (extract_item) and the edition from the
+  item_editions rows (extract_item_editions) already in the RecordBatch;
+  nothing is extracted twice.
+- The edition value is the collection without its "WOS." prefix (SCI,
+  SSCI, AHCI, ...). A record in several collections goes to one combined
+  partition (e.g. edition=SCI+SSCI) so that no row is written twice. A
+  query for one collection must therefore not test edition = 'SCI' but
+  use edition_filter('SCI'), which also matches the combined partitions;
+  partitions_with_edition() finds them in the manifest.
+- Records without pubyear or edition go to the "unknown" value.
+- Once rows are written (for buffered sinks such as Parquet: once the
+  sinks are closed) their counts per partition and table are appended to
+  partition_counts.jsonl; at the end of the run build_partition_manifest()
+  sums them into partition_manifest.json.
+
+Any RecordBatch sink (CSV, compressed CSV, Parquet) can be partitioned:
+one sink per partition directory is created on demand.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from xml_common_def import OUTPUT_DIR
+
+PARTITION_COUNTS_FILE = "partition_counts.jsonl"
+PARTITION_MANIFEST_FILE = "partition_manifest.json"
+
+# Value of a partition key the record does not have
+UNKNOWN_PARTITION_VALUE = "unknown"
+
+EDITION_PREFIX = "WOS."
+
+
+def edition_label(editions):
+    """
+    Partition value for the editions of a record
+
+    :param editions: Edition values, e.g. ['WOS.SSCI', 'WOS.SCI']
+    :return: e.g. 'SCI+SSCI', or 'unknown' without editions
+    """
+    labels = sorted({edition[len(EDITION_PREFIX):] if edition.startswith(EDITION_PREFIX) else edition
+                     for edition in editions if edition})
+    return '+'.join(labels) if labels else UNKNOWN_PARTITION_VALUE
+
+
+def edition_filter(edition, column='edition'):
+    """
+    SQL predicate selecting the partitions of one edition
+
+    Matches the edition alone and in combined partitions, but not other
+    editions containing its name (SCI is not in SSCI). The predicate only
+    uses the partition column, so DuckDB and Spark still prune on it.
+
+    :param edition: Edition without the WOS. prefix, e.g. 'SCI'
+    :param column: Name of the partition column
+    :return: e.g. "(edition = 'SCI' OR edition LIKE 'SCI+%' OR ...)"
+    """
+    edition = edition.replace("'", "''")
+    return (f"({column} = '{edition}' OR {column} LIKE '{edition}+%' "
+            f"OR {column} LIKE '%+{edition}' OR {column} LIKE '%+{edition}+%')")
+
+
+def partitions_with_edition(manifest, edition):
+    """
+    Partitions of the manifest holding records of one edition
+
+    :param manifest: Dictionary from build_partition_manifest() or partition_manifest.json
+    :param edition: Edition without the WOS. prefix, e.g. 'SCI'
+    :return: Relative partition directories, including combined ones such as edition=SCI+SSCI
+    """
+    return [entry['path'] for entry in manifest['partitions'] if edition in entry['editions']]
+
+
+def partition_path(pubyear, edition):
+    """Relative directory of a partition, e.g. 'pubyear=1985/edition=SCI'"""
+    return os.path.join(f"pubyear={pubyear or UNKNOWN_PARTITION_VALUE}", f"edition={edition}")
+
+
+def record_partitions(batch):
+    """
+    Partition of every record of a batch, from its item and item_editions rows
+
+    :param batch: RecordBatch
+    :return: Dictionary of UID to relative partition directory
+    """
+    editions = {}
+    edition_columns = batch.columns['item_editions']
+    for uid, edition in zip(edition_columns[0], edition_columns[1]):
+        editions.setdefault(uid, []).append(edition)
+
+    item_columns = batch.columns['item']
+    pubyear_index = batch.tables['item'].index('pubyear')
+    return {uid: partition_path(pubyear, edition_label(editions.get(uid, ())))
+            for uid, pubyear in zip(item_columns[0], item_columns[pubyear_index])}
+
+
+class PartitionedWriter:
+    """RecordBatch sink routing rows to one inner sink per partition directory"""
+
+    def __init__(self, output_dir=None, sink_class=None):
+        """
+        Initialize the partitioned sink
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param sink_class: Inner sink class, built as sink_class(partition_dir)
+                           (default: XMLDataWriter)
+        """
+        if sink_class is None:
+            from csv_writer import XMLDataWriter
+            sink_class = XMLDataWriter
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.sink_class = sink_class
+        self.sinks = {}
+        self.pending_counts = {}
+
+    @property
+    def buffered(self):
+        """Rows only count as written after close() if any inner sink buffers them"""
+        return any(getattr(sink, 'buffered', False) for sink in self.sinks.values())
+
+    @property
+    def deferred(self):
+        """Rows are only committed when the worker exits if any inner sink defers them"""
+        return any(getattr(sink, 'deferred', False) for sink in self.sinks.values())
+
+    def write_batch(self, batch):
+        """
+        Write the rows of a RecordBatch to their partitions
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        unknown = partition_path(None, UNKNOWN_PARTITION_VALUE)
+        for partition, part in batch.split(record_partitions(batch), unknown).items():
+            sink = self.sinks.get(partition)
+            if sink is None:
+                sink = self.sinks[partition] = self.sink_class(os.path.join(self.output_dir, partition))
+            sink.write_batch(part)
+            counts = self.pending_counts.setdefault(partition, {'records': 0, 'rows': {}})
+            counts['records'] += len(part)
+            for table_name in part.tables:
+                row_count = part.row_count(table_name)
+                if row_count:
+                    counts['rows'][table_name] = counts['rows'].get(table_name, 0) + row_count
+        if not self.buffered:
+            self._log_counts()
+
+    def _log_counts(self):
+        """Append the counts of the written rows to partition_counts.jsonl"""
+        if not self.pending_counts:
+            return
+        # One line per write; appends of a single short line do not interleave
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, PARTITION_COUNTS_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.pending_counts, sort_keys=True) + "\n")
+        self.pending_counts = {}
+
+    def commit(self, commit_info):
+        """Hand the commit to the partition sinks"""
+        for sink in self.sinks.values():
+            if hasattr(sink, 'commit'):
+                sink.commit(commit_info)
+
+    def close(self):
+        """Close all partition sinks"""
+        for sink in self.sinks.values():
+            if hasattr(sink, 'close'):
+                sink.close()
+        self._log_counts()
+        self.sinks = {}
+
+    def discard(self):
+        """Drop the rows and counts of a failed input file"""
+        for sink in self.sinks.values():
+            if hasattr(sink, 'discard'):
+                sink.discard()
+        self.pending_counts = {}
+        self.sinks = {}
+
+
+def build_partition_manifest(output_dir=None):
+    """
+    Sum the partition row counts into partition_manifest.json
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: The manifest dictionary
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    partitions = {}
+    counts_path = os.path.join(output_dir, PARTITION_COUNTS_FILE)
+    if os.path.exists(counts_path):
+        with open(counts_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for path, counts in json.loads(line).items():
+                    entry = partitions.setdefault(path, {'records': 0, 'rows': {}})
+                    entry['records'] += counts['records']
+                    for table_name, count in counts['rows'].items():
+                        entry['rows'][table_name] = entry['rows'].get(table_name, 0) + count
+
+    manifest = {'updated': datetime.now().isoformat(), 'partitions': []}
+    for path in sorted(partitions):
+        pubyear_dir, edition_dir = path.split(os.sep)
+        pubyear = pubyear_dir.split('=', 1)[1]
+        edition = edition_dir.split('=', 1)[1]
+        manifest['partitions'].append({
+            'path': path,
+            'pubyear': pubyear,
+            'edition': edition,
+            'editions': [] if edition == UNKNOWN_PARTITION_VALUE else edition.split('+'),
+            'records': partitions[path]['records'],
+            'rows': partitions[path]['rows'],
+        })
+
+    manifest_path = os.path.join(output_dir, PARTITION_MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+    total_records = sum(entry['records'] for entry in manifest['partitions'])
+    print(f"\nPartition manifest: {manifest_path} "
+          f"({len(manifest['partitions'])} partitions, {total_records} records)")
+    return manifest
@@ -5,14 +5,17 @@ This script is the main entry point for processing WOS XML files.
 It extracts data from XML files and writes them to CSV files.
 
 Usage:
-    python xml_proc_main.py <path_to_xml_file_or_directory> [--parallel] [--workers N] [--skip-processed]
+    python xml_proc_main.py <path_to_xml_file_or_directory> [--parallel] [--workers N] [--skip-processed] [--delta]
+    python xml_proc_main.py <path_or_path_list.txt> --coordinate LEASE_DIR --atomic [--node-id ID] [--workers N]
 """
 
 import sys
 import os
 import argparse
-from xml_info_load_api import process_xml_to_csv, process_xml_to_csv_parallel
-from xml_common_def import OUTPUT_DIR
+from datetime import datetime
+from xml_info_load_api import process_xml_to_csv, process_xml_to_csv_parallel, process_xml_to_csv_cooperative
+from xml_common_def import OUTPUT_DIR, TOMBSTONE_DIR
+from xml_record_batch import DEFAULT_BATCH_SIZE
 
 def main():
     """Main function to process XML files"""
@@ -28,10 +31,24 @@ def main():
                '  python xml_proc_main.py data/SCI.xml\n'
                '  python xml_proc_main.py data/xml_files/\n'
                '  python xml_proc_main.py data/xml_files/ --parallel\n'
-               '  python xml_proc_main.py data/xml_files/ --parallel --workers 4',
+               '  python xml_proc_main.py data/xml_files/ --parallel --workers 4\n'
+               '  python xml_proc_main.py data/updates/ --delta\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --format parquet\n'
+               '  python xml_proc_main.py data/xml_files/ --format sqlite --batch-size 2000\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --compress zstd\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --partition\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --max-part-mb 1024\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --dimensions\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --index\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --atomic\n'
+               '  python xml_proc_main.py data/weekly_update/ --delta --import-batch\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --stats\n'
+               '  python xml_proc_main.py data/xml_files/ --parallel --sketches\n'
+               '  python xml_proc_main.py path.txt --coordinate /data1/share/wosxml/leases --atomic',
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument('xml_path', help='Path to XML file or directory')
+    parser.add_argument('xml_path', help='Path to XML file or directory '
+                                         '(with --coordinate also a .txt file listing directories)')
     parser.add_argument('--parallel', action='store_true', 
                        help='Enable concurrent processing')
     parser.add_argument('--workers', type=int, default=None,
@@ -40,6 +57,60 @@ def main():
                        help='Skip already processed files (default: True)')
     parser.add_argument('--no-skip-processed', dest='skip_processed', action='store_false',
                        help='Reprocess all files, ignoring history')
+    parser.add_argument('--delta', action='store_true',
+                       help='Upsert mode: write only new or changed records and '
+                            'tombstone the UIDs of changed ones')
+    parser.add_argument('--coordinate', metavar='LEASE_DIR', default=None,
+                       help='Cooperative multi-node mode: claim files through lease files '
+                            'in this shared directory (requires --atomic)')
+    parser.add_argument('--node-id', default=None,
+                       help='Node id for --coordinate (default: host name)')
+    parser.add_argument('--bundle-size', type=int, default=1,
+                       help='Files claimed per lease in --coordinate mode (default: 1)')
+    parser.add_argument('--lease-ttl', type=int, default=None,
+                       help='Seconds before an unrefreshed lease is reclaimed (default: 300)')
+    parser.add_argument('--retry-failed', action='store_true',
+                       help='Clear the .failed markers of --coordinate mode so failed files are processed again')
+    parser.add_argument('--manifest', default=None,
+                       help='Directory manifest file caching the input tree listing '
+                            '(all modes)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Records collected per batch before writing (default: {DEFAULT_BATCH_SIZE}; '
+                            '1 writes every record on its own)')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'parquet', 'sqlite'], default='csv',
+                       help='Output format (default: csv); parquet writes typed, dictionary-encoded '
+                            'part files under <output>/parquet/<table>/ and needs pyarrow; '
+                            'sqlite loads <output>/wos_xml.sqlite and builds its indexes after the load')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], default=None,
+                       help='Write compressed CSV files (.csv.gz / .csv.zst; zstd needs the zstandard package)')
+    parser.add_argument('--partition', action='store_true',
+                       help='Write every table to pubyear=YYYY/edition=X/ partition directories '
+                            'with a partition manifest (csv and parquet formats)')
+    parser.add_argument('--compress-level', type=int, default=None,
+                       help='Compression level for --compress (default: 3)')
+    parser.add_argument('--max-part-mb', type=float, default=None,
+                       help='Split every CSV table into numbered parts (item.00001.csv, ...) of at most '
+                            'this many MB of CSV text, listed in <output>/load_manifest.json')
+    parser.add_argument('--dimensions', action='store_true',
+                       help='Write organizations, subjects, sources, grant agencies and document types '
+                            'once to dim_*.csv tables and their ids to the fact tables (csv format)')
+    parser.add_argument('--max-part-rows', type=int, default=None,
+                       help='Split every CSV table into numbered parts of at most this many rows')
+    parser.add_argument('--index', action='store_true',
+                       help='Build a UID -> row offset index next to every CSV table for '
+                            '"python xml_uid_index.py lookup UID" (plain, unsplit csv format)')
+    parser.add_argument('--atomic', action='store_true',
+                       help='Stage the rows of every input file and commit them with its processing '
+                            'history when the file is done, so a crash only redoes the files in flight')
+    parser.add_argument('--import-batch', action='store_true',
+                       help='Write the rows of this run to a new import batch (<output>/batches/<id>/) '
+                            'that import_csv_to_mysql.sh loads on its own (csv format)')
+    parser.add_argument('--stats', action='store_true',
+                       help='Keep running counts by year, doctype, language, country and edition and '
+                            'top authors, organizations and sources, summed into run_summary.json/.csv')
+    parser.add_argument('--sketches', action='store_true',
+                       help='Keep Count-Min/Space-Saving sketches of keywords, keywords plus, cited works '
+                            'and organizations per worker, merged into sketches.npz (needs numpy)')
     
     args = parser.parse_args()
     
@@ -55,23 +126,125 @@ def main():
     
     print(f"\nInput: {args.xml_path}")
     print(f"Output directory: {OUTPUT_DIR}")
+    if args.partition and args.output_format == 'sqlite':
+        print("\nError: --partition applies to CSV and Parquet output only")
+        sys.exit(1)
+    if args.compress and args.output_format != 'csv':
+        print("\nError: --compress applies to CSV output only")
+        sys.exit(1)
+    if (args.max_part_mb or args.max_part_rows) and args.output_format != 'csv':
+        print("\nError: --max-part-mb/--max-part-rows apply to CSV output only")
+        sys.exit(1)
+    if args.dimensions and args.output_format != 'csv':
+        print("\nError: --dimensions applies to CSV output only")
+        sys.exit(1)
+    if args.index and (args.output_format != 'csv' or args.compress or args.max_part_mb or args.max_part_rows):
+        print("\nError: --index applies to plain CSV output without --compress or part caps")
+        sys.exit(1)
+    if args.atomic and (args.output_format == 'sqlite' or args.max_part_mb or args.max_part_rows or args.index):
+        print("\nError: --atomic cannot be combined with --format sqlite, part caps or --index")
+        sys.exit(1)
+    if args.import_batch and (args.output_format != 'csv' or args.coordinate):
+        print("\nError: --import-batch applies to CSV output in sequential and parallel mode only")
+        sys.exit(1)
+    if args.delta and args.output_format != 'sqlite' and not args.import_batch:
+        # The new versions would be appended to the files holding the old rows
+        print("\nError: --delta needs --import-batch (CSV output), which keeps the new versions of changed "
+              "records apart from the old rows")
+        sys.exit(1)
+    if args.coordinate and not args.atomic:
+        # Rows of a file whose lease was taken over must not reach the shard
+        print("\nError: --coordinate requires --atomic")
+        sys.exit(1)
+    if args.delta and args.coordinate:
+        # Old rows loaded by another node are in that node's shard
+        print("\nError: --delta cannot be combined with --coordinate")
+        sys.exit(1)
+    max_part_bytes = int(args.max_part_mb * 1024 * 1024) if args.max_part_mb else None
+    if args.compress:
+        print(f"Output format: CSV, {args.compress}-compressed")
+    if args.output_format == 'parquet':
+        print(f"Output format: Parquet ({os.path.join(OUTPUT_DIR, 'parquet')})")
+    elif args.output_format == 'sqlite':
+        print(f"Output format: SQLite ({os.path.join(OUTPUT_DIR, 'wos_xml.sqlite')})")
+    if args.partition:
+        print(f"Partitioned output: {os.path.join(OUTPUT_DIR, 'pubyear=YYYY', 'edition=X')}")
+    if max_part_bytes or args.max_part_rows:
+        caps = [f"{args.max_part_mb:g} MB" if max_part_bytes else None,
+                f"{args.max_part_rows} rows" if args.max_part_rows else None]
+        print(f"Part files: at most {' / '.join(cap for cap in caps if cap)} per part "
+              f"(manifest: {os.path.join(OUTPUT_DIR, 'load_manifest.json')})")
+    if args.dimensions:
+        print("Dimension tables: dim_org, dim_subject, dim_source, dim_grant_agency, dim_doctype")
+    if args.index:
+        print("UID index: <table>.csv.uidx next to every table")
+    if args.atomic:
+        print(f"Atomic file commits: staged in {os.path.join(OUTPUT_DIR, '.staging')}")
+    if args.stats:
+        print("Run statistics: run_stats.jsonl, summed into run_summary.json and run_summary.csv")
+    if args.sketches:
+        print(f"Sketches: {os.path.join(OUTPUT_DIR, 'sketches')}, merged into sketches.npz")
+    output_dir = tombstone_dir = None
+    if args.import_batch:
+        from xml_import_batches import batch_tombstone_dir, finish_batch, new_batch_dir
+        output_dir = new_batch_dir()
+        tombstone_dir = batch_tombstone_dir(output_dir)
+        print(f"Import batch: {output_dir}")
+    if args.delta:
+        print(f"Delta mode: tombstones written to {tombstone_dir or TOMBSTONE_DIR}")
+    started = datetime.now()
     
     # Process the XML files
     try:
-        if args.parallel:
+        if args.coordinate:
+            print(f"==> Cooperative processing mode active (leases in {args.coordinate})")
+            print("\nStarting XML processing...\n")
+            process_xml_to_csv_cooperative(args.xml_path, args.coordinate, node_id=args.node_id,
+                                           workers=args.workers, skip_processed=args.skip_processed,
+                                           delta=args.delta, bundle_size=args.bundle_size,
+                                           lease_ttl=args.lease_ttl, manifest_path=args.manifest,
+                                           batch_size=args.batch_size, output_format=args.output_format,
+                                           compression=args.compress, compression_level=args.compress_level,
+                                           partition=args.partition, max_part_bytes=max_part_bytes,
+                                           max_part_rows=args.max_part_rows, dimensions=args.dimensions,
+                                           index=args.index, atomic=args.atomic, stats=args.stats,
+                                           sketches=args.sketches, retry_failed=args.retry_failed)
+        elif args.parallel:
             print("==> Concurrent processing mode active")
             if args.workers:
                 print(f"==> Using {args.workers} workers")
             print("\nStarting XML processing...\n")
-            process_xml_to_csv_parallel(args.xml_path, workers=args.workers, skip_processed=args.skip_processed)
+            process_xml_to_csv_parallel(args.xml_path, workers=args.workers, skip_processed=args.skip_processed,
+                                        delta=args.delta, manifest_path=args.manifest,
+                                        batch_size=args.batch_size, output_format=args.output_format,
+                                        compression=args.compress, compression_level=args.compress_level,
+                                        partition=args.partition, max_part_bytes=max_part_bytes,
+                                        max_part_rows=args.max_part_rows, dimensions=args.dimensions,
+                                        index=args.index, atomic=args.atomic, output_dir=output_dir,
+                                        tombstone_dir=tombstone_dir, stats=args.stats,
+                                        sketches=args.sketches)
         else:
             print("==> Sequential processing mode active")
             print("\nStarting XML processing...\n")
-            process_xml_to_csv(args.xml_path, skip_processed=args.skip_processed)
+            process_xml_to_csv(args.xml_path, skip_processed=args.skip_processed, delta=args.delta,
+                               batch_size=args.batch_size, output_format=args.output_format,
+                               compression=args.compress, compression_level=args.compress_level,
+                               partition=args.partition, max_part_bytes=max_part_bytes,
+                               max_part_rows=args.max_part_rows, dimensions=args.dimensions,
+                               index=args.index, atomic=args.atomic, output_dir=output_dir,
+                               tombstone_dir=tombstone_dir, stats=args.stats, sketches=args.sketches,
+                               manifest_path=args.manifest)
+        if args.import_batch:
+            finish_batch(output_dir, started, args.xml_path, args.delta)
         
         print("\n" + "="*60)
         print("Processing completed successfully!")
-        print(f"CSV files have been saved to: {OUTPUT_DIR}")
+        if args.output_format == 'parquet':
+            print(f"Parquet files have been saved to: {os.path.join(OUTPUT_DIR, 'parquet')}")
+        elif args.output_format == 'sqlite':
+            print(f"SQLite database has been saved to: {os.path.join(OUTPUT_DIR, 'wos_xml.sqlite')}")
+        else:
+            print(f"CSV files have been saved to: {output_dir or OUTPUT_DIR}")
         print("="*60)
         
     except Exception as e:
@@ -55,8 +55,11 @@ class ProcessingHistoryManager:
         """Save processing history to file"""
         try:
             self.history["metadata"]["last_updated"] = datetime.now().isoformat()
-            with open(self.history_file, 'w', encoding='utf-8') as f:
+            # Replaced atomically: a crash while saving keeps the previous history
+            tmp_path = f"{self.history_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(self.history, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.history_file)
         except Exception as e:
             print(f"Warning: Could not save history file: {e}")
     
@@ -95,7 +98,26 @@ class ProcessingHistoryManager:
         }
         self.history["statistics"]["total_records"] += 1
         self._save_history()
-    
+
+    def mark_records_processed(self, records, file_path=None):
+        """
+        Mark several records as processed with a single history save
+
+        :param records: List of (uid, metadata) tuples
+        :param file_path: Optional source file path
+        """
+        if not records:
+            return
+        processed_at = datetime.now().isoformat()
+        for uid, metadata in records:
+            self.history["processed_records"][uid] = {
+                "processed_at": processed_at,
+                "source_file": file_path,
+                "metadata": metadata or {}
+            }
+        self.history["statistics"]["total_records"] += len(records)
+        self._save_history()
+
     def mark_file_processed(self, file_path, record_count, error_count=0):
         """
         Mark a file as fully processed
@@ -181,7 +203,15 @@ class ProcessingHistoryManager:
         """
         return self.history["processed_records"].get(uid)
 
-    
+    def get_record_hash(self, uid):
+        """Get the content hash stored for a record in delta mode
+
+        :param uid: Record UID
+        :return: Content hash or None if the record was stored without one
+        """
+        info = self.history["processed_records"].get(uid) or {}
+        return (info.get("metadata") or {}).get("content_hash")
+
     def get_file_info(self, file_path):
         """
         Get information about a specific file
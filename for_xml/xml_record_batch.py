@@ -0,0 +1,221 @@
+"""
+Columnar record batches for WOS XML extraction
+
+Writing every record on its own means one round of list/dict/tuple objects
+and one open() per table per record. RecordBatch accumulates the rows of K
+records per table as columns (one list per column), so a sink receives a
+whole batch at once: CSV sinks zip the columns back into rows in a single
+writerows() call, and columnar sinks take the columns directly without any
+row-to-column transposition.
+
+Integer columns listed in XML_INTEGER_COLUMNS (pubyear, seq_no,
+occurence_order, ...) are available as typed array.array columns through
+RecordBatch.column(); a column with any value that is not a canonical
+integer (empty, None, leading zeros, ...) is returned as plain values so
+that no sink ever changes the text that was extracted.
+"""
+
+from array import array
+
+from xml_common_def import XML_TABLE_COLUMNS, XML_INTEGER_COLUMNS
+
+# Records per batch before the sink is called
+DEFAULT_BATCH_SIZE = 500
+
+
+def _as_integer_array(values, typecode):
+    """
+    Convert a column to a typed array if every value round-trips through int
+
+    :return: array.array, or None if any value is not a canonical integer
+    """
+    try:
+        typed = array(typecode, map(int, values))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if list(map(str, typed)) != values:
+        return None
+    return typed
+
+
+class RecordBatch:
+    """Rows of several records, stored per table as column lists"""
+
+    def __init__(self, tables=None):
+        """
+        Initialize an empty batch
+
+        :param tables: Mapping of table name to column names (default: XML_TABLE_COLUMNS)
+        """
+        self.tables = tables or XML_TABLE_COLUMNS
+        self.columns = {table_name: [[] for _ in columns] for table_name, columns in self.tables.items()}
+        self.uids = []
+        # UIDs whose rows written before the batch it replaces (delta mode)
+        self.tombstones = []
+
+    def __len__(self):
+        """Number of records in the batch"""
+        return len(self.uids)
+
+    def add_record(self, parser):
+        """
+        Append the rows of one parsed record to every table
+
+        :param parser: XMLRecordParser instance
+        """
+        for table_name, columns in self.columns.items():
+            rows = parser.extract_tuples(table_name)
+            if not rows:
+                continue
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+        self.uids.append(parser.uid)
+
+    def row_count(self, table_name):
+        """Number of rows of a table in the batch"""
+        return len(self.columns[table_name][0])
+
+    def rows(self, table_name):
+        """
+        Rows of a table as tuples in column order
+
+        :param table_name: Output table name
+        :return: List of tuples
+        """
+        return list(zip(*self.columns[table_name]))
+
+    def split(self, key_of_uid, default_key=None):
+        """
+        Split the batch into one batch per key, keeping row order
+
+        :param key_of_uid: Mapping of record UID to key (e.g. a partition)
+        :param default_key: Key of rows whose UID is not in key_of_uid
+        :return: Dictionary of key to RecordBatch
+        """
+        parts = {}
+
+        def part(key):
+            if key not in parts:
+                parts[key] = RecordBatch(self.tables)
+            return parts[key]
+
+        for uid in self.uids:
+            part(key_of_uid.get(uid, default_key)).uids.append(uid)
+        for uid in self.tombstones:
+            part(key_of_uid.get(uid, default_key)).tombstones.append(uid)
+        for table_name, columns in self.columns.items():
+            if not columns[0]:
+                continue
+            row_indexes = {}
+            uid_column = columns[self.tables[table_name].index('uid')]
+            for index, uid in enumerate(uid_column):
+                row_indexes.setdefault(key_of_uid.get(uid, default_key), []).append(index)
+            for key, indexes in row_indexes.items():
+                part_columns = part(key).columns[table_name]
+                for part_column, column in zip(part_columns, columns):
+                    part_column.extend([column[index] for index in indexes])
+        return parts
+
+    def column(self, table_name, column_name):
+        """
+        One column of a table, typed where possible
+
+        :param table_name: Output table name
+        :param column_name: Column name from XML_TABLE_COLUMNS
+        :return: array.array for integer columns whose values are all integers, else a list
+        """
+        values = self.columns[table_name][self.tables[table_name].index(column_name)]
+        typecode = XML_INTEGER_COLUMNS.get(column_name)
+        if typecode is not None and values:
+            typed = _as_integer_array(values, typecode)
+            if typed is not None:
+                return typed
+        return values
+
+
+class RecordBatchCallback:
+    """
+    Record callback collecting records into RecordBatch objects
+
+    Picklable like write_record_callback, so it can be handed to worker
+    processes; every process builds its own sink. Calling it returns True
+    when the call filled the batch and the sink wrote it; load_xml_file uses
+    this to mark records as processed only once their rows are on disk, and
+    calls flush() at the end of every file. Sinks that only commit their
+    output when closed (buffered = True, e.g. Parquet) never return True:
+    their records are marked after flush(). Sinks that publish their output
+    only when the worker process exits (deferred = True, e.g. per-process
+    Parquet parts) mark the records themselves then; flush() returns False
+    for them.
+    """
+
+    def __init__(self, output_dir=None, batch_size=DEFAULT_BATCH_SIZE, sink_class=None):
+        """
+        Initialize the callback
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param batch_size: Records per batch
+        :param sink_class: Class with write_batch(batch) and optionally close(),
+                           built as sink_class(output_dir) (default: XMLDataWriter)
+        """
+        self.output_dir = output_dir
+        self.batch_size = max(1, batch_size)
+        self.sink_class = sink_class
+        self.batch = RecordBatch()
+        self._sink = None
+
+    def __getstate__(self):
+        """Sinks may hold open files and are not sent to other processes"""
+        state = self.__dict__.copy()
+        state['_sink'] = None
+        return state
+
+    def _get_sink(self):
+        """Build the sink on first use"""
+        if self._sink is None:
+            sink_class = self.sink_class
+            if sink_class is None:
+                from csv_writer import XMLDataWriter
+                sink_class = XMLDataWriter
+            self._sink = sink_class(self.output_dir)
+        return self._sink
+
+    def _write_batch(self):
+        """Hand the pending batch to the sink"""
+        if not len(self.batch):
+            return
+        batch, self.batch = self.batch, RecordBatch()
+        self._get_sink().write_batch(batch)
+
+    def __call__(self, parser):
+        """Add a record; write the batch when it is full"""
+        self.batch.add_record(parser)
+        if len(self.batch) >= self.batch_size:
+            self._write_batch()
+            return not getattr(self._sink, 'buffered', False)
+        return False
+
+    def flush(self, commit_info=None):
+        """
+        Write the pending batch and close the sink (end of an input file)
+
+        :param commit_info: Processing history entries of the file, handed to
+                            sinks that commit whole files (see xml_file_commit)
+        :return: False if the sink defers the commit and marks the records itself
+        """
+        try:
+            self._write_batch()
+            if self._sink is not None and hasattr(self._sink, 'commit'):
+                self._sink.commit(commit_info)
+            if self._sink is not None and hasattr(self._sink, 'close'):
+                self._sink.close()
+            return not getattr(self._sink, 'deferred', False)
+        finally:
+            self._sink = None
+
+    def discard(self):
+        """Drop the pending batch and the uncommitted rows of a failed input file"""
+        self.batch = RecordBatch()
+        sink, self._sink = self._sink, None
+        if sink is not None and hasattr(sink, 'discard'):
+            sink.discard()
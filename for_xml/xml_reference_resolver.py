@@ -0,0 +1,286 @@
+"""
+Resolution of cited references without a WOS cited_uid
+
+Many item_references rows carry no cited_uid, or only a placeholder
+("WOS:<citing uid>.<n>", which modify_database.sql deletes with
+LIKE '%.%'), although the cited paper is a source record of the output.
+This resolver links them by exact keys, without fuzzy matching:
+
+- doi: the normalized cited_doi against the DOIs of item_ids
+  (identifier_type doi / xref_doi)
+- author_year_volume_page: the normalized surname of the first author,
+  year, volume and first page against item_authors (seq_no 1), item
+  pubyear, vol and page_begin
+
+Keys that more than one source record has are dropped, so every match is
+unambiguous; references are never resolved to the citing record itself.
+The keys of all source records are held in hash tables; the unlinked
+references are read in chunks and looked up in parallel worker processes
+(hash join), so every reference costs one lookup per key.
+
+The result, <output>/derived/resolved_citations.csv (uid, cited_uid,
+occurence_order, match_method), is loaded with the derived tables through
+resolved_citations.sql. Its first two columns are an edge list, so the
+resolved edges can be merged into citation_merge:
+
+    python xml_reference_resolver.py xml_output --workers 8
+    python xml_citation_merge.py xml_output --edges xml_output/derived/resolved_citations.csv
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+from xml_derived_tables import DERIVED_DIR_NAME, is_wos_citation, table_rows
+
+RESOLVED_CITATIONS_FILE = 'resolved_citations.csv'
+RESOLVED_CITATIONS_SQL_FILE = 'resolved_citations.sql'
+RESOLVED_CITATIONS_COLUMNS = ('uid', 'cited_uid', 'occurence_order', 'match_method')
+
+MATCH_DOI = 'doi'
+MATCH_AUTHOR_YEAR_VOLUME_PAGE = 'author_year_volume_page'
+
+DOI_IDENTIFIER_TYPES = ('doi', 'xref_doi')
+
+DEFAULT_CHUNK_REFERENCES = 100000
+
+_DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+_NON_LETTERS = re.compile(r'[^A-Z]')
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+# Indexes of the worker processes, set by _init_worker
+_worker_indexes = None
+
+
+def normalize_doi(value):
+    """Lowercased DOI without URL or doi: prefix, '' if empty"""
+    return _DOI_PREFIX.sub('', value.strip()).lower()
+
+
+def normalize_surname(name):
+    """
+    Surname of a WOS author name, uppercase ASCII letters only
+
+    'PERLMANN, AJ', 'Perlmann, A. J.' and 'PERLMANN AJ' all give 'PERLMANN'.
+    """
+    name = name.strip()
+    surname = name.split(',', 1)[0] if ',' in name else name.split(' ', 1)[0]
+    surname = unicodedata.normalize('NFKD', surname).encode('ascii', 'ignore').decode('ascii')
+    return _NON_LETTERS.sub('', surname.upper())
+
+
+def normalize_page(value):
+    """First page without separators and a leading P ('P66' -> '66')"""
+    page = _NON_ALPHANUMERIC.sub('', value.upper().split('-', 1)[0])
+    if page.startswith('P') and page[1:].isdigit():
+        page = page[1:]
+    return page.lstrip('0') or page
+
+
+def normalize_volume(value):
+    """Volume without separators and leading zeros"""
+    volume = _NON_ALPHANUMERIC.sub('', value.upper())
+    return volume.lstrip('0') or volume
+
+
+def bibliographic_key(author, year, volume, page):
+    """(surname, year, volume, page) key, or None unless all parts are present"""
+    key = (normalize_surname(author), year.strip(), normalize_volume(volume), normalize_page(page))
+    return key if all(key) else None
+
+
+def _unique_index(pairs):
+    """Dictionary of key to uid for the keys of exactly one uid"""
+    index, ambiguous = {}, set()
+    for key, uid in pairs:
+        if key in ambiguous:
+            continue
+        known = index.get(key)
+        if known is None:
+            index[key] = uid
+        elif known != uid:
+            del index[key]
+            ambiguous.add(key)
+    return index
+
+
+def build_source_indexes(output_dir):
+    """
+    Key indexes of the source records of an output tree
+
+    :return: {match method: {key: uid}}
+    """
+    doi_pairs = ((normalize_doi(value), uid) for uid, id_type, value in
+                 table_rows(output_dir, 'item_ids', ('uid', 'identifier_type', 'identifier_value'))
+                 if id_type in DOI_IDENTIFIER_TYPES and normalize_doi(value))
+    doi_index = _unique_index(doi_pairs)
+
+    first_authors = {}
+    for uid, seq_no, name, display_name in table_rows(output_dir, 'item_authors',
+                                                      ('uid', 'seq_no', 'wos_standard', 'display_name')):
+        if seq_no == '1':
+            first_authors.setdefault(uid, name or display_name)
+    bibliographic_pairs = []
+    for uid, pubyear, volume, page in table_rows(output_dir, 'item', ('uid', 'pubyear', 'vol', 'page_begin')):
+        key = bibliographic_key(first_authors.get(uid, ''), pubyear, volume, page)
+        if key:
+            bibliographic_pairs.append((key, uid))
+    del first_authors
+    return {MATCH_DOI: doi_index,
+            MATCH_AUTHOR_YEAR_VOLUME_PAGE: _unique_index(bibliographic_pairs)}
+
+
+def _init_worker(indexes):
+    global _worker_indexes
+    _worker_indexes = indexes
+
+
+def resolve_references(references, indexes=None):
+    """
+    Resolve a chunk of references
+
+    :param references: List of (uid, occurence_order, cited_author, cited_year, cited_volume, cited_page, cited_doi)
+    :param indexes: Source indexes (default: the indexes of the worker process)
+    :return: List of (uid, cited_uid, occurence_order, match_method)
+    """
+    indexes = indexes if indexes is not None else _worker_indexes
+    doi_index, bibliographic_index = indexes[MATCH_DOI], indexes[MATCH_AUTHOR_YEAR_VOLUME_PAGE]
+    resolved = []
+    for uid, order, author, year, volume, page, doi in references:
+        cited_uid = doi and doi_index.get(normalize_doi(doi))
+        method = MATCH_DOI
+        if not cited_uid:
+            key = bibliographic_key(author, year, volume, page)
+            cited_uid = key and bibliographic_index.get(key)
+            method = MATCH_AUTHOR_YEAR_VOLUME_PAGE
+        if cited_uid and cited_uid != uid:
+            resolved.append((uid, cited_uid, order, method))
+    return resolved
+
+
+def _unlinked_chunks(output_dir, chunk_references):
+    """Chunks of the references without a WOS cited_uid"""
+    chunk = []
+    columns = ('uid', 'occurence_order', 'cited_uid', 'cited_author', 'cited_year', 'cited_volume', 'cited_page',
+               'cited_doi')
+    for uid, order, cited_uid, author, year, volume, page, doi in table_rows(output_dir, 'item_references', columns):
+        if not is_wos_citation(cited_uid):
+            chunk.append((uid, order, author, year, volume, page, doi))
+            if len(chunk) >= chunk_references:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ordered_results(executor, chunks, pending_limit):
+    """Results of resolve_references over chunks, in order, with at most pending_limit chunks in flight"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(resolve_references, chunk))
+        if len(pending) >= pending_limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def resolved_citations_sql(csv_path):
+    """SQL creating and loading the resolved_citations table"""
+    return (
+        "DROP TABLE IF EXISTS resolved_citations;\n\n"
+        "CREATE TABLE resolved_citations (\n"
+        "    uid VARCHAR(50),\n"
+        "    cited_uid VARCHAR(50),\n"
+        "    occurence_order INT,\n"
+        "    match_method VARCHAR(32),\n"
+        "    INDEX idx_uid (uid),\n"
+        "    INDEX idx_cited_uid (cited_uid)\n"
+        ");\n\n"
+        f"LOAD DATA LOCAL INFILE '{csv_path}'\n"
+        "INTO TABLE resolved_citations\n"
+        "CHARACTER SET utf8mb4\n"
+        "FIELDS TERMINATED BY ','\n"
+        "OPTIONALLY ENCLOSED BY '\"'\n"
+        "ESCAPED BY ''\n"
+        "LINES TERMINATED BY '\\r\\n'\n"
+        "IGNORE 1 LINES\n"
+        "(uid, cited_uid, @occurence_order, match_method)\n"
+        "SET occurence_order = NULLIF(@occurence_order, '');\n"
+    )
+
+
+def build_resolved_citations(output_dir=None, derived_dir=None, workers=None,
+                             chunk_references=DEFAULT_CHUNK_REFERENCES):
+    """
+    Resolve the unlinked references of an output tree
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param derived_dir: Directory of the result (default: <output_dir>/derived)
+    :param workers: Worker processes (default: CPU count); 1 resolves in this process
+    :param chunk_references: References per chunk handed to a worker
+    :return: Counter of resolved references by match method, with 'unlinked'
+    """
+    started = time.time()
+    output_dir = output_dir or OUTPUT_DIR
+    derived_dir = derived_dir or os.path.join(output_dir, DERIVED_DIR_NAME)
+    indexes = build_source_indexes(output_dir)
+    print(f"Resolving references of {output_dir}: {len(indexes[MATCH_DOI])} DOI keys, "
+          f"{len(indexes[MATCH_AUTHOR_YEAR_VOLUME_PAGE])} author/year/volume/page keys "
+          f"({time.time() - started:.1f}s)")
+
+    counts = Counter()
+    os.makedirs(derived_dir, exist_ok=True)
+    csv_path = os.path.join(derived_dir, RESOLVED_CITATIONS_FILE)
+
+    def counted(chunks):
+        for chunk in chunks:
+            counts['unlinked'] += len(chunk)
+            yield chunk
+
+    with open(csv_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        writer.writerow(RESOLVED_CITATIONS_COLUMNS)
+        chunks = counted(_unlinked_chunks(output_dir, chunk_references))
+        if workers == 1:
+            results = (resolve_references(chunk, indexes) for chunk in chunks)
+            for resolved in results:
+                writer.writerows(resolved)
+                counts.update(method for _, _, _, method in resolved)
+        else:
+            workers = workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(indexes,)) as executor:
+                for resolved in _ordered_results(executor, chunks, workers * 2):
+                    writer.writerows(resolved)
+                    counts.update(method for _, _, _, method in resolved)
+    os.replace(csv_path + '.tmp', csv_path)
+    with open(os.path.join(derived_dir, RESOLVED_CITATIONS_SQL_FILE), 'w', encoding='utf-8') as f:
+        f.write(resolved_citations_sql(os.path.abspath(csv_path)))
+
+    resolved_count = counts[MATCH_DOI] + counts[MATCH_AUTHOR_YEAR_VOLUME_PAGE]
+    print(f"Resolved citations in {csv_path}: {resolved_count} of {counts['unlinked']} unlinked references "
+          f"({counts[MATCH_DOI]} by DOI, {counts[MATCH_AUTHOR_YEAR_VOLUME_PAGE]} by author/year/volume/page, "
+          f"{time.time() - started:.1f}s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve cited references without a WOS cited_uid')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--derived-dir', default=None, help='Directory of the result '
+                                                            '(default: <output_dir>/derived)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunk-references', type=int, default=DEFAULT_CHUNK_REFERENCES,
+                        help=f'References per worker task (default: {DEFAULT_CHUNK_REFERENCES})')
+    args = parser.parse_args()
+    build_resolved_citations(args.output_dir, args.derived_dir, args.workers, args.chunk_references)
+
+
+if __name__ == "__main__":
+    main()
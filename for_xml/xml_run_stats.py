@@ -0,0 +1,376 @@
+"""
+Streaming aggregate statistics of an extraction run
+
+Papers per year, document types, top authors, countries and organizations
+(the questions of example_queries.py) otherwise need the MySQL import and
+a full scan of the tables. With --stats the extraction keeps cheap running
+aggregates of the rows it writes:
+
+- Exact counts of records by pubyear, doctype, language, edition and
+  country. A value counts once per record, like COUNT(DISTINCT uid) ...
+  GROUP BY; empty values are not counted.
+- Heavy hitters of authors (item_authors.full_name), organizations
+  (item_orgs.organization) and sources (item_source.source), kept in
+  Space-Saving summaries of DEFAULT_HEAVY_HITTER_CAPACITY values each, so
+  their memory is bounded however many distinct values there are.
+
+RunStatisticsWriter collects them in front of the usual sink and, when an
+input file is done, appends them to <output>/run_stats.jsonl (one line per
+input file; with --atomic the line is committed with the rows of the file).
+The statistics of a failed input file are dropped; without --atomic the rows
+it wrote before the failure stay in the tables, so only --atomic runs give
+statistics that always match the tables.
+All statistics merge exactly (counts) or with known error bounds (heavy
+hitters), so the lines of all workers, node shards and import batches are
+summed at the end of the run into run_summary.json and run_summary.csv:
+
+    python xml_proc_main.py data/xml_files/ --parallel --stats
+    python xml_run_stats.py xml_output          # summary of a whole output tree
+
+Heavy-hitter error bounds: every listed value has a count c and an error
+e, and its true number of records lies in [c - e, c]; a value that is not
+listed has at most `floor` records, and e <= floor. For the summary of one
+input file floor <= N / k (N values counted, k the capacity); merging adds
+up the floors of the merged summaries, so values well above the summed
+floor are always listed. Records rewritten by --delta runs are counted
+again.
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import OUTPUT_DIR
+
+RUN_STATS_FILE = "run_stats.jsonl"
+RUN_SUMMARY_FILE = "run_summary.json"
+RUN_SUMMARY_CSV_FILE = "run_summary.csv"
+
+# Counted statistic -> (table, column)
+COUNTED_COLUMNS = {
+    'pubyear': ('item', 'pubyear'),
+    'doctype': ('item_doc_types', 'doctype'),
+    'language': ('item_langs', 'language'),
+    'edition': ('item_editions', 'edition'),
+    'country': ('item_addresses', 'country'),
+}
+
+# Heavy-hitter statistic -> (table, column)
+HEAVY_HITTER_COLUMNS = {
+    'author': ('item_authors', 'full_name'),
+    'organization': ('item_orgs', 'organization'),
+    'source': ('item_source', 'source'),
+}
+
+DEFAULT_HEAVY_HITTER_CAPACITY = 1000
+
+# Heavy hitters listed in the summary
+DEFAULT_SUMMARY_TOP = 100
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary (Metwally et al.) of at most capacity values
+
+    Every tracked value has an upper bound count and an error, with the true
+    count in [count - error, count]; values that are not tracked have a true
+    count of at most floor.
+    """
+
+    def __init__(self, capacity=DEFAULT_HEAVY_HITTER_CAPACITY):
+        """
+        Initialize an empty summary
+
+        :param capacity: Number of values tracked
+        """
+        self.capacity = max(1, capacity)
+        self.counters = {}
+        self.floor = 0
+        self.total = 0
+        # One (count, value) entry per tracked value; the count may lag behind (see _pop_min)
+        self._heap = []
+
+    def _pop_min(self):
+        """Remove the tracked value with the smallest count and return its count"""
+        while True:
+            count, value = self._heap[0]
+            current = self.counters[value][0]
+            if count == current:
+                heapq.heappop(self._heap)
+                del self.counters[value]
+                return count
+            heapq.heapreplace(self._heap, (current, value))
+
+    def add(self, value, weight=1):
+        """
+        Count weight occurrences of a value
+
+        :param value: Value (str)
+        :param weight: Number of occurrences
+        """
+        self.total += weight
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += weight
+            return
+        if len(self.counters) >= self.capacity:
+            # The evicted value occurred at most its count times; a new value inherits that bound
+            self.floor = max(self.floor, self._pop_min())
+        self.counters[value] = [self.floor + weight, self.floor]
+        heapq.heappush(self._heap, (self.floor + weight, value))
+
+    def merge(self, other):
+        """
+        Add the counts of another summary
+
+        A value missing from one summary is counted with that summary's floor,
+        both as count and as error, so the bounds stay valid.
+
+        :param other: SpaceSaving summary
+        """
+        counters = {}
+        for value in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(value, (self.floor, self.floor))
+            other_count, other_error = other.counters.get(value, (other.floor, other.floor))
+            counters[value] = [count + other_count, error + other_error]
+        floor = self.floor + other.floor
+        if len(counters) > self.capacity:
+            ranked = sorted(counters.items(), key=lambda item: (-item[1][0], item[0]))
+            floor = max(floor, ranked[self.capacity][1][0])
+            counters = dict(ranked[:self.capacity])
+        self.counters = counters
+        self.floor = floor
+        self.total += other.total
+        self._heap = [(count, value) for value, (count, _) in counters.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n=None):
+        """
+        Values with the largest counts
+
+        :param n: Number of values (default: all tracked)
+        :return: List of (value, count, error)
+        """
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(value, count, error) for value, (count, error) in ranked[:n]]
+
+    def to_dict(self):
+        """JSON form of the summary"""
+        return {'capacity': self.capacity, 'floor': self.floor, 'total': self.total, 'counters': self.top()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Summary from its to_dict() form"""
+        summary = cls(data['capacity'])
+        summary.floor = data['floor']
+        summary.total = data['total']
+        summary.counters = {value: [count, error] for value, count, error in data['counters']}
+        summary._heap = [(count, value) for value, count, _ in data['counters']]
+        heapq.heapify(summary._heap)
+        return summary
+
+
+def _record_values(batch, table_name, column):
+    """Counter of the non-empty values of a column, every value counted once per record"""
+    columns = batch.columns[table_name]
+    values = columns[batch.tables[table_name].index(column)]
+    return Counter(value for _, value in set(zip(columns[0], values)) if value)
+
+
+class RunStatistics:
+    """Counts and heavy hitters of the records of a run"""
+
+    def __init__(self, capacity=DEFAULT_HEAVY_HITTER_CAPACITY):
+        self.records = 0
+        self.counts = {name: Counter() for name in COUNTED_COLUMNS}
+        self.heavy_hitters = {name: SpaceSaving(capacity) for name in HEAVY_HITTER_COLUMNS}
+
+    def add_batch(self, batch):
+        """
+        Count the records of a batch
+
+        :param batch: RecordBatch with XML_TABLE_COLUMNS tables
+        """
+        self.records += len(batch)
+        for name, (table_name, column) in COUNTED_COLUMNS.items():
+            self.counts[name].update(_record_values(batch, table_name, column))
+        for name, (table_name, column) in HEAVY_HITTER_COLUMNS.items():
+            summary = self.heavy_hitters[name]
+            for value, count in _record_values(batch, table_name, column).items():
+                summary.add(value, count)
+
+    def merge(self, other):
+        """Add the statistics of another RunStatistics"""
+        self.records += other.records
+        for name, counts in other.counts.items():
+            self.counts.setdefault(name, Counter()).update(counts)
+        for name, summary in other.heavy_hitters.items():
+            if name in self.heavy_hitters:
+                self.heavy_hitters[name].merge(summary)
+            else:
+                self.heavy_hitters[name] = summary
+
+    def to_dict(self):
+        """JSON form of the statistics"""
+        return {'records': self.records,
+                'counts': {name: dict(counts) for name, counts in self.counts.items()},
+                'heavy_hitters': {name: summary.to_dict() for name, summary in self.heavy_hitters.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Statistics from their to_dict() form"""
+        statistics = cls()
+        statistics.records = data['records']
+        statistics.counts = {name: Counter(counts) for name, counts in data['counts'].items()}
+        statistics.heavy_hitters = {name: SpaceSaving.from_dict(summary)
+                                    for name, summary in data['heavy_hitters'].items()}
+        return statistics
+
+
+class RunStatisticsWriter:
+    """RecordBatch sink counting the records of an input file in front of an inner sink"""
+
+    def __init__(self, output_dir=None, sink_class=None):
+        """
+        Initialize the counting sink
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param sink_class: Inner sink class, built as sink_class(output_dir)
+                           (default: XMLDataWriter)
+        """
+        if sink_class is None:
+            from csv_writer import XMLDataWriter
+            sink_class = XMLDataWriter
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.sink = sink_class(self.output_dir)
+        self.statistics = RunStatistics()
+
+    @property
+    def buffered(self):
+        return getattr(self.sink, 'buffered', False)
+
+    @property
+    def deferred(self):
+        return getattr(self.sink, 'deferred', False)
+
+    def write_batch(self, batch):
+        """
+        Count and write the records of a batch
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        # Counted first: inner sinks may replace the columns (see xml_dimensions)
+        self.statistics.add_batch(batch)
+        self.sink.write_batch(batch)
+
+    def commit(self, commit_info):
+        """Hand the commit to the inner sink"""
+        if hasattr(self.sink, 'commit'):
+            self.sink.commit(commit_info)
+
+    def close(self):
+        """Close the inner sink and append the statistics of the input file to run_stats.jsonl"""
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+        if not self.statistics.records:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        line = (json.dumps(self.statistics.to_dict(), sort_keys=True) + "\n").encode('utf-8')
+        # Unbuffered: the line is appended by a single write and does not interleave with other workers
+        with open(os.path.join(self.output_dir, RUN_STATS_FILE), 'ab', buffering=0) as f:
+            f.write(line)
+        self.statistics = RunStatistics()
+
+    def discard(self):
+        """Drop the statistics of a failed input file"""
+        self.statistics = RunStatistics()
+        if hasattr(self.sink, 'discard'):
+            self.sink.discard()
+
+
+def run_stats_paths(output_dir):
+    """run_stats.jsonl files of an output tree (node shards and import batches included)"""
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(output_dir):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+        if RUN_STATS_FILE in file_names:
+            paths.append(os.path.join(dir_path, RUN_STATS_FILE))
+    return paths
+
+
+def load_run_statistics(output_dir):
+    """Merged RunStatistics of all run_stats.jsonl files of an output tree"""
+    statistics = RunStatistics()
+    for path in run_stats_paths(output_dir):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    statistics.merge(RunStatistics.from_dict(json.loads(line)))
+    return statistics
+
+
+def _sorted_counts(counts):
+    """Counts by value, years and other numbers in numeric order"""
+    return dict(sorted(counts.items(), key=lambda item: (not item[0].isdigit(), int(item[0]) if item[0].isdigit()
+                                                         else 0, item[0])))
+
+
+def build_run_summary(output_dir=None, top=DEFAULT_SUMMARY_TOP):
+    """
+    Write run_summary.json and run_summary.csv from the statistics of an output tree
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param top: Heavy hitters listed per statistic
+    :return: The summary dictionary
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    statistics = load_run_statistics(output_dir)
+    summary = {
+        'updated': datetime.now().isoformat(),
+        'records': statistics.records,
+        'counts': {name: _sorted_counts(counts) for name, counts in statistics.counts.items()},
+        'heavy_hitters': {
+            name: {'capacity': heavy_hitters.capacity, 'floor': heavy_hitters.floor, 'total': heavy_hitters.total,
+                   'top': [{'value': value, 'count': count, 'error': error}
+                           for value, count, error in heavy_hitters.top(top)]}
+            for name, heavy_hitters in statistics.heavy_hitters.items()
+        },
+    }
+
+    summary_path = os.path.join(output_dir, RUN_SUMMARY_FILE)
+    with open(summary_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    os.replace(summary_path + '.tmp', summary_path)
+
+    csv_path = os.path.join(output_dir, RUN_SUMMARY_CSV_FILE)
+    with open(csv_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        writer.writerow(('statistic', 'value', 'count', 'error'))
+        writer.writerow(('records', '', statistics.records, 0))
+        for name, counts in summary['counts'].items():
+            writer.writerows((name, value, count, 0) for value, count in counts.items())
+        for name, heavy_hitters in summary['heavy_hitters'].items():
+            writer.writerows((name, entry['value'], entry['count'], entry['error'])
+                             for entry in heavy_hitters['top'])
+    os.replace(csv_path + '.tmp', csv_path)
+
+    print(f"\nRun summary: {summary_path} ({statistics.records} records)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summary of the --stats statistics of an output tree')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--top', type=int, default=DEFAULT_SUMMARY_TOP,
+                        help=f'Heavy hitters listed per statistic (default: {DEFAULT_SUMMARY_TOP})')
+    args = parser.parse_args()
+    build_run_summary(args.output_dir, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Heavy-hitter sketches of keywords, cited works and organizations
+
+Exact top-K lists of item_keywords.keyword, item_keywords_plus.keyword_plus,
+item_references.cited_work and item_orgs.organization need a GROUP BY over
+billions of rows. With --sketches every worker keeps, per column, a
+Count-Min sketch (frequency estimate of any value) and a Space-Saving
+summary (the candidate heavy hitters, see xml_run_stats.SpaceSaving) of
+the rows it writes; both have a fixed size and merge by addition.
+
+- A value counts once per row, like COUNT(*) ... GROUP BY value; empty
+  values are not counted.
+- Every process keeps one set of sketches per output directory. The values
+  of the input file in flight are only counted (Counter) and added to the
+  process sketches when the file is done, or dropped if it fails.
+- The process sketches are saved to <output>/sketches/<host>-<pid>-<id>.npz
+  every SKETCH_SAVE_INTERVAL input files and when the process exits; at the
+  end of the run all shards are merged into <output>/sketches.npz.
+- The sketches are estimates and are not committed with the rows: the rows
+  written before a failure stay in the tables without --atomic, and a killed
+  worker loses the counts of the files since its last save. Use --stats with
+  --atomic (xml_run_stats) for counts that always match the tables.
+
+    python xml_proc_main.py data/xml_files/ --parallel --sketches
+    python xml_sketches.py merge xml_output node_shards/ -o all.npz
+    python xml_sketches.py top xml_output/sketches.npz cited_work -k 20
+    python xml_sketches.py estimate xml_output/sketches.npz keyword "GRAPHENE" "DEEP LEARNING"
+
+Error bounds (N: rows counted for a column, w: width, d: depth, k: capacity):
+
+- Count-Min: the estimate of a value never undercounts it, and exceeds the
+  true count by at most e / w * N with probability 1 - exp(-d). The
+  defaults w = 2^18 and d = 4 give at most 1.04e-5 * N (about 10,400 on
+  10^9 rows) with probability 98.2%, in 8 MiB per column.
+- Space-Saving: a listed value's true count is at least count - error; a
+  value that is not listed occurs at most floor times, floor <= N / k for
+  one summary and the sum of the floors for merged ones.
+- Reported ranges are [lower, upper] with upper the smaller of both upper
+  bounds.
+
+Merged sketches must have the same width and depth. Requires numpy.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import socket
+import uuid
+from collections import Counter
+from multiprocessing import util as multiprocessing_util
+
+from xml_common_def import OUTPUT_DIR
+from xml_optional_deps import optional_import, require
+from xml_run_stats import SpaceSaving
+
+np = optional_import('numpy')
+
+SKETCH_DIR_NAME = "sketches"
+MERGED_SKETCH_FILE = "sketches.npz"
+
+# Sketched column -> (table, column)
+SKETCH_COLUMNS = {
+    'keyword': ('item_keywords', 'keyword'),
+    'keyword_plus': ('item_keywords_plus', 'keyword_plus'),
+    'cited_work': ('item_references', 'cited_work'),
+    'organization': ('item_orgs', 'organization'),
+}
+
+DEFAULT_WIDTH = 1 << 18
+DEFAULT_DEPTH = 4
+DEFAULT_CAPACITY = 1000
+
+# Input files added to the sketches of a process between two saves of its shard
+SKETCH_SAVE_INTERVAL = 100
+
+# Sketches of this process by output directory, added to when an input file is done
+_PROCESS_SKETCHES = {}
+# Input files added since the last save, by the same keys
+_UNSAVED_FILES = {}
+_SHARD_IDS = {}
+
+
+class CountMinSketch:
+    """Count-Min sketch (Cormode and Muthukrishnan) of depth rows of width counters"""
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH):
+        """
+        Initialize an empty sketch
+
+        :param width: Counters per row; the error is at most e / width of the total count
+        :param depth: Rows; the error bound fails with probability exp(-depth)
+        """
+        require(np, 'numpy')
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    @property
+    def width(self):
+        return self.table.shape[1]
+
+    @property
+    def depth(self):
+        return self.table.shape[0]
+
+    @property
+    def epsilon(self):
+        """Error bound as a fraction of the total count"""
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        """Probability that the error bound does not hold"""
+        return math.exp(-self.depth)
+
+    def _columns(self, values):
+        """Counter of every value in every row (depth x len(values)), from one 64-bit hash per value"""
+        hashes = np.array([int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+                           for value in values], dtype=np.uint64)
+        low = hashes & np.uint64(0xFFFFFFFF)
+        # Odd step: the rows of a value never share a counter sequence with an even period
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return (low[None, :] + rows * high[None, :]) % np.uint64(self.width)
+
+    def add(self, counts):
+        """
+        Count several values
+
+        :param counts: Mapping of value to number of occurrences
+        """
+        if not counts:
+            return
+        values = list(counts)
+        weights = np.fromiter((counts[value] for value in values), dtype=np.int64, count=len(values))
+        columns = self._columns(values).astype(np.intp)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], weights)
+        self.total += int(weights.sum())
+
+    def estimate(self, value):
+        """Upper bound of the occurrences of a value"""
+        columns = self._columns([value])[:, 0].astype(np.intp)
+        return int(self.table[np.arange(self.depth), columns].min())
+
+    def merge(self, other):
+        """Add the counts of a sketch of the same shape"""
+        if self.table.shape != other.table.shape:
+            raise ValueError(f"Cannot merge Count-Min sketches of shapes {self.table.shape} and {other.table.shape}")
+        self.table += other.table
+        self.total += other.total
+
+
+class ColumnSketch:
+    """Count-Min sketch and Space-Saving summary of one column"""
+
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, capacity=DEFAULT_CAPACITY):
+        self.count_min = CountMinSketch(width, depth)
+        self.heavy_hitters = SpaceSaving(capacity)
+
+    def add(self, counts):
+        """
+        Count several values
+
+        :param counts: Mapping of value to number of occurrences
+        """
+        self.count_min.add(counts)
+        for value, count in counts.items():
+            self.heavy_hitters.add(value, count)
+
+    def merge(self, other):
+        """Add the counts of another ColumnSketch"""
+        self.count_min.merge(other.count_min)
+        self.heavy_hitters.merge(other.heavy_hitters)
+
+    def estimate(self, value):
+        """
+        Bounds of the occurrences of a value
+
+        :return: (lower, upper); upper holds with probability 1 - delta
+        """
+        upper = self.count_min.estimate(value)
+        counter = self.heavy_hitters.counters.get(value)
+        if counter is None:
+            return 0, min(upper, self.heavy_hitters.floor)
+        count, error = counter
+        return count - error, min(upper, count)
+
+    def top(self, k):
+        """
+        Most frequent values
+
+        :param k: Number of values
+        :return: List of (value, lower, upper), by upper bound
+        """
+        ranked = [(value,) + self.estimate(value) for value in self.heavy_hitters.counters]
+        ranked.sort(key=lambda entry: (-entry[2], -entry[1], entry[0]))
+        return ranked[:k]
+
+
+def new_sketches(width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, capacity=DEFAULT_CAPACITY):
+    """Empty sketches of all SKETCH_COLUMNS"""
+    return {name: ColumnSketch(width, depth, capacity) for name in SKETCH_COLUMNS}
+
+
+def merge_sketches(sketches, other):
+    """Add the sketches of other to sketches (both {name: ColumnSketch})"""
+    for name, sketch in other.items():
+        if name in sketches:
+            sketches[name].merge(sketch)
+        else:
+            sketches[name] = sketch
+
+
+def save_sketches(path, sketches):
+    """Save sketches to a .npz file through a temporary file"""
+    meta = {name: {'total': sketch.count_min.total, 'space_saving': sketch.heavy_hitters.to_dict()}
+            for name, sketch in sketches.items()}
+    arrays = {name: sketch.count_min.table for name, sketch in sketches.items()}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(path + '.tmp', path)
+
+
+def load_sketches(path):
+    """Sketches saved by save_sketches: {name: ColumnSketch}"""
+    require(np, 'numpy')
+    sketches = {}
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        for name, entry in meta.items():
+            sketch = ColumnSketch.__new__(ColumnSketch)
+            sketch.count_min = CountMinSketch.__new__(CountMinSketch)
+            sketch.count_min.table = data[name]
+            sketch.count_min.total = entry['total']
+            sketch.heavy_hitters = SpaceSaving.from_dict(entry['space_saving'])
+            sketches[name] = sketch
+    return sketches
+
+
+def _batch_counts(batch, table_name, column):
+    """Counter of the non-empty values of a column of a RecordBatch"""
+    return Counter(value for value in batch.columns[table_name][batch.tables[table_name].index(column)] if value)
+
+
+def _shard_path(output_dir):
+    """Shard file of this process"""
+    shard_id = _SHARD_IDS.get(os.getpid())
+    if shard_id is None:
+        shard_id = _SHARD_IDS[os.getpid()] = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return os.path.join(output_dir, SKETCH_DIR_NAME, shard_id + '.npz')
+
+
+def save_process_sketches():
+    """Save the sketches of this process that changed since their last save"""
+    pid = os.getpid()
+    for key in [key for key in _PROCESS_SKETCHES if key[0] == pid]:
+        if _UNSAVED_FILES.get(key):
+            save_sketches(_shard_path(key[1]), _PROCESS_SKETCHES[key])
+            _UNSAVED_FILES[key] = 0
+
+
+def _process_sketches(output_dir):
+    """Sketches of this process for an output directory, created on first use"""
+    pid = os.getpid()
+    key = (pid, os.path.abspath(output_dir))
+    if key not in _PROCESS_SKETCHES:
+        if not any(existing[0] == pid for existing in _PROCESS_SKETCHES):
+            # Worker processes save their shards when they exit (multiprocessing runs
+            # finalizers on a normal exit, unlike atexit handlers)
+            multiprocessing_util.Finalize(None, save_process_sketches, exitpriority=10)
+        _PROCESS_SKETCHES[key] = new_sketches()
+        _UNSAVED_FILES[key] = 0
+    return key, _PROCESS_SKETCHES[key]
+
+
+class SketchWriter:
+    """RecordBatch sink sketching the columns of SKETCH_COLUMNS in front of an inner sink"""
+
+    def __init__(self, output_dir=None, sink_class=None):
+        """
+        Initialize the sketching sink
+
+        :param output_dir: Optional directory replacing the default output directory
+        :param sink_class: Inner sink class, built as sink_class(output_dir)
+                           (default: XMLDataWriter)
+        """
+        require(np, 'numpy')
+        if sink_class is None:
+            from csv_writer import XMLDataWriter
+            sink_class = XMLDataWriter
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.sink = sink_class(self.output_dir)
+        self.counts = None
+
+    @property
+    def buffered(self):
+        return getattr(self.sink, 'buffered', False)
+
+    @property
+    def deferred(self):
+        return getattr(self.sink, 'deferred', False)
+
+    def write_batch(self, batch):
+        """
+        Sketch and write the rows of a batch
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        if self.counts is None:
+            self.counts = {name: Counter() for name in SKETCH_COLUMNS}
+        for name, (table_name, column) in SKETCH_COLUMNS.items():
+            self.counts[name].update(_batch_counts(batch, table_name, column))
+        self.sink.write_batch(batch)
+
+    def commit(self, commit_info):
+        """Hand the commit to the inner sink"""
+        if hasattr(self.sink, 'commit'):
+            self.sink.commit(commit_info)
+
+    def close(self):
+        """Close the inner sink and add the counts of the file to the sketches of the process"""
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+        if self.counts is None:
+            return
+        key, process_sketches = _process_sketches(self.output_dir)
+        for name, counts in self.counts.items():
+            process_sketches[name].add(counts)
+        self.counts = None
+        _UNSAVED_FILES[key] += 1
+        if _UNSAVED_FILES[key] >= SKETCH_SAVE_INTERVAL:
+            save_process_sketches()
+
+    def discard(self):
+        """Drop the counts of a failed input file"""
+        self.counts = None
+        if hasattr(self.sink, 'discard'):
+            self.sink.discard()
+
+
+def sketch_paths(paths):
+    """
+    Sketch files of paths: .npz files, and the shards in the sketches
+    directories of output trees (node shards and import batches included)
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            if os.path.basename(dir_path) == SKETCH_DIR_NAME:
+                files.extend(os.path.join(dir_path, name) for name in sorted(file_names) if name.endswith('.npz'))
+    return files
+
+
+def combine_sketches(paths):
+    """Merged sketches of the sketch files of paths (see sketch_paths)"""
+    sketches = {}
+    for path in sketch_paths(paths):
+        merge_sketches(sketches, load_sketches(path))
+    return sketches
+
+
+def build_merged_sketches(output_dir=None, merged_path=None):
+    """
+    Merge the shards of an output tree into one file
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param merged_path: Merged file (default: <output_dir>/sketches.npz)
+    :return: The merged sketches
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    merged_path = merged_path or os.path.join(output_dir, MERGED_SKETCH_FILE)
+    # Shards of this process (sequential runs); workers saved theirs when they exited
+    save_process_sketches()
+    shard_count = len(sketch_paths([output_dir]))
+    sketches = combine_sketches([output_dir])
+    if sketches:
+        save_sketches(merged_path, sketches)
+        print(f"\nSketches: {shard_count} shards merged into {merged_path} ("
+              + ", ".join(f"{name} {sketch.count_min.total} rows" for name, sketch in sketches.items()) + ")")
+    return sketches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Heavy-hitter sketches of keywords, cited works and organizations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge_parser = subparsers.add_parser('merge', help='Merge sketch files and output trees into one file')
+    merge_parser.add_argument('paths', nargs='+', help='.npz sketch files or output directories')
+    merge_parser.add_argument('-o', '--output', required=True, help='Merged .npz file')
+    top_parser = subparsers.add_parser('top', help='Print the approximate top-K values of a column')
+    top_parser.add_argument('path', help='.npz sketch file or output directory')
+    top_parser.add_argument('column', choices=sorted(SKETCH_COLUMNS))
+    top_parser.add_argument('-k', type=int, default=20, help='Number of values (default: 20)')
+    estimate_parser = subparsers.add_parser('estimate', help='Print the estimated counts of values')
+    estimate_parser.add_argument('path', help='.npz sketch file or output directory')
+    estimate_parser.add_argument('column', choices=sorted(SKETCH_COLUMNS))
+    estimate_parser.add_argument('values', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        sketches = combine_sketches(args.paths)
+        save_sketches(args.output, sketches)
+        print(f"Merged {len(sketch_paths(args.paths))} sketch files into {args.output}")
+        return
+    sketch = combine_sketches([args.path]).get(args.column)
+    if sketch is None:
+        print(f"No {args.column} sketch in {args.path}")
+        return
+    count_min = sketch.count_min
+    print(f"{args.column}: {count_min.total} rows; Count-Min error <= {count_min.epsilon * count_min.total:.0f} "
+          f"with probability {1 - count_min.delta:.3f}; values not tracked <= {sketch.heavy_hitters.floor}")
+    entries = sketch.top(args.k) if args.command == 'top' else [(value,) + sketch.estimate(value)
+                                                                 for value in args.values]
+    for value, lower, upper in entries:
+        print(f"{value}\t{lower}\t{upper}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+UID-sorted output tables by external merge sort
+
+Parallel runs write rows in the order the workers finish their batches.
+MySQL and SQLite load faster and build idx_uid far more cheaply when rows
+arrive in key order, so this post-processing stage sorts every table file
+of an output directory by (uid, order columns) within a memory budget:
+
+- A table is read in runs of at most the memory budget; each run is sorted
+  in memory and, if the table does not fit in one run, written to a
+  temporary run file.
+- The run files are merged with a k-way merge (heapq.merge), in several
+  passes above MAX_MERGE_FANIN runs, into the sorted table, which replaces
+  the original file atomically. Rows with equal keys keep their order.
+- Tables are sorted in parallel, each job with its share of the budget;
+  the temporary space used is reported per table.
+
+The order columns are the sequence columns a table has (occurence_order,
+seq_no, addr_no, address_no), compared as numbers. Plain, .gz and .zst
+table files are sorted and keep their compression, rewritten at the level
+given with --compress-level (default: DEFAULT_COMPRESSION_LEVELS, as the
+writers). UID indexes (xml_uid_index) of sorted tables are rebuilt.
+
+Tables written as part files (table.00001.csv: --atomic and the
+--max-part-mb/--max-part-rows caps) are not sorted: their parts are listed
+in part logs and load manifests by row count and checksum. An output tree
+with part files is rejected with an error instead of being reported as
+sorted.
+
+    python xml_sort_tables.py xml_output [--memory-mb 1024] [--jobs 4] [--temp-dir /scratch] [--compress-level 3]
+"""
+
+import argparse
+import csv
+import heapq
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from csv_writer import CSV_DIALECT, open_csv_file
+from xml_common_def import OUTPUT_DIR, XML_TABLE_NAMES
+from xml_derived_tables import DERIVED_DIR_NAME
+from xml_import_batches import BATCHES_DIR_NAME
+from xml_uid_index import UID_INDEX_LOG_SUFFIX, build_uid_indexes, index_table_file
+
+DEFAULT_MEMORY_MB = 1024
+
+# Sequence columns ordering the rows of one record, in key order
+SORT_ORDER_COLUMNS = ('occurence_order', 'seq_no', 'addr_no', 'address_no')
+
+# Python rows take several times the memory of their CSV text
+ROW_MEMORY_FACTOR = 4
+
+# Run files merged at once; more runs are first merged in passes
+MAX_MERGE_FANIN = 128
+
+_TABLE_FILE_PATTERN = re.compile(r'^(\w+)\.csv(\.gz|\.zst)?$')
+_PART_FILE_PATTERN = re.compile(r'^(\w+)\.\d+\.csv(\.gz|\.zst)?$')
+
+# Directories of an output tree whose table files are not sorted: tombstones,
+# import batches (loaded as written), derived tables and Parquet parts. Dot
+# directories (.staging, .commits) hold files of uncommitted or unmerged commits.
+_SKIPPED_DIR_NAMES = ('tombstones', BATCHES_DIR_NAME, DERIVED_DIR_NAME, 'parquet')
+
+
+def _order_value(value):
+    """Order of a sequence column value: numbers first, by value, then text"""
+    return (0, int(value), '') if value.isdigit() else (1, 0, value)
+
+
+def sort_key_function(headers):
+    """
+    Sort key of the rows of a table
+
+    :param headers: Header row of the table
+    :return: Function of a row to (uid, order values...)
+    """
+    uid_index = headers.index('uid')
+    order_indexes = [headers.index(column) for column in SORT_ORDER_COLUMNS if column in headers]
+
+    def sort_key(row):
+        return (row[uid_index],) + tuple(_order_value(row[index]) for index in order_indexes)
+    return sort_key
+
+
+def _write_rows(file_path, headers, rows, compression_level=None):
+    with open_csv_file(file_path, 'w', compression_level) as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        if headers is not None:
+            writer.writerow(headers)
+        writer.writerows(rows)
+
+
+def _read_rows(file_path):
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.reader(f, dialect=CSV_DIALECT)
+
+
+def sort_table_file(file_path, memory_bytes=DEFAULT_MEMORY_MB * 1024 * 1024, temp_dir=None,
+                    compression_level=None):
+    """
+    Sort one table file in place by (uid, order columns)
+
+    :param file_path: Table CSV file (plain, .gz or .zst)
+    :param memory_bytes: Memory budget of the sort
+    :param temp_dir: Directory for the run files (default: next to the table)
+    :param compression_level: Level of a compressed table (default: DEFAULT_COMPRESSION_LEVELS)
+    :return: Dictionary with rows, runs, temp_bytes and seconds
+    """
+    started = time.time()
+    run_bytes = max(memory_bytes // ROW_MEMORY_FACTOR, 1)
+    run_dir = tempfile.mkdtemp(prefix='sort-' + os.path.basename(file_path) + '-',
+                               dir=temp_dir or os.path.dirname(os.path.abspath(file_path)))
+    sorted_path = os.path.join(os.path.dirname(file_path), '.sorted-' + os.path.basename(file_path))
+    run_paths = []
+    temp_bytes = 0
+    rows_total = 0
+    try:
+        with open_csv_file(file_path) as f:
+            reader = csv.reader(f, dialect=CSV_DIALECT)
+            headers = next(reader, None)
+            if headers is None:
+                return {'rows': 0, 'runs': 0, 'temp_bytes': 0, 'seconds': time.time() - started}
+            sort_key = sort_key_function(headers)
+            run, size = [], 0
+            for row in reader:
+                run.append(row)
+                size += sum(map(len, row)) + len(row)
+                if size >= run_bytes:
+                    run.sort(key=sort_key)
+                    run_path = os.path.join(run_dir, f"run-{len(run_paths):05d}.csv")
+                    _write_rows(run_path, None, run)
+                    run_paths.append(run_path)
+                    temp_bytes += os.path.getsize(run_path)
+                    rows_total += len(run)
+                    run, size = [], 0
+            run.sort(key=sort_key)
+            rows_total += len(run)
+        runs = len(run_paths) + 1
+
+        while len(run_paths) > MAX_MERGE_FANIN:
+            # Merge pass: the oldest runs become one longer run
+            merged_path = os.path.join(run_dir, f"run-{len(run_paths):05d}-merged.csv")
+            _write_rows(merged_path, None, heapq.merge(*[_read_rows(run_path)
+                                                         for run_path in run_paths[:MAX_MERGE_FANIN]],
+                                                       key=sort_key))
+            temp_bytes += os.path.getsize(merged_path)
+            for run_path in run_paths[:MAX_MERGE_FANIN]:
+                os.remove(run_path)
+            run_paths = [merged_path] + run_paths[MAX_MERGE_FANIN:]
+
+        if run_paths:
+            # The last run stays in memory as one more input of the merge
+            rows = heapq.merge(*[_read_rows(run_path) for run_path in run_paths], iter(run), key=sort_key)
+        else:
+            rows = run
+        # Next to the table (same file system, same compression suffix)
+        _write_rows(sorted_path, headers, rows, compression_level)
+        temp_bytes += os.path.getsize(sorted_path)
+        os.replace(sorted_path, file_path)
+        if os.path.exists(file_path + UID_INDEX_LOG_SUFFIX):
+            # The rows moved: the UID index is rebuilt from the sorted table
+            index_table_file(file_path)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        if os.path.exists(sorted_path):
+            os.remove(sorted_path)
+    return {'rows': rows_total, 'runs': runs, 'temp_bytes': temp_bytes,
+            'seconds': time.time() - started}
+
+
+def table_files(output_dir=None):
+    """
+    Unsplit table files of an output tree (including partition and node
+    shard directories), largest first so the long sorts start early
+
+    :raises ValueError: if tables of the tree are written as part files
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    files = []
+    part_dirs = set()
+    for dir_path, dir_names, file_names in os.walk(output_dir):
+        dir_names[:] = [name for name in dir_names if name not in _SKIPPED_DIR_NAMES and not name.startswith('.')]
+        for file_name in file_names:
+            match = _TABLE_FILE_PATTERN.match(file_name)
+            if match and match.group(1) in XML_TABLE_NAMES:
+                file_path = os.path.join(dir_path, file_name)
+                files.append((os.path.getsize(file_path), file_path))
+            match = _PART_FILE_PATTERN.match(file_name)
+            if match and match.group(1) in XML_TABLE_NAMES:
+                part_dirs.add(dir_path)
+    if part_dirs:
+        raise ValueError(f"Cannot sort part files (table.00001.csv, written by --atomic or part caps) in "
+                         f"{', '.join(sorted(part_dirs))}; sort output written without them")
+    return [file_path for _, file_path in sorted(files, reverse=True)]
+
+
+def sort_output_tables(output_dir=None, memory_mb=DEFAULT_MEMORY_MB, jobs=None, temp_dir=None,
+                       compression_level=None):
+    """
+    Sort every table file of an output directory, tables in parallel
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param memory_mb: Total memory budget, shared by the parallel jobs
+    :param jobs: Tables sorted at the same time (default: CPU count)
+    :param temp_dir: Directory for run files (default: the output directory)
+    :param compression_level: Level of compressed tables (default: DEFAULT_COMPRESSION_LEVELS)
+    :return: Dictionary of file path to sort statistics
+    """
+    files = table_files(output_dir)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files) or 1))
+    memory_bytes = memory_mb * 1024 * 1024 // jobs
+    print(f"Sorting {len(files)} tables by uid with {jobs} jobs, {memory_mb} MB memory budget")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {file_path: executor.submit(sort_table_file, file_path, memory_bytes, temp_dir,
+                                              compression_level)
+                   for file_path in files}
+        for file_path, future in futures.items():
+            result = results[file_path] = future.result()
+            print(f"  {os.path.relpath(file_path, output_dir or OUTPUT_DIR)}: {result['rows']} rows, {result['runs']} runs, "
+                  f"{result['temp_bytes'] / 1024 / 1024:.1f} MB temp, {result['seconds']:.1f}s")
+
+    # Jobs run concurrently, so the peak is at most the largest `jobs` tables together
+    peaks = sorted((result['temp_bytes'] for result in results.values()), reverse=True)
+    print(f"Temporary space: {sum(peaks) / 1024 / 1024:.1f} MB written, "
+          f"peak at most {sum(peaks[:jobs]) / 1024 / 1024:.1f} MB")
+    build_uid_indexes(output_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sort the table files of an output directory by uid')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'Total memory budget in MB (default: {DEFAULT_MEMORY_MB})')
+    parser.add_argument('--jobs', type=int, default=None, help='Tables sorted in parallel (default: CPU count)')
+    parser.add_argument('--temp-dir', default=None, help='Directory for the sorted runs (default: output directory)')
+    parser.add_argument('--compress-level', type=int, default=None,
+                        help='Compression level of .gz/.zst tables (default: 3, as xml_proc_main.py)')
+    args = parser.parse_args()
+    try:
+        sort_output_tables(args.output_dir, args.memory_mb, args.jobs, args.temp_dir, args.compress_level)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
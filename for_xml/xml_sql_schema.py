@@ -0,0 +1,88 @@
+"""
+Table definitions of the output tables, read from create_database_and_tables.sql
+
+The MySQL schema is the single place where column types, indexes and
+foreign keys are declared. Typed output sinks (Parquet, SQLite, ...) read
+them from there instead of keeping a second copy of the schema in Python.
+"""
+
+import os
+import re
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+SQL_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create_database_and_tables.sql')
+
+_CREATE_TABLE_PATTERN = re.compile(r'CREATE TABLE IF NOT EXISTS (\w+) \((.*?)\n\)', re.DOTALL)
+_COLUMN_PATTERN = re.compile(r'(\w+)\s+(\w+(?:\s*\([^)]*\))?)(.*)')
+_INDEX_PATTERN = re.compile(r'(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\((.*)\)$', re.IGNORECASE)
+_FOREIGN_KEY_PATTERN = re.compile(r'FOREIGN KEY\s*\(([^)]*)\)\s*REFERENCES\s+(\w+)\s*\(([^)]*)\)(.*)', re.IGNORECASE)
+
+# First words of CREATE TABLE body lines that are not column definitions
+_NON_COLUMN_WORDS = {'INDEX', 'KEY', 'UNIQUE', 'PRIMARY', 'FOREIGN', 'FULLTEXT', 'CONSTRAINT'}
+
+# columns: [(name, type)], types upper-case with parameters, e.g. ('vol', 'VARCHAR(50)')
+# indexes: [(name, [column, ...], unique)], MySQL prefix lengths removed
+# foreign_keys: [([column, ...], parent_table, [parent_column, ...], clause)], clause e.g. 'ON DELETE CASCADE'
+# auto_increment: names of AUTO_INCREMENT columns
+TableDefinition = namedtuple('TableDefinition', ['columns', 'indexes', 'foreign_keys', 'auto_increment'])
+
+
+def _split_columns(column_list):
+    """'a, b(255)' -> ['a', 'b']"""
+    return [re.sub(r'\(\d+\)', '', column).strip() for column in column_list.split(',')]
+
+
+def load_table_definitions(sql_path: str = SQL_SCHEMA_PATH) -> Dict[str, TableDefinition]:
+    """
+    Read the definition of every table
+
+    :param sql_path: Path of the CREATE TABLE script
+    :return: Mapping of table name to TableDefinition, in script order
+    """
+    with open(sql_path, 'r', encoding='utf-8') as f:
+        script = f.read()
+
+    tables = {}
+    for table_name, body in _CREATE_TABLE_PATTERN.findall(script):
+        definition = TableDefinition([], [], [], [])
+        for line in body.splitlines():
+            line = line.strip().rstrip(',')
+            if not line or line.startswith('--'):
+                continue
+            if line.split(None, 1)[0].upper() in _NON_COLUMN_WORDS:
+                index_match = _INDEX_PATTERN.match(line)
+                foreign_key_match = _FOREIGN_KEY_PATTERN.match(line)
+                if index_match:
+                    definition.indexes.append((index_match.group(2), _split_columns(index_match.group(3)),
+                                               bool(index_match.group(1))))
+                elif foreign_key_match:
+                    definition.foreign_keys.append((_split_columns(foreign_key_match.group(1)),
+                                                    foreign_key_match.group(2),
+                                                    _split_columns(foreign_key_match.group(3)),
+                                                    foreign_key_match.group(4).strip()))
+                continue
+            column_match = _COLUMN_PATTERN.match(line)
+            if column_match:
+                definition.columns.append((column_match.group(1), column_match.group(2).upper().replace(' ', '')))
+                if 'AUTO_INCREMENT' in column_match.group(3).upper():
+                    definition.auto_increment.append(column_match.group(1))
+        tables[table_name] = definition
+    return tables
+
+
+def load_table_schema(sql_path: str = SQL_SCHEMA_PATH) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    Read the column definitions of every table
+
+    :param sql_path: Path of the CREATE TABLE script
+    :return: Mapping of table name to [(column, type)], types upper-case with
+             their parameters, e.g. ('pubyear', 'SMALLINT'), ('vol', 'VARCHAR(50)')
+    """
+    return {table_name: definition.columns
+            for table_name, definition in load_table_definitions(sql_path).items()}
+
+
+def base_type(sql_type: str) -> str:
+    """SQL type without its parameters, e.g. 'VARCHAR(50)' -> 'VARCHAR'"""
+    return sql_type.split('(', 1)[0]
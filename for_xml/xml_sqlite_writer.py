@@ -0,0 +1,248 @@
+"""
+SQLite output sink for the XML tables
+
+Loads the tables straight into one local SQLite database
+(xml_output/wos_xml.sqlite), a self-contained, queryable artifact per
+delivery that needs no MySQL server.
+
+- The schema mirrors create_database_and_tables.sql (types, indexes and
+  foreign keys are read from it; MySQL index prefix lengths are dropped).
+- prepare_sqlite_database() runs once per run before loading: it creates
+  missing tables, switches the database to WAL and drops the secondary
+  indexes so the load only appends to the tables.
+- Every RecordBatch is inserted in one transaction with one executemany()
+  per table, with synchronous=OFF; empty values become NULL as with the
+  NULLIF of import_csv_data.sql. Parallel workers share the database and
+  take turns through SQLite's write lock.
+- In delta mode the rows of the changed records of a batch (its
+  tombstones) are deleted from every table in the same transaction, before
+  the new rows are inserted. The first such delete builds a uid index on
+  every table, which finalize_sqlite_database() drops again.
+- finalize_sqlite_database() runs once after the load: it builds the
+  indexes, creates the unique keys the foreign keys point to and checks the
+  foreign keys, then checkpoints the WAL and prints load throughput.
+
+SQLite cannot add a foreign key to an existing table, so the FOREIGN KEY
+clauses are part of CREATE TABLE; they are not enforced while loading
+(PRAGMA foreign_keys is off by default) and are verified with
+PRAGMA foreign_key_check after the load instead.
+"""
+
+import os
+import sqlite3
+import time
+
+from xml_common_def import OUTPUT_DIR, XML_TABLE_COLUMNS
+from xml_sql_schema import load_table_definitions
+
+SQLITE_DB_NAME = "wos_xml.sqlite"
+
+# Seconds a worker waits for another worker's write transaction
+SQLITE_BUSY_TIMEOUT = 600
+
+# Index on uid kept during a delta load, so tombstoned rows are deleted without table scans
+TOMBSTONE_INDEX_SUFFIX = "_tombstone_uid"
+
+
+def sqlite_db_path(output_dir=None):
+    """Path of the SQLite database of an output directory"""
+    return os.path.join(output_dir or OUTPUT_DIR, SQLITE_DB_NAME)
+
+
+def sqlite_table_definitions():
+    """Definitions of the output tables that exist in create_database_and_tables.sql"""
+    definitions = load_table_definitions()
+    return {table_name: definitions[table_name] for table_name in XML_TABLE_COLUMNS if table_name in definitions}
+
+
+def _create_table_sql(table_name, definition):
+    """CREATE TABLE statement for SQLite"""
+    lines = []
+    for column, sql_type in definition.columns:
+        if column in definition.auto_increment:
+            lines.append(f"{column} INTEGER PRIMARY KEY")
+        else:
+            lines.append(f"{column} {sql_type}")
+    for columns, parent_table, parent_columns, clause in definition.foreign_keys:
+        lines.append(f"FOREIGN KEY ({', '.join(columns)}) REFERENCES {parent_table}({', '.join(parent_columns)}) "
+                     f"{clause}".rstrip())
+    return f"CREATE TABLE IF NOT EXISTS {table_name} (\n    " + ",\n    ".join(lines) + "\n)"
+
+
+def _count_rows(connection, table_names):
+    return {table_name: connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            for table_name in table_names}
+
+
+def _connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    return connection
+
+
+def prepare_sqlite_database(output_dir=None):
+    """
+    Create the database for a bulk load
+
+    Creates missing tables, enables WAL and drops the secondary indexes,
+    which finalize_sqlite_database() builds again after the load.
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: Number of rows already in the database
+    """
+    db_path = sqlite_db_path(output_dir)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    definitions = sqlite_table_definitions()
+    connection = _connect(db_path)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        for table_name, definition in definitions.items():
+            connection.execute(_create_table_sql(table_name, definition))
+        rows_before = sum(_count_rows(connection, definitions).values())
+        index_names = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+        for index_name in index_names:
+            connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+    finally:
+        connection.close()
+    return rows_before
+
+
+def _create_index(connection, index_name, table_name, columns, unique):
+    """Create an index; a unique index over duplicate values falls back to a plain one"""
+    column_list = ', '.join(columns)
+    if unique:
+        try:
+            connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_list})")
+            return True
+        except sqlite3.IntegrityError:
+            print(f"Warning: duplicate values in {table_name}({column_list}), "
+                  f"creating {index_name} as a non-unique index")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_list})")
+    return False
+
+
+def finalize_sqlite_database(output_dir=None, load_seconds=None, rows_before=0):
+    """
+    Build indexes and check foreign keys after a bulk load
+
+    :param output_dir: Optional directory replacing the default output directory
+    :param load_seconds: Duration of the load, for the throughput report
+    :param rows_before: Rows in the database before the load (from prepare_sqlite_database)
+    :return: Dictionary with row counts, index build time and foreign key violations
+    """
+    db_path = sqlite_db_path(output_dir)
+    definitions = sqlite_table_definitions()
+    connection = _connect(db_path)
+    try:
+        row_counts = _count_rows(connection, definitions)
+
+        index_start = time.time()
+        parent_keys = set()
+        for table_name, definition in definitions.items():
+            table_columns = {column for column, _ in definition.columns}
+            for index_name, columns, unique in definition.indexes:
+                if not set(columns) <= table_columns or columns == definition.auto_increment:
+                    # Skips e.g. an index on a column the table does not have
+                    # and indexes on the INTEGER PRIMARY KEY itself
+                    continue
+                _create_index(connection, f"{table_name}_{index_name}", table_name, columns, unique)
+            for _, parent_table, parent_columns, _ in definition.foreign_keys:
+                parent_keys.add((parent_table, tuple(parent_columns)))
+
+        # SQLite foreign keys need a unique key on the parent columns
+        checkable = True
+        for parent_table, parent_columns in sorted(parent_keys):
+            index_name = f"{parent_table}_{'_'.join(parent_columns)}_key"
+            checkable &= _create_index(connection, index_name, parent_table, parent_columns, True)
+        index_seconds = time.time() - index_start
+
+        for table_name in definitions:
+            connection.execute(f"DROP INDEX IF EXISTS {table_name}{TOMBSTONE_INDEX_SUFFIX}")
+        violations = None
+        if checkable:
+            violations = len(connection.execute("PRAGMA foreign_key_check").fetchall())
+        connection.execute("ANALYZE")
+        # Back to a single self-contained file, unless a reader still holds the database open
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        try:
+            connection.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.OperationalError as e:
+            print(f"Warning: database kept in WAL mode: {e}")
+    finally:
+        connection.close()
+
+    loaded_rows = sum(row_counts.values()) - rows_before
+    print(f"\nSQLite database: {db_path}")
+    if load_seconds:
+        print(f"Loaded {loaded_rows} rows in {load_seconds:.1f}s ({loaded_rows / load_seconds:.0f} rows/s)")
+    else:
+        print(f"Loaded {loaded_rows} rows")
+    print(f"Indexes built in {index_seconds:.1f}s")
+    if violations is None:
+        print("Foreign keys not checked (duplicate parent keys)")
+    else:
+        print(f"Foreign key violations: {violations}")
+    return {'row_counts': row_counts, 'loaded_rows': loaded_rows, 'index_seconds': index_seconds, 'foreign_key_violations': violations}
+
+
+class XMLSQLiteWriter:
+    """Inserts RecordBatch objects into the SQLite database"""
+
+    def __init__(self, output_dir=None):
+        """
+        Initialize the SQLite sink
+
+        The database must have been created by prepare_sqlite_database().
+
+        :param output_dir: Optional directory replacing the default output
+                           directory (e.g. a per-node output shard)
+        """
+        self.db_path = sqlite_db_path(output_dir)
+        self.insert_statements = {}
+        for table_name in sqlite_table_definitions():
+            columns = XML_TABLE_COLUMNS[table_name]
+            placeholders = ', '.join(["NULLIF(?, '')"] * len(columns))
+            self.insert_statements[table_name] = \
+                f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        self.connection = None
+
+    def _delete_tombstones(self, uids):
+        """Delete the rows of replaced UIDs from every table (inside the batch transaction)"""
+        for table_name in self.insert_statements:
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}{TOMBSTONE_INDEX_SUFFIX} "
+                                    f"ON {table_name} (uid)")
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS tombstone_uid (uid TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM tombstone_uid")
+        self.connection.executemany("INSERT OR IGNORE INTO tombstone_uid VALUES (?)", ((uid,) for uid in uids))
+        for table_name in self.insert_statements:
+            self.connection.execute(f"DELETE FROM {table_name} WHERE uid IN (SELECT uid FROM tombstone_uid)")
+
+    def write_batch(self, batch):
+        """
+        Insert all rows of a RecordBatch in one transaction
+
+        The old rows of the tombstoned UIDs of the batch are deleted first.
+
+        :param batch: RecordBatch with the rows of several records
+        """
+        if self.connection is None:
+            self.connection = _connect(self.db_path)
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if batch.tombstones:
+                self._delete_tombstones(batch.tombstones)
+            for table_name, statement in self.insert_statements.items():
+                if batch.row_count(table_name):
+                    self.connection.executemany(statement, batch.rows(table_name))
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """Close the database connection"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
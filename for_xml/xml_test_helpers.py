@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fixtures shared by the test suites
+"""
+
+import csv
+import os
+
+from csv_writer import CSV_DIALECT
+from xml_common_def import XML_TABLE_COLUMNS
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+EXAMPLE_XML = os.path.join(EXAMPLES_DIR, '1985.xml')
+
+
+def write_csv(file_path, headers, rows):
+    """Write a CSV file in the output dialect, creating its directory"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, dialect=CSV_DIALECT)
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+
+def write_table(output_dir, table_name, rows):
+    """Write rows given as column dictionaries with the full header of the table"""
+    columns = XML_TABLE_COLUMNS[table_name]
+    write_csv(os.path.join(output_dir, table_name + '.csv'), columns,
+              [[row.get(column, '') for column in columns] for row in rows])
@@ -0,0 +1,314 @@
+"""
+UID -> row offset sidecar index of the CSV tables
+
+With --index the CSV writers record, for every record and table, where the
+rows of the record start in the table file and how many there are. At the
+end of the run every table gets a sorted, fixed-width index next to it
+(item_references.csv.uidx) that lookup() searches through mmap, so the
+rows of one paper are read straight from the CSV files in milliseconds:
+
+    python xml_uid_index.py lookup WOS:A1985ASN8900007 [--output-dir xml_output]
+
+Index files are arrays of INDEX_RECORD entries (big-endian, 28 bytes):
+
+- key: 16-byte UID codec (see uid_key): the UID without its "WOS:" prefix,
+  NUL-padded, or for other UIDs a 0xFF byte and a 15-byte BLAKE2b hash
+- offset: byte offset of the first row of the record in the CSV file
+- rows: number of consecutive rows of the record
+
+Writers append the entries of every write, unsorted, to <table>.csv.uidx.log.
+O_APPEND alone does not make the recorded offset exact: on NFS the client
+computes the end of file from its cached attributes, so concurrent appends
+from several hosts can land at stale offsets. Every write therefore holds
+a POSIX lock on the table file (fcntl.lockf, which NFS forwards to the
+server), reads the file size under the lock and writes the rows and their
+index entries before releasing it. lookup() checks the UID of every row it
+reads, so an index that no longer matches its table raises StaleIndexError
+instead of returning the rows of another record. build_uid_indexes()
+sorts the whole log into the .uidx file; the log stays as the source for
+the next build. Tables whose rows move (xml_sort_tables) or that were written
+without the index are rescanned with index_table_file(). Plain (uncompressed,
+unsplit) CSV files only.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+import time
+
+from xml_common_def import OUTPUT_DIR, XML_TABLE_NAMES
+from xml_optional_deps import optional_import
+
+np = optional_import('numpy')
+# POSIX only; without it the writes are not locked
+fcntl = optional_import('fcntl')
+
+UID_INDEX_SUFFIX = ".uidx"
+UID_INDEX_LOG_SUFFIX = ".uidx.log"
+
+UID_KEY_SIZE = 16
+WOS_UID_PREFIX = "WOS:"
+
+# key, offset, rows
+INDEX_RECORD = struct.Struct('>16sQI')
+
+
+class StaleIndexError(ValueError):
+    """An index entry does not point at rows of its UID"""
+
+
+def uid_key(uid):
+    """
+    Fixed-width 16-byte key of a UID
+
+    WOS UIDs (WOS:A1985ASN8900007, WOS:000123456789012) keep their 15 to 16
+    characters after the prefix; any other UID is hashed.
+    """
+    if uid.startswith(WOS_UID_PREFIX) and len(uid) - len(WOS_UID_PREFIX) <= UID_KEY_SIZE:
+        return uid[len(WOS_UID_PREFIX):].encode('ascii', 'replace').ljust(UID_KEY_SIZE, b'\0')
+    return b'\xff' + hashlib.blake2b(uid.encode('utf-8'), digest_size=UID_KEY_SIZE - 1).digest()
+
+
+def append_indexed_rows(file_path, chunks):
+    """
+    Append rows to a CSV file and their index entries to its log
+
+    :param file_path: Plain CSV file
+    :param chunks: List of (uid, row count, CSV bytes) in file order
+    """
+    data = b''.join(chunk for _, _, chunk in chunks)
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            # Taking the lock revalidates the size cached by an NFS client
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+        offset = os.fstat(fd).st_size
+        written = os.pwrite(fd, data, offset)
+        if written != len(data):
+            raise IOError(f"Short write to {file_path}: {written} of {len(data)} bytes")
+
+        entries = []
+        for uid, row_count, chunk in chunks:
+            entries.append(INDEX_RECORD.pack(uid_key(uid), offset, row_count))
+            offset += len(chunk)
+        # Written under the table lock, so the log has one writer at a time as well
+        log_fd = os.open(file_path + UID_INDEX_LOG_SUFFIX, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(log_fd, b''.join(entries))
+        finally:
+            os.close(log_fd)
+    finally:
+        # Closing the file releases the lock, after the NFS client flushed the writes
+        os.close(fd)
+
+
+def index_table_file(file_path):
+    """
+    Rewrite the index log of a plain CSV table by scanning it
+
+    Used after the rows of a table moved (xml_sort_tables) or for tables
+    written without the index. A row ends at a newline outside quotes.
+
+    :param file_path: Plain CSV file with a uid column
+    :return: Number of index entries
+    """
+    entries = []
+    with open(file_path, 'rb') as f:
+        headers = next(csv.reader([f.readline().decode('utf-8')]))
+        uid_index = headers.index('uid')
+        offset = f.tell()
+        row_start = offset
+        row_text = b''
+        current_uid, current_offset, current_rows = None, 0, 0
+        for line in f:
+            row_text += line
+            offset += len(line)
+            if row_text.count(b'"') % 2:
+                continue
+            uid = next(csv.reader([row_text.decode('utf-8')]))[uid_index]
+            if uid != current_uid:
+                if current_rows:
+                    entries.append(INDEX_RECORD.pack(uid_key(current_uid), current_offset, current_rows))
+                current_uid, current_offset, current_rows = uid, row_start, 0
+            current_rows += 1
+            row_start = offset
+            row_text = b''
+        if current_rows:
+            entries.append(INDEX_RECORD.pack(uid_key(current_uid), current_offset, current_rows))
+
+    log_path = file_path + UID_INDEX_LOG_SUFFIX
+    tmp_path = log_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(entries))
+    os.replace(tmp_path, log_path)
+    return len(entries)
+
+
+def _sort_entries(data):
+    """Index entries sorted by key, then offset"""
+    if np is not None:
+        dtype = np.dtype([('key', 'S16'), ('offset', '>u8'), ('rows', '>u4')])
+        entries = np.frombuffer(data, dtype=dtype)
+        return entries[np.lexsort((entries['offset'], entries['key']))].tobytes()
+    records = [data[i:i + INDEX_RECORD.size] for i in range(0, len(data), INDEX_RECORD.size)]
+    records.sort()
+    return b''.join(records)
+
+
+def build_uid_indexes(output_dir=None):
+    """
+    Sort the index logs of an output tree into .uidx files
+
+    :param output_dir: Optional directory replacing the default output directory
+    :return: Dictionary of index path to number of entries
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    started = time.time()
+    counts = {}
+    for dir_path, _, file_names in os.walk(output_dir):
+        for file_name in file_names:
+            if not file_name.endswith(UID_INDEX_LOG_SUFFIX):
+                continue
+            log_path = os.path.join(dir_path, file_name)
+            with open(log_path, 'rb') as f:
+                data = f.read()
+            # A worker killed mid-write may leave a partial entry at the end
+            data = data[:len(data) - len(data) % INDEX_RECORD.size]
+            index_path = log_path[:-len(UID_INDEX_LOG_SUFFIX)] + UID_INDEX_SUFFIX
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(_sort_entries(data))
+            os.replace(tmp_path, index_path)
+            counts[index_path] = len(data) // INDEX_RECORD.size
+    if counts:
+        print(f"\nUID indexes: {len(counts)} tables, {sum(counts.values())} entries "
+              f"in {time.time() - started:.1f}s")
+    return counts
+
+
+def find_entries(index_path, uid):
+    """
+    Binary search an index file
+
+    :param index_path: .uidx file
+    :param uid: Record UID
+    :return: List of (offset, row count)
+    """
+    key = uid_key(uid)
+    size = INDEX_RECORD.size
+    with open(index_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            low, high = 0, len(index) // size
+            while low < high:
+                middle = (low + high) // 2
+                if index[middle * size:middle * size + UID_KEY_SIZE] < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            entries = []
+            while low < len(index) // size:
+                entry_key, offset, row_count = INDEX_RECORD.unpack_from(index, low * size)
+                if entry_key != key:
+                    break
+                entries.append((offset, row_count))
+                low += 1
+    return entries
+
+
+def read_rows(csv_path, offset, row_count, uid=None, uid_index=0):
+    """
+    Read row_count CSV rows starting at a byte offset
+
+    :param uid: Optional UID every row must have
+    :param uid_index: Position of the uid column
+    :raises StaleIndexError: If a row is missing or belongs to another UID
+    """
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+        try:
+            rows = [next(reader) for _ in range(row_count)]
+        except (StopIteration, UnicodeDecodeError, csv.Error):
+            rows = None
+    if uid is not None and (rows is None or any(len(row) <= uid_index or row[uid_index] != uid for row in rows)):
+        raise StaleIndexError(f"Index of {csv_path} does not match the table at offset {offset}; "
+                              f"rebuild it with: python xml_uid_index.py build --rescan")
+    if rows is None:
+        raise StaleIndexError(f"Index of {csv_path} points past the rows of the table at offset {offset}")
+    return rows
+
+
+def lookup(uid, output_dir=None):
+    """
+    Rows of a record in every indexed table of an output tree
+
+    :param uid: Record UID
+    :param output_dir: Optional directory replacing the default output directory
+    :return: List of (CSV path, header row, rows) for the tables with rows
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    table_order = {table_name: index for index, table_name in enumerate(XML_TABLE_NAMES)}
+    index_paths = []
+    for dir_path, _, file_names in os.walk(output_dir):
+        for file_name in file_names:
+            if file_name.endswith('.csv' + UID_INDEX_SUFFIX):
+                table_name = file_name[:-len('.csv' + UID_INDEX_SUFFIX)]
+                index_paths.append((table_order.get(table_name, len(table_order)), dir_path, file_name))
+
+    results = []
+    for _, dir_path, file_name in sorted(index_paths):
+        index_path = os.path.join(dir_path, file_name)
+        csv_path = index_path[:-len(UID_INDEX_SUFFIX)]
+        entries = find_entries(index_path, uid)
+        if not entries:
+            continue
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            headers = next(csv.reader(f))
+        rows = []
+        for offset, row_count in entries:
+            rows.extend(read_rows(csv_path, offset, row_count, uid, headers.index('uid')))
+        results.append((csv_path, headers, rows))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UID index of the CSV tables')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Sort the index logs into .uidx files')
+    build_parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    build_parser.add_argument('--rescan', action='store_true',
+                              help='Rescan every plain table file instead of using the index logs')
+    lookup_parser = subparsers.add_parser('lookup', help='Print the rows of records in every table')
+    lookup_parser.add_argument('uids', nargs='+', metavar='UID')
+    lookup_parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.rescan:
+            from xml_sort_tables import table_files
+            for file_path in table_files(args.output_dir):
+                if file_path.endswith('.csv'):
+                    index_table_file(file_path)
+        build_uid_indexes(args.output_dir)
+        return
+    writer = csv.writer(sys.stdout)
+    for uid in args.uids:
+        started = time.time()
+        results = lookup(uid, args.output_dir)
+        for csv_path, headers, rows in results:
+            print(f"== {os.path.relpath(csv_path, args.output_dir)} ({len(rows)} rows)")
+            writer.writerow(headers)
+            writer.writerows(rows)
+        print(f"-- {uid}: {sum(len(rows) for _, _, rows in results)} rows in {len(results)} tables, "
+              f"{(time.time() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
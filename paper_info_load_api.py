@@ -1,6 +1,7 @@
 from paper_parser import PaperInfo
 from paper_parser import get_ut_by_dict_data
 from proc_history_manager import is_ut_in_proc_history
+from for_xml.dir_manifest import DirectoryManifest
 import os
 
 RESULT_TITLE = "PT,AU,BA,BE,GP,AF,BF,CA,TI,SO,SE,BS,LA,DT,CT,CY,CL,SP,HO,DE,ID,AB,C1,RP,EM,RI,OI,FU,FX,CR,NR,TC,Z9," \
@@ -86,23 +87,18 @@ def load_paper_info_file(file_path: str, load_proc):
     pass
 
 
-def load_paper_input_dir(dir_path: str, load_proc):
-    for dir_v in os.listdir(dir_path):
-        dir_tmp = os.path.join(dir_path, dir_v)
-        if os.path.isdir(dir_tmp):
-            # 说明还是目录，那么继续遍历目录
-            load_paper_input_dir(dir_tmp, load_proc)
-        else:
-            if dir_v.startswith(".DS_Store"):
-                continue
-            # elif dir_v.startswith("result_"):
-            # 说明是要找的文件，那么进行解析
-            load_paper_info_file(dir_tmp, load_proc)
+def load_paper_input_dir(dir_path: str, load_proc, manifest_path=None):
+    # 用 os.scandir 遍历目录（可选使用目录清单缓存），逐个解析文件
+    manifest = DirectoryManifest(manifest_path)
+    entries = manifest.scan(dir_path, lambda name: not name.startswith(".DS_Store"))
+    manifest.save()
+    for file_path, _, _ in entries:
+        load_paper_info_file(file_path, load_proc)
     pass
 
 
-def load_paper_input(load_proc, paper_input_dir):
+def load_paper_input(load_proc, paper_input_dir, manifest_path=None):
     # 先遍历目录，找到所有的文件名
     paper_input_path = os.path.join(os.getcwd(), paper_input_dir)
-    load_paper_input_dir(paper_input_path, load_proc)
+    load_paper_input_dir(paper_input_path, load_proc, manifest_path)
     pass
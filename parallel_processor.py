@@ -8,34 +8,31 @@ Concurrent file processing capabilities for WOS data
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
 from typing import Callable, List, Dict, Tuple
+from for_xml.dir_manifest import DirectoryManifest, input_file_filter, schedule_by_size
 
 
 class ParallelFileProcessor:
     """Handles concurrent processing of WOS data files"""
     
-    def __init__(self, worker_count=None):
+    def __init__(self, worker_count=None, manifest_path=None):
         if worker_count is None:
             worker_count = os.cpu_count() or 1
         self.worker_count = worker_count
+        self.manifest_path = manifest_path
+        
+    def scan_manifest_entries(self, root_path: str) -> List[Tuple[str, int, float]]:
+        """Recursively find all processable files as (path, size, mtime) manifest entries"""
+        manifest = DirectoryManifest(self.manifest_path)
+        entries = manifest.scan(root_path, input_file_filter())
+        manifest.save()
+        if self.manifest_path:
+            print(f"Manifest: {manifest.stats['dirs_cached']} directories cached, "
+                  f"{manifest.stats['dirs_scanned']} rescanned")
+        return entries
         
     def scan_directory_tree(self, root_path: str) -> List[str]:
         """Recursively find all processable files"""
-        found_files = []
-        
-        try:
-            entries = os.listdir(root_path)
-        except (PermissionError, FileNotFoundError):
-            return found_files
-            
-        for entry in entries:
-            full_path = os.path.join(root_path, entry)
-            
-            if os.path.isdir(full_path):
-                found_files.extend(self.scan_directory_tree(full_path))
-            elif not entry.startswith('.'):
-                found_files.append(full_path)
-                
-        return found_files
+        return [path for path, _, _ in self.scan_manifest_entries(root_path)]
     
     def execute_on_file(self, filepath: str, handler: Callable) -> Tuple[bool, str, str]:
         """Execute processing handler on a single file"""
@@ -51,7 +48,7 @@ class ParallelFileProcessor:
         target_path = os.path.join(os.getcwd(), input_directory)
         
         print(f"Scanning: {target_path}")
-        file_list = self.scan_directory_tree(target_path)
+        file_list = schedule_by_size(self.scan_manifest_entries(target_path))
         total_count = len(file_list)
         
         if total_count == 0:
@@ -124,7 +121,7 @@ class ParallelFileProcessor:
                 print(f"  {os.path.basename(path)}: {err[:100]}")
 
 
-def process_with_concurrency(handler: Callable, directory: str, workers=None):
+def process_with_concurrency(handler: Callable, directory: str, workers=None, manifest_path=None):
     """Convenience function for concurrent processing"""
-    processor = ParallelFileProcessor(worker_count=workers)
+    processor = ParallelFileProcessor(worker_count=workers, manifest_path=manifest_path)
     return processor.run_batch(handler, directory)
@@ -14,6 +14,8 @@ def run_parser():
                            help='Enable concurrent processing')
     arg_parser.add_argument('--workers', type=int, default=None,
                            help='Worker count for parallel mode (default: auto-detect)')
+    arg_parser.add_argument('--manifest', default=None,
+                           help='Directory manifest file caching the input tree listing')
     
     options = arg_parser.parse_args()
     
@@ -22,10 +24,11 @@ def run_parser():
     
     if options.parallel:
         print("==> Concurrent processing mode active")
-        process_with_concurrency(paper_info_proc, PAPER_INPUT_UNIQ_DIR, workers=options.workers)
+        process_with_concurrency(paper_info_proc, PAPER_INPUT_UNIQ_DIR, workers=options.workers,
+                                 manifest_path=options.manifest)
     else:
         print("==> Sequential processing mode active")
-        load_paper_input(paper_info_proc, PAPER_INPUT_UNIQ_DIR)
+        load_paper_input(paper_info_proc, PAPER_INPUT_UNIQ_DIR, options.manifest)
 
 
 if __name__ == '__main__':